@@ -10,9 +10,12 @@ import json
 
 # Add ml to path
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ml'))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scraper'))
 try:
     import train_model
     import feature_engineering
+    import race_analytics
+    import race_dataset
     import importlib
     importlib.reload(train_model)
     importlib.reload(feature_engineering)
@@ -156,17 +159,14 @@ else:
 st.markdown("### 📊 データベースプレビュー")
 if os.path.exists(target_parquet):
     try:
-        df = pd.read_parquet(target_parquet)
-        
         # Reorder columns for better visibility (Date, Venue, Race Name first)
         priority_cols = ['date', '日付', 'venue', '開催地', 'race_name', 'レース名', 'race_id', 'horse_name', '馬名', 'rank', '着 順']
-        existing_priority = [c for c in priority_cols if c in df.columns]
-        other_cols = [c for c in df.columns if c not in existing_priority]
-        df = df[existing_priority + other_cols]
+        # Row count comes from parquet metadata; only the trailing row groups are read
+        total_rows, df = race_analytics.preview(target_parquet, limit=1000, priority_columns=priority_cols)
         
-        st.metric("総データ数 (行)", len(df))
+        st.metric("総データ数 (行)", total_rows)
         st.caption("※データ量が多いため、最新の1000件のみ表示しています。")
-        st.dataframe(df.tail(1000), width='stretch')
+        st.dataframe(df, width='stretch')
     except Exception as e:
         st.error(f"読み込みエラー: {e}")
 else:
@@ -225,13 +225,13 @@ if st.button("🚀 フル学習プロセスを開始 (最適化+較正+デプロ
                 try:
                     import db_helper
                     importlib.reload(db_helper)
-                    df_proc = pd.read_parquet(data_path)
                     db_path_sql = os.path.join(project_root, "keiba_data.db")
                     # Ensure file creation
                     conn_check = importlib.import_module("sqlite3").connect(db_path_sql)
                     conn_check.close()
                     db = db_helper.KeibaDatabase(db_path_sql)
-                    db.save_processed_data(df_proc, mode=mode_val)
+                    # Upsert by (race_id, horse_id): only new/changed rows touch the table
+                    db.ingest_parquet(data_path, mode=mode_val)
                 except Exception as e:
                     print(f"SQL Save skipped: {e}")
 
@@ -373,29 +373,21 @@ if st.button("⚖️ 重みを最適化する (Optimize Weights)", type="primary
                 st.error("処理済みデータが見つかりません。先に「MLOps」で前処理を実行してください。")
                 st.stop()
             
-            df_proc = pd.read_parquet(processed_data_path)
-            
             # 2. Filter Period
-            # Fix: Handle mixed formats or Japanese format
-            # Keep original for fallback
-            date_raw_temp = df_proc['date'].copy()
-            df_proc['date'] = pd.to_datetime(df_proc['date'], errors='coerce')
+            # Only the rows of the period are read (dates parsed in the query,
+            # including the Japanese format)
+            _, max_date = race_analytics.date_bounds(processed_data_path, date_col='date')
             
-            # If many dates failed (NaT), try Japanese format explicit parsing using saved raw data
-            if df_proc['date'].isna().sum() > len(df_proc) * 0.5:
-                 df_proc['date'] = pd.to_datetime(date_raw_temp, format='%Y年%m月%d日', errors='coerce')
+            start_date = None
+            if max_date is not None:
+                if "1ヶ月間" in period_opt:
+                    start_date = max_date - pd.Timedelta(days=30)
+                elif "1年間" in period_opt:
+                    start_date = max_date - pd.Timedelta(days=365)
+                elif "3年間" in period_opt:
+                    start_date = max_date - pd.Timedelta(days=365*3)
             
-            max_date = df_proc['date'].max()
-            
-            if "1ヶ月間" in period_opt:
-                start_date = max_date - pd.Timedelta(days=30)
-                df_proc = df_proc[df_proc['date'] >= start_date]
-            elif "1年間" in period_opt:
-                start_date = max_date - pd.Timedelta(days=365)
-                df_proc = df_proc[df_proc['date'] >= start_date]
-            elif "3年間" in period_opt:
-                start_date = max_date - pd.Timedelta(days=365*3)
-                df_proc = df_proc[df_proc['date'] >= start_date]
+            df_proc = race_analytics.load_date_range(processed_data_path, start=start_date, date_col='date')
             
             st.write(f"検証データ数: {len(df_proc)} rows (期間: {df_proc['date'].min().date()} ~ {df_proc['date'].max().date()})")
 
@@ -660,17 +652,8 @@ if not os.path.exists(processed_data_path):
 else:
     # 1. Pre-load Dates for Selection (Lightweight)
     try:
-        # Read only date column
-        df_dates = pd.read_parquet(processed_data_path, columns=['date'])
-        
-        # Robust Date Parsing
-        date_raw_dates = df_dates['date'].copy()
-        df_dates['date'] = pd.to_datetime(df_dates['date'], errors='coerce')
-        if df_dates['date'].isna().sum() > len(df_dates) * 0.5:
-             df_dates['date'] = pd.to_datetime(date_raw_dates, format='%Y年%m月%d日', errors='coerce')
-        
-        df_dates['date_norm'] = df_dates['date'].dt.normalize()
-        unique_dates = sorted(df_dates['date_norm'].dropna().unique(), reverse=True)
+        # Distinct race days only (newest first)
+        unique_dates = race_analytics.distinct_dates(processed_data_path, date_col='date')
         
         if not unique_dates:
             st.warning("利用可能な日付データがありません。")
@@ -689,14 +672,10 @@ else:
         st.stop()
 
     if st.button("🚀 レース結果を確認する"):
-        # 2. Load Full Data & Filter
-        df_recent = pd.read_parquet(processed_data_path)
-        
-        # Ensure Date (Repeat robust parsing for full dataframe)
-        date_raw_temp = df_recent['date'].copy()
-        df_recent['date'] = pd.to_datetime(df_recent['date'], errors='coerce')
-        if df_recent['date'].isna().sum() > len(df_recent) * 0.5:
-             df_recent['date'] = pd.to_datetime(date_raw_temp, format='%Y年%m月%d日', errors='coerce')
+        # 2. Load only the selected day
+        df_recent = race_analytics.load_date_range(
+            processed_data_path, start=selected_date_norm, end=selected_date_norm, date_col='date'
+        )
         
         df_recent['date_norm'] = df_recent['date'].dt.normalize()
         
@@ -709,11 +688,12 @@ else:
         meta_cols_needed = ['race_name', 'レース名', '会場', 'レース番号', 'R']
         missing_meta = [c for c in meta_cols_needed if c not in df_target.columns]
         
-        if missing_meta and os.path.exists(target_parquet):
+        if missing_meta and (race_dataset.exists(mode_val) or os.path.exists(target_parquet)):
             try:
-                # Load raw data (subset of cols)
-                # We don't know exact col names in raw, so load needed + race_id
-                df_raw = pd.read_parquet(target_parquet)
+                # Load raw data (subset of cols, selected day only)
+                # We don't know exact col names in raw, so load needed + race_id (missing ones are skipped)
+                df_raw = race_dataset.read(mode_val, columns=['race_id'] + meta_cols_needed,
+                                           start=selected_date_norm, end=selected_date_norm)
                 
                 # Select relevant columns that exist in raw
                 raw_cols = [c for c in meta_cols_needed if c in df_raw.columns]
@@ -67,7 +67,15 @@ def load_model_metadata(mode="JRA"):
 
 @st.cache_resource
 def load_history_csv(mode):
-    """過去データをキャッシュとしてロード (高速化: Parquet優先 + メモリ最適化)"""
+    """過去データをキャッシュとしてロード (高速化: Parquet優先 + メモリ最適化)
+
+    馬ごとの戦績索引 (scraper/horse_history.py) があれば None を返す。出馬表の補完はスクレイパーが
+    索引 (メモリマップ) から必要な馬の出走だけを読むため、全件の DataFrame をプロセスごとに持たない。
+    """
+    from scraper import horse_history
+    if horse_history.exists(mode):
+        return None
+
     base_dir = os.path.join(PROJECT_ROOT, "data", "raw")
     filename_base = "database_nar" if mode == "NAR" else "database"
     
@@ -99,15 +107,13 @@ def load_history_csv(mode):
 
     df = None
     
-    if os.path.exists(parquet_path):
+    from scraper import race_dataset
+    if race_dataset.exists(mode) or os.path.exists(parquet_path):
         try:
-            # Parquet is efficient, but we can cast types after load
-            df = pd.read_parquet(parquet_path, columns=usecols)
-        except:
-             try:
-                 df = pd.read_parquet(parquet_path) # Fallback
-             except Exception as e:
-                 st.warning(f"Parquet load failed: {e}")
+            # 分割データセット (なければ Parquet) から必要な列だけを読む (存在しない列は無視される)
+            df = race_dataset.read(mode, columns=usecols)
+        except Exception as e:
+            st.warning(f"Parquet load failed: {e}")
             
     elif os.path.exists(csv_path):
         try:
@@ -1701,10 +1707,15 @@ if schedule_data and "races" in schedule_data:
         st.markdown("### 📊 過去のレース分析: 堅いレースの抽出")
         st.info("過去の全レースデータから、オッズのばらつきや人気差を計算し、特に「堅い」（予測しやすい）レースを抽出します。")
 
-        # Helper: Load Data Cached
+        # Queries run directly on the parquet file (DuckDB when installed), so
+        # only the filter options and the per-race result rows are held here.
+        import ml.race_analytics as race_analytics
+
         @st.cache_data(ttl=3600)
-        def load_analysis_data(path):
-            return pd.read_parquet(path)
+        def load_analysis_filters(path, version):
+            lo, hi = race_analytics.date_bounds(path)
+            venues = race_analytics.distinct_values(path, race_analytics.venue_column(path))
+            return lo, hi, venues
 
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         if mode_val == "NAR":
@@ -1717,25 +1728,17 @@ if schedule_data and "races" in schedule_data:
         else:
              # Filters UI
              try:
-                 # Load just to get metadata for filters (Cached)
-                 df_raw = load_analysis_data(db_path)
-                 
+                 # Filter options only (Cached per file version)
+                 lo, hi, all_venues = load_analysis_filters(db_path, race_analytics.file_version(db_path))
+
                  # Prepare Filter Options
-                 if '日付' in df_raw.columns:
-                     df_raw['日付'] = pd.to_datetime(df_raw['日付'], errors='coerce')
-                     valid_dates = df_raw['日付'].dropna()
-                     if not valid_dates.empty:
-                         min_date = valid_dates.min().date()
-                         max_date = valid_dates.max().date()
-                     else:
-                         min_date = datetime.now().date()
-                         max_date = datetime.now().date()
+                 if lo is not None:
+                     min_date = lo.date()
+                     max_date = hi.date()
                  else:
                      min_date = datetime.now().date()
                      max_date = datetime.now().date()
 
-                 all_venues = sorted(df_raw['開催地'].unique().astype(str)) if '開催地' in df_raw.columns else []
-
                  # Layout
                  col_f1, col_f2 = st.columns(2)
                  with col_f1:
@@ -1750,41 +1753,18 @@ if schedule_data and "races" in schedule_data:
 
                  if st.button("🔍 条件で分析開始"):
                      with st.spinner("データをフィルタリング・分析中..."):
-                         df_target = df_raw.copy()
-                         
-                         # Apply Filters
+                         start, end = None, None
                          if isinstance(date_range, tuple) and len(date_range) == 2:
                              start, end = date_range
-                             msk = (df_target['日付'].dt.date >= start) & (df_target['日付'].dt.date <= end)
-                             df_target = df_target[msk]
-                         
-                         if sel_venues:
-                             df_target = df_target[df_target['開催地'].isin(sel_venues)]
-                             
-                         if df_target.empty:
-                             st.warning("条件に一致するデータがありません。")
+
+                         # Filters and per-race odds metrics are computed in the query
+                         result_df = race_analytics.hard_race_metrics(db_path, start=start, end=end, venues=sel_venues)
+
+                         if result_df.empty:
+                             st.warning("条件に一致するデータがないか、分析可能なデータが不足しています（オッズ情報など）。")
                          else:
-                             # Import Analysis Module
-                             import ml.analysis_hard_race as analysis_hard_race
-                             importlib.reload(analysis_hard_race)
-                             
-                             # Calculate Metrics
-                             metrics_df = analysis_hard_race.calculate_hard_race_metrics(df_target)
-                             
-                             if metrics_df.empty:
-                                 st.warning("分析可能なデータが不足しています（オッズ情報など）。")
-                             else:
-                                 # Merge Metadata
-                                 meta_cols = ['race_id', '日付', '開催地', 'レース名']
-                                 avail_meta = [c for c in meta_cols if c in df_target.columns]
-                                 meta_df = df_target[avail_meta].drop_duplicates(subset=['race_id'])
-                                 
-                                 result_df = pd.merge(metrics_df, meta_df, on='race_id', how='left')
-                                 # Format Date back to string for display if needed, but dataframe handles it.
-                                 result_df = result_df.sort_values('odds_gap_1_2', ascending=False)
-                                 
-                                 st.session_state['hist_analysis_result'] = result_df
-                                 st.success(f"分析完了: {len(result_df)} レース")
+                             st.session_state['hist_analysis_result'] = result_df
+                             st.success(f"分析完了: {len(result_df)} レース")
 
              except Exception as e:
                  st.error(f"データ読み込みエラー: {e}")
@@ -2298,7 +2278,8 @@ if race_id:
              if fetch_trigger:
                   with st.spinner("オッズを取得中..."):
                       try:
-                          current_odds = auto_scraper.scrape_odds_for_race(race_id, mode=mode_val)
+                          # Use the odds poller's snapshot when it is fresh; fetch otherwise
+                          current_odds = auto_scraper.latest_polled_odds(race_id) or auto_scraper.scrape_odds_for_race(race_id, mode=mode_val)
                           # Update session state df
                           if current_odds:
                               odds_map = {x['number']: x['odds'] for x in current_odds}
@@ -2697,6 +2678,7 @@ if race_id:
         evs_adjusted = []  # 調整後EV（印補正あり）
         kellys = []
         bias_reasons_list = [] # 補正理由リスト
+        alert_factors = []  # 勝率に掛ける倍率 (オッズ更新時の期待値アラート用、除外は NaN)
 
         for idx, (p, o_win, o_place, m, c) in enumerate(zip(probs, odds, place_min_odds, marks, confidences)):
             reasons = [] # この馬の補正理由
@@ -2716,6 +2698,7 @@ if race_id:
                 ev_adj = -1.0
                 kelly = 0.0
                 reasons.append("確率不足(除外)")
+                alert_factors.append(float('nan'))
             else:
                 w = mark_weights.get(m, 1.0)
                 if w != 1.0:
@@ -2766,6 +2749,7 @@ if race_id:
                 # 信頼度(c)を乗算することで、「AIが自信のない穴馬」のEV過大評価を防ぐ
                 trust_factor = c / 100.0
                 ev_adj = (adjusted_p * w * calc_odds * trust_factor) - 1.0
+                alert_factors.append(adjusted_p * w * trust_factor / p)
                 
                 if trust_factor < 0.6:
                      reasons.append(f"信頼度低 (x{trust_factor:.2f})")
@@ -2790,6 +2774,16 @@ if race_id:
         edited_df['推奨度(Kelly)'] = kellys
         edited_df['補正内容'] = bias_reasons_list
 
+        # ポーラー (auto_scraper.py --poll-odds --alerts) がオッズ更新ごとに同じ期待値を計算できるよう保存する
+        if '馬番' in edited_df.columns:
+            try:
+                from utils.alert import save_predictions
+                save_predictions(race_id, pd.to_numeric(edited_df['馬番'], errors='coerce').fillna(0).astype(int),
+                                 probs, factors=alert_factors, names=edited_df['馬名'],
+                                 race_name=race_name, venue=venue)
+            except Exception as e:
+                print(f"Failed to save alert predictions: {e}")
+
         # === AI期待度TOP5のグラフ（デフォルト表示） ===
         st.markdown("---")
         st.subheader("📊 AI評価 TOP5 分析")
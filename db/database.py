@@ -3,23 +3,31 @@ SQLiteデータベース管理
 CSVからの移行と高速クエリ機能
 """
 
-import sqlite3
-import pandas as pd
 import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scraper'))
+
+from storage import RESULTS_TABLE, get_storage
 
 
 class KeibaDatabase:
     """
-    競馬データベース管理クラス
+    競馬データベース管理クラス (race_results テーブル)
+
+    接続・SQL は共通ストレージ層 (scraper/storage.py) が扱う。
     """
 
     def __init__(self, db_path='dai_keiba.db'):
         self.db_path = db_path
+        self.storage = get_storage(db_path)
         self.conn = None
 
     def connect(self):
-        """データベースに接続"""
-        self.conn = sqlite3.connect(self.db_path)
+        """データベースに接続 (プール外の専用接続。close() で閉じる)"""
+        self.conn = self.storage.connect()
         return self.conn
 
     def close(self):
@@ -40,36 +48,16 @@ class KeibaDatabase:
             return False
 
         print(f"📥 Loading CSV: {csv_path}")
-        df = pd.read_csv(csv_path)
-
-        print(f"  Rows: {len(df)}, Columns: {len(df.columns)}")
-
-        # Connect
-        conn = self.connect()
 
-        # Create table
+        # Stream the CSV into a staging table, then swap it in with indexes
+        # (schema: storage.TABLES["results"])
         print("🔄 Migrating to SQLite...")
-        df.to_sql('race_results', conn, if_exists='replace', index=False)
-
-        # Create indexes for fast queries
-        print("🔍 Creating indexes...")
-        cursor = conn.cursor()
-
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_race_id ON race_results(race_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_horse_id ON race_results(horse_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_date ON race_results(日付)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_venue ON race_results(会場)')
-
-        if '馬名' in df.columns:
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_horse_name ON race_results(馬名)')
-
-        conn.commit()
+        chunks = pd.read_csv(csv_path, chunksize=50000)
+        result = self.storage.bulk_load(RESULTS_TABLE, chunks, how="replace")
 
         print("✅ Migration complete!")
         print(f"  Database: {self.db_path}")
-        print(f"  Table: race_results ({len(df)} rows)")
-
-        self.close()
+        print(f"  Table: race_results ({result['rows']} rows, {result['rows_per_sec']:,.0f} rows/s)")
 
         return True
 
@@ -83,14 +71,7 @@ class KeibaDatabase:
         Returns:
             DataFrame: レース結果
         """
-        conn = self.connect()
-
-        query = "SELECT * FROM race_results WHERE race_id = ?"
-        df = pd.read_sql_query(query, conn, params=(race_id,))
-
-        self.close()
-
-        return df
+        return self.storage.race_results(race_id)
 
     def query_horse_history(self, horse_id, limit=10):
         """
@@ -103,19 +84,7 @@ class KeibaDatabase:
         Returns:
             DataFrame: 過去走データ
         """
-        conn = self.connect()
-
-        query = """
-            SELECT * FROM race_results
-            WHERE horse_id = ?
-            ORDER BY 日付 DESC
-            LIMIT ?
-        """
-        df = pd.read_sql_query(query, conn, params=(horse_id, limit))
-
-        self.close()
-
-        return df
+        return self.storage.horse_results(horse_id, limit)
 
     def query_by_date_range(self, start_date, end_date):
         """
@@ -128,18 +97,7 @@ class KeibaDatabase:
         Returns:
             DataFrame: データ
         """
-        conn = self.connect()
-
-        query = """
-            SELECT * FROM race_results
-            WHERE 日付 BETWEEN ? AND ?
-            ORDER BY 日付 DESC
-        """
-        df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-
-        self.close()
-
-        return df
+        return self.storage.results_between(start_date, end_date)
 
     def query_by_venue(self, venue, limit=100):
         """
@@ -152,19 +110,7 @@ class KeibaDatabase:
         Returns:
             DataFrame: データ
         """
-        conn = self.connect()
-
-        query = """
-            SELECT * FROM race_results
-            WHERE 会場 = ?
-            ORDER BY 日付 DESC
-            LIMIT ?
-        """
-        df = pd.read_sql_query(query, conn, params=(venue, limit))
-
-        self.close()
-
-        return df
+        return self.storage.results_by_venue(venue, limit)
 
     def get_all_data(self):
         """
@@ -173,13 +119,7 @@ class KeibaDatabase:
         Returns:
             DataFrame: 全データ
         """
-        conn = self.connect()
-
-        df = pd.read_sql_query("SELECT * FROM race_results", conn)
-
-        self.close()
-
-        return df
+        return self.storage.all_results()
 
     def get_statistics(self):
         """
@@ -188,33 +128,7 @@ class KeibaDatabase:
         Returns:
             dict: 統計情報
         """
-        conn = self.connect()
-        cursor = conn.cursor()
-
-        # Total rows
-        cursor.execute("SELECT COUNT(*) FROM race_results")
-        total_rows = cursor.fetchone()[0]
-
-        # Unique races
-        cursor.execute("SELECT COUNT(DISTINCT race_id) FROM race_results")
-        unique_races = cursor.fetchone()[0]
-
-        # Unique horses
-        cursor.execute("SELECT COUNT(DISTINCT horse_id) FROM race_results")
-        unique_horses = cursor.fetchone()[0]
-
-        # Date range
-        cursor.execute("SELECT MIN(日付), MAX(日付) FROM race_results")
-        date_range = cursor.fetchone()
-
-        self.close()
-
-        return {
-            'total_rows': total_rows,
-            'unique_races': unique_races,
-            'unique_horses': unique_horses,
-            'date_range': date_range
-        }
+        return self.storage.results_stats()
 
 
 def migrate_csv_to_sqlite(csv_path, db_path='dai_keiba.db'):
@@ -1,6 +1,15 @@
 import pandas as pd
 import numpy as np
 
+# Column names used by the different databases (first match wins)
+ODDS_COLUMNS = ['odds', '単勝', '単勝 オッズ', '単勝オッズ']
+POPULARITY_COLUMNS = ['popularity', '人 気', '人気']
+# Horse number orders rows with the same popularity (ties), so results don't depend on row order
+HORSE_NUMBER_COLUMNS = ['馬 番', '馬番']
+METRIC_COLUMNS = ['odds_gap_1_2', 'odds_gap_2_3', 'odds_gap_3_4', 'odds_gap_4_5', 'odds_gap_5_6',
+                  'odds_std_1_2_3', 'odds_std_1_6']
+
+
 def calculate_hard_race_metrics(df):
     """
     Calculates metrics to identify 'hard' (predictable/firm) races based on odds distribution.
@@ -12,124 +21,53 @@ def calculate_hard_race_metrics(df):
     
     Args:
         df: DataFrame containing at least 'race_id', '単勝' (Odds), and '人 気' (Popularity).
-            If columns are named differently, they will be coerced.
+            Any name in ODDS_COLUMNS / POPULARITY_COLUMNS is accepted.
+            Rows with the same popularity are ordered by horse number (HORSE_NUMBER_COLUMNS),
+            then by row order; the last of them is used for that rank.
             
     Returns:
         DataFrame: One row per race_id with calculated metrics.
     """
     # 1. Preprocessing
     # Ensure necessary columns exist or map them
-    req_cols = ['race_id']
-    
-    # Odds column mapping
-    if 'odds' in df.columns:
-        odds_col = 'odds'
-    elif '単勝' in df.columns:
-        odds_col = '単勝'
-    elif '単勝 オッズ' in df.columns:
-        odds_col = '単勝 オッズ'
-    else:
-        # Cannot calculate without odds
-        return pd.DataFrame()
-
-    # Popularity column mapping
-    if 'popularity' in df.columns:
-        pop_col = 'popularity'
-    elif '人 気' in df.columns:
-        pop_col = '人 気'
-    else:
-        # Cannot calculate without popularity
+    odds_col = next((c for c in ODDS_COLUMNS if c in df.columns), None)
+    pop_col = next((c for c in POPULARITY_COLUMNS if c in df.columns), None)
+    num_col = next((c for c in HORSE_NUMBER_COLUMNS if c in df.columns), None)
+    if odds_col is None or pop_col is None:
+        # Cannot calculate without odds / popularity
         return pd.DataFrame()
 
     # Create working copy
-    work_df = df[['race_id', odds_col, pop_col]].copy()
-    
-    # Coerce numeric
-    work_df['odds_val'] = pd.to_numeric(work_df[odds_col], errors='coerce')
-    work_df['pop_val'] = pd.to_numeric(work_df[pop_col], errors='coerce')
-    
+    work_df = pd.DataFrame({
+        'race_id': df['race_id'].to_numpy(),
+        'odds_val': pd.to_numeric(df[odds_col], errors='coerce').to_numpy(),
+        'pop_val': pd.to_numeric(df[pop_col], errors='coerce').to_numpy(),
+        'num_val': pd.to_numeric(df[num_col], errors='coerce').to_numpy() if num_col else np.nan,
+    })
+
     # Drop invalid rows
     work_df.dropna(subset=['odds_val', 'pop_val'], inplace=True)
-    
-    # 2. Calculation per Race
-    results = []
-    
-    # Group by race_id
-    grouped = work_df.groupby('race_id')
-    
-    for race_id, group in grouped:
-        # Sort by popularity (ascending: 1, 2, 3...)
-        group = group.sort_values('pop_val')
-        
-        # Get odds for top 6
-        # We use 'pop_val' to ensure we get the actual 1st popular, 2nd popular etc.
-        # But sometimes popularity might be missing or duplicate. 
-        # Safety: Take top 6 sorted rows.
-        top_6 = group.head(6)
-        
-        # Need at least 2 horses for gap, 3 for std 1-2-3
-        if len(top_6) < 2:
-            continue
-            
-        metrics = {'race_id': race_id}
-        
-        # Extract odds values as list
-        # Ensure we have odds for rank 1, 2, 3, 4, 5, 6
-        # We can map pop_val to odds if strictly 1..6 exist
-        # Or just take position in sorted list as approximation if pop_val is messy
-        # Let's strictly use pop_val if possible, else positional
-        
-        odds_map = {}
-        for _, row in top_6.iterrows():
-            p = int(row['pop_val'])
-            o = row['odds_val']
-            odds_map[p] = o
-            
-        # Calculate Gaps
-        # 1-2
-        if 1 in odds_map and 2 in odds_map:
-            metrics['odds_gap_1_2'] = odds_map[2] - odds_map[1]
-        else:
-            metrics['odds_gap_1_2'] = np.nan
-            
-        # 2-3
-        if 2 in odds_map and 3 in odds_map:
-            metrics['odds_gap_2_3'] = odds_map[3] - odds_map[2]
-        else:
-            metrics['odds_gap_2_3'] = np.nan
-            
-        # 3-4
-        if 3 in odds_map and 4 in odds_map:
-            metrics['odds_gap_3_4'] = odds_map[4] - odds_map[3]
-        else:
-            metrics['odds_gap_3_4'] = np.nan
 
-        # 4-5
-        if 4 in odds_map and 5 in odds_map:
-            metrics['odds_gap_4_5'] = odds_map[5] - odds_map[4]
-        else:
-            metrics['odds_gap_4_5'] = np.nan
-            
-        # 5-6
-        if 5 in odds_map and 6 in odds_map:
-            metrics['odds_gap_5_6'] = odds_map[6] - odds_map[5]
-        else:
-            metrics['odds_gap_5_6'] = np.nan
-            
-        # Calculate Std Dev 1-2-3
-        top_3_odds = [odds_map[p] for p in [1, 2, 3] if p in odds_map]
-        if len(top_3_odds) >= 2: # Std dev needs at least 2? Ideally 3 for "1-2-3"
-             metrics['odds_std_1_2_3'] = np.std(top_3_odds, ddof=1) # Sample std dev
-        else:
-             metrics['odds_std_1_2_3'] = np.nan
-             
-        # Calculate Std Dev 1-6
-        top_6_odds = [odds_map[p] for p in range(1, 7) if p in odds_map]
-        if len(top_6_odds) >= 2:
-             metrics['odds_std_1_6'] = np.std(top_6_odds, ddof=1)
-        else:
-             metrics['odds_std_1_6'] = np.nan
+    # 2. Calculation per Race (vectorized over all races at once)
+    # Take the 6 most popular rows of each race; need at least 2 horses for a gap
+    work_df = work_df.sort_values(['race_id', 'pop_val', 'num_val'], kind='stable', na_position='last')
+    work_df = work_df[work_df.groupby('race_id').cumcount() < 6]
+    sizes = work_df.groupby('race_id').size()
+    races = sizes.index[sizes >= 2]
+    if races.empty:
+        return pd.DataFrame()
+
+    # Odds by actual popularity rank 1..6 (one column per rank, NaN where missing)
+    work_df['pop_int'] = work_df['pop_val'].astype(int)
+    ranked = work_df[work_df['pop_int'].between(1, 6)].drop_duplicates(['race_id', 'pop_int'], keep='last')
+    odds = ranked.pivot(index='race_id', columns='pop_int', values='odds_val')
+    odds = odds.reindex(index=races, columns=range(1, 7))
+
+    metrics = pd.DataFrame({'race_id': races})
+    for a in range(1, 6):
+        metrics[f'odds_gap_{a}_{a + 1}'] = (odds[a + 1] - odds[a]).to_numpy()
+    # Sample std dev (NaN when fewer than 2 ranks are present)
+    metrics['odds_std_1_2_3'] = odds[[1, 2, 3]].std(axis=1, ddof=1).to_numpy()
+    metrics['odds_std_1_6'] = odds.std(axis=1, ddof=1).to_numpy()
 
-        results.append(metrics)
-        
-    return pd.DataFrame(results)
+    return metrics
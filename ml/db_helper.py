@@ -7,11 +7,18 @@ Colab環境で生成したSQLiteデータベースを読み書きするための
 import sqlite3
 import pandas as pd
 import os
+import sys
 from typing import Optional, List, Dict, Any
 
+try:
+    from scraper.storage import get_storage
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scraper'))
+    from storage import get_storage
+
 
 class KeibaDatabase:
-    """競馬データベース管理クラス"""
+    """競馬データベース管理クラス (接続・SQL は共通ストレージ層 scraper/storage.py が扱う)"""
 
     def __init__(self, db_path: str = "keiba_data.db"):
         """
@@ -25,10 +32,11 @@ class KeibaDatabase:
                 f"データベースファイルが見つかりません: {db_path}\n"
                 "Google Colabで colab_data_pipeline.ipynb を実行してデータベースを作成してください。"
             )
+        self.storage = get_storage(db_path)
 
     def get_connection(self) -> sqlite3.Connection:
-        """データベース接続を取得"""
-        return sqlite3.connect(self.db_path)
+        """データベース接続を取得 (プール外の専用接続。呼び出し側で close() する)"""
+        return self.storage.connect()
 
     def get_processed_data(self, mode: str = "JRA", limit: Optional[int] = None) -> pd.DataFrame:
         """
@@ -41,17 +49,7 @@ class KeibaDatabase:
         Returns:
             処理済みデータのDataFrame
         """
-        table_name = f"processed_data_{mode.lower()}"
-
-        query = f"SELECT * FROM {table_name}"
-        if limit:
-            query += f" LIMIT {limit}"
-
-        conn = self.get_connection()
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-
-        return df
+        return self.storage.processed(mode, limit)
 
     def get_race_data(self, race_id: str, mode: str = "JRA") -> pd.DataFrame:
         """
@@ -64,15 +62,7 @@ class KeibaDatabase:
         Returns:
             レースデータのDataFrame
         """
-        table_name = f"processed_data_{mode.lower()}"
-
-        query = f"SELECT * FROM {table_name} WHERE race_id = ?"
-
-        conn = self.get_connection()
-        df = pd.read_sql_query(query, conn, params=(race_id,))
-        conn.close()
-
-        return df
+        return self.storage.processed_race(race_id, mode)
 
     def get_horse_history(self, horse_id: str, mode: str = "JRA", limit: int = 10) -> pd.DataFrame:
         """
@@ -86,20 +76,7 @@ class KeibaDatabase:
         Returns:
             馬の過去データのDataFrame
         """
-        table_name = f"processed_data_{mode.lower()}"
-
-        query = f"""
-            SELECT * FROM {table_name}
-            WHERE horse_id = ?
-            ORDER BY date DESC
-            LIMIT ?
-        """
-
-        conn = self.get_connection()
-        df = pd.read_sql_query(query, conn, params=(horse_id, limit))
-        conn.close()
-
-        return df
+        return self.storage.processed_horse(horse_id, mode, limit)
 
     def get_statistics(self, mode: str = "JRA") -> Dict[str, Any]:
         """
@@ -111,24 +88,7 @@ class KeibaDatabase:
         Returns:
             統計情報の辞書
         """
-        table_name = f"processed_data_{mode.lower()}"
-
-        query = f"""
-            SELECT
-                COUNT(*) as total_records,
-                COUNT(DISTINCT race_id) as unique_races,
-                COUNT(DISTINCT horse_id) as unique_horses,
-                MIN(date) as earliest_date,
-                MAX(date) as latest_date,
-                AVG(target_win) as win_rate
-            FROM {table_name}
-        """
-
-        conn = self.get_connection()
-        result = pd.read_sql_query(query, conn)
-        conn.close()
-
-        return result.iloc[0].to_dict()
+        return self.storage.processed_stats(mode)
 
     def get_feature_names(self, mode: str = "JRA") -> List[str]:
         """
@@ -140,15 +100,7 @@ class KeibaDatabase:
         Returns:
             列名のリスト
         """
-        table_name = f"processed_data_{mode.lower()}"
-
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [row[1] for row in cursor.fetchall()]
-        conn.close()
-
-        return columns
+        return self.storage.feature_names(mode)
 
     def get_latest_update(self, mode: str = "JRA") -> Optional[str]:
         """
@@ -160,15 +112,7 @@ class KeibaDatabase:
         Returns:
             最新データの日付（YYYY-MM-DD形式）
         """
-        table_name = f"processed_data_{mode.lower()}"
-
-        query = f"SELECT MAX(date) as latest_date FROM {table_name}"
-
-        conn = self.get_connection()
-        result = pd.read_sql_query(query, conn)
-        conn.close()
-
-        latest = result['latest_date'].iloc[0]
+        latest = self.storage.latest_date(mode)
         return latest if pd.notna(latest) else None
 
     def get_data_freshness(self, mode: str = "JRA") -> str:
@@ -219,38 +163,32 @@ class KeibaDatabase:
         Returns:
             クエリ結果のDataFrame
         """
-        conn = self.get_connection()
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
-        
-        return df
+        return self.storage.query(query, params)
 
-    def save_processed_data(self, df: pd.DataFrame, mode: str = "JRA"):
+    def save_processed_data(self, df: pd.DataFrame, mode: str = "JRA", how: str = "replace"):
         """
         処理済みデータを保存
         
         Args:
             df: 保存するDataFrame
             mode: "JRA" または "NAR"
+            how: "replace" (作り直す) / "upsert" (race_id, horse_id が同じ行だけ更新・追加)
         """
-        table_name = f"processed_data_{mode.lower()}"
-        conn = self.get_connection()
-        
-        # Save to SQL
-        df.to_sql(table_name, conn, if_exists='replace', index=False, chunksize=1000)
-        
-        # Create indices for speed
-        cursor = conn.cursor()
-        indices = ['race_id', 'horse_id', 'date']
-        for idx in indices:
-            try:
-                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{idx} ON {table_name}({idx})")
-            except Exception as e:
-                print(f"Index creation failed for {idx}: {e}")
-        
-        conn.commit()
-        conn.close()
+        self.storage.save_processed(df, mode, how)
 
+    def ingest_parquet(self, parquet_path: str, mode: str = "JRA", how: str = "upsert") -> Dict[str, Any]:
+        """
+        処理済みの Parquet をバッチで読みながら取り込む (テーブルは作り直さず upsert)
+
+        Args:
+            parquet_path: 処理済みデータの Parquet
+            mode: "JRA" または "NAR"
+            how: "upsert" / "replace" / "append"
+
+        Returns:
+            取り込み結果 (rows, seconds, rows_per_sec)
+        """
+        return self.storage.ingest_processed(parquet_path, mode, how)
 
 # 便利関数
 def get_training_data(mode: str = "JRA", db_path: str = "keiba_data.db") -> pd.DataFrame:
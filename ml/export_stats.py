@@ -10,30 +10,36 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(PROJECT_ROOT)
 
 from ml.feature_engineering import process_data
+from scraper import race_dataset
 
-def export_stats(mode="JRA", output_dir=None):
+def export_stats(mode="JRA", output_dir=None, start=None, end=None):
     """
     Load raw database, process features, and export statistical artifacts.
+    start / end restrict the stats window (only that slice is read from the partitioned dataset).
     """
     if output_dir is None:
         output_dir = os.path.join(PROJECT_ROOT, "ml", "models")
         
     os.makedirs(output_dir, exist_ok=True)
     
-    # Select DB
+    # Select DB (partitioned dataset / Parquet first, legacy CSV as fallback)
     if mode == "NAR":
         db_path = os.path.join(PROJECT_ROOT, "data", "raw", "database_nar.csv")
         suffix = "_nar"
     else:
         db_path = os.path.join(PROJECT_ROOT, "data", "raw", "database.csv")
         suffix = ""
-        
-    if not os.path.exists(db_path):
+    parquet_path = race_dataset.SOURCES[mode][0]
+
+    if race_dataset.exists(mode) or os.path.exists(parquet_path):
+        print(f"Loading {mode} database ({'partitioned dataset' if race_dataset.exists(mode) else parquet_path})...")
+        df = race_dataset.read(mode, start=start, end=end)
+    elif os.path.exists(db_path):
+        print(f"Loading {db_path}...")
+        df = pd.read_csv(db_path)
+    else:
         print(f"Error: Database not found at {db_path}")
         return False
-        
-    print(f"Loading {db_path}...")
-    df = pd.read_csv(db_path)
     
     print("Processing data and calculating stats...")
     # enable venue features for full stats availability
@@ -65,6 +71,8 @@ def export_stats(mode="JRA", output_dir=None):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--mode", type=str, default="JRA", help="JRA or NAR")
+    parser.add_argument("--start", help="First race date to include (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last race date to include (YYYY-MM-DD)")
     args = parser.parse_args()
     
-    export_stats(args.mode)
+    export_stats(args.mode, start=args.start, end=args.end)
@@ -35,6 +35,15 @@ except ImportError:
         VENUE_ANALYSIS_AVAILABLE = False
         print("Warning: venue_characteristics or run_style_analyzer not found.")
 
+# 血統ストア (data/pedigree.db) — レースデータ側で空の father / mother / bms を horse_id で埋める
+try:
+    from scraper.pedigree_store import join_pedigree
+except ImportError:
+    try:
+        from pedigree_store import join_pedigree
+    except ImportError:
+        join_pedigree = None
+
 def parse_time(t_str):
     if not isinstance(t_str, str):
         return np.nan
@@ -298,6 +307,10 @@ def process_data_v2(df, lambda_decay=0.2, use_venue_features=False, input_stats=
     Process Data V2 (Force Update)
     """
 
+    # 血統はレースデータに書き戻さず、ストアから結合する
+    if join_pedigree is not None and 'horse_id' in df.columns:
+        df = join_pedigree(df)
+
     # FIRST: Add history features
     df = add_history_features(df)
     
@@ -0,0 +1,367 @@
+"""
+レースデータベース (Parquet) の分析クエリ
+
+データベース全体をメモリに読み込まずに、必要な列・行だけを Parquet から直接取り出す。
+DuckDB があれば SQL で実行し (列の読み飛ばし・条件の押し下げ、レースごとの指標はウィンドウ関数で計算)、
+結果の行だけを DataFrame で返す。DuckDB がなければ pyarrow で必要な列だけを読み、pandas で同じ結果を作る。
+
+    lo, hi = date_bounds(path)                                  # 日付範囲 (フィルタUI用)
+    venues = distinct_values(path, venue_column(path))
+    df = hard_race_metrics(path, start=lo, end=hi, venues=["中山"])  # 堅いレースの指標 (1レース1行)
+    df = load_date_range(path, start, end, date_col="date")     # 期間の行だけ読む
+    total, df = preview(path, limit=1000)                       # 末尾の行 (行数はメタデータから)
+"""
+
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    from analysis_hard_race import (
+        HORSE_NUMBER_COLUMNS, METRIC_COLUMNS, ODDS_COLUMNS, POPULARITY_COLUMNS, calculate_hard_race_metrics,
+    )
+except ImportError:
+    from ml.analysis_hard_race import (
+        HORSE_NUMBER_COLUMNS, METRIC_COLUMNS, ODDS_COLUMNS, POPULARITY_COLUMNS, calculate_hard_race_metrics,
+    )
+
+
+DATE_COLUMNS = ['date', '日付']
+VENUE_COLUMNS = ['開催地', '会場', 'venue']
+RACE_NAME_COLUMNS = ['レース名', 'race_name']
+# 文字列の日付として受け付ける書式 (DuckDB の strptime 書式)
+DATE_FORMATS = ['%Y/%m/%d', '%Y-%m-%d', '%Y年%m月%d日']
+
+_local = threading.local()
+_root_conn = None
+_root_lock = threading.Lock()
+
+
+def available():
+    """DuckDB が使えるか"""
+    return duckdb is not None
+
+
+def _cursor():
+    """スレッドごとの DuckDB カーソル (接続は1つを共有する)"""
+    global _root_conn
+    cursor = getattr(_local, "cursor", None)
+    if cursor is None:
+        with _root_lock:
+            if _root_conn is None:
+                _root_conn = duckdb.connect()
+            cursor = _local.cursor = _root_conn.cursor()
+    return cursor
+
+
+def _schema(path):
+    import pyarrow.parquet as pq
+
+    return pq.read_schema(path)
+
+
+def _pick(path, candidates):
+    names = set(_schema(path).names)
+    return next((c for c in candidates if c in names), None)
+
+
+def venue_column(path):
+    """開催地の列名 (なければ None)"""
+    return _pick(path, VENUE_COLUMNS)
+
+
+def _ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _date_sql(path, column):
+    """日付列を TIMESTAMP にする SQL 式 (文字列は DATE_FORMATS の順に解釈する)"""
+    import pyarrow as pa
+
+    col = _ident(column)
+    dtype = _schema(path).field(column).type
+    if pa.types.is_timestamp(dtype) or pa.types.is_date(dtype):
+        return f"CAST({col} AS TIMESTAMP)"
+    parsed = [f"try_strptime(CAST({col} AS VARCHAR), '{fmt}')" for fmt in DATE_FORMATS]
+    parsed.append(f"TRY_CAST({col} AS TIMESTAMP)")
+    return f"COALESCE({', '.join(parsed)})"
+
+
+def _parse_dates(series):
+    """pandas 側の日付の解釈 (DuckDB がない場合)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if series.astype(str).str.contains('年', regex=False).any():
+        return pd.to_datetime(series, format='%Y年%m月%d日', errors='coerce')
+    return pd.to_datetime(series, errors='coerce')
+
+
+def _bounds(start, end):
+    """日付範囲の両端 (end はその日の終わりまで含める)"""
+    lo = pd.Timestamp(start) if start is not None else None
+    hi = pd.Timestamp(end) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1) if end is not None else None
+    return lo, hi
+
+
+def date_bounds(path, date_col=None):
+    """
+    日付列の最小・最大
+
+    Returns:
+        tuple: (最小, 最大) の pd.Timestamp (日付列がない・すべて欠損の場合は (None, None))
+    """
+    date_col = date_col or _pick(path, DATE_COLUMNS)
+    if date_col is None:
+        return None, None
+    if available():
+        expr = _date_sql(path, date_col)
+        lo, hi = _cursor().execute(f"SELECT MIN({expr}), MAX({expr}) FROM read_parquet(?)", [path]).fetchone()
+    else:
+        dates = _parse_dates(pd.read_parquet(path, columns=[date_col])[date_col])
+        lo, hi = dates.min(), dates.max()
+    if lo is None or pd.isna(lo):
+        return None, None
+    return pd.Timestamp(lo), pd.Timestamp(hi)
+
+
+def distinct_dates(path, date_col=None):
+    """日付列にある日 (新しい順、時刻は切り捨て)"""
+    date_col = date_col or _pick(path, DATE_COLUMNS)
+    if date_col is None:
+        return []
+    if available():
+        expr = _date_sql(path, date_col)
+        rows = _cursor().execute(
+            f"SELECT DISTINCT date_trunc('day', {expr}) AS d FROM read_parquet(?) WHERE d IS NOT NULL ORDER BY d DESC",
+            [path],
+        ).fetchall()
+        return [pd.Timestamp(r[0]) for r in rows]
+    dates = _parse_dates(pd.read_parquet(path, columns=[date_col])[date_col]).dt.normalize().dropna()
+    return [pd.Timestamp(d) for d in sorted(dates.unique(), reverse=True)]
+
+
+def distinct_values(path, column):
+    """列の値の一覧 (文字列、昇順)"""
+    if column is None:
+        return []
+    if available():
+        rows = _cursor().execute(
+            f"SELECT DISTINCT CAST({_ident(column)} AS VARCHAR) AS v FROM read_parquet(?) ORDER BY v", [path]
+        ).fetchall()
+        return [r[0] for r in rows if r[0] is not None]
+    return sorted(pd.read_parquet(path, columns=[column])[column].dropna().astype(str).unique())
+
+
+def hard_race_metrics(path, start=None, end=None, venues=None):
+    """
+    条件に合うレースの「堅さ」の指標 (analysis_hard_race.calculate_hard_race_metrics と同じ定義)
+
+    Args:
+        path: レースデータベース (Parquet)
+        start / end: 日付範囲 (両端を含む、省略可)
+        venues: 開催地のリスト (省略時はすべて)
+
+    Returns:
+        DataFrame: 1レース1行 (race_id, 指標列, 日付, 開催地, レース名)。1-2番人気のオッズ差が大きい順
+    """
+    odds_col = _pick(path, ODDS_COLUMNS)
+    pop_col = _pick(path, POPULARITY_COLUMNS)
+    if odds_col is None or pop_col is None:
+        return pd.DataFrame()
+    date_col = _pick(path, DATE_COLUMNS)
+    venue_col = venue_column(path)
+    name_col = _pick(path, RACE_NAME_COLUMNS)
+    num_col = _pick(path, HORSE_NUMBER_COLUMNS)
+    lo, hi = _bounds(start, end)
+
+    if not available():
+        return _hard_race_metrics_pandas(path, odds_col, pop_col, num_col, date_col, venue_col, name_col,
+                                         lo, hi, venues)
+
+    where, params = [], [path]
+    date_expr = _date_sql(path, date_col) if date_col else "NULL::TIMESTAMP"
+    if date_col and lo is not None:
+        where.append(f"{date_expr} >= ?")
+        params.append(lo.to_pydatetime())
+    if date_col and hi is not None:
+        where.append(f"{date_expr} <= ?")
+        params.append(hi.to_pydatetime())
+    if venues and venue_col:
+        where.append(f"CAST({_ident(venue_col)} AS VARCHAR) IN ({', '.join('?' * len(venues))})")
+        params.extend(str(v) for v in venues)
+    venue_expr = f"CAST({_ident(venue_col)} AS VARCHAR)" if venue_col else "NULL"
+    name_expr = f"CAST({_ident(name_col)} AS VARCHAR)" if name_col else "NULL"
+    num_expr = f"TRY_CAST({_ident(num_col)} AS DOUBLE)" if num_col else "NULL::DOUBLE"
+
+    odds_by_rank = ",\n".join(
+        f"MAX(odds_val) FILTER (WHERE pop_int = {k}) AS o{k}" for k in range(1, 7)
+    )
+    gaps = ",\n".join(f"o{k + 1} - o{k} AS odds_gap_{k}_{k + 1}" for k in range(1, 6))
+    sql = f"""
+        WITH base AS (
+            SELECT CAST(race_id AS VARCHAR) AS race_id, file_row_number AS row_idx,
+                   TRY_CAST({_ident(odds_col)} AS DOUBLE) AS odds_val,
+                   TRY_CAST({_ident(pop_col)} AS DOUBLE) AS pop_val, {num_expr} AS num_val,
+                   {date_expr} AS race_date, {venue_expr} AS venue, {name_expr} AS race_name
+            FROM read_parquet(?, file_row_number = true)
+            {"WHERE " + " AND ".join(where) if where else ""}
+        ),
+        -- 人気順の上位6行 (同じ人気が複数ある場合は馬番順・ファイルの行順に並べ、最後の行の値を使う)
+        ranked AS (
+            SELECT *, CAST(floor(pop_val) AS INTEGER) AS pop_int,
+                   ROW_NUMBER() OVER (PARTITION BY race_id ORDER BY pop_val, num_val NULLS LAST, row_idx) AS rn
+            FROM base
+            WHERE odds_val IS NOT NULL AND pop_val IS NOT NULL
+        ),
+        top6 AS (SELECT * FROM ranked WHERE rn <= 6),
+        sizes AS (SELECT race_id, COUNT(*) AS n FROM top6 GROUP BY race_id),
+        by_rank AS (
+            SELECT race_id, pop_int, arg_max(odds_val, rn) AS odds_val
+            FROM top6 WHERE pop_int BETWEEN 1 AND 6 GROUP BY race_id, pop_int
+        ),
+        per_race AS (
+            SELECT race_id,
+                   {odds_by_rank},
+                   stddev_samp(odds_val) FILTER (WHERE pop_int <= 3) AS odds_std_1_2_3,
+                   stddev_samp(odds_val) AS odds_std_1_6
+            FROM by_rank GROUP BY race_id
+        ),
+        meta AS (
+            SELECT race_id, arg_min(race_date, row_idx) AS race_date, arg_min(venue, row_idx) AS venue,
+                   arg_min(race_name, row_idx) AS race_name
+            FROM base GROUP BY race_id
+        )
+        SELECT s.race_id,
+               {gaps},
+               p.odds_std_1_2_3, p.odds_std_1_6,
+               m.race_date, m.venue, m.race_name
+        FROM sizes s JOIN meta m USING (race_id) LEFT JOIN per_race p USING (race_id)
+        WHERE s.n >= 2
+        ORDER BY odds_gap_1_2 DESC NULLS LAST, s.race_id
+    """
+    df = _cursor().execute(sql, params).df()
+    return _finish_metrics(df, date_col, venue_col, name_col)
+
+
+def _finish_metrics(df, date_col, venue_col, name_col):
+    """結果の列を画面の表示名に揃え、元の列がない情報は落とす"""
+    df = df.rename(columns={'race_date': '日付', 'venue': '開催地', 'race_name': 'レース名'})
+    drop = [c for c, src in (('日付', date_col), ('開催地', venue_col), ('レース名', name_col)) if src is None]
+    return df.drop(columns=drop).reset_index(drop=True)
+
+
+def _hard_race_metrics_pandas(path, odds_col, pop_col, num_col, date_col, venue_col, name_col, lo, hi, venues):
+    columns = ['race_id', odds_col, pop_col] + [c for c in (num_col, date_col, venue_col, name_col) if c]
+    filters = [(venue_col, 'in', [str(v) for v in venues])] if venues and venue_col else None
+    df = pd.read_parquet(path, columns=list(dict.fromkeys(columns)), filters=filters)
+    df['race_id'] = df['race_id'].astype(str)
+    if date_col:
+        df['race_date'] = _parse_dates(df[date_col])
+        if lo is not None:
+            df = df[df['race_date'] >= lo]
+        if hi is not None:
+            df = df[df['race_date'] <= hi]
+    if df.empty:
+        return pd.DataFrame()
+    metrics = calculate_hard_race_metrics(df)
+    if metrics.empty:
+        return metrics
+    meta = pd.DataFrame({'race_id': df['race_id']})
+    meta['race_date'] = df['race_date'] if date_col else None
+    meta['venue'] = df[venue_col].astype(str) if venue_col else None
+    meta['race_name'] = df[name_col].astype(str) if name_col else None
+    meta = meta.drop_duplicates(subset=['race_id'])
+    df = metrics.merge(meta, on='race_id', how='left')
+    df = df.sort_values(['odds_gap_1_2', 'race_id'], ascending=[False, True], na_position='last')
+    return _finish_metrics(df[['race_id'] + METRIC_COLUMNS + ['race_date', 'venue', 'race_name']],
+                           date_col, venue_col, name_col)
+
+
+def load_date_range(path, start=None, end=None, date_col=None, columns=None):
+    """
+    日付範囲の行だけを読む (日付列は datetime に変換済み)
+
+    Args:
+        path: Parquet
+        start / end: 日付範囲 (両端を含む、省略可)
+        date_col: 日付列 (省略時は date / 日付)
+        columns: 読む列 (省略時は全列)
+
+    Returns:
+        DataFrame
+    """
+    date_col = date_col or _pick(path, DATE_COLUMNS)
+    if date_col is None:
+        return pd.read_parquet(path, columns=columns)
+    names = _schema(path).names
+    columns = [c for c in (columns or names) if c in names]
+    if date_col not in columns:
+        columns = columns + [date_col]
+    lo, hi = _bounds(start, end)
+
+    if not available():
+        df = pd.read_parquet(path, columns=columns)
+        df[date_col] = _parse_dates(df[date_col])
+        if lo is not None:
+            df = df[df[date_col] >= lo]
+        if hi is not None:
+            df = df[df[date_col] <= hi]
+        return df.reset_index(drop=True)
+
+    expr = _date_sql(path, date_col)
+    select = ", ".join(f"{expr} AS {_ident(c)}" if c == date_col else _ident(c) for c in columns)
+    where, params = [], [path]
+    if lo is not None:
+        where.append(f"{expr} >= ?")
+        params.append(lo.to_pydatetime())
+    if hi is not None:
+        where.append(f"{expr} <= ?")
+        params.append(hi.to_pydatetime())
+    sql = f"SELECT {select} FROM read_parquet(?)" + (" WHERE " + " AND ".join(where) if where else "")
+    return _cursor().execute(sql, params).df()
+
+
+def read_columns(path, columns):
+    """指定した列のうちファイルにあるものだけを読む"""
+    names = _schema(path).names
+    return pd.read_parquet(path, columns=[c for c in columns if c in names])
+
+
+def preview(path, limit=1000, priority_columns=None):
+    """
+    末尾の limit 行 (ファイル末尾の行グループだけを読む)
+
+    Returns:
+        tuple: (総行数, DataFrame)。総行数は Parquet のメタデータから取る
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    total = parquet.metadata.num_rows
+    groups, rows = [], 0
+    for i in reversed(range(parquet.num_row_groups)):
+        groups.insert(0, i)
+        rows += parquet.metadata.row_group(i).num_rows
+        if rows >= limit:
+            break
+    if groups:
+        df = parquet.read_row_groups(groups).to_pandas().tail(limit)
+    else:
+        df = pa.table({n: [] for n in parquet.schema_arrow.names}).to_pandas()
+    if priority_columns:
+        first = [c for c in priority_columns if c in df.columns]
+        df = df[first + [c for c in df.columns if c not in first]]
+    return total, df
+
+
+def file_version(path):
+    """キャッシュのキーにするファイルの版 (更新時刻・大きさ)"""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
@@ -0,0 +1,137 @@
+"""
+非同期フェッチエンジン
+ホスト別トークンバケットの予算内で N 件のリクエストを並行実行し、
+HTMLの解析はワーカープールで行う (ダウンロードと解析を重ねて実行する)
+
+使い方:
+    async with AsyncFetcher(max_in_flight=8) as fetcher:
+        response = await fetcher.fetch(url)
+        df = await fetcher.parse(parse_func, response.text)
+
+同期コードからは run() でコルーチンを実行する。
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import http_client
+    import rate_limit
+    import response_cache
+except ImportError:
+    from . import http_client
+    from . import rate_limit
+    from . import response_cache
+
+
+class AsyncFetcher:
+    """
+    非同期フェッチャー
+
+    HTTP通信は共有Session (http_client) をI/Oスレッドで実行する。
+    aiohttp 等の追加依存は不要で、keep-alive・リトライ・文字コード処理も同期経路と共通。
+    """
+
+    def __init__(self, max_in_flight=8, parse_workers=None, use_processes=False):
+        """
+        Args:
+            max_in_flight: 同時に実行するリクエスト数の上限 (全ホスト合計)
+            parse_workers: 解析ワーカー数 (省略時はCPU数)
+            use_processes: True の場合は解析をプロセスプールで実行する (CPU並列)。
+                解析関数と引数・戻り値は pickle 可能である必要がある
+        """
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._io_pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="fetch")
+        workers = parse_workers or os.cpu_count() or 1
+        if use_processes:
+            self._parse_pool = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._parse_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parse")
+        self.stats = {"requests": 0, "errors": 0, "cache_hits": 0}
+
+    async def fetch(self, url, method="GET", **kwargs):
+        """
+        URLを取得する (ホストの予算を待ってから送信)
+
+        Args:
+            url: URL
+            method: "GET" / "POST"
+            **kwargs: http_client.request() の引数 (params, data, headers, timeout, encoding, cache)
+
+        Returns:
+            requests.Response
+        """
+        loop = asyncio.get_running_loop()
+        # キャッシュで応答できる場合はホストの予算を消費しない (オフライン再生モードでは cache=False でも)
+        if kwargs.get("cache", True) or response_cache.is_offline():
+            lookup = functools.partial(
+                http_client.cached_response, method, url,
+                kwargs.get("params"), kwargs.get("data"), kwargs.get("encoding"),
+            )
+            cached = await loop.run_in_executor(self._io_pool, lookup)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                return cached
+
+        # 予約を先に行い、待機中は同時実行枠を占有しない
+        await rate_limit.get_bucket(http_client.host_of(url)).acquire_async()
+        async with self._semaphore:
+            call = functools.partial(http_client.request, method, url, rate_limited=False, **kwargs)
+            try:
+                response = await loop.run_in_executor(self._io_pool, call)
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            self.stats["requests"] += 1
+            return response
+
+    async def parse(self, func, *args):
+        """解析関数をワーカープールで実行する"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._parse_pool, func, *args)
+
+    async def run_blocking(self, func, *args):
+        """同期I/Oを含む処理をI/Oスレッドで実行する (イベントループをブロックしない)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_pool, func, *args)
+
+    def close(self):
+        self._io_pool.shutdown(wait=True)
+        self._parse_pool.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def run(coro):
+    """
+    同期コードからコルーチンを実行する
+
+    実行中のイベントループがある環境 (Jupyter / Colab) では別スレッドの新しいループで実行する。
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    result = {}
+
+    def _target():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=_target)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result.get("value")
@@ -1,6 +1,6 @@
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
+import numpy as np
+import asyncio
 import io
 import time
 import re
@@ -8,16 +8,45 @@ from datetime import datetime, timedelta, date
 import os
 import sys
 import json # Added json import here
+import hashlib
 # Selenium usage removed
 SELENIUM_AVAILABLE = False
 
 try:
-    from jra_scraper import scrape_jra_race, scrape_jra_year
+    from jra_scraper import scrape_jra_race, scrape_jra_year, scrape_jra_year_async, enqueue_jra_months, jra_backfill_handlers
     from race_scraper import RaceScraper
+    import http_client
+    import rate_limit
+    from html_parse import make_soup, PAGE_FILTERS
+    from async_fetch import AsyncFetcher, run as run_async
+    from job_queue import JobQueue, drain_async, REOPEN_DAYS
+    from parquet_sink import ParquetSink
+    from name_resolver import NameResolver
+    from worker_pool import run_backfill_pool
+    from race_index import RaceIdSet, load_race_ids, present_mask
+    from pedigree_store import get_store as get_pedigree_store, clean_horse_ids
+    import odds_store
+    import race_dataset
+    import horse_history
+    from storage import get_storage
 except ImportError:
     # Try relative import if running as module
-    from .jra_scraper import scrape_jra_race, scrape_jra_year
+    from .jra_scraper import scrape_jra_race, scrape_jra_year, scrape_jra_year_async, enqueue_jra_months, jra_backfill_handlers
     from .race_scraper import RaceScraper
+    from . import http_client
+    from . import rate_limit
+    from .html_parse import make_soup, PAGE_FILTERS
+    from .async_fetch import AsyncFetcher, run as run_async
+    from .job_queue import JobQueue, drain_async, REOPEN_DAYS
+    from .parquet_sink import ParquetSink
+    from .name_resolver import NameResolver
+    from .worker_pool import run_backfill_pool
+    from .race_index import RaceIdSet, load_race_ids, present_mask
+    from .pedigree_store import get_store as get_pedigree_store, clean_horse_ids
+    from . import odds_store
+    from . import race_dataset
+    from . import horse_history
+    from .storage import get_storage
 
 
 # ==========================================
@@ -30,149 +59,87 @@ CSV_FILE_PATH = os.path.join(PROJECT_ROOT, "data", "raw", "database.parquet")
 CSV_FILE_PATH_NAR = os.path.join(PROJECT_ROOT, "data", "raw", "database_nar.parquet")
 TARGET_YEARS = [2024, 2025, 2026] # Expandable
 HORSE_HISTORY_CACHE = {} # Cache for horse history DataFrames
-HORSE_PROFILE_CACHE = {} # Cache for horse profile (pedigree)
+HORSE_PROFILE_CACHE = {} # Cache for horse profile (pedigree); backed by the pedigree store (data/pedigree.db)
 
-# Name Resolution Cache (for resolving abbreviated names via ID/URL)
-NAME_CACHE_FILE = os.path.join(PROJECT_ROOT, "data", "name_cache.json")
-NAME_CACHE = {}
-
-def load_name_cache():
-    global NAME_CACHE
-    if os.path.exists(NAME_CACHE_FILE):
-        try:
-            with open(NAME_CACHE_FILE, 'r', encoding='utf-8') as f:
-                NAME_CACHE = json.load(f)
-            print(f"DEBUG: Loaded Name Cache ({len(NAME_CACHE)} entries)")
-        except Exception as e:
-            print(f"DEBUG: Failed to load Name Cache: {e}")
-            NAME_CACHE = {}
-    else:
-        NAME_CACHE = {}
-
-def save_name_cache():
-    try:
-        with open(NAME_CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(NAME_CACHE, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"DEBUG: Failed to save Name Cache: {e}")
+# Name Resolution (for resolving abbreviated names via ID/URL)
+# Unseen jockey/trainer URLs are collected while a card is parsed and resolved
+# together afterwards; the cache lives in data/name_cache.db (see name_resolver).
+NAMES = NameResolver()
 
 def resolve_full_name(url, default_name):
     """
     Resolve full name from URL (e.g. jockey/trainer profile) if not in cache.
+    Fetches immediately; prefer NAMES.lookup() + NAMES.resolve_pending() when parsing a page.
     """
-    if not url: return default_name
-    
-    # Normalize URL (remove query params if any, ensure trailing slash?)
-    # Netkeiba URLs are usually clean.
-    if url in NAME_CACHE:
-        return NAME_CACHE[url]
-    
-    # Fetch and Parse
-    try:
-        # Avoid hammering
-        time.sleep(1.0) 
-        
-        headers = { 
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36" 
-        }
-        res = requests.get(url, headers=headers, timeout=5)
-        res.encoding = 'EUC-JP'
-        
-        if res.status_code == 200:
-            soup = BeautifulSoup(res.content, 'html.parser')
-            title = soup.title.string if soup.title else ""
-            
-            # Pattern: "Nameの[騎手|調教師][成績|プロフィール]..."
-            # e.g. "松山弘平の騎手成績...", "矢作芳人の調教師成績..."
-            full_name = default_name
-            if "の騎手" in title:
-                full_name = title.split("の騎手")[0]
-            elif "の調教師" in title:
-                full_name = title.split("の調教師")[0]
-            elif "のプロフィール" in title:
-                full_name = title.split("のプロフィール")[0]
-            
-            if full_name and full_name != default_name:
-                print(f"DEBUG: Resolved {default_name} -> {full_name}")
-                NAME_CACHE[url] = full_name
-                save_name_cache()
-                return full_name
-            else:
-                # Cache negative result? Or verify extraction?
-                # If extraction fails, we might just store default to avoid re-fetching
-                NAME_CACHE[url] = default_name
-                save_name_cache()
-                return default_name
-    except Exception as e:
-        print(f"DEBUG: Resolution failed for {url}: {e}")
-    
-    return default_name
+    return NAMES.resolve(url, default_name)
 
-# Initialize Cache on Module Load
-# json = __import__('json') # Ensure json imported - moved to top-level
-load_name_cache()
+def _load_stored_profiles(hids):
+    """
+    Moves pedigrees already in the pedigree store into HORSE_PROFILE_CACHE (no request).
+    Pedigrees never change, so a horse stored once is never fetched again.
+    """
+    missing = [hid for hid in hids if hid not in HORSE_PROFILE_CACHE]
+    if missing:
+        HORSE_PROFILE_CACHE.update(get_pedigree_store().get_many(missing))
+
+def _remember_profile(hid, profile):
+    """Caches a fetched pedigree in memory and in the pedigree store."""
+    HORSE_PROFILE_CACHE[hid] = profile
+    if profile:
+        get_pedigree_store().put_many({hid: profile})
+
+def _horse_profile(hid, scraper):
+    """Pedigree from HORSE_PROFILE_CACHE, then the pedigree store, then db.netkeiba.com."""
+    if hid not in HORSE_PROFILE_CACHE:
+        _load_stored_profiles([hid])
+    if hid in HORSE_PROFILE_CACHE:
+        return HORSE_PROFILE_CACHE[hid]
+    profile = scraper.get_horse_profile(hid)
+    _remember_profile(hid, profile)
+    return profile
 
 # ==========================================
 # ユーティリティ関数: 既存race_idの取得
 # ==========================================
 def get_existing_race_ids(mode="JRA", db_path=None, csv_path=None):
     """
-    既存のrace_idを取得（SQLiteまたはCSVから）
+    既存のrace_idを取得（SQLiteまたはParquetのrace_id索引から）
 
     Args:
         mode: "JRA" または "NAR"
         db_path: SQLiteデータベースのパス（優先）
-        csv_path: CSVファイルのパス（フォールバック）
+        csv_path: Parquetファイルのパス（フォールバック、race_index の索引を使う）
 
     Returns:
-        set: 既存のrace_idのセット
+        RaceIdSet: 既存のrace_id (`rid in ids` で判定、present_mask() で一括判定)
     """
-    existing_ids = set()
+    existing_ids = RaceIdSet()
 
     # SQLiteから取得を試みる
     if db_path and os.path.exists(db_path):
         try:
-            import sqlite3
-            conn = sqlite3.connect(db_path)
-            table_name = f"processed_data_{mode.lower()}"
-
-            # テーブルの存在確認
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
-                (table_name,)
-            )
-
-            if cursor.fetchone():
-                query = f"SELECT DISTINCT race_id FROM {table_name}"
-                df = pd.read_sql_query(query, conn)
-                existing_ids = set(df['race_id'].astype(str))
-                print(f"✅ SQLiteから既存race_id取得: {len(existing_ids)}件")
-            else:
-                print(f"⚠️ テーブル '{table_name}' が見つかりません")
-
-            conn.close()
+            existing_ids = RaceIdSet.from_strings(get_storage(db_path).race_ids(mode))
+            print(f"✅ SQLiteから既存race_id取得: {len(existing_ids)}件")
+            return existing_ids
+        except LookupError as e:
+            print(f"⚠️ {e}")
             return existing_ids
         except Exception as e:
             print(f"⚠️ SQLiteからの取得に失敗: {e}")
             print("   CSVファイルから取得を試みます...")
 
-    # CSVから取得（フォールバック）
+    # Parquetの索引から取得（フォールバック）
     if csv_path is None:
         csv_path = CSV_FILE_PATH_NAR if mode == "NAR" else CSV_FILE_PATH
 
-    if os.path.exists(csv_path):
-        try:
-            df = pd.read_csv(csv_path)
-            if 'race_id' in df.columns:
-                existing_ids = set(df['race_id'].astype(str))
-                print(f"✅ CSVから既存race_id取得: {len(existing_ids)}件")
-            else:
-                print(f"⚠️ CSVに'race_id'カラムが見つかりません")
-        except Exception as e:
-            print(f"⚠️ CSVからの取得に失敗: {e}")
-    else:
-        print(f"ℹ️ 既存データが見つかりません（初回スクレイピング）")
+    try:
+        existing_ids = load_race_ids(csv_path)
+        if existing_ids:
+            print(f"✅ race_id索引から既存race_id取得: {len(existing_ids)}件")
+        else:
+            print(f"ℹ️ 既存データが見つかりません（初回スクレイピング）")
+    except Exception as e:
+        print(f"⚠️ race_id索引の読み込みに失敗: {e}")
 
     return existing_ids
 
@@ -184,7 +151,7 @@ def find_missing_races(start_date, end_date, existing_race_ids, mode="JRA"):
     Args:
         start_date: 開始日（datetime.date or datetime）
         end_date: 終了日（datetime.date or datetime）
-        existing_race_ids: 既存のrace_idのセット
+        existing_race_ids: 既存のrace_id (RaceIdSet または set)
         mode: "JRA" または "NAR"
 
     Returns:
@@ -203,57 +170,35 @@ def find_missing_races(start_date, end_date, existing_race_ids, mode="JRA"):
     if isinstance(end_date, datetime):
         end_date = end_date.date()
 
-    # 既存race_idから日付パターンを抽出
-    # race_id format: YYYYMMDDKKPPRRNN (例: 2024112303051201)
-    # YYYY: 年, MM: 月, DD: 日, KK: 開催, PP: 場所, RR: レース番号, NN: 不明
-
-    existing_dates = set()
-    existing_dates_by_year = {}  # 年度別の既存日付
-
-    for race_id in existing_race_ids:
-        if len(race_id) >= 8:
-            try:
-                date_str = race_id[:8]  # YYYYMMDD
-                race_date = datetime.strptime(date_str, "%Y%m%d").date()
-                if start_date <= race_date <= end_date:
-                    existing_dates.add(race_date)
-
-                    # 年度別にグループ化
-                    year = race_date.year
-                    if year not in existing_dates_by_year:
-                        existing_dates_by_year[year] = set()
-                    existing_dates_by_year[year].add(race_date)
-            except:
-                pass
-
-    # 全期間の日数
-    total_days = (end_date - start_date).days + 1
+    # 既存レースの開催日
+    # race_id 索引 (RaceIdSet.dates) があればデータの日付列から作った開催日を使う。
+    # ない場合は race_id の先頭8桁を YYYYMMDD とみなす (従来の判定)
+    start64 = np.datetime64(start_date, 'D')
+    end64 = np.datetime64(end_date, 'D')
+    race_dates = getattr(existing_race_ids, 'dates', None)
+    if race_dates is None:
+        prefixes = pd.Series([str(rid)[:8] for rid in existing_race_ids], dtype=object)
+        race_dates = pd.to_datetime(prefixes, format="%Y%m%d", errors="coerce").dropna().to_numpy().astype('datetime64[D]')
+    race_dates = np.unique(race_dates)
+    race_dates = race_dates[(race_dates >= start64) & (race_dates <= end64)]
+    existing_dates = set(pd.DatetimeIndex(race_dates).date)
+
+    # 全期間の日数と週末 (土曜日=5, 日曜日=6)
+    all_days = pd.date_range(start_date, end_date, freq='D')
+    total_days = len(all_days)
+    weekends = all_days[all_days.weekday >= 5]
+    weekend_days = len(weekends)
 
     # 年度別の統計情報を計算
     yearly_coverage = {}
-    target_years = range(start_date.year, end_date.year + 1)
-
-    for year in target_years:
-        # その年の範囲を決定
-        year_start = date(year, 1, 1)
-        year_end = date(year, 12, 31)
-
+    date_years = pd.DatetimeIndex(race_dates).year
+    for year in range(start_date.year, end_date.year + 1):
         # 期間との重なりを考慮
-        actual_start = max(year_start, start_date)
-        actual_end = min(year_end, end_date)
-
-        # その年の週末日数をカウント
-        year_weekends = 0
-        current = actual_start
-        while current <= actual_end:
-            if current.weekday() in [5, 6]:
-                year_weekends += 1
-            current = current + timedelta(days=1)
-
-        # その年の既存レース日数
-        year_existing = len(existing_dates_by_year.get(year, set()))
+        actual_start = max(date(year, 1, 1), start_date)
+        actual_end = min(date(year, 12, 31), end_date)
 
-        # カバレッジ率
+        year_weekends = int((weekends.year == year).sum())
+        year_existing = int((date_years == year).sum())
         coverage = year_existing / year_weekends if year_weekends > 0 else 0
 
         yearly_coverage[year] = {
@@ -268,22 +213,9 @@ def find_missing_races(start_date, end_date, existing_race_ids, mode="JRA"):
     missing_years = [year for year, info in yearly_coverage.items()
                      if info['coverage_rate'] == 0 and info['weekend_days'] > 0]
 
-    # 土日の日数を概算（レースは主に週末）
-    weekend_days = 0
-    current = start_date
-    while current <= end_date:
-        if current.weekday() in [5, 6]:  # 土曜日=5, 日曜日=6
-            weekend_days += 1
-        current += timedelta(days=1)
-
     # 欠落している可能性のある週末を検出
-    missing_dates = []
-    current = start_date
-    while current <= end_date:
-        if current.weekday() in [5, 6]:  # 週末のみチェック
-            if current not in existing_dates:
-                missing_dates.append(current)
-        current += timedelta(days=1)
+    weekend_dates = weekends.to_numpy().astype('datetime64[D]')
+    missing_dates = list(pd.DatetimeIndex(weekend_dates[~np.isin(weekend_dates, race_dates)]).date)
 
     result = {
         'total_days': total_days,
@@ -301,326 +233,404 @@ def find_missing_races(start_date, end_date, existing_race_ids, mode="JRA"):
 # ==========================================
 # 1. レース詳細データを取得する関数
 # ==========================================
+def parse_race_result(html, race_id):
+    """
+    result.html (All_Result_Table) を解析してDataFrameを返す (過去走・血統の付与前)
+    テーブルがない場合は None
+    """
+    soup = make_soup(html, PAGE_FILTERS["race_result"])
+
+    target_table = soup.find("table", id="All_Result_Table")
+    if not target_table:
+        return None
+
+    # --- メタデータ抽出 ---
+    # 日付
+    date_text = ""
+    title_text = soup.title.text if soup.title else ""
+    match = re.search(r'(\d{4}年\d{1,2}月\d{1,2}日)', title_text)
+    if match:
+        date_text = match.group(1)
+
+    # 会場
+    venue_elem = soup.select_one(".RaceKaisaiWrap .Active")
+    venue_text = venue_elem.text.strip() if venue_elem else ""
+
+    # レース番号・名
+    race_num_elem = soup.select_one(".RaceNum")
+    race_num_text = race_num_elem.text.strip().replace("\n", "") if race_num_elem else ""
+    
+    race_name_elem = soup.select_one(".RaceName")
+    race_name_text = race_name_elem.text.strip().replace("\n", "") if race_name_elem else ""
+
+    # 重賞グレード
+    grade_text = ""
+    if soup.select_one(".Icon_GradeType1"): grade_text = "G1"
+    elif soup.select_one(".Icon_GradeType2"): grade_text = "G2"
+    elif soup.select_one(".Icon_GradeType3"): grade_text = "G3"
+
+    # --- コース情報抽出 (RaceData01) ---
+    # Format: "14:15発走 / ダ1200m (左) / 天候:小雨 / 馬場:良"
+    surface_type = ""
+    distance = ""
+    rotation = ""
+    weather = ""
+    condition = ""
+
+    racedata1 = soup.select_one(".RaceData01")
+    if racedata1:
+        raw_text = racedata1.text.replace("\n", "").strip()
+        
+        # Surface & Distance & Rotation
+        # Matches: 芝1600m or 芝2000m (右) or ダ1200m (左)
+        # Regex: (芝|ダ|障)(\d+)m(?:\s*\((.*?)\))?
+        
+        match_course = re.search(r'(芝|ダ|障)(\d+)m(?:\s*\((.*?)\))?', raw_text)
+        if match_course:
+            surface_type = match_course.group(1) # 芝/ダ
+            distance = match_course.group(2)     # 2000
+            rotation = match_course.group(3) if match_course.group(3) else "直線" if "直線" in raw_text else ""
+        
+        # Weather
+        match_weather = re.search(r'天候:(\S+)', raw_text)
+        if match_weather:
+            weather = match_weather.group(1)
+        
+        # Condition
+        match_cond = re.search(r'馬場:(\S+)', raw_text)
+        if match_cond:
+            condition = match_cond.group(1)
+
+        # Debug check
+        # print(f"Parsed: {surface_type} {distance}m {rotation} En:{weather} Cond:{condition}")
+
+    # --- データフレーム化 ---
+    dfs = pd.read_html(io.StringIO(str(target_table)))
+    if len(dfs) == 0:
+        return None
+    df = dfs[0]
+    df = df.replace(r'\n', '', regex=True)
+    
+    # Column Normalization
+    # Replace newlines in columns
+    df.columns = df.columns.astype(str).str.replace(r'\n', '', regex=True).str.replace(r'\s+', '', regex=True)
+    
+    # Map known columns to database.csv standard
+    # Expected DB: 着順, 枠, 馬番, 馬名, 性齢, 斤量, 騎手, タイム, 着差, 人気, 単勝オッズ, 後3F, ...
+    # Actual from read_html might be: 着順, 枠番, 馬番, 馬名, 性齢, 斤量, 騎手, タイム, 着差, 人気, 単勝, 後3F...
+    
+    rename_map = {
+        '枠番': '枠',
+        '枠': '枠',
+        '馬番': '馬 番', # DB has space? Check debug output or CSV header.
+        # CSV Header: 着 順,枠,馬 番,馬名,性齢,斤量,騎手,タイム,着差,人 気,単勝 オッズ,後3F
+        '馬名': '馬名',
+        '単勝': '単勝 オッズ',
+        '単勝オッズ': '単勝 オッズ',
+        'オッズ': '単勝 オッズ',
+        '人気': '人 気',
+        '着順': '着 順',
+        '上り': '後3F'
+    }
+    df.rename(columns=rename_map, inplace=True)
+    
+    # Ensure Odds is numeric
+    if '単勝 オッズ' in df.columns:
+         df['単勝 オッズ'] = pd.to_numeric(df['単勝 オッズ'], errors='coerce').fillna(0.0) 
+    
+    # Warning if mismatch
+    # print("Columns after rename:", df.columns)
+
+    # 列追加 (既に存在する場合はスキップまたは上書き)
+    meta_cols = [
+        ("日付", date_text), ("会場", venue_text), ("レース番号", race_num_text),
+        ("レース名", race_name_text), ("重賞", grade_text), ("コースタイプ", surface_type),
+        ("距離", distance), ("回り", rotation), ("天候", weather), ("馬場状態", condition)
+    ]
+    
+    # 挿入位置(0から順に)
+    # insertを使うと既存列は右にずれるため、0番目に順次追加する場合、
+    # 逆順に入れるか、インデックスをずらすか。
+    # 元のコード: df.insert(0, ...), df.insert(1, ...) 
+    # これは 0に入れた後、次のinsert(1)は「新0番目の次」に入れる。つまり先頭から順に並ぶ。
+    
+    for i, (col, val) in enumerate(meta_cols):
+        if col not in df.columns:
+            df.insert(i, col, val)
+        else:
+            df[col] = val
+    
+    # Additional Bloodline Columns (Empty init)
+    df["father"] = ""
+    df["mother"] = ""
+    df["bms"] = ""
+    
+    # Split Stable and Trainer
+    # 厩舎 column in read_html result often contains mixed content like "北海道田中淳司"
+    # We need to separate them.
+    
+    # First, check if '厩舎' exists in columns
+    if '厩舎' in df.columns:
+        # Apply separation logic
+        # Regex to split known stable names vs trainer names
+        # NAR Stables: 北海道, 岩手, 浦和, 船橋, 大井, 川崎, 金沢, 笠松, 愛知, 兵庫, 高知, 佐賀
+        # Also: JRA (during exchange races) -> 美浦, 栗東
+        
+        def split_stable_trainer(text):
+            if not isinstance(text, str): return text, ""
+            text = text.strip()
+            # Common affiliates
+            affiliates = ["北海道", "岩手", "水沢", "盛岡", "浦和", "船橋", "大井", "川崎", 
+                          "金沢", "笠松", "愛知", "名古屋", "兵庫", "園田", "姫路", "高知", "佐賀",
+                          "美浦", "栗東", "JRA", "地方", "海外"]
+            
+            stable_part = ""
+            trainer_part = text
+            
+            # Try to match start
+            for aff in affiliates:
+                if text.startswith(aff):
+                    stable_part = aff
+                    trainer_part = text[len(aff):].strip()
+                    return stable_part, trainer_part
+                    
+            # If no match but text exists, maybe it's just trainer name (rare) 
+            # or stable name is unknown.
+            # Fallback: Assume no stable prefix if not found? 
+            # Or heuristic: first 2-3 chars?
+            # Let's keep it as is if no match found, put all in Trainer?
+            # Or put all in Stable? 
+            # Usually "北海道田中" -> Stable=北海道, Trainer=田中
+            return "", text
+
+        # Apply
+        def apply_split(row):
+            s, t = split_stable_trainer(row['厩舎'])
+            return pd.Series([s, t])
+
+        df[['厩舎', '調教師']] = df.apply(apply_split, axis=1)
+    else:
+        # '厩舎' column might be named differently ('調教師'?) in source table?
+        # If '調教師' exists but '厩舎' doesn't, maybe it's already separated or just trainer?
+        if '調教師' in df.columns:
+             # Copy to trainer, leave stable empty?
+             pass
+        else:
+             df['厩舎'] = ""
+             df['調教師'] = ""
+    
+    df["race_id"] = race_id # IDも保存 (末尾に追加されることが多いが明示的に)
+    
+    # 不要な列が含まれることがあるので整理しても良いが、
+    # ユーザー要望は「蓄積」なので、基本はそのまま保持する
+    
+    # Extract Horse IDs via Name Mapping (Robust)
+    horse_name_map = {}
+    for tr in target_table.find_all("tr"):
+        a_tag = tr.select_one(".Horse_Name a")
+        if a_tag:
+            h_name = a_tag.text.strip().replace("\n", "")
+            href = a_tag.get('href')
+            hid_match = re.search(r'/horse/(\d+)', href)
+            if hid_match:
+                horse_name_map[h_name] = hid_match.group(1)
+    
+    
+    # Apply to DF (Mapping by Name)
+    # Ensure df['馬名'] is clean matches key
+    if '馬名' in df.columns:
+        df['horse_id'] = df['馬名'].map(horse_name_map).fillna("")
+    else:
+        df['horse_id'] = ""
+        
+    # If mapping largely failed (e.g. name mismatch), warn
+    if len(df) > 0 and (df['horse_id'] == "").sum() > len(df) * 0.5:
+         print(f"Warning: High ID miss rate for {race_id}. Names might differ.")
+         # Fallback: Try strict index alignment if map failed? 
+         # But map is usually safer.
+         # Debug:
+         # print("DF Names:", df['馬名'].unique())
+         # print("Map Keys:", list(horse_name_map.keys()))
+
+    return df
+
+
+def _enrich_race_result(df, scraper):
+    """
+    parse_race_result の結果に過去走 (past_N_*) と血統を付与する
+    HORSE_HISTORY_CACHE / HORSE_PROFILE_CACHE にない馬のみ取得する
+    """
+    date_text = df['日付'].iloc[0] if len(df) > 0 else ""
+    # Enrich with Past Data
+    # This is slow, so we only do it if we successfully got IDs
+    # Parse Race Date for filtering
+    try:
+        current_race_date = datetime.strptime(date_text, '%Y年%m月%d日')
+    except:
+        current_race_date = datetime.now()
+    
+    print(f"  Enriching {len(df)} horses with past data...")
+    if 'horse_id' in df.columns:
+        _load_stored_profiles([h for h in clean_horse_ids(df['horse_id']) if h.isdigit()])
+    
+    past_columns = []
+    # Prepare new columns
+    # Added: last_3f, horse_weight, jockey, weight_carried, condition, odds, weather, distance, course_type
+    p_fields = ['date', 'rank', 'time', 'run_style', 'race_name', 'last_3f', 'horse_weight', 'jockey', 'condition', 'odds', 'weather', 'distance', 'course_type']
+    
+    for i in range(1, 6):
+        for f in p_fields:
+            past_columns.append(f"past_{i}_{f}")
+    
+    # Pre-fill empty
+    for col in past_columns:
+        df[col] = None
+
+    for idx, row in df.iterrows():
+        hid = row.get('horse_id')
+        # Clean .0 if present
+        hid = str(hid).replace('.0', '') if hid else None
+        
+        if hid and str(hid).isdigit():
+            # Use Cache to avoid repeated requests
+            global HORSE_HISTORY_CACHE
+            if hid in HORSE_HISTORY_CACHE:
+                past_df = HORSE_HISTORY_CACHE[hid].copy()
+            else:
+                past_df = scraper.get_past_races(hid, n_samples=None) # Fetch ALL
+                HORSE_HISTORY_CACHE[hid] = past_df
+                past_df = past_df.copy()
+            
+            # --- Fetch Bloodline Data (pedigree store first) ---
+            profile_data = _horse_profile(hid, scraper)
+            
+            if profile_data:
+                df.at[idx, 'father'] = profile_data.get('father', '')
+                df.at[idx, 'mother'] = profile_data.get('mother', '')
+                df.at[idx, 'bms'] = profile_data.get('bms', '')
+                
+            # past_df = scraper.get_past_races(hid, n_samples=20) # Old method
+            
+            if not past_df.empty:
+            
+
+                 # Filter: Date < current_race_date
+                 if 'date' in past_df.columns: # Changed from date_obj or 日付
+                    if 'date_obj' not in past_df.columns and 'date' in past_df.columns:
+                        past_df['date_obj'] = pd.to_datetime(past_df['date'], format='%Y/%m/%d', errors='coerce')
+                    
+                    if 'date_obj' in past_df.columns:
+                        past_df = past_df[past_df['date_obj'] < current_race_date]
+                 
+                 # Take top 5
+                 past_df = past_df.head(5)
+                 
+                 # Assign to columns
+                 for i, (p_idx, p_row) in enumerate(past_df.iterrows()):
+                     if i >= 5: break
+                     n = i + 1
+                     # p_row keys are now English from race_scraper
+                     df.at[idx, f"past_{n}_date"] = p_row.get('date')
+                     df.at[idx, f"past_{n}_rank"] = p_row.get('rank')
+                     df.at[idx, f"past_{n}_time"] = p_row.get('time')
+                     df.at[idx, f"past_{n}_run_style"] = p_row.get('run_style')
+                     df.at[idx, f"past_{n}_race_name"] = p_row.get('race_name')
+                     df.at[idx, f"past_{n}_last_3f"] = p_row.get('last_3f')
+                     df.at[idx, f"past_{n}_horse_weight"] = p_row.get('horse_weight')
+                     df.at[idx, f"past_{n}_jockey"] = p_row.get('jockey')
+                     df.at[idx, f"past_{n}_condition"] = p_row.get('condition')
+                     df.at[idx, f"past_{n}_weather"] = p_row.get('weather')
+                     df.at[idx, f"past_{n}_distance"] = p_row.get('distance')
+                     df.at[idx, f"past_{n}_course_type"] = p_row.get('course_type')
+
+    get_pedigree_store().flush()
+
+
+def _uncached_horse_ids(df):
+    """Horse IDs in df whose history or profile is not cached yet (pedigree store hits count as cached)."""
+    hids = []
+    if 'horse_id' not in df.columns:
+        return hids
+    for hid in df['horse_id']:
+        hid = str(hid).replace('.0', '') if hid else None
+        if hid and hid.isdigit():
+            hids.append(hid)
+    hids = list(dict.fromkeys(hids))
+    _load_stored_profiles(hids)
+    return [hid for hid in hids if hid not in HORSE_HISTORY_CACHE or hid not in HORSE_PROFILE_CACHE]
+
+
+async def _prefetch_horses_async(hids, scraper, fetcher):
+    """
+    Fetches history and pedigree for all given horses concurrently (within the host budget)
+    and stores them in HORSE_HISTORY_CACHE / HORSE_PROFILE_CACHE.
+    """
+    async def _history(hid):
+        if hid not in HORSE_HISTORY_CACHE:
+            HORSE_HISTORY_CACHE[hid] = await scraper.get_past_races_async(hid, fetcher, n_samples=None)
+
+    async def _profile(hid):
+        if hid not in HORSE_PROFILE_CACHE:
+            _remember_profile(hid, await scraper.get_horse_profile_async(hid, fetcher))
+
+    _load_stored_profiles(hids)
+    tasks = []
+    for hid in hids:
+        tasks.append(_history(hid))
+        tasks.append(_profile(hid))
+    await asyncio.gather(*tasks)
+
+
 def scrape_race_data(race_id, mode="JRA"):
     base_domain = "nar.netkeiba.com" if mode == "NAR" else "race.netkeiba.com"
     url = f"https://{base_domain}/race/result.html?race_id={race_id}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36" 
-    }
     
     # Initialize Scraper
     scraper = RaceScraper()
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_client.get(url)
         
         if response.status_code != 200:
             return None
         
-        response.encoding = response.apparent_encoding
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        target_table = soup.find("table", id="All_Result_Table")
-        if not target_table:
+        df = parse_race_result(response.text, race_id)
+        if df is None:
             return None
 
-        # --- メタデータ抽出 ---
-        # 日付
-        date_text = ""
-        title_text = soup.title.text if soup.title else ""
-        match = re.search(r'(\d{4}年\d{1,2}月\d{1,2}日)', title_text)
-        if match:
-            date_text = match.group(1)
-
-        # 会場
-        venue_elem = soup.select_one(".RaceKaisaiWrap .Active")
-        venue_text = venue_elem.text.strip() if venue_elem else ""
+        _enrich_race_result(df, scraper)
+        return df
 
-        # レース番号・名
-        race_num_elem = soup.select_one(".RaceNum")
-        race_num_text = race_num_elem.text.strip().replace("\n", "") if race_num_elem else ""
-        
-        race_name_elem = soup.select_one(".RaceName")
-        race_name_text = race_name_elem.text.strip().replace("\n", "") if race_name_elem else ""
+    except Exception as e:
+        print(f"Error scraping {race_id}: {e}")
+        return None
 
-        # 重賞グレード
-        grade_text = ""
-        if soup.select_one(".Icon_GradeType1"): grade_text = "G1"
-        elif soup.select_one(".Icon_GradeType2"): grade_text = "G2"
-        elif soup.select_one(".Icon_GradeType3"): grade_text = "G3"
 
-        # --- コース情報抽出 (RaceData01) ---
-        # Format: "14:15発走 / ダ1200m (左) / 天候:小雨 / 馬場:良"
-        surface_type = ""
-        distance = ""
-        rotation = ""
-        weather = ""
-        condition = ""
+async def scrape_race_data_async(race_id, fetcher, mode="JRA"):
+    """
+    Async counterpart of scrape_race_data.
+    The result page is parsed in the fetcher's worker pool, and the histories/pedigrees
+    of all horses are downloaded concurrently before enrichment.
+    """
+    base_domain = "nar.netkeiba.com" if mode == "NAR" else "race.netkeiba.com"
+    url = f"https://{base_domain}/race/result.html?race_id={race_id}"
 
-        racedata1 = soup.select_one(".RaceData01")
-        if racedata1:
-            raw_text = racedata1.text.replace("\n", "").strip()
-            
-            # Surface & Distance & Rotation
-            # Matches: 芝1600m or 芝2000m (右) or ダ1200m (左)
-            # Regex: (芝|ダ|障)(\d+)m(?:\s*\((.*?)\))?
-            
-            match_course = re.search(r'(芝|ダ|障)(\d+)m(?:\s*\((.*?)\))?', raw_text)
-            if match_course:
-                surface_type = match_course.group(1) # 芝/ダ
-                distance = match_course.group(2)     # 2000
-                rotation = match_course.group(3) if match_course.group(3) else "直線" if "直線" in raw_text else ""
-            
-            # Weather
-            match_weather = re.search(r'天候:(\S+)', raw_text)
-            if match_weather:
-                weather = match_weather.group(1)
-            
-            # Condition
-            match_cond = re.search(r'馬場:(\S+)', raw_text)
-            if match_cond:
-                condition = match_cond.group(1)
+    scraper = RaceScraper()
 
-            # Debug check
-            # print(f"Parsed: {surface_type} {distance}m {rotation} En:{weather} Cond:{condition}")
+    try:
+        response = await fetcher.fetch(url)
 
-        # --- データフレーム化 ---
-        dfs = pd.read_html(io.StringIO(str(target_table)))
-        if len(dfs) > 0:
-            df = dfs[0]
-            df = df.replace(r'\n', '', regex=True)
-            
-            # Column Normalization
-            # Replace newlines in columns
-            df.columns = df.columns.astype(str).str.replace(r'\n', '', regex=True).str.replace(r'\s+', '', regex=True)
-            
-            # Map known columns to database.csv standard
-            # Expected DB: 着順, 枠, 馬番, 馬名, 性齢, 斤量, 騎手, タイム, 着差, 人気, 単勝オッズ, 後3F, ...
-            # Actual from read_html might be: 着順, 枠番, 馬番, 馬名, 性齢, 斤量, 騎手, タイム, 着差, 人気, 単勝, 後3F...
-            
-            rename_map = {
-                '枠番': '枠',
-                '枠': '枠',
-                '馬番': '馬 番', # DB has space? Check debug output or CSV header.
-                # CSV Header: 着 順,枠,馬 番,馬名,性齢,斤量,騎手,タイム,着差,人 気,単勝 オッズ,後3F
-                '馬名': '馬名',
-                '単勝': '単勝 オッズ',
-                '単勝オッズ': '単勝 オッズ',
-                'オッズ': '単勝 オッズ',
-                '人気': '人 気',
-                '着順': '着 順',
-                '上り': '後3F'
-            }
-            df.rename(columns=rename_map, inplace=True)
-            
-            # Ensure Odds is numeric
-            if '単勝 オッズ' in df.columns:
-                 df['単勝 オッズ'] = pd.to_numeric(df['単勝 オッズ'], errors='coerce').fillna(0.0) 
-            
-            # Warning if mismatch
-            # print("Columns after rename:", df.columns)
-
-            # 列追加 (既に存在する場合はスキップまたは上書き)
-            meta_cols = [
-                ("日付", date_text), ("会場", venue_text), ("レース番号", race_num_text),
-                ("レース名", race_name_text), ("重賞", grade_text), ("コースタイプ", surface_type),
-                ("距離", distance), ("回り", rotation), ("天候", weather), ("馬場状態", condition)
-            ]
-            
-            # 挿入位置(0から順に)
-            # insertを使うと既存列は右にずれるため、0番目に順次追加する場合、
-            # 逆順に入れるか、インデックスをずらすか。
-            # 元のコード: df.insert(0, ...), df.insert(1, ...) 
-            # これは 0に入れた後、次のinsert(1)は「新0番目の次」に入れる。つまり先頭から順に並ぶ。
-            
-            for i, (col, val) in enumerate(meta_cols):
-                if col not in df.columns:
-                    df.insert(i, col, val)
-                else:
-                    df[col] = val
-            
-            # Additional Bloodline Columns (Empty init)
-            df["father"] = ""
-            df["mother"] = ""
-            df["bms"] = ""
-            
-            # Split Stable and Trainer
-            # 厩舎 column in read_html result often contains mixed content like "北海道田中淳司"
-            # We need to separate them.
-            
-            # First, check if '厩舎' exists in columns
-            if '厩舎' in df.columns:
-                # Apply separation logic
-                # Regex to split known stable names vs trainer names
-                # NAR Stables: 北海道, 岩手, 浦和, 船橋, 大井, 川崎, 金沢, 笠松, 愛知, 兵庫, 高知, 佐賀
-                # Also: JRA (during exchange races) -> 美浦, 栗東
-                
-                def split_stable_trainer(text):
-                    if not isinstance(text, str): return text, ""
-                    text = text.strip()
-                    # Common affiliates
-                    affiliates = ["北海道", "岩手", "水沢", "盛岡", "浦和", "船橋", "大井", "川崎", 
-                                  "金沢", "笠松", "愛知", "名古屋", "兵庫", "園田", "姫路", "高知", "佐賀",
-                                  "美浦", "栗東", "JRA", "地方", "海外"]
-                    
-                    stable_part = ""
-                    trainer_part = text
-                    
-                    # Try to match start
-                    for aff in affiliates:
-                        if text.startswith(aff):
-                            stable_part = aff
-                            trainer_part = text[len(aff):].strip()
-                            return stable_part, trainer_part
-                            
-                    # If no match but text exists, maybe it's just trainer name (rare) 
-                    # or stable name is unknown.
-                    # Fallback: Assume no stable prefix if not found? 
-                    # Or heuristic: first 2-3 chars?
-                    # Let's keep it as is if no match found, put all in Trainer?
-                    # Or put all in Stable? 
-                    # Usually "北海道田中" -> Stable=北海道, Trainer=田中
-                    return "", text
-
-                # Apply
-                def apply_split(row):
-                    s, t = split_stable_trainer(row['厩舎'])
-                    return pd.Series([s, t])
-
-                df[['厩舎', '調教師']] = df.apply(apply_split, axis=1)
-            else:
-                # '厩舎' column might be named differently ('調教師'?) in source table?
-                # If '調教師' exists but '厩舎' doesn't, maybe it's already separated or just trainer?
-                if '調教師' in df.columns:
-                     # Copy to trainer, leave stable empty?
-                     pass
-                else:
-                     df['厩舎'] = ""
-                     df['調教師'] = ""
-            
-            df["race_id"] = race_id # IDも保存 (末尾に追加されることが多いが明示的に)
-            
-            # 不要な列が含まれることがあるので整理しても良いが、
-            # ユーザー要望は「蓄積」なので、基本はそのまま保持する
-            
-            # Extract Horse IDs via Name Mapping (Robust)
-            horse_name_map = {}
-            for tr in target_table.find_all("tr"):
-                a_tag = tr.select_one(".Horse_Name a")
-                if a_tag:
-                    h_name = a_tag.text.strip().replace("\n", "")
-                    href = a_tag.get('href')
-                    hid_match = re.search(r'/horse/(\d+)', href)
-                    if hid_match:
-                        horse_name_map[h_name] = hid_match.group(1)
-            
-            
-            # Apply to DF (Mapping by Name)
-            # Ensure df['馬名'] is clean matches key
-            if '馬名' in df.columns:
-                df['horse_id'] = df['馬名'].map(horse_name_map).fillna("")
-            else:
-                df['horse_id'] = ""
-                
-            # If mapping largely failed (e.g. name mismatch), warn
-            if len(df) > 0 and (df['horse_id'] == "").sum() > len(df) * 0.5:
-                 print(f"Warning: High ID miss rate for {race_id}. Names might differ.")
-                 # Fallback: Try strict index alignment if map failed? 
-                 # But map is usually safer.
-                 # Debug:
-                 # print("DF Names:", df['馬名'].unique())
-                 # print("Map Keys:", list(horse_name_map.keys()))
-
-            # Enrich with Past Data
-            # This is slow, so we only do it if we successfully got IDs
-            # Parse Race Date for filtering
-            try:
-                current_race_date = datetime.strptime(date_text, '%Y年%m月%d日')
-            except:
-                current_race_date = datetime.now()
-            
-            print(f"  Enriching {len(df)} horses with past data...")
-            
-            past_columns = []
-            # Prepare new columns
-            # Added: last_3f, horse_weight, jockey, weight_carried, condition, odds, weather, distance, course_type
-            p_fields = ['date', 'rank', 'time', 'run_style', 'race_name', 'last_3f', 'horse_weight', 'jockey', 'condition', 'odds', 'weather', 'distance', 'course_type']
-            
-            for i in range(1, 6):
-                for f in p_fields:
-                    past_columns.append(f"past_{i}_{f}")
-            
-            # Pre-fill empty
-            for col in past_columns:
-                df[col] = None
-
-            for idx, row in df.iterrows():
-                hid = row.get('horse_id')
-                # Clean .0 if present
-                hid = str(hid).replace('.0', '') if hid else None
-                
-                if hid and str(hid).isdigit():
-                    # Use Cache to avoid repeated requests
-                    global HORSE_HISTORY_CACHE
-                    if hid in HORSE_HISTORY_CACHE:
-                        past_df = HORSE_HISTORY_CACHE[hid].copy()
-                    else:
-                        past_df = scraper.get_past_races(hid, n_samples=None) # Fetch ALL
-                        HORSE_HISTORY_CACHE[hid] = past_df
-                        past_df = past_df.copy()
-                    
-                    # --- Fetch Bloodline Data ---
-                    global HORSE_PROFILE_CACHE
-                    profile_data = None
-                    if hid in HORSE_PROFILE_CACHE:
-                        profile_data = HORSE_PROFILE_CACHE[hid]
-                    else:
-                         profile_data = scraper.get_horse_profile(hid)
-                         HORSE_PROFILE_CACHE[hid] = profile_data
-                    
-                    if profile_data:
-                        df.at[idx, 'father'] = profile_data.get('father', '')
-                        df.at[idx, 'mother'] = profile_data.get('mother', '')
-                        df.at[idx, 'bms'] = profile_data.get('bms', '')
-                        
-                    # past_df = scraper.get_past_races(hid, n_samples=20) # Old method
-                    
-                    if not past_df.empty:
-                    
+        if response.status_code != 200:
+            return None
 
-                         # Filter: Date < current_race_date
-                         if 'date' in past_df.columns: # Changed from date_obj or 日付
-                            if 'date_obj' not in past_df.columns and 'date' in past_df.columns:
-                                past_df['date_obj'] = pd.to_datetime(past_df['date'], format='%Y/%m/%d', errors='coerce')
-                            
-                            if 'date_obj' in past_df.columns:
-                                past_df = past_df[past_df['date_obj'] < current_race_date]
-                         
-                         # Take top 5
-                         past_df = past_df.head(5)
-                         
-                         # Assign to columns
-                         for i, (p_idx, p_row) in enumerate(past_df.iterrows()):
-                             if i >= 5: break
-                             n = i + 1
-                             # p_row keys are now English from race_scraper
-                             df.at[idx, f"past_{n}_date"] = p_row.get('date')
-                             df.at[idx, f"past_{n}_rank"] = p_row.get('rank')
-                             df.at[idx, f"past_{n}_time"] = p_row.get('time')
-                             df.at[idx, f"past_{n}_run_style"] = p_row.get('run_style')
-                             df.at[idx, f"past_{n}_race_name"] = p_row.get('race_name')
-                             df.at[idx, f"past_{n}_last_3f"] = p_row.get('last_3f')
-                             df.at[idx, f"past_{n}_horse_weight"] = p_row.get('horse_weight')
-                             df.at[idx, f"past_{n}_jockey"] = p_row.get('jockey')
-                             df.at[idx, f"past_{n}_condition"] = p_row.get('condition')
-                             df.at[idx, f"past_{n}_weather"] = p_row.get('weather')
-                             df.at[idx, f"past_{n}_distance"] = p_row.get('distance')
-                             df.at[idx, f"past_{n}_course_type"] = p_row.get('course_type')
-            
-            return df
-        else:
+        df = await fetcher.parse(parse_race_result, response.text, race_id)
+        if df is None:
             return None
 
+        await _prefetch_horses_async(_uncached_horse_ids(df), scraper, fetcher)
+        _enrich_race_result(df, scraper)
+        return df
+
     except Exception as e:
         print(f"Error scraping {race_id}: {e}")
         return None
@@ -633,8 +643,13 @@ def scrape_race_data(race_id, mode="JRA"):
 def fill_bloodline_data(mode="NAR"):
     """
     Backfills missing bloodline data (father, mother, bms) for JRA or NAR database.
-    Skips rows that already have data or are not valid horses.
-    Uses threaded scraping.
+
+    Pedigrees go into the pedigree store (data/pedigree.db, keyed by horse_id); the race
+    data itself is not rewritten; readers join the store lazily (PedigreeStore.join()).
+    Only the horse_id / pedigree columns are read, pedigrees already present in the race
+    data are imported first, and horses already in the store are never fetched again
+    (horses whose page has no pedigree are stored with an empty father).
+    Requests go through the shared per-host budget (AsyncFetcher).
     """
     print(f"=== Bloodline Backfill Tool ({mode}) ===")
     
@@ -644,8 +659,6 @@ def fill_bloodline_data(mode="NAR"):
     except ImportError:
         print("tqdm not installed, progress bar disabled.")
         def tqdm(iterable, **kwargs): return iterable
-        
-    from concurrent.futures import ThreadPoolExecutor, as_completed
 
     # Path Setup
     target_file = CSV_FILE_PATH_NAR if mode == "NAR" else CSV_FILE_PATH
@@ -654,539 +667,678 @@ def fill_bloodline_data(mode="NAR"):
         print(f'Error: {target_file} not found.')
         return
 
-    print(f'Reading {target_file}...')
-    # Use pandas to read parquet or csv depending on file extension
+    print(f'Reading horse_id / pedigree columns of {target_file}...')
+    columns = ['horse_id', 'father', 'mother', 'bms']
     if str(target_file).endswith('.parquet'):
         try:
-             df = pd.read_parquet(target_file)
+            df = ParquetSink(target_file).read(columns=columns)
         except Exception as e:
-             print(f"Error reading parquet: {e}")
-             return
+            print(f"Error reading parquet: {e}")
+            return
     else:
-        df = pd.read_csv(target_file, low_memory=False, dtype={'race_id': str, 'horse_id': str})
+        df = pd.read_csv(target_file, usecols=lambda c: c in columns, dtype=str)
 
-    # ID Cleaning (remove .0)
-    if 'horse_id' in df.columns:
-        df['horse_id'] = df['horse_id'].astype(str).str.replace(r'\.0$', '', regex=True)
-    
-    # Ensure columns exist
-    for col in ['father', 'mother', 'bms']:
-        if col not in df.columns:
-            df[col] = None
+    if 'horse_id' not in df.columns:
+        print("Error: horse_id column not found.")
+        return
+    df['horse_id'] = clean_horse_ids(df['horse_id']).to_numpy()
 
-    # Identify Missing Rows
-    # Criteria: Father is empty/NaN AND HorseID is valid digits
-    mask_missing = (df['father'].isna()) | (df['father'] == '') | (df['father'] == 'nan')
-    if 'horse_id' in df.columns:
-        target_horses = df.loc[mask_missing, 'horse_id'].dropna().unique()
-        # Filter for digits only
-        target_horses = [h for h in target_horses if str(h).isdigit()]
-    else:
-        target_horses = []
+    store = get_pedigree_store()
+    imported = store.import_frame(df)
+    if imported:
+        print(f'Imported {imported} pedigrees already present in the race data.')
+
+    # Horses with valid digit IDs that the store does not know yet
+    horse_ids = [h for h in df['horse_id'].dropna().unique() if str(h).isdigit()]
+    target_horses = store.missing(horse_ids)
     
     total_missing = len(target_horses)
-    print(f'Found {total_missing} horses with MISSING bloodline data. (Already filled horses skipped)')
+    print(f'Found {total_missing} horses with MISSING bloodline data. ({len(horse_ids) - total_missing} already in the pedigree store)')
     
     if total_missing == 0:
         print("✅ All data present. No action needed.")
         return
 
-    # Initialize Scraper
     scraper = RaceScraper()
-    
     BATCH_SIZE = 100
-    ped_buffer = {}
-    processed_count = 0
-    
-    # Worker Function
-    def fetch_pedigree(hid):
-        try:
-            return (hid, scraper.get_horse_profile(hid))
-        except:
-            return (hid, None)
 
-    print("Starting threaded scraping (Chunked)...")
-    CHUNK_SIZE = 500
-    
-    # Process in chunks to manage memory
-    for i in range(0, len(target_horses), CHUNK_SIZE):
-        chunk = target_horses[i : i + CHUNK_SIZE]
-        
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = {executor.submit(fetch_pedigree, hid): hid for hid in chunk}
-            
-            for future in tqdm(as_completed(futures), total=len(chunk), desc=f"Fetching Chunk {i//CHUNK_SIZE + 1}", leave=False):
+    async def _fetch_all():
+        fetched = 0
+        async with AsyncFetcher() as fetcher:
+            async def _one(hid):
                 try:
-                    hid, data = future.result()
-                    if data:
-                        ped_buffer[hid] = data
-                except:
-                    pass
-                
-                processed_count += 1
-                
-                # Batch Save
-                if len(ped_buffer) >= BATCH_SIZE:
-                    save_batch_bloodline(df, ped_buffer, target_file)
-                    ped_buffer = {} # Clear buffer
+                    return hid, await scraper.get_horse_profile_async(hid, fetcher)
+                except Exception:
+                    return hid, None
 
-        # Save any remaining in buffer for this chunk
-        if ped_buffer:
-             save_batch_bloodline(df, ped_buffer, target_file)
-             ped_buffer = {}
+            batches = range(0, total_missing, BATCH_SIZE)
+            for i in tqdm(batches, total=len(batches), desc="Fetching pedigrees"):
+                results = await asyncio.gather(*(_one(hid) for hid in target_horses[i:i + BATCH_SIZE]))
+                # Failed requests (None) are left out so they are retried next run
+                fetched += save_batch_bloodline(None, {hid: data for hid, data in results if data is not None})
+        return fetched
 
+    fetched = run_async(_fetch_all())
+    print(f"✅ {mode} Bloodline backfill completed. ({fetched}/{total_missing} pedigrees stored in {store.db_path})")
 
-    # Final Save
-    if ped_buffer:
-        save_batch_bloodline(df, ped_buffer, target_file)
-        
-    print(f"✅ {mode} Bloodline backfill completed.")
-
-def save_batch_bloodline(df, ped_buffer, target_file):
-    """Helper to apply buffer to DF and save."""
-    # Create Maps
-    f_map = {h: d.get('father') for h, d in ped_buffer.items()}
-    m_map = {h: d.get('mother') for h, d in ped_buffer.items()}
-    b_map = {h: d.get('bms') for h, d in ped_buffer.items()}
-    
-    # Apply to DF
-    # We use boolean mask for all rows with these IDs
-    mask = df['horse_id'].isin(ped_buffer.keys())
-    
-    # Update logic: fillna ensures we don't overwrite if (hypothetically) partly matched,
-    # but since we targeted missing, we basically overwrite the NaNs.
-    df.loc[mask, 'father'] = df.loc[mask, 'horse_id'].map(f_map).fillna(df.loc[mask, 'father'])
-    df.loc[mask, 'mother'] = df.loc[mask, 'horse_id'].map(m_map).fillna(df.loc[mask, 'mother'])
-    df.loc[mask, 'bms'] = df.loc[mask, 'horse_id'].map(b_map).fillna(df.loc[mask, 'bms'])
-    
-    # Save
-    print(f"  Saving batch to {target_file}...")
-    if str(target_file).endswith('.parquet'):
-         df.to_parquet(target_file, index=False, compression='snappy')
-    else:
-         df.to_csv(target_file, index=False, encoding='utf-8-sig')
+def save_batch_bloodline(df, ped_buffer, target_file=None):
+    """
+    Stores a batch of fetched pedigrees in the pedigree store (one transaction).
+    Profiles without a father are stored as empty entries so those horses are not fetched again.
+    If df is given, its father / mother / bms columns are filled in memory as well.
+    target_file is accepted for compatibility; race data files are no longer rewritten.
+
+    Returns:
+        int: number of pedigrees stored (empty entries not counted)
+    """
+    store = get_pedigree_store()
+    stored = store.put_many(ped_buffer)
+    store.put_empty([hid for hid, profile in ped_buffer.items() if profile is not None and not profile.get("father")])
+    store.flush()
+    if df is not None and 'horse_id' in df.columns:
+        store.join(df)
+    return stored
 
 
 # ==========================================
 # 2. Upcoming/Today's Race Scraping (JSON for Web App)
 # ==========================================
-def scrape_todays_schedule(mode="JRA"):
+SCHEDULE_DAY_OFFSETS = range(-7, 8) # previous 7 days and next 7 days
+
+def parse_schedule_day(html, race_date):
     """
-    Scrapes race list for today + next 7 days (Total 8 days).
-    Saves to 'todays_data.json' (JRA) or 'todays_data_nar.json' (NAR).
-    mode: "JRA" or "NAR"
+    Parses a race_list_sub.html page into the schedule entries for one day.
+    race_date: "YYYY-MM-DD". Odds ("horses") are filled in separately.
     """
-    # import json # Moved to top-level
-    
+    soup = make_soup(html, PAGE_FILTERS["race_list"])
     race_list = []
-    today = datetime.now()
-    
-    print(f"Fetching schedule for next 8 days (Mode: {mode})...")
+
+    # Unified Parsing Logic (Works for both JRA sub-list and NAR)
+    venue_item_pairs = []
     
-    today = datetime.now()
-    # Fetch previous 7 days and next 7 days (Total 15 days) as requested
-    date_range = range(-7, 8)
+    wrapper = soup.select_one('.RaceList_Box')
+    venue_blocks = []
+    if wrapper:
+        venue_blocks = wrapper.find_all('dl', recursive=False)
     
-    race_list = []
+    # JRA might fallback to .RaceList_DataList if only one venue or older format?
+    # But debug showed JRA using dl too.
     
-    print(f"Fetching schedule for range [{today + timedelta(days=-7):%Y-%m-%d} to {today + timedelta(days=7):%Y-%m-%d}] (Mode: {mode})...")
+    if not venue_blocks and wrapper and wrapper.name == 'dl':
+         venue_blocks = [wrapper]
+
+    # If still found nothing but items exist (flat list structure fallback)
+    if not venue_blocks:
+         items = soup.select('.RaceList_DataList .RaceList_DataItem')
+         if not items and wrapper: items = wrapper.select('.RaceList_DataItem')
+         for it in items: venue_item_pairs.append(("Unknown", it))
+    else:
+        for block in venue_blocks:
+            venue_name = "Unknown"
+            dt = block.select_one('dt')
+            if dt:
+                txt = dt.text.replace("\n", " ").strip()
+                
+                # 1. Try NAR pattern "高知競馬場TOP"
+                m_nar = re.search(r'(\S+?)競馬場', txt)
+                if m_nar:
+                    venue_name = m_nar.group(1)
+                else:
+                    # 2. Try JRA pattern "5回 中山 7日目"
+                    # Matches "N回 Venue N日目"
+                    m_jra = re.search(r'\d+回\s*(\S+)\s*\d+日目', txt)
+                    if m_jra:
+                        venue_name = m_jra.group(1)
+                    else:
+                        # 3. Fallback: Search for known venue names
+                        # JRA + NAR
+                        known_venues = r'(札幌|函館|福島|新潟|東京|中山|中京|京都|阪神|小倉|帯広|門別|盛岡|水沢|浦和|船橋|大井|川崎|金沢|笠松|名古屋|園田|姫路|高知|佐賀)'
+                        match_v = re.search(known_venues, txt)
+                        if match_v:
+                            venue_name = match_v.group(1)
+
+            sub_items = block.select('.RaceList_DataItem')
+            for it in sub_items:
+                venue_item_pairs.append((venue_name, it))
+
+    if not venue_item_pairs:
+        return [] # No races on this day
     
-    for i in date_range:
-        target_date = today + timedelta(days=i)
-        date_str = target_date.strftime('%Y%m%d')
+    for venue_cache, item in venue_item_pairs:
+        link_elem = item.find('a')
+        if not link_elem: continue
+        
+        href = link_elem.get('href', '')
+        race_id_match = re.search(r'race_id=(\d+)', href)
+        if not race_id_match: continue
+        
+        race_id = race_id_match.group(1)
+        
+        title_elem = item.select_one('.RaceList_ItemTitle')
+        race_name = title_elem.text.strip() if title_elem else "Unknown Race"
+        
+        venue = "Unknown"
+        number = ""
+        
+        if venue_cache and venue_cache != "Unknown":
+            venue = venue_cache
+        else:
+            # Last resort fallback if header parsing failed (JRA flat list?)
+            meta_elem = item.select_one('.RaceList_Item02')
+            if meta_elem:
+                 meta_txt = meta_elem.text.strip()
+                 # e.g. "中山1R"
+                 vm = re.search(r'(\D+)(\d+)R', meta_txt)
+                 if vm:
+                     venue = vm.group(1).strip()
+                     # Update number if found
+                     if not number: number = vm.group(2)
+        
+        # Try to extract race number from .Race_Num (Robust for both)
+        num_elem = item.select_one('.Race_Num')
+        if num_elem:
+            num_txt = num_elem.text.strip()
+            nm = re.search(r'(\d+)R', num_txt)
+            if nm: number = nm.group(1)
+        
+        if not number: number = "1" # Default
+
+        # Post time ("15:25"); used by the odds poller to schedule refreshes
+        post_time = ""
+        time_elem = item.select_one('.RaceList_Itemtime')
+        if time_elem:
+            tm = re.search(r'(\d{1,2}):(\d{2})', time_elem.text)
+            if tm: post_time = f"{int(tm.group(1)):02d}:{tm.group(2)}"
+        
+        # --- Mark Flags (WIN5 / Triple Umatan) ---
+        is_win5 = False
+        is_triple = False
+        
+        # Debug Check
+        # if "WIN5" in item.text or "トリプル" in item.text:
+        #    print(f"DEBUG: Found Text Match '{race_name}' in {venue}. Classes: {item.get('class')}")
+        #    print(str(item)[:200])
+
+        # Check based on Netkeiba CSS classes or text
+        # WIN5 often has .Icon_Win5 or .Icon_Win5_1 etc
+        if item.select_one('[class*="Icon_Win5"]'): # Broad search
+            is_win5 = True
+        
+        # Fallback: Text search in the item row
+        item_text = item.text
+        if "WIN5" in item_text:
+            is_win5 = True
         
-        # JRA/NAR specific logic if needed for URL? They seem to allow same param.
-        # But JRA base is race.netkeiba, NAR is nar.netkeiba.
-        base_domain = "nar.netkeiba.com" if mode == "NAR" else "race.netkeiba.com"
-        url = f"https://{base_domain}/top/race_list_sub.html?kaisai_date={date_str}"
-        headers = { "User-Agent": "Mozilla/5.0" }
+        # Triple Umatan: Usually .Icon_TripleUmatan or text
+        if item.select_one('[class*="Icon_Triple"]'):
+             is_triple = True
+             
+        if "トリプル" in item_text or "トリプル馬単" in item_text:
+            is_triple = True
         
-        print(f" Checking {target_date.strftime('%Y-%m-%d')}...")
+        # Logic: Triple Umatan is usually the last 3 races in NAR (SPAT4 venues)
+        # But explicit flags are better if found. 
+        # If not found, we rely on the UI 'Last 3' fallback.
+
+        race_list.append({
+            "id": race_id,
+            "date": race_date,
+            "venue": venue,
+            "number": number,
+            "name": race_name,
+            "post_time": post_time,
+            "is_win5": is_win5,
+            "is_triple": is_triple,
+            "horses": []
+        })
+
+    return race_list
+
+def _post_timestamp(race):
+    """Post time of a schedule entry as epoch seconds (None if the list had no time)."""
+    try:
+        return datetime.strptime(f"{race['date']} {race['post_time']}", "%Y-%m-%d %H:%M").timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _schedule_path(mode):
+    filename = "todays_data_nar.json" if mode == "NAR" else "todays_data.json"
+    return os.path.join(PROJECT_ROOT, "data", "temp", filename)
+
+def _write_json_atomic(path, payload):
+    # Write to a temp file and swap it in so the app never reads a half-written schedule
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+async def scrape_todays_schedule_async(mode="JRA", fetcher=None, odds_days=1):
+    """
+    Async counterpart of scrape_todays_schedule.
+
+    Day lists are fetched concurrently within the per-host budget. Each day's list is
+    hashed and compared with the previous run: unchanged days keep their parsed races,
+    and past days that were already fetched after they ended are not fetched at all.
+    A day becomes final only after a 200 response with at least one race; failed or
+    empty responses keep the previous races and fingerprint.
+    Odds are refreshed for today .. today+odds_days, and for any other upcoming day
+    whose list changed.
+    """
+    today = datetime.now().date()
+    output_path = _schedule_path(mode)
+    base_domain = "nar.netkeiba.com" if mode == "NAR" else "race.netkeiba.com"
+
+    previous = {}
+    if os.path.exists(output_path):
         try:
-            # JRA sub-list also tends to group by venue in dl elements
-            if i != 0: time.sleep(1)
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            response.encoding = response.apparent_encoding 
-            
-            if not response.text: continue
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Debug: Print first few detection items to see structure
-            # (Remove this later)
-            # if i == 0:
-            #    print("HTML Sample:", soup.prettify()[:1000])
+            with open(output_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Previous schedule unreadable, refreshing all days: {e}")
+    prev_days = previous.get("days", {})
+    prev_races = {}
+    for race in previous.get("races", []):
+        prev_races.setdefault(race.get("date"), []).append(race)
+
+    dates = [today + timedelta(days=i) for i in SCHEDULE_DAY_OFFSETS]
+    print(f"Fetching schedule for range [{dates[0]:%Y-%m-%d} to {dates[-1]:%Y-%m-%d}] (Mode: {mode})...")
+
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = AsyncFetcher()
+
+    async def refresh_day(day):
+        key = day.strftime("%Y-%m-%d")
+        meta = prev_days.get(key, {})
+        if meta.get("final"):
+            return key, prev_races.get(key, []), meta, False
+
+        url = f"https://{base_domain}/top/race_list_sub.html?kaisai_date={day:%Y%m%d}"
+        # Bypass the response cache; the content hash decides whether anything changed
+        response = await fetcher.fetch(url, cache=False)
+        if response.status_code != 200:
+            # Handled below: previous races and fingerprint are kept, and the day is retried next time
+            raise RuntimeError(f"HTTP {response.status_code}")
+        digest = hashlib.sha1(response.content).hexdigest()
+        if digest == meta.get("hash") and key in prev_days:
+            races = prev_races.get(key, [])
+            return key, races, {"hash": digest, "final": day < today and bool(races)}, False
+
+        races = await fetcher.parse(parse_schedule_day, response.text, key)
+        if not races and prev_races.get(key):
+            # A page without races for a day that had them (block / error page): keep what we had
+            print(f"  No races parsed for {key} (had {len(prev_races[key])}), keeping the previous list.")
+            return key, prev_races[key], dict(meta, final=False), False
+        if races:
+            print(f"  Found {len(races)} races for {key}.")
+        # Only a past day with races is final (never fetched again)
+        return key, races, {"hash": digest, "final": day < today and bool(races)}, True
+
+    try:
+        results = await asyncio.gather(*(refresh_day(d) for d in dates), return_exceptions=True)
+
+        days = {}
+        race_list = []
+        odds_targets = []
+        changed = 0
+        for day, result in zip(dates, results):
+            key = day.strftime("%Y-%m-%d")
+            if isinstance(result, Exception):
+                print(f" Error fetching {day:%Y%m%d}: {result}")
+                # Keep what we had for this day and retry on the next refresh
+                race_list.extend(prev_races.get(key, []))
+                if key in prev_days:
+                    days[key] = dict(prev_days[key], final=False)
+                continue
+            key, races, meta, is_changed = result
+            days[key] = meta
+            race_list.extend(races)
+            changed += is_changed
+            offset = (day - today).days
+            if offset >= 0 and (is_changed or offset <= odds_days):
+                odds_targets.extend(races)
+
+        if odds_targets:
+            odds = await asyncio.gather(
+                *(scrape_odds_for_race_async(r["id"], fetcher, mode=mode, race_date=r["date"],
+                                             post_time=_post_timestamp(r)) for r in odds_targets),
+                return_exceptions=True,
+            )
+            for race, horses in zip(odds_targets, odds):
+                if isinstance(horses, Exception):
+                    print(f" Error fetching odds for {race['id']}: {horses}")
+                    continue
+                race["horses"] = horses
+    finally:
+        if own_fetcher:
+            fetcher.close()
+
+    _write_json_atomic(output_path, {"date": today.strftime("%Y-%m-%d"), "races": race_list, "days": days})
+
+    print(f"Saved {len(race_list)} races to {output_path} ({changed} day(s) changed, odds for {len(odds_targets)} race(s))")
+    return True, f"{len(race_list)} races saved (Next 1 week)."
+
+def scrape_todays_schedule(mode="JRA"):
+    """
+    Scrapes race list for the previous 7 days + today + next 7 days.
+    Saves to 'todays_data.json' (JRA) or 'todays_data_nar.json' (NAR).
+    mode: "JRA" or "NAR"
+    """
+    return run_async(scrape_todays_schedule_async(mode=mode))
+
+def _odds_headers(mode):
+    # Extra headers for the odds API (User-Agent etc. come from http_client)
+    return {
+        "Referer": "https://race.netkeiba.com/" if mode == "JRA" else "https://nar.netkeiba.com/",
+        "X-Requested-With": "XMLHttpRequest",
+    }
+
+def _odds_api_url(race_id, odds_type):
+    # action=init gets initialization data which includes odds
+    # type=1: Win, type=2: Place
+    return f"https://race.netkeiba.com/api/api_get_jra_odds.html?race_id={race_id}&type={odds_type}&action=init"
+
+def _odds_html_url(race_id, mode):
+    base_domain = "nar.netkeiba.com" if mode == "NAR" else "race.netkeiba.com"
+    url_main = f"https://{base_domain}/odds/index.html?race_id={race_id}"
+    if mode == "NAR": url_main += "&type=b1"
+    return url_main
+
+def _response_json(response):
+    if response.status_code != 200:
+        return None
+    try:
+        return response.json()
+    except:
+        return None
+
+def parse_odds_api(win_payload, place_payload):
+    """
+    Parses the JRA odds API payloads (type=1 win, type=2 place).
+    Returns a list of {"number", "odds", "place_odds_min", "place_odds_max"} (may be empty).
+    """
+    horse_data = {}
+
+    # Parse Win
+    if win_payload:
+        try:
+            d = win_payload
+            # 'result' (final?), 'middle' (live/pre-race), 'live' (maybe?)
+            if d.get('status') in ['result', 'middle', 'live']:
+                odds_map = d.get('data', {}).get('odds', {}).get('1', {})
+                for k, v in odds_map.items():
+                    try:
+                        n = int(k)
+                        # v is list, v[0] is odds?
+                        val = v[0] if isinstance(v, list) and len(v) > 0 else v
+                        odds_val = 0.0
+                        if val and str(val) != '---':
+                            odds_val = float(val)
+                        horse_data[n] = {"number": n, "odds": odds_val}
+                    except: pass
+        except: pass
 
-            # Unified Parsing Logic (Works for both JRA sub-list and NAR)
-            venue_item_pairs = []
+    # Parse Place
+    if place_payload:
+        try:
+            d = place_payload
+            if d.get('status') in ['result', 'middle', 'live']:
+                odds_map = d.get('data', {}).get('odds', {}).get('2', {})
+                for k, v in odds_map.items():
+                    try:
+                        n = int(k)
+                        if n not in horse_data: horse_data[n] = {"number": n, "odds": 0.0}
+                        
+                        p_min = 0.0
+                        p_max = 0.0
+                        if isinstance(v, list) and len(v) >= 2:
+                            if v[0] and str(v[0]) != '---': p_min = float(v[0])
+                            if v[1] and str(v[1]) != '---': p_max = float(v[1])
+                        
+                        horse_data[n]['place_odds_min'] = p_min
+                        horse_data[n]['place_odds_max'] = p_max
+                    except: pass
+        except: pass
+
+    return list(horse_data.values())
+
+def parse_odds_html(html):
+    """
+    Parses the odds page (odds/index.html) table.
+    Returns a list of horses, or [] if no positive odds were found.
+    """
+    soup = make_soup(html, PAGE_FILTERS["odds"])
+    
+    tables = soup.select('table.RaceOdds_HorseList_Table')
+    target_table = None
+    
+    if tables: target_table = tables[0]
+    
+    # Fallback for old JRA format
+    if not target_table:
+         target_table = soup.select_one('table#Ninki')
             
-            wrapper = soup.select_one('.RaceList_Box')
-            venue_blocks = []
-            if wrapper:
-                venue_blocks = wrapper.find_all('dl', recursive=False)
+    if target_table:
+        rows = target_table.find_all('tr')
+        horses_map = {} 
+        for row in rows:
+            # Skip header based on th existence
+            if row.find('th'): continue
+            
+            # Robust extraction
+            # Number
+            num_el = row.select_one('td.Umaban') or row.select_one('td.Waku') # Sometimes different class
+            # Or just by index? Usually col 2 for Umaban
+            cols = row.find_all('td')
+            
+            num = None
+            if num_el:
+                try: num = int(re.sub(r'\D', '', num_el.text))
+                except: pass
+            elif len(cols) >= 2: # Try 2nd col
+                try: num = int(re.sub(r'\D', '', cols[1].text))
+                except: pass
             
-            # JRA might fallback to .RaceList_DataList if only one venue or older format?
-            # But debug showed JRA using dl too.
+            if num is None: continue # Skip if no number
             
-            if not venue_blocks and wrapper and wrapper.name == 'dl':
-                 venue_blocks = [wrapper]
-
-            # If still found nothing but items exist (flat list structure fallback)
-            if not venue_blocks:
-                 items = soup.select('.RaceList_DataList .RaceList_DataItem')
-                 if not items and wrapper: items = wrapper.select('.RaceList_DataItem')
-                 for it in items: venue_item_pairs.append(("Unknown", it))
-            else:
-                for block in venue_blocks:
-                    venue_name = "Unknown"
-                    dt = block.select_one('dt')
-                    if dt:
-                        txt = dt.text.replace("\n", " ").strip()
-                        
-                        # 1. Try NAR pattern "高知競馬場TOP"
-                        m_nar = re.search(r'(\S+?)競馬場', txt)
-                        if m_nar:
-                            venue_name = m_nar.group(1)
-                        else:
-                            # 2. Try JRA pattern "5回 中山 7日目"
-                            # Matches "N回 Venue N日目"
-                            m_jra = re.search(r'\d+回\s*(\S+)\s*\d+日目', txt)
-                            if m_jra:
-                                venue_name = m_jra.group(1)
-                            else:
-                                # 3. Fallback: Search for known venue names
-                                # JRA + NAR
-                                known_venues = r'(札幌|函館|福島|新潟|東京|中山|中京|京都|阪神|小倉|帯広|門別|盛岡|水沢|浦和|船橋|大井|川崎|金沢|笠松|名古屋|園田|姫路|高知|佐賀)'
-                                match_v = re.search(known_venues, txt)
-                                if match_v:
-                                    venue_name = match_v.group(1)
-
-                    sub_items = block.select('.RaceList_DataItem')
-                    for it in sub_items:
-                        venue_item_pairs.append((venue_name, it))
-
-            if not venue_item_pairs:
-                continue # No races today
-                
-            print(f"  Found {len(venue_item_pairs)} races for {target_date.strftime('%Y-%m-%d')}.")
+            # Odds
+            odds = 0.0
+            odds_el = row.select_one('td.Odds') or row.select_one('.Odds') or row.select_one('.Odds_Ninki')
+            if odds_el:
+                txt = odds_el.text.strip()
+                if txt and "---" not in txt:
+                    try: odds = float(txt)
+                    except: pass
             
-            for venue_cache, item in venue_item_pairs:
-                link_elem = item.find('a')
-                if not link_elem: continue
-                
-                href = link_elem.get('href', '')
-                race_id_match = re.search(r'race_id=(\d+)', href)
-                if not race_id_match: continue
-                
-                race_id = race_id_match.group(1)
-                
-                title_elem = item.select_one('.RaceList_ItemTitle')
-                race_name = title_elem.text.strip() if title_elem else "Unknown Race"
-                
-                venue = "Unknown"
-                number = ""
-                
-                if venue_cache and venue_cache != "Unknown":
-                    venue = venue_cache
-                else:
-                    # Last resort fallback if header parsing failed (JRA flat list?)
-                    meta_elem = item.select_one('.RaceList_Item02')
-                    if meta_elem:
-                         meta_txt = meta_elem.text.strip()
-                         # e.g. "中山1R"
-                         vm = re.search(r'(\D+)(\d+)R', meta_txt)
-                         if vm:
-                             venue = vm.group(1).strip()
-                             # Update number if found
-                             if not number: number = vm.group(2)
-                
-                # Try to extract race number from .Race_Num (Robust for both)
-                num_elem = item.select_one('.Race_Num')
-                if num_elem:
-                    num_txt = num_elem.text.strip()
-                    nm = re.search(r'(\d+)R', num_txt)
-                    if nm: number = nm.group(1)
-                
-                if not number: number = "1" # Default
-                
-                # --- Mark Flags (WIN5 / Triple Umatan) ---
-                is_win5 = False
-                is_triple = False
-                
-                # Debug Check
-                # if "WIN5" in item.text or "トリプル" in item.text:
-                #    print(f"DEBUG: Found Text Match '{race_name}' in {venue}. Classes: {item.get('class')}")
-                #    print(str(item)[:200])
-
-                # Check based on Netkeiba CSS classes or text
-                # WIN5 often has .Icon_Win5 or .Icon_Win5_1 etc
-                if item.select_one('[class*="Icon_Win5"]'): # Broad search
-                    is_win5 = True
-                
-                # Fallback: Text search in the item row
-                item_text = item.text
-                if "WIN5" in item_text:
-                    is_win5 = True
-                
-                # Triple Umatan: Usually .Icon_TripleUmatan or text
-                if item.select_one('[class*="Icon_Triple"]'):
-                     is_triple = True
-                     
-                if "トリプル" in item_text or "トリプル馬単" in item_text:
-                    is_triple = True
-                
-                # Logic: Triple Umatan is usually the last 3 races in NAR (SPAT4 venues)
-                # But explicit flags are better if found. 
-                # If not found, we rely on the UI 'Last 3' fallback.
-
-                # For odds, check Today and Future (i >= 0)
-                horses = []
-                if i >= 0:
-                     # Scrape odds for today and future days
-                     horses = scrape_odds_for_race(race_id, mode=mode)
-                
-                race_info = {
-                    "id": race_id,
-                    "date": target_date.strftime("%Y-%m-%d"),
-                    "venue": venue,
-                    "number": number,
-                    "name": race_name,
-                    "is_win5": is_win5,
-                    "is_triple": is_triple,
-                    "horses": horses
-                }
-                race_list.append(race_info)
+            # Place Odds (Min/Max) - often in .Fuku_Odds
+            p_min, p_max = 0.0, 0.0
+            f_el = row.select_one('.Fuku_Odds')
+            if f_el:
+                ft = f_el.text.strip()
+                if ft and "---" not in ft:
+                     parts = ft.split('-')
+                     try:
+                         if len(parts) >= 1: p_min = float(parts[0].strip())
+                         if len(parts) >= 2: p_max = float(parts[1].strip())
+                         else: p_max = p_min
+                     except: pass
+
+            if num not in horses_map:
+                horses_map[num] = {"number": num, "odds": odds, "place_odds_min": p_min, "place_odds_max": p_max}
                 
-        except Exception as e:
-            print(f" Error fetching {date_str}: {e}")
+        if horses_map:
+                temp_horses = list(horses_map.values())
+                # Only return if we actually found odds
+                if any(h['odds'] > 0 for h in temp_horses):
+                    return temp_horses
+        else:
+            print("  -> No odds found in table rows.")
 
-    # Save to JSON
-    # Save to JSON
-    filename = "todays_data_nar.json" if mode == "NAR" else "todays_data.json"
-    output_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "temp", filename)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump({"date": today.strftime("%Y-%m-%d"), "races": race_list}, f, ensure_ascii=False, indent=2)
-        
-    print(f"Saved {len(race_list)} future races to {output_path}")
-    return True, f"{len(race_list)} races saved (Next 1 week)."
+    return []
 
-def scrape_odds_for_race(race_id, mode="JRA", fetch_type="real"):
+def scrape_odds_for_race(race_id, mode="JRA", fetch_type="real", race_date=None, post_time=None, cache=True):
     """
     Fetches odds for a specific race_id.
     Retries only requests (API or HTML).
     fetch_type: 'real' (current odds)
+    Every live fetch is also appended to the odds history (odds_store);
+    race_date / post_time (epoch seconds), when known, are stored with the snapshot.
+    Bodies served from the HTTP response cache are not recorded (they were fetched earlier).
+    cache=False always goes to the network (live polling).
     """
     horses = []
-    # robust headers mimicking browser
-    headers = { 
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Referer": "https://race.netkeiba.com/" if mode == "JRA" else "https://nar.netkeiba.com/",
-        "X-Requested-With": "XMLHttpRequest",
-        "Accept-Language": "ja,en-US;q=0.9,en;q=0.8"
-    }
+    headers = _odds_headers(mode)
     
     print(f"  Scraping odds for {race_id} (Mode: {mode})...")
     
-    base_domain = "nar.netkeiba.com" if mode == "NAR" else "race.netkeiba.com"
-    
     # --- 1. Real Odds (Requests: API & HTML) ---
     # 1-A. Try JSON API (JRA Only)
     if mode == "JRA":
         try:
-            # action=init gets initialization data which includes odds
-            url_win = f"https://race.netkeiba.com/api/api_get_jra_odds.html?race_id={race_id}&type=1&action=init"
-            r_win = requests.get(url_win, headers=headers, timeout=10)
-            
-            # Place odds (type=2)
-            url_place = f"https://race.netkeiba.com/api/api_get_jra_odds.html?race_id={race_id}&type=2&action=init"
-            r_place = requests.get(url_place, headers=headers, timeout=10)
+            r_win = http_client.get(_odds_api_url(race_id, 1), headers=headers, cache=cache)
+            r_place = http_client.get(_odds_api_url(race_id, 2), headers=headers, cache=cache)
+
+            temp_horses = parse_odds_api(_response_json(r_win), _response_json(r_place))
+            if any(h['odds'] > 0 for h in temp_horses):
+                print("  -> Found Real Odds via API.")
+                if http_client.is_live(r_win) and http_client.is_live(r_place):
+                    odds_store.record(race_id, temp_horses, source="api", race_date=race_date, post_time=post_time)
+                return temp_horses
+        except Exception as e:
+            print(f"JRA API Error: {e}")
 
-            horse_data = {}
+    # 1-B. Try HTML Scraping (NAR or JRA Fallback)
+    try:
+        response = http_client.get(_odds_html_url(race_id, mode), headers=headers, cache=cache)
+        temp_horses = parse_odds_html(response.text)
+        if temp_horses:
+            print("  -> Found Real Odds via HTML.")
+            if http_client.is_live(response):
+                odds_store.record(race_id, temp_horses, source="html", race_date=race_date, post_time=post_time)
+            return temp_horses
+    except Exception as e:
+        print(f"Requests HTML Error: {e}")
 
-            # Parse Win
-            if r_win.status_code == 200:
-                try:
-                    d = r_win.json()
-                    # 'result' (final?), 'middle' (live/pre-race), 'live' (maybe?)
-                    if d.get('status') in ['result', 'middle', 'live']:
-                        odds_map = d.get('data', {}).get('odds', {}).get('1', {})
-                        for k, v in odds_map.items():
-                            try:
-                                n = int(k)
-                                # v is list, v[0] is odds?
-                                val = v[0] if isinstance(v, list) and len(v) > 0 else v
-                                odds_val = 0.0
-                                if val and str(val) != '---':
-                                    odds_val = float(val)
-                                horse_data[n] = {"number": n, "odds": odds_val}
-                            except: pass
-                except: pass
+    return horses
 
-            # Parse Place
-            if r_place.status_code == 200:
-                try:
-                    d = r_place.json()
-                    if d.get('status') in ['result', 'middle', 'live']:
-                        odds_map = d.get('data', {}).get('odds', {}).get('2', {})
-                        for k, v in odds_map.items():
-                            try:
-                                n = int(k)
-                                if n not in horse_data: horse_data[n] = {"number": n, "odds": 0.0}
-                                
-                                p_min = 0.0
-                                p_max = 0.0
-                                if isinstance(v, list) and len(v) >= 2:
-                                    if v[0] and str(v[0]) != '---': p_min = float(v[0])
-                                    if v[1] and str(v[1]) != '---': p_max = float(v[1])
-                                
-                                horse_data[n]['place_odds_min'] = p_min
-                                horse_data[n]['place_odds_max'] = p_max
-                            except: pass
-                except: pass
-            
-            if horse_data:
-                temp_horses = list(horse_data.values())
-                if any(h['odds'] > 0 for h in temp_horses):
-                        print("  -> Found Real Odds via API.")
-                        return temp_horses
+async def scrape_odds_for_race_async(race_id, fetcher, mode="JRA", fetch_type="real", race_date=None, post_time=None,
+                                     cache=True):
+    """
+    Async counterpart of scrape_odds_for_race.
+    The JRA win/place API requests are issued concurrently.
+    """
+    horses = []
+    headers = _odds_headers(mode)
+
+    print(f"  Scraping odds for {race_id} (Mode: {mode})...")
+
+    if mode == "JRA":
+        try:
+            r_win, r_place = await asyncio.gather(
+                fetcher.fetch(_odds_api_url(race_id, 1), headers=headers, cache=cache),
+                fetcher.fetch(_odds_api_url(race_id, 2), headers=headers, cache=cache),
+            )
+            temp_horses = parse_odds_api(_response_json(r_win), _response_json(r_place))
+            if any(h['odds'] > 0 for h in temp_horses):
+                print("  -> Found Real Odds via API.")
+                if http_client.is_live(r_win) and http_client.is_live(r_place):
+                    odds_store.record(race_id, temp_horses, source="api", race_date=race_date, post_time=post_time)
+                return temp_horses
         except Exception as e:
             print(f"JRA API Error: {e}")
 
-    # 1-B. Try HTML Scraping (NAR or JRA Fallback)
     try:
-        url_main = f"https://{base_domain}/odds/index.html?race_id={race_id}"
-        if mode == "NAR": url_main += "&type=b1"
-                
-        response = requests.get(url_main, headers=headers, timeout=10)
-        # Attempt to handle encoding
-        response.encoding = response.apparent_encoding 
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        tables = soup.select('table.RaceOdds_HorseList_Table')
-        target_table = None
-        
-        if tables: target_table = tables[0]
-        
-        # Fallback for old JRA format
-        if not target_table:
-             target_table = soup.select_one('table#Ninki')
-                
-        if target_table:
-            rows = target_table.find_all('tr')
-            horses_map = {} 
-            for row in rows:
-                # Skip header based on th existence
-                if row.find('th'): continue
-                
-                # Robust extraction
-                # Number
-                num_el = row.select_one('td.Umaban') or row.select_one('td.Waku') # Sometimes different class
-                # Or just by index? Usually col 2 for Umaban
-                cols = row.find_all('td')
-                
-                num = None
-                if num_el:
-                    try: num = int(re.sub(r'\D', '', num_el.text))
-                    except: pass
-                elif len(cols) >= 2: # Try 2nd col
-                    try: num = int(re.sub(r'\D', '', cols[1].text))
-                    except: pass
-                
-                if num is None: continue # Skip if no number
-                
-                # Odds
-                odds = 0.0
-                odds_el = row.select_one('td.Odds') or row.select_one('.Odds') or row.select_one('.Odds_Ninki')
-                if odds_el:
-                    txt = odds_el.text.strip()
-                    if txt and "---" not in txt:
-                        try: odds = float(txt)
-                        except: pass
-                
-                # Place Odds (Min/Max) - often in .Fuku_Odds
-                p_min, p_max = 0.0, 0.0
-                f_el = row.select_one('.Fuku_Odds')
-                if f_el:
-                    ft = f_el.text.strip()
-                    if ft and "---" not in ft:
-                         parts = ft.split('-')
-                         try:
-                             if len(parts) >= 1: p_min = float(parts[0].strip())
-                             if len(parts) >= 2: p_max = float(parts[1].strip())
-                             else: p_max = p_min
-                         except: pass
-
-                if num not in horses_map:
-                    horses_map[num] = {"number": num, "odds": odds, "place_odds_min": p_min, "place_odds_max": p_max}
-                    
-            if horses_map:
-                    temp_horses = list(horses_map.values())
-                    # Only return if we actually found odds
-                    if any(h['odds'] > 0 for h in temp_horses):
-                        print("  -> Found Real Odds via HTML.")
-                        return temp_horses
-            else:
-                print("  -> No odds found in table rows.")
-                
+        response = await fetcher.fetch(_odds_html_url(race_id, mode), headers=headers, cache=cache)
+        temp_horses = await fetcher.parse(parse_odds_html, response.text)
+        if temp_horses:
+            print("  -> Found Real Odds via HTML.")
+            if http_client.is_live(response):
+                odds_store.record(race_id, temp_horses, source="html", race_date=race_date, post_time=post_time)
+            return temp_horses
     except Exception as e:
         print(f"Requests HTML Error: {e}")
 
     return horses
 
+def latest_polled_odds(race_id, max_age=120):
+    """
+    Latest odds snapshot from the odds history (written by the odds poller) if it is
+    at most max_age seconds old, in the scrape_odds_for_race format; otherwise None.
+    """
+    try:
+        snap = odds_store.get_store().latest(race_id, day=datetime.now().strftime("%Y%m%d"))
+    except Exception:
+        return None
+    if snap.empty or time.time() - snap["ts"].iloc[0] > max_age:
+        return None
+    return [
+        {"number": int(r.number), "odds": float(r.win) if pd.notna(r.win) else 0.0,
+         "place_odds_min": float(r.place_min) if pd.notna(r.place_min) else 0.0,
+         "place_odds_max": float(r.place_max) if pd.notna(r.place_max) else 0.0}
+        for r in snap.itertuples(index=False)
+    ]
+
+def parse_race_list_ids(html):
+    """
+    Extracts race_ids from a race_list_sub.html page (sorted, unique).
+    """
+    soup = make_soup(html, PAGE_FILTERS["race_list"])
+    # Usually .RaceList_DataList -> .RaceList_DataItem
+    items = soup.select('.RaceList_Box .RaceList_DataItem')
+    if not items:
+        items = soup.select('.RaceList_DataList .RaceList_DataItem')
+
+    race_ids = []
+    for item in items:
+        a = item.find('a')
+        if a and 'href' in a.attrs:
+            # ../race/result.html?race_id=...
+             m = re.search(r'race_id=(\d+)', a['href'])
+             if m:
+                 race_ids.append(m.group(1))
+
+    return sorted(list(set(race_ids)))
+
+def _nar_year_range(year_str, start_date=None, end_date=None):
+    y = int(year_str)
+    # Determine range
+    d_start = datetime(y, 1, 1).date()
+    d_end = datetime(y, 12, 31).date()
+
+    if start_date: d_start = max(d_start, start_date)
+    if end_date: d_end = min(d_end, end_date)
+
+    days = []
+    current = d_start
+    while current <= d_end:
+        days.append(current)
+        current += timedelta(days=1)
+    return days
+
 def scrape_nar_year(year_str, start_date=None, end_date=None, save_callback=None, existing_race_ids=None):
     """
     Scrapes NAR races for a given year.
     Iterates every day.
     """
     print(f"=== Starting NAR Bulk Scraping for {year_str} ===")
-    import time
-    from datetime import timedelta
     
     try:
-        y = int(year_str)
-        # Determine range
-        d_start = datetime(y, 1, 1).date()
-        d_end = datetime(y, 12, 31).date()
-        
-        if start_date: d_start = max(d_start, start_date)
-        if end_date: d_end = min(d_end, end_date)
-            
-        current = d_start
-        headers = { "User-Agent": "Mozilla/5.0" }
-        
-        while current <= d_end:
+        for current in _nar_year_range(year_str, start_date, end_date):
             kaisai_date = current.strftime("%Y%m%d")
             url = f"https://nar.netkeiba.com/top/race_list_sub.html?kaisai_date={kaisai_date}"
             
             print(f"Checking {current}...")
             
             try:
-                resp = requests.get(url, headers=headers, timeout=10)
-                # Parse
-                soup = BeautifulSoup(resp.content, 'html.parser')
-                # Usually .RaceList_DataList -> .RaceList_DataItem
-                items = soup.select('.RaceList_Box .RaceList_DataItem')
-                if not items:
-                    items = soup.select('.RaceList_DataList .RaceList_DataItem')
+                resp = http_client.get(url)
+                race_ids = parse_race_list_ids(resp.text)
                     
-                if items:
-                    race_ids = []
-                    for item in items:
-                        a = item.find('a')
-                        if a and 'href' in a.attrs:
-                            # ../race/result.html?race_id=...
-                             m = re.search(r'race_id=(\d+)', a['href'])
-                             if m:
-                                 race_ids.append(m.group(1))
-                    
-                    race_ids = sorted(list(set(race_ids)))
+                if race_ids:
                     print(f"  Found {len(race_ids)} races.")
                     
-                    for rid in race_ids:
+                    for rid, exists in zip(race_ids, present_mask(race_ids, existing_race_ids)):
                         # Skip if already exists
-                        if existing_race_ids and rid in existing_race_ids:
+                        if exists:
                              print(f"    Skipping {rid} (Already exists)")
                              continue
 
@@ -1195,19 +1347,98 @@ def scrape_nar_year(year_str, start_date=None, end_date=None, save_callback=None
                         if df is not None and not df.empty:
                             if save_callback:
                                 save_callback(df)
-                        time.sleep(0.5)
                 else:
                     print("  No races.")
                     
             except Exception as e:
                  print(f"  Error on {current}: {e}")
             
-            current += timedelta(days=1)
-            time.sleep(0.5)
-            
     except Exception as e:
         print(f"Error in scrape_nar_year: {e}")
 
+async def scrape_nar_year_async(year_str, fetcher, start_date=None, end_date=None, save_callback=None, existing_race_ids=None):
+    """
+    Async counterpart of scrape_nar_year.
+    Day lists and race results are fetched concurrently under the per-host budget;
+    save_callback is called from the event loop as each race completes.
+    """
+    print(f"=== Starting NAR Bulk Scraping for {year_str} (async) ===")
+
+    async def _race(rid):
+        df = await scrape_race_data_async(rid, fetcher, mode="NAR")
+        if df is not None and not df.empty:
+            if save_callback:
+                save_callback(df)
+
+    async def _day(current):
+        kaisai_date = current.strftime("%Y%m%d")
+        url = f"https://nar.netkeiba.com/top/race_list_sub.html?kaisai_date={kaisai_date}"
+        try:
+            resp = await fetcher.fetch(url)
+            race_ids = await fetcher.parse(parse_race_list_ids, resp.text)
+        except Exception as e:
+            print(f"  Error on {current}: {e}")
+            return
+
+        if not race_ids:
+            print(f"  {current}: No races.")
+            return
+
+        print(f"  {current}: Found {len(race_ids)} races.")
+        targets = []
+        for rid, exists in zip(race_ids, present_mask(race_ids, existing_race_ids)):
+            if exists:
+                print(f"    Skipping {rid} (Already exists)")
+                continue
+            targets.append(rid)
+        await asyncio.gather(*(_race(rid) for rid in targets))
+
+    try:
+        await asyncio.gather(*(_day(d) for d in _nar_year_range(year_str, start_date, end_date)))
+    except Exception as e:
+        print(f"Error in scrape_nar_year_async: {e}")
+
+def enqueue_nar_days(queue, start_date, end_date, reset=False):
+    """
+    Registers one nar_day discovery task per calendar day (YYYYMMDD) in the job queue.
+    reset=True re-opens days that were already processed (force mode).
+    Recent days (races may still be added or not have results yet) are re-opened on every run.
+    """
+    recent = (date.today() - timedelta(days=REOPEN_DAYS)).strftime("%Y%m%d")
+    days = []
+    for y in range(start_date.year, end_date.year + 1):
+        days.extend(d.strftime("%Y%m%d") for d in _nar_year_range(str(y), start_date, end_date))
+    added = queue.add("nar_day", [d for d in days if d < recent], reset=reset)
+    return added + queue.add("nar_day", [d for d in days if d >= recent], reset=True)
+
+def nar_backfill_handlers(fetcher, save_callback=None, existing_race_ids=None):
+    """
+    Job queue handlers for the NAR backfill (nar_day -> nar_race).
+    A nar_race task is done only after save_callback has stored the race.
+    """
+    async def handle_day(task):
+        url = f"https://nar.netkeiba.com/top/race_list_sub.html?kaisai_date={task.key}"
+        resp = await fetcher.fetch(url)
+        if resp.status_code != 200:
+            raise RuntimeError(f"HTTP {resp.status_code}")
+        race_ids = await fetcher.parse(parse_race_list_ids, resp.text)
+        if not race_ids:
+            print(f"  {task.key}: No races.")
+            return []
+        print(f"  {task.key}: Found {len(race_ids)} races.")
+        reopen = task.key >= (date.today() - timedelta(days=REOPEN_DAYS)).strftime("%Y%m%d")
+        return [("nar_race", rid, None, reopen)
+                for rid, exists in zip(race_ids, present_mask(race_ids, existing_race_ids)) if not exists]
+
+    async def handle_race(task):
+        df = await scrape_race_data_async(task.key, fetcher, mode="NAR")
+        if df is None or df.empty:
+            raise RuntimeError("No result data")
+        if save_callback:
+            save_callback(df)
+
+    return {"nar_day": handle_day, "nar_race": handle_race}
+
 # ==========================================
 # 2.5 Shutuba Scraping (Future Races)
 # ==========================================
@@ -1220,19 +1451,14 @@ def scrape_shutuba_data(race_id, mode="JRA", history_df=None):
     base_domain = "nar.netkeiba.com" if mode == "NAR" else "race.netkeiba.com"
     url = f"https://{base_domain}/race/shutuba.html?race_id={race_id}"
     
-    headers = { 
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36" 
-    }
-    
     print(f"Scraping Shutuba: {url} (Mode: {mode})")
     
     scraper = RaceScraper() # Initialize for pulling history later
 
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.encoding = response.apparent_encoding
-        soup = BeautifulSoup(response.text, 'html.parser')
+        response = http_client.get(url)
+        soup = make_soup(response.text)
         
         # Meta info
         race_name_elem = soup.select_one(".RaceName")
@@ -1327,6 +1553,7 @@ def scrape_shutuba_data(race_id, mode="JRA", history_df=None):
              rows = [r for r in rows if not r.find('th')]
         
         data = []
+        name_refs = []
         
         for row in rows:
             # Extract fields
@@ -1355,34 +1582,25 @@ def scrape_shutuba_data(race_id, mode="JRA", history_df=None):
                 if hm: horse_id = hm.group(1)
             
             # Basic info
-            jockey_elem = row.select_one(".Jockey a")
+            # Full names are looked up in the cache; unseen URLs are resolved after the loop
+            jockey_elem = row.select_one(".Jockey a") or row.select_one("td:nth-child(7) a")
             jockey = ""
+            jockey_url = None
             if jockey_elem:
                 jockey = jockey_elem.get('title', '').strip() or jockey_elem.text.strip()
-                if jockey_elem.get('href'):
-                    jockey = resolve_full_name(jockey_elem.get('href'), jockey)
-            else:
-                j_backup = row.select_one("td:nth-child(7) a")
-                if j_backup:
-                    jockey = j_backup.get('title', '').strip() or j_backup.text.strip()
-                    if j_backup.get('href'):
-                        jockey = resolve_full_name(j_backup.get('href'), jockey)
+                jockey_url = jockey_elem.get('href')
+                jockey = NAMES.lookup(jockey_url, jockey)
             
             weight_elem = row.select_one(".Txt_C")
             weight = weight_elem.text.strip() if weight_elem else (row.select_one("td:nth-child(6)").text.strip() if row.select_one("td:nth-child(6)") else "57.0")
 
-            trainer_elem = row.select_one(".Trainer a")
+            trainer_elem = row.select_one(".Trainer a") or row.select_one("td:nth-child(8) a")
             trainer = ""
+            trainer_url = None
             if trainer_elem:
                 trainer = trainer_elem.get('title', '').strip() or trainer_elem.text.strip()
-                if trainer_elem.get('href'):
-                     trainer = resolve_full_name(trainer_elem.get('href'), trainer)
-            else:
-                t_backup = row.select_one("td:nth-child(8) a")
-                if t_backup:
-                     trainer = t_backup.get('title', '').strip() or t_backup.text.strip()
-                     if t_backup.get('href'):
-                         trainer = resolve_full_name(t_backup.get('href'), trainer)
+                trainer_url = trainer_elem.get('href')
+                trainer = NAMES.lookup(trainer_url, trainer)
 
             # --- Added: Extract Predicted Odds ---
             predicted_pop = ""
@@ -1436,17 +1654,11 @@ def scrape_shutuba_data(race_id, mode="JRA", history_df=None):
             # --- Fetch Profile for Shutuba ---
             # Similar to scrape_race_data, use cache
             if horse_id and horse_id.isdigit():
-                 global HORSE_PROFILE_CACHE
-                 # Initialize if not present (handled at module level)
                  prof = None
-                 if horse_id in HORSE_PROFILE_CACHE:
-                     prof = HORSE_PROFILE_CACHE[horse_id]
-                 else:
-                     try:
-                         prof = scraper.get_horse_profile(horse_id)
-                         if prof: HORSE_PROFILE_CACHE[horse_id] = prof
-                     except Exception as e:
-                         print(f"Error fetching profile for {horse_id}: {e}")
+                 try:
+                     prof = _horse_profile(horse_id, scraper)
+                 except Exception as e:
+                     print(f"Error fetching profile for {horse_id}: {e}")
                  
                  if prof:
                      entry["father"] = prof.get("father", "")
@@ -1459,7 +1671,16 @@ def scrape_shutuba_data(race_id, mode="JRA", history_df=None):
                 entry["性齢"] = "牡3" # Default fallback
             
             data.append(entry)
+            name_refs.append((entry, jockey_url, trainer_url))
             
+        # Resolve names first seen on this card in one concurrent batch
+        card_urls = [url for _, j_url, t_url in name_refs for url in (j_url, t_url) if url]
+        if any(url not in NAMES.store for url in card_urls):
+            NAMES.resolve_pending(card_urls)
+            for entry, jockey_url, trainer_url in name_refs:
+                entry["騎手"] = NAMES.lookup(jockey_url, entry["騎手"])
+                entry["厩舎"] = NAMES.lookup(trainer_url, entry["厩舎"])
+
         df = pd.DataFrame(data)
         
         # Merge Current Odds
@@ -1501,22 +1722,24 @@ def scrape_shutuba_data(race_id, mode="JRA", history_df=None):
 
         # Load History
         full_history = pd.DataFrame()
+        # Memory-mapped per-horse history index (if built): gathers one horse's runs without loading the database
+        history_index = horse_history.get_history(mode)
         
         if history_df is not None:
              # Use provided dataframe (Cached)
              full_history = history_df
-        else:
-            # Fallback to loading from CSV
+        elif history_index is None:
+            # Fallback: read only this race's horses from the local database (partitioned dataset if built)
             csv_path = CSV_FILE_PATH_NAR if mode == "NAR" else CSV_FILE_PATH
-            if os.path.exists(csv_path):
-                 print(f"  Loading local history from {csv_path} for enrichment...")
+            hids = set(clean_horse_ids(df['horse_id'])) if 'horse_id' in df.columns else set()
+            if hids and (race_dataset.exists(mode) or os.path.exists(csv_path)):
+                 print(f"  Loading local history of {len(hids)} horses for enrichment...")
                  try:
-                     full_history = pd.read_csv(csv_path, dtype={'horse_id': str, 'race_id': str})
-                     if 'horse_id' in full_history.columns:
-                         full_history['horse_id'] = full_history['horse_id'].astype(str).str.replace(r'\.0$', '', regex=True)
+                     full_history = race_dataset.read(mode, horse_ids=hids)
                  except Exception as e:
-                     print(f"  Failed to load CSV history: {e}")
+                     print(f"  Failed to load local history: {e}")
 
+        get_pedigree_store().flush()
 
         print(f"  Enriching {len(df)} horses with past data...")
         past_columns = []
@@ -1535,7 +1758,9 @@ def scrape_shutuba_data(race_id, mode="JRA", history_df=None):
                 # Use Cache
                 global HORSE_HISTORY_CACHE
                 
-                # Try to fill cache from local CSV if not present
+                # Try the history index first, then the local database frame
+                if hid not in HORSE_HISTORY_CACHE and history_index is not None and hid in history_index:
+                     HORSE_HISTORY_CACHE[hid] = history_index.runs(hid)
                 if hid not in HORSE_HISTORY_CACHE and not full_history.empty:
                      if 'horse_id' in full_history.columns:
                          subset = full_history[full_history['horse_id'] == str(hid)]
@@ -1587,6 +1812,15 @@ def scrape_shutuba_data(race_id, mode="JRA", history_df=None):
     except Exception as e:
         print(f"Error scraping Shutuba {race_id}: {e}")
         return None
+
+async def scrape_shutuba_data_async(race_id, fetcher, mode="JRA", history_df=None):
+    """
+    Async counterpart of scrape_shutuba_data.
+    The card is enriched with several dependent lookups (profiles, name resolution),
+    so it runs in the fetcher's I/O pool; requests stay within the shared per-host budget.
+    """
+    return await fetcher.run_blocking(scrape_shutuba_data, race_id, mode, history_df)
+
 def get_start_params(start_args=None, end_args=None, places_args=None):
     """
     start_args, end_args: datetime objects or None.
@@ -1601,6 +1835,8 @@ def get_start_params(start_args=None, end_args=None, places_args=None):
     parser.add_argument("--source", type=str, default="netkeiba", help="Scraping source: 'netkeiba' or 'jra'")
     parser.add_argument("--mode", type=str, default="JRA", help="Mode: 'JRA' or 'NAR'")
     parser.add_argument("--force", action="store_true", help="Force scrape (Ignore existing data)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry races that failed in previous bulk runs")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for bulk (JRA/NAR) runs, sharing one request budget")
     
     # Only parse args if not provided programmatically or if we want to fallback
     # If called from admin UI, sys.argv might contain streamlit args, so be careful.
@@ -1643,42 +1879,55 @@ def get_start_params(start_args=None, end_args=None, places_args=None):
         # 既存データの最新日を参考情報として表示（ただし開始日には使わない）
         if os.path.exists(CSV_FILE_PATH):
             try:
-                df_existing = pd.read_csv(CSV_FILE_PATH)
-                if '日付' in df_existing.columns and not df_existing.empty:
-                    df_existing['date_obj'] = pd.to_datetime(df_existing['日付'], format='%Y年%m月%d日', errors='coerce')
-                    last_date = df_existing['date_obj'].max()
-
-                    if pd.notna(last_date):
-                        print(f"ℹ️ 既存データの最終日: {last_date.strftime('%Y-%m-%d')}")
-                        print(f"💡 既存race_idは自動的にスキップされるため、欠落分のみ取得します")
+                known = load_race_ids(CSV_FILE_PATH)
+                if known.dates is not None and len(known.dates) > 0:
+                    last_date = pd.Timestamp(known.dates.max())
+                    print(f"ℹ️ 既存データの最終日: {last_date.strftime('%Y-%m-%d')}")
+                    print(f"💡 既存race_idは自動的にスキップされるため、欠落分のみ取得します")
             except Exception as e:
-                print(f"既存CSV読み込みエラー: {e}")
+                print(f"既存データ読み込みエラー: {e}")
 
     if start_date is None:
          # フォールバック
          print("デフォルト開始日: 2023-01-01")
          start_date = datetime(2023, 1, 1)
 
-    return start_date, args.end, target_places, args.source, args.mode, args.force
+    return start_date, args.end, target_places, args.source, args.mode, args.force, args.retry_failed, args.workers
+
+def _report_queue(queue, counts):
+    for kind, states in counts.items():
+        print(f"  {kind}: " + ", ".join(f"{state}={n}" for state, n in sorted(states.items())))
+    failures = queue.failures()
+    if failures:
+        print(f"⚠️ {len(failures)} failed task(s) (retry with --retry-failed):")
+        for kind, key, attempts, error in failures[:10]:
+            print(f"    {kind} {key} (attempts={attempts}): {error}")
+    for host, m in rate_limit.metrics().items():
+        print(f"  {host}: rate={m['rate']}/{m['ceiling']} req/s, responses={m['responses']}, "
+              f"throttled={m['throttled']}, errors={m['errors']}, trips={m['trips']}")
 
 # ==========================================
 # 3. メイン実行処理
 # ==========================================
-def main(start_date_arg=None, end_date_arg=None, places_arg=None, source_arg=None, mode_arg=None, force_arg=False, progress_callback=None):
+def main(start_date_arg=None, end_date_arg=None, places_arg=None, source_arg=None, mode_arg=None, force_arg=False, progress_callback=None, retry_failed_arg=False, workers_arg=None):
     """
     progress_callback: function(str) -> None. If provided, call with status update.
+    retry_failed_arg: re-queue races that failed in previous bulk (JRA/NAR) runs.
+    workers_arg: number of worker processes for bulk (JRA/NAR) runs (see worker_pool).
     """
     print("=== 自動スクレイピング開始 ===")
     start_time = time.time()
     
     
     # Pass arguments to helper
-    start_date, end_arg_cli, places, source_cli, mode_cli, force_cli = get_start_params(start_date_arg, end_date_arg, places_arg)
+    start_date, end_arg_cli, places, source_cli, mode_cli, force_cli, retry_failed_cli, workers_cli = get_start_params(start_date_arg, end_date_arg, places_arg)
     
     # Prioritize function arg over CLI
     source = source_arg if source_arg else source_cli
     mode = mode_arg if mode_arg else mode_cli
     force = force_arg if force_arg else force_cli
+    retry_failed = retry_failed_arg or retry_failed_cli
+    workers = max(1, workers_arg or workers_cli or 1)
     
     today = datetime.now()
     
@@ -1770,38 +2019,36 @@ def main(start_date_arg=None, end_date_arg=None, places_arg=None, source_arg=Non
             if progress_callback:
                 progress_callback(f"既存データ: {len(existing_race_ids)}レース、スキップして欠落分のみ取得")
 
-        # Callback wrapper to save to database_nar.parquet
         def save_nar_callback(df_new):
             if df_new is None or df_new.empty: return
-            csv_target = CSV_FILE_PATH_NAR
-            if os.path.exists(csv_target):
-                try:
-                    existing = pd.read_parquet(csv_target)
-                    combined = pd.concat([existing, df_new], ignore_index=True)
-                    # Deduplicate based on race_id and horse_number/horse_name
-                    # Or just race_id + horse_number
-                    if 'race_id' in combined.columns and '馬 番' in combined.columns:
-                        combined = combined.drop_duplicates(subset=['race_id', '馬 番'], keep='last')
-                    combined.to_parquet(csv_target, index=False, compression='snappy')
-                    print(f"Saved {len(df_new)} rows to {csv_target} (Total {len(combined)})")
-                except:
-                    df_new.to_parquet(csv_target, index=False, compression='snappy')
-            else:
-                df_new.to_parquet(csv_target, index=False, compression='snappy')
-                print(f"Created {csv_target} with {len(df_new)} rows.")
-
-        # Loop years if range spans multiple years
-        current_y = start_date.year
-        end_y = end_date.year
-
-        for y in range(current_y, end_y + 1):
-             scrape_nar_year(
-                 str(y),
-                 start_date=start_date.date(),
-                 end_date=end_date.date(),
-                 save_callback=save_nar_callback,
-                 existing_race_ids=existing_race_ids  # 既存IDを渡す
-             )
+            nar_sink.append(df_new)
+            print(f"Saved {len(df_new)} rows to {CSV_FILE_PATH_NAR} (+{nar_sink.rows_appended} this run)")
+
+        # Progress is kept in the job queue: a restart resumes where it stopped
+        queue = JobQueue()
+        enqueue_nar_days(queue, start_date.date(), end_date.date(), reset=force)
+        if retry_failed:
+            print(f"🔁 Retrying {queue.retry_failed(kind='nar_race')} failed race(s)")
+
+        async def _scrape_nar_queue():
+            async with AsyncFetcher() as fetcher:
+                handlers = nar_backfill_handlers(fetcher, save_nar_callback, existing_race_ids)
+                return await drain_async(queue, handlers, progress_callback=progress_callback, reset_discovered=force)
+
+        if workers > 1:
+            # Worker processes write their own fragments; the pool compacts them at the end
+            counts = run_backfill_pool("NAR", start_date.date(), end_date.date(), workers, CSV_FILE_PATH_NAR,
+                                       ['race_id', '馬 番'], existing_race_ids=existing_race_ids, force=force,
+                                       queue=queue, progress_callback=progress_callback)
+        else:
+            # Append-only sink for database_nar.parquet (dedup on race_id + horse number at compaction)
+            nar_sink = ParquetSink(CSV_FILE_PATH_NAR, subset=['race_id', '馬 番'], dataset_mode="NAR")
+            try:
+                counts = run_async(_scrape_nar_queue())
+            finally:
+                nar_sink.close()
+        _report_queue(queue, counts)
+        queue.close()
 
         print("NAR Scraping Completed.")
         if progress_callback: progress_callback("NAR Scraping Completed.")
@@ -1857,49 +2104,54 @@ def main(start_date_arg=None, end_date_arg=None, places_arg=None, source_arg=Non
         # We need to span years
         years_to_scan = range(start_date.year, end_date.year + 1)
 
-        # Save Callback Wrapper
+        # Save Callback Wrapper (writes to the single-process sink below)
         def save_chunk_wrapper(df_chunk):
-            # Same save logic as existing
-             CSV_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "raw", "database.parquet")
-             if os.path.exists(CSV_FILE_PATH):
-                try:
-                    existing_df = pd.read_parquet(CSV_FILE_PATH)
-                    combined_df = pd.concat([existing_df, df_chunk], ignore_index=True)
-                except:
-                    combined_df = df_chunk
-             else:
-                combined_df = df_chunk
-
-             # Deduplicate
-             subset_cols = ['race_id', '馬名']
-             subset_cols = [c for c in subset_cols if c in combined_df.columns]
-             if subset_cols:
-                 combined_df.drop_duplicates(subset=subset_cols, keep='last', inplace=True)
-
-             combined_df.to_parquet(CSV_FILE_PATH, index=False, compression='snappy')
-             msg = f"  -> JRA Save: {len(df_chunk)} rows. Total: {len(combined_df)}"
+             jra_sink.append(df_chunk)
+             msg = f"  -> JRA Save: {len(df_chunk)} rows. This run: {jra_sink.rows_appended}"
              print(msg)
              if progress_callback: progress_callback(msg)
 
+        # Progress is kept in the job queue: a restart resumes where it stopped
+        queue = JobQueue()
         for year in years_to_scan:
-             print(f"Starting JRA Scrape for Year {year}...")
-             if progress_callback: progress_callback(f"JRAスクレイピング開始: {year}年")
-
-             # Adjust start/end for this year chunk if needed, but scrape_jra_year handles full date range filter
-             scrape_jra_year(
-                 str(year),
-                 start_date=start_date.date(),
-                 end_date=end_date.date(),
-                 save_callback=save_chunk_wrapper,
-                 existing_race_ids=existing_race_ids  # 既存IDを渡す
-             )
+            enqueue_jra_months(queue, str(year), start_date.date(), end_date.date(), reset=force)
+        if retry_failed:
+            print(f"🔁 Retrying {queue.retry_failed(kind='jra_race')} failed race(s)")
+        if progress_callback: progress_callback(f"JRAスクレイピング開始: {start_date.year}〜{end_date.year}年")
+
+        async def _scrape_jra_queue():
+            async with AsyncFetcher() as fetcher:
+                handlers = jra_backfill_handlers(
+                    fetcher,
+                    start_date=start_date.date(),
+                    end_date=end_date.date(),
+                    save_callback=save_chunk_wrapper,
+                    existing_race_ids=existing_race_ids  # 既存IDを渡す
+                )
+                return await drain_async(queue, handlers, progress_callback=progress_callback, reset_discovered=force)
+
+        if workers > 1:
+            counts = run_backfill_pool("JRA", start_date.date(), end_date.date(), workers, CSV_FILE_PATH,
+                                       ['race_id', '馬名'], existing_race_ids=existing_race_ids, force=force,
+                                       queue=queue, progress_callback=progress_callback)
+        else:
+            # Append-only sink, dedup on race_id + 馬名 at compaction
+            jra_sink = ParquetSink(CSV_FILE_PATH, subset=['race_id', '馬名'], dataset_mode="JRA")
+            try:
+                counts = run_async(_scrape_jra_queue())
+            finally:
+                jra_sink.close()
+        _report_queue(queue, counts)
+        queue.close()
 
         print(f"所要時間: {(time.time() - start_time)/60:.1f} 分")
         return
 
     # === Default: Netkeiba Logic ===
 
-    all_data = []
+    # 取得したレースはその都度追記する (統合・重複排除は最後にまとめて行う)
+    sink = ParquetSink(CSV_FILE_PATH, subset=['race_id', '馬名'], dataset_mode="JRA")
+    added_rows = 0
     
     # 年ごとのループ
     years_to_scan = range(start_date.year, end_date.year + 1)
@@ -1908,14 +2160,12 @@ def main(start_date_arg=None, end_date_arg=None, places_arg=None, source_arg=Non
     kais = range(1, 7)    # 開催回
     days = range(1, 13)   # 開催日数
     
-    existing_ids = set()
+    existing_ids = RaceIdSet()
     if os.path.exists(CSV_FILE_PATH):
         try:
-            df_ex = pd.read_csv(CSV_FILE_PATH)
-            if 'race_id' in df_ex.columns:
-                existing_ids = set(df_ex['race_id'].astype(str))
-        except:
-            pass
+            existing_ids = sink.load_index()
+        except Exception as e:
+            print(f"⚠️ race_id索引の読み込みに失敗: {e}")
 
     for year in years_to_scan:
         for place in places:
@@ -1930,9 +2180,7 @@ def main(start_date_arg=None, end_date_arg=None, places_arg=None, source_arg=Non
                     if progress_callback: progress_callback(status_text)
                     print(f"Search: {check_race_id} ... ", end="")
                     
-                    # サーバー負荷軽減
-                    time.sleep(1)
-                    
+                    # サーバー負荷軽減は http_client のホスト別予算で行う
                     first_race_df = scrape_race_data(check_race_id)
                     
                     if first_race_df is None:
@@ -1965,7 +2213,7 @@ def main(start_date_arg=None, end_date_arg=None, places_arg=None, source_arg=Non
                         
                         # 1Rを保存
                         if check_race_id not in existing_ids:
-                             all_data.append(first_race_df)
+                             added_rows += sink.append(first_race_df)
                         
                         # 2R〜12R
                         for r in range(2, 13):
@@ -1975,61 +2223,24 @@ def main(start_date_arg=None, end_date_arg=None, places_arg=None, source_arg=Non
                                 
                             if progress_callback: progress_callback(f"取得中: {race_date_str} {r}R ({race_id})")
                             
-                            time.sleep(1) # Wait
                             df = scrape_race_data(race_id)
                             if df is not None:
-                                all_data.append(df)
-                                # Incremental Save Support (Local/Manual run)
-                                # Note: This 'Netkeiba Logic' block calculates 'all_data' and saves at end.
-                                # To support incremental save here, we would need a callback or logic.
-                                # Check if 'save_nar_callback' is available in scope? No.
+                                added_rows += sink.append(df)
                                 print(f".", end="", flush=True) 
                             else:
                                 break
                         print(" Done")
 
     # ==========================================
-    # CSV保存 (追記 or 新規)
+    # 保存 (断片をベースに統合)
     # ==========================================
-    if len(all_data) > 0:
-        print("\nデータ結合中...")
-        new_df = pd.concat(all_data, ignore_index=True)
-        
-        # 既存データとマージ
-        # 既存データとマージ
-        if os.path.exists(CSV_FILE_PATH):
-            try:
-                existing_df = pd.read_parquet(CSV_FILE_PATH)
-                combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-            except:
-                combined_df = new_df
-        else:
-            combined_df = new_df
-        
-        # Column name cleaning
-        # Sometimes header has newlines
-        
-        # 重複排除
-        # race_id と 馬名 でユニークにする
-        subset_cols = ['race_id', '馬名']
-        # 実際に存在するカラムだけでフィルタ
-        subset_cols = [c for c in subset_cols if c in combined_df.columns]
-        
-        if subset_cols:
-            combined_df.drop_duplicates(subset=subset_cols, keep='last', inplace=True)
-        
-        # 日付ソート
-        try:
-            combined_df['date_obj'] = pd.to_datetime(combined_df['日付'], format='%Y年%m月%d日', errors='coerce')
-            combined_df = combined_df.sort_values(['date_obj', 'race_id'])
-            combined_df = combined_df.drop(columns=['date_obj'])
-        except:
-            pass
-
-        combined_df.to_parquet(CSV_FILE_PATH, index=False, compression='snappy')
-        print(f"保存完了: {len(new_df)} 件追加 (Total: {len(combined_df)})")
+    if added_rows > 0:
+        print("\nデータ統合中...")
+        total = sink.close()
+        print(f"保存完了: {added_rows} 件追加 (Total: {total})")
         print(f"ファイル: {CSV_FILE_PATH}")
     else:
+        sink.close()
         print("新規取得データはありませんでした。")
 
     print(f"所要時間: {(time.time() - start_time)/60:.1f} 分")
@@ -2048,39 +2259,43 @@ if __name__ == "__main__":
     parser.add_argument("--places", type=str, help="Target places")
     parser.add_argument("--source", type=str, help="Source: netkeiba or jra")
     parser.add_argument("--mode", type=str, help="Mode: JRA or NAR")
+    parser.add_argument("--poll-odds", action="store_true", help="Poll today's odds until the last race closes (needs the --today schedule)")
+    parser.add_argument("--poll-minutes", type=float, help="Stop odds polling after this many minutes")
+    parser.add_argument("--alerts", action="store_true", help="With --poll-odds: send EV alerts for the predictions saved by the app")
+    parser.add_argument("--alert-log", type=str, default=os.path.join(PROJECT_ROOT, "data", "alerts.jsonl"), help="EV alert log (JSON Lines)")
+    parser.add_argument("--alert-predictions", type=str, help="Predictions file written by the app (default: data/alert_predictions.json)")
     
     args, unknown = parser.parse_known_args()
     
     if args.today:
         mode = args.mode if args.mode else "JRA"
         scrape_todays_schedule(mode=mode)
+    elif args.poll_odds:
+        try:
+            from odds_poller import run_odds_poller
+        except ImportError:
+            from .odds_poller import run_odds_poller
+        alert_engine = None
+        if args.alerts:
+            if PROJECT_ROOT not in sys.path:
+                sys.path.append(PROJECT_ROOT)
+            from utils.alert import engine_from_env
+            alert_engine = engine_from_env(log_path=args.alert_log, predictions_path=args.alert_predictions,
+                                           safety_threshold=0.03 if args.mode == "NAR" else 0.04)
+            print(f"EV alerts: {len(alert_engine.races)} race(s) with predictions")
+        run_odds_poller(mode=args.mode or "JRA", duration=args.poll_minutes * 60 if args.poll_minutes else None,
+                        alert_engine=alert_engine)
     elif args.jra_url:
         print(f"Direct JRA Mode: {args.jra_url}")
         df = scrape_jra_race(args.jra_url)
         if df is not None and not df.empty:
-            # Save logic (similar to main)
-            # We can reuse the save logic but it's embedded in main()
-            # Let's minimal-copy the save logic here for simplicity or refactor
-            # For now, append to CSV directly
-            CSV_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "raw", "database.parquet")
-            
-            if os.path.exists(CSV_FILE_PATH):
-                try:
-                    existing_df = pd.read_parquet(CSV_FILE_PATH)
-                    combined_df = pd.concat([existing_df, df], ignore_index=True)
-                except:
-                    combined_df = df
-            else:
-                combined_df = df
-                
-            # Deduplicate
-            subset_cols = ['race_id', '馬名']
-            subset_cols = [c for c in subset_cols if c in combined_df.columns]
-            if subset_cols:
-                combined_df.drop_duplicates(subset=subset_cols, keep='last', inplace=True)
-            
-            combined_df.to_parquet(CSV_FILE_PATH, index=False, compression='snappy')
-            print(f"Saved to {CSV_FILE_PATH}")
+            # Same append-only path as the bulk writers (manifest, race index and derived data stay in sync)
+            sink = ParquetSink(CSV_FILE_PATH, subset=['race_id', '馬名'], dataset_mode="JRA")
+            try:
+                sink.append(df)
+            finally:
+                sink.close()
+            print(f"Saved {len(df)} rows to {CSV_FILE_PATH}")
         else:
             print("Failed to scrape JRA data.")
     elif args.jra_year:
@@ -2104,28 +2319,16 @@ if __name__ == "__main__":
                 sys.exit(1)
 
         # Define save callback to handle incremental saves
+        sink = ParquetSink(CSV_FILE_PATH, subset=['race_id', '馬名'], dataset_mode="JRA")
+
         def save_chunk(df_chunk):
-            CSV_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "raw", "database.parquet")
-            
-            if os.path.exists(CSV_FILE_PATH):
-                try:
-                    existing_df = pd.read_parquet(CSV_FILE_PATH)
-                    combined_df = pd.concat([existing_df, df_chunk], ignore_index=True)
-                except:
-                    combined_df = df_chunk
-            else:
-                combined_df = df_chunk
+            sink.append(df_chunk)
+            print(f"  -> Saved {len(df_chunk)} rows. This run: {sink.rows_appended}")
             
-            # Deduplicate
-            subset_cols = ['race_id', '馬名']
-            subset_cols = [c for c in subset_cols if c in combined_df.columns]
-            if subset_cols:
-                combined_df.drop_duplicates(subset=subset_cols, keep='last', inplace=True)
-            
-            combined_df.to_parquet(CSV_FILE_PATH, index=False, compression='snappy')
-            print(f"  -> Saved {len(df_chunk)} rows. Total: {len(combined_df)}")
-            
-        scrape_jra_year(args.jra_year, start_date=start_date, end_date=end_date, save_callback=save_chunk)
+        try:
+            scrape_jra_year(args.jra_year, start_date=start_date, end_date=end_date, save_callback=save_chunk)
+        finally:
+            sink.close()
 
     else:
         # Pass unknown arguments or parse them again inside main/get_start_params 
@@ -0,0 +1,82 @@
+"""
+プロセス間ファイルロック
+同じファイルを複数のプロセス (スクレイピングワーカー・アプリ) から更新する箇所で使う
+
+    with FileLock(path + ".lock"):
+        ...
+"""
+
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    排他ロック (POSIX は flock、Windows は msvcrt.locking)
+
+    同一プロセス内のスレッド間でも排他になる。再入はできない。
+    """
+
+    def __init__(self, path, timeout=None, poll_interval=0.05):
+        """
+        Args:
+            path: ロックファイルのパス (なければ作成)
+            timeout: 取得を待つ最大秒数 (None は無制限)。超えた場合は TimeoutError
+            poll_interval: Windows でのリトライ間隔
+        """
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+        self._thread_lock = threading.Lock()
+
+    def acquire(self):
+        if not self._thread_lock.acquire(timeout=-1 if self.timeout is None else self.timeout):
+            raise TimeoutError(f"Could not lock {self.path}")
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            deadline = None if self.timeout is None else time.monotonic() + self.timeout
+            while True:
+                try:
+                    if fcntl is not None:
+                        flags = fcntl.LOCK_EX if deadline is None else fcntl.LOCK_EX | fcntl.LOCK_NB
+                        fcntl.flock(fd, flags)
+                    else:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        os.close(fd)
+                        raise TimeoutError(f"Could not lock {self.path}")
+                    time.sleep(self.poll_interval)
+            self._fd = fd
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(fd)
+                self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -0,0 +1,440 @@
+"""
+馬ごとの戦績索引 (メモリマップで開く列指向ファイル)
+「馬 X の日付 D より前の全出走」を、データベース全体を読み込まずに取り出す
+
+レイアウト (data/raw/history):
+    data/raw/history/JRA/CURRENT                  現在の版のディレクトリ名 (置き換えは原子的)
+    data/raw/history/JRA/v1760000000000000000/
+        horse_ids.npy      馬の一覧 (固定長バイト列、昇順)
+        offsets.npy        馬ごとの開始位置 (int64、馬数+1)。馬 i の出走は offsets[i]:offsets[i+1]
+        date.npy           レース日 (int32、1970-01-01 からの日数)
+        race_id.npy        race_id (int64、数字でない場合は -1)
+        odds.npy ほか       数値列 (float32、欠損は NaN)
+        jockey.npy ほか     文字列列の辞書コード (int32、欠損は -1)
+        dictionaries.json  文字列列の辞書
+        meta.json          行数・馬数・作成元など
+
+- 行は (馬, 日付) 順。馬の位置は horse_ids の二分探索で求め、その馬の範囲だけをメモリマップから読む
+- 列名はスクレイパーの戦績 (RaceScraper.get_past_races) と同じ (date, rank, time, jockey, ...)。
+  JRA / NAR で異なるデータベースの列名はここで揃える
+- ParquetSink の統合時に、追記されたレースの出走を加えた新しい版を書いて CURRENT を切り替える
+  (読み込み側は開いている版をそのまま使い、次に get_history() を呼んだときに新しい版を開く)
+
+    history = get_history("JRA")
+    history.runs("2019105283", before="2025-07-26", limit=5)   # 新しい順
+    history.runs_many(horse_ids, before=race_date, limit=5)
+
+コマンドライン: python scripts/build_horse_history.py --mode JRA
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import race_dataset
+    from file_lock import FileLock
+except ImportError:
+    from . import race_dataset
+    from .file_lock import FileLock
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 数値列 (float32): 列名 → データベースの列名の候補
+NUMERIC_FIELDS = {
+    "odds": ["単勝 オッズ", "単勝オッズ", "単勝"],
+    "popularity": ["人 気", "人気"],
+    "last_3f": ["後3F", "上り"],
+    "distance": ["距離"],
+    "horse_weight": ["馬体重(増減)", "馬体重"],
+    "weight_change": ["増減", "馬体重(増減)"],
+}
+
+# 文字列列 (辞書コード): 列名 → データベースの列名の候補
+TEXT_FIELDS = {
+    "rank": ["着 順", "着順"],
+    "time": ["タイム"],
+    "run_style": ["コーナー 通過順", "コーナー通過順", "通過"],
+    "race_name": ["レース名"],
+    "jockey": ["騎手"],
+    "condition": ["馬場状態"],
+    "weather": ["天候"],
+    "course_type": ["コースタイプ"],
+    "venue": ["会場", "開催地"],
+}
+
+CORNER_COLUMNS = ["corner_1", "corner_2", "corner_3", "corner_4"]
+CURRENT_NAME = "CURRENT"
+EPOCH = np.datetime64("1970-01-01", "D")
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "root": os.environ.get("KEIBA_HISTORY_DIR") or os.path.join(PROJECT_ROOT, "data", "raw", "history"),
+    "keep_versions": 2,   # 残す版の数 (読み込み中のプロセスが古い版を開いていてもよいように)
+}
+
+
+def configure(**kwargs):
+    """
+    戦績索引の設定を変更する
+
+    Args:
+        root: 保存先ディレクトリ (モードごとのサブディレクトリを作る)
+        keep_versions: 残す版の数
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown horse_history option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+def _mode_dir(mode):
+    return os.path.join(CONFIG["root"], mode)
+
+
+def _current_version(mode):
+    try:
+        with open(os.path.join(_mode_dir(mode), CURRENT_NAME), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(_mode_dir(mode), name)
+    return path if name and os.path.isdir(path) else None
+
+
+def exists(mode="JRA"):
+    """索引が作成済みか"""
+    return _current_version(mode) is not None
+
+
+def source_columns():
+    """索引の作成に使うデータベースの列"""
+    names = ["horse_id", "race_id", "日付"] + CORNER_COLUMNS
+    for candidates in list(NUMERIC_FIELDS.values()) + list(TEXT_FIELDS.values()):
+        names.extend(candidates)
+    return list(dict.fromkeys(names))
+
+
+# --- encode ---
+
+def _pick(df, candidates):
+    for col in candidates:
+        if col in df.columns:
+            return df[col]
+    return None
+
+
+def _numbers(series, pattern=r"(-?\d+(?:\.\d+)?)"):
+    """先頭の数値を取り出す ('480(+2)' → 480, 'ダ1400' → 1400)"""
+    if series is None:
+        return None
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype("float32").to_numpy()
+    extracted = series.astype("str").str.extract(pattern, expand=False)
+    return pd.to_numeric(extracted, errors="coerce").astype("float32").to_numpy()
+
+
+def _numeric_field(df, name):
+    if name == "weight_change":
+        if "増減" in df.columns:
+            return _numbers(df["増減"], r"([+-]?\d+)")
+        return _numbers(_pick(df, ["馬体重(増減)"]), r"\(([+-]?\d+)\)")
+    return _numbers(_pick(df, NUMERIC_FIELDS[name]))
+
+
+def _text_field(df, name):
+    series = _pick(df, TEXT_FIELDS[name])
+    if series is None and name == "run_style":
+        corners = [c for c in CORNER_COLUMNS if c in df.columns]
+        if corners:
+            # JRA はコーナーごとの列 → '3-3-2-1'
+            parts = df[corners].apply(pd.to_numeric, errors="coerce").astype("Int64").astype("str").fillna("")
+            series = parts[corners[0]]
+            for col in corners[1:]:
+                series = series + "-" + parts[col]
+            series = series.str.replace("<NA>", "").str.replace(r"-{2,}", "-", regex=True).str.strip("-")
+            series = series.where(series != "", None)
+    return series
+
+
+def _encode_text(series, dictionary, index, n):
+    """文字列を辞書コードにする (辞書にない値は追加する。列がなければ n 行すべて欠損 -1)"""
+    codes = np.full(n, -1, dtype=np.int32)
+    if series is None:
+        return codes
+    text = series.astype("str").str.strip()
+    missing = (series.isna() | text.isin(["", "nan", "None"])).to_numpy()
+    local, uniques = pd.factorize(text.where(~missing))
+    mapping = np.empty(len(uniques), dtype=np.int32)
+    for i, value in enumerate(uniques):
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(dictionary)
+            dictionary.append(value)
+        mapping[i] = code
+    present = local >= 0
+    codes[present] = mapping[local[present]]
+    return codes
+
+
+def _encode(df, dictionaries):
+    """
+    データベースの行を索引の列にする (horse_id・日付のない行は除く)
+
+    Returns:
+        dict: horse (bytes 配列), date, race_id, 数値列, 文字列列の辞書コード
+    """
+    if "horse_id" not in df.columns or "日付" not in df.columns:
+        raise ValueError("horse_id and 日付 columns are required to index horse history")
+    horse = race_dataset._id_text(df["horse_id"])
+    dates = race_dataset.parse_race_dates(df["日付"])
+    keep = (dates.notna() & horse.str.fullmatch(r"[0-9A-Za-z]+") & ~horse.isin(["nan", "None"])).to_numpy()
+    df = df[keep].reset_index(drop=True)
+
+    arrays = {
+        "horse": horse[keep].to_numpy().astype("S"),
+        "date": ((dates[keep].to_numpy().astype("datetime64[D]") - EPOCH).astype(np.int32)),
+    }
+    race_ids = pd.to_numeric(race_dataset._id_text(df["race_id"]), errors="coerce") if "race_id" in df.columns else None
+    arrays["race_id"] = (race_ids.fillna(-1).astype(np.int64).to_numpy() if race_ids is not None
+                         else np.full(len(df), -1, dtype=np.int64))
+    for name in NUMERIC_FIELDS:
+        values = _numeric_field(df, name)
+        arrays[name] = values if values is not None else np.full(len(df), np.nan, dtype=np.float32)
+    for name in TEXT_FIELDS:
+        dictionary = dictionaries.setdefault(name, [])
+        index = {v: i for i, v in enumerate(dictionary)}
+        arrays[name] = _encode_text(_text_field(df, name), dictionary, index, len(df))
+    return arrays
+
+
+def _finalize(arrays):
+    """同じ馬・レース (race_id、ない場合は日付) の重複を後の行を残して除き、(馬, 日付) 順に並べる"""
+    n = len(arrays["horse"])
+    seq = np.arange(n)
+    race = np.where(arrays["race_id"] >= 0, arrays["race_id"], -1 - arrays["date"].astype(np.int64))
+    order = np.lexsort((seq, race, arrays["horse"]))
+    horse, race = arrays["horse"][order], race[order]
+    last = np.ones(n, dtype=bool)
+    if n > 1:
+        last[:-1] = (horse[1:] != horse[:-1]) | (race[1:] != race[:-1])
+    keep = order[last]
+    keep = keep[np.lexsort((arrays["race_id"][keep], arrays["date"][keep], arrays["horse"][keep]))]
+    return {name: values[keep] for name, values in arrays.items()}
+
+
+# --- write ---
+
+def _write_version(mode, arrays, dictionaries, meta):
+    """新しい版を書いて CURRENT を切り替える (古い版は keep_versions を超えた分を消す)"""
+    base = _mode_dir(mode)
+    os.makedirs(base, exist_ok=True)
+    name = f"v{time.time_ns()}"
+    staging = os.path.join(base, f".{name}.tmp")
+    os.makedirs(staging)
+
+    horse = arrays["horse"]
+    horse_ids, starts = np.unique(horse, return_index=True)
+    offsets = np.append(starts, len(horse)).astype(np.int64)
+    np.save(os.path.join(staging, "horse_ids.npy"), horse_ids)
+    np.save(os.path.join(staging, "offsets.npy"), offsets)
+    for col, values in arrays.items():
+        if col != "horse":
+            np.save(os.path.join(staging, f"{col}.npy"), np.ascontiguousarray(values))
+    with open(os.path.join(staging, "dictionaries.json"), "w", encoding="utf-8") as f:
+        json.dump(dictionaries, f, ensure_ascii=False)
+    meta = dict(meta, rows=len(horse), horses=len(horse_ids),
+                max_date=str(EPOCH + int(arrays["date"].max())) if len(horse) else None,
+                updated_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(staging, os.path.join(base, name))
+
+    pointer = os.path.join(base, f".{CURRENT_NAME}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(base, CURRENT_NAME))
+
+    versions = sorted(d for d in os.listdir(base) if d.startswith("v") and os.path.isdir(os.path.join(base, d)))
+    for old in versions[:-max(1, CONFIG["keep_versions"])]:
+        shutil.rmtree(os.path.join(base, old), ignore_errors=True)
+    return meta
+
+
+def _lock(mode):
+    os.makedirs(_mode_dir(mode), exist_ok=True)
+    return FileLock(os.path.join(_mode_dir(mode), ".lock"))
+
+
+def build(mode="JRA", df=None):
+    """
+    データベース (分割データセット、なければ Parquet) から索引を作り直す
+
+    Args:
+        mode: "JRA" / "NAR"
+        df: 索引にする行 (省略時はデータベースから必要な列だけを読む)
+
+    Returns:
+        dict: meta (rows, horses, max_date, ...)
+    """
+    started = time.monotonic()
+    if df is None:
+        df = race_dataset.read(mode, columns=source_columns())
+    if df.empty:
+        raise ValueError(f"No {mode} results to index")
+    dictionaries = {}
+    arrays = _finalize(_encode(df, dictionaries))
+    with _lock(mode):
+        meta = _write_version(mode, arrays, dictionaries, {"mode": mode, "built_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+    print(f"Built {mode} horse history: {meta['rows']} runs of {meta['horses']} horses "
+          f"({time.monotonic() - started:.1f}s)")
+    return meta
+
+
+def update(mode, df):
+    """
+    新しい出走を加えた版を書く (同じ馬・レースの行は置き換える)。索引が未作成なら何もしない
+
+    既存の版はメモリマップから配列のまま結合するため、データベースは読み直さない。
+
+    Returns:
+        int: 加えた行数
+    """
+    if df is None or df.empty or not exists(mode):
+        return 0
+    with _lock(mode):
+        current = HorseHistory(_current_version(mode))
+        dictionaries = {name: list(values) for name, values in current.dictionaries.items()}
+        fresh = _encode(df, dictionaries)
+        lengths = np.diff(current.offsets)
+        old = {"horse": np.repeat(np.asarray(current.horse_ids), lengths)}
+        old.update({name: np.asarray(current.columns[name]) for name in fresh if name != "horse"})
+        width = max(old["horse"].dtype.itemsize, fresh["horse"].dtype.itemsize)
+        merged = {name: np.concatenate([old[name].astype(f"S{width}") if name == "horse" else old[name],
+                                        fresh[name].astype(f"S{width}") if name == "horse" else fresh[name]])
+                  for name in fresh}
+        meta = _write_version(mode, _finalize(merged), dictionaries, current.meta)
+    return len(fresh["horse"])
+
+
+# --- read ---
+
+class HorseHistory:
+    """
+    1つの版の索引 (列はメモリマップで開き、必要な範囲だけが読まれる)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "dictionaries.json"), "r", encoding="utf-8") as f:
+            self.dictionaries = {k: np.array(v + [None], dtype=object) for k, v in json.load(f).items()}
+        self.horse_ids = np.load(os.path.join(path, "horse_ids.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        names = ["date", "race_id"] + list(NUMERIC_FIELDS) + list(TEXT_FIELDS)
+        self.columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in names}
+
+    def __len__(self):
+        return len(self.horse_ids)
+
+    def __contains__(self, horse_id):
+        return self.locate(horse_id)[1] > 0
+
+    def locate(self, horse_id):
+        """馬の出走の範囲 (start, length)。索引にない馬は (0, 0)"""
+        key = str(horse_id).removesuffix(".0").encode("ascii", "ignore")
+        if not key or len(key) > self.horse_ids.dtype.itemsize:
+            return 0, 0
+        i = int(np.searchsorted(self.horse_ids, key))
+        if i >= len(self.horse_ids) or self.horse_ids[i] != key:
+            return 0, 0
+        start = int(self.offsets[i])
+        return start, int(self.offsets[i + 1]) - start
+
+    def _frame(self, index, columns=None):
+        names = columns or (["date", "race_id"] + list(NUMERIC_FIELDS) + list(TEXT_FIELDS))
+        data = {}
+        for name in names:
+            values = self.columns[name][index]
+            if name == "date":
+                day = EPOCH + values.astype("timedelta64[D]")
+                data["date"] = pd.to_datetime(day).strftime("%Y/%m/%d")
+                data["date_obj"] = pd.to_datetime(day)
+            elif name == "race_id":
+                data[name] = np.where(values >= 0, values.astype(str), None)
+            elif name in TEXT_FIELDS:
+                data[name] = self.dictionaries[name][values]   # -1 は末尾の None
+            else:
+                # float32 の表現誤差を元の桁 (小数2桁程度) に戻す
+                data[name] = values.astype(np.float64).round(4)
+        return pd.DataFrame(data)
+
+    def _run_index(self, horse_id, before=None, limit=None):
+        start, length = self.locate(horse_id)
+        stop = start + length
+        if length and before is not None:
+            cutoff = (np.datetime64(pd.Timestamp(before).date(), "D") - EPOCH).astype(np.int32)
+            stop = start + int(np.searchsorted(self.columns["date"][start:stop], cutoff, side="left"))
+        if limit is not None:
+            start = max(start, stop - limit)
+        return np.arange(stop - 1, start - 1, -1)
+
+    def runs(self, horse_id, before=None, limit=None, columns=None):
+        """
+        馬の出走 (新しい順)
+
+        Args:
+            horse_id: 馬ID
+            before: この日付より前の出走だけにする (当日は含まない)
+            limit: 新しい方から最大何走か
+            columns: 返す列 (省略時は全列)
+
+        Returns:
+            pd.DataFrame: date ('YYYY/MM/DD')・date_obj・race_id・数値列・文字列列
+        """
+        return self._frame(self._run_index(horse_id, before, limit), columns)
+
+    def runs_many(self, horse_ids, before=None, limit=None, columns=None):
+        """
+        複数の馬の出走 (馬ごとに新しい順、horse_id 列つき)
+
+        Args:
+            before: 日付 (全馬共通) または {horse_id: 日付}
+        """
+        parts, owners = [], []
+        for hid in horse_ids:
+            cutoff = before.get(hid) if isinstance(before, dict) else before
+            index = self._run_index(hid, cutoff, limit)
+            parts.append(index)
+            owners.extend([str(hid)] * len(index))
+        index = np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+        df = self._frame(index, columns)
+        df.insert(0, "horse_id", owners)
+        return df
+
+
+_opened = {}
+
+
+def get_history(mode="JRA"):
+    """
+    モードの現在の索引を開く (開いた版はプロセス内で再利用し、CURRENT が切り替わったら開き直す)
+
+    Returns:
+        HorseHistory (索引が未作成なら None)
+    """
+    path = _current_version(mode)
+    if path is None:
+        return None
+    cached = _opened.get(mode)
+    if cached is None or cached.path != path:
+        cached = _opened[mode] = HorseHistory(path)
+    return cached
@@ -0,0 +1,440 @@
+"""
+取得ページのアーカイブ (生HTML)
+ネットワークから取得したページを圧縮して追記保存し、URL と取得時刻で引けるようにする
+
+解析処理を直したときに再取得せず、アーカイブに対して現在の抽出処理を実行し直すためのもの (reparse.py)。
+response_cache が「最新の1件を再利用する」キャッシュなのに対し、こちらは取得のたびに履歴として残す。
+
+レイアウト (data/archive/html):
+    index.db                         索引 (SQLite, WAL): リクエスト行・URL・種類・取得時刻 → セグメント内の位置
+    segments/YYYYMM/<pid>-<id>.pack  圧縮済みの本文を連結した追記専用ファイル (プロセスごとに別ファイル)
+
+- 圧縮は zstandard があれば zstd、なければ zlib (エントリごとに方式を記録するので混在してよい)
+- 同じ内容の本文は保存し直さず、既存の位置を参照する (取得時刻の記録のみ追加)
+- 種類 (kind) は response_cache.CACHE_POLICIES の名前 (race_result / jra_result / horse_result ...)
+
+http_client.request() がネットワークから取得した 200 の応答を自動で保存する。
+再生モード (configure(replay=True)) では http_client がネットワークの代わりにアーカイブから応答する
+(アーカイブにないページは ArchiveMiss)。
+環境変数 KEIBA_HTML_ARCHIVE=0 で保存を無効化、KEIBA_HTML_ARCHIVE_DIR で保存先を変更できる。
+"""
+
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+import requests
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import response_cache
+except ImportError:
+    from . import response_cache
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "enabled": os.environ.get("KEIBA_HTML_ARCHIVE", "1") not in ("", "0"),
+    "archive_dir": os.environ.get("KEIBA_HTML_ARCHIVE_DIR") or os.path.join(PROJECT_ROOT, "data", "archive", "html"),
+    "level": 10,                          # 圧縮レベル (zlib は 9 が上限)
+    "segment_size": 256 * 1024 * 1024,    # セグメントファイルの最大サイズ (バイト)
+    "commit_every": 50,                   # 索引をまとめてコミットする件数
+    "replay": False,                      # True の場合は http_client がアーカイブから応答する
+    "as_of": None,                        # 再生時、取得時刻がこれ以前 (epoch秒) の版を使う (None は最新)
+}
+
+# 再現に必要なレスポンスヘッダー
+STORED_HEADERS = ("Content-Type",)
+
+stats = {"stored": 0, "deduplicated": 0, "replayed": 0, "misses": 0}
+
+
+class ArchiveMiss(requests.exceptions.ConnectionError):
+    """再生モードでアーカイブにないページを要求した"""
+
+
+def configure(**kwargs):
+    """
+    アーカイブ設定を変更する
+
+    Args:
+        enabled: False の場合は取得したページを保存しない
+        archive_dir: 保存先ディレクトリ
+        level: 圧縮レベル
+        segment_size: セグメントファイルの最大サイズ (バイト)
+        commit_every: 索引をまとめてコミットする件数
+        replay: True の場合はネットワークの代わりにアーカイブから応答する
+        as_of: 再生時に使う版の上限時刻 (epoch秒、None は最新)
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown html_archive option(s): {sorted(unknown)}")
+    previous_dir = CONFIG["archive_dir"]
+    CONFIG.update(kwargs)
+    if CONFIG["archive_dir"] != previous_dir:
+        close()
+
+
+def is_replay():
+    return CONFIG["replay"]
+
+
+def codec_name():
+    """新規エントリの圧縮方式"""
+    return "zstd" if zstandard is not None else "zlib"
+
+
+_codec_local = threading.local()
+
+
+def _compress(content):
+    if zstandard is not None:
+        compressor = getattr(_codec_local, "compressor", None)
+        if compressor is None:
+            compressor = _codec_local.compressor = zstandard.ZstdCompressor(level=CONFIG["level"])
+        return "zstd", compressor.compress(content)
+    return "zlib", zlib.compress(content, min(CONFIG["level"], 9))
+
+
+def _decompress(codec, payload):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd で保存されたエントリの読み込みには zstandard が必要です (pip install zstandard)")
+        decompressor = getattr(_codec_local, "decompressor", None)
+        if decompressor is None:
+            decompressor = _codec_local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(payload)
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    return payload
+
+
+ENTRY_COLUMNS = ("id", "request", "url", "kind", "fetched_at", "status", "content_type",
+                 "digest", "segment", "offset", "length", "codec", "size")
+
+
+class HtmlArchive:
+    """
+    ページアーカイブ (追記専用セグメント + SQLite 索引)
+
+    書き込みはプロセスごとに自分のセグメントへ追記し、索引は commit_every 件ごとにまとめてコミットする。
+    """
+
+    def __init__(self, archive_dir=None):
+        self.archive_dir = archive_dir or CONFIG["archive_dir"]
+        self.index_path = os.path.join(self.archive_dir, "index.db")
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        self._segment = None      # (相対パス, ファイル)
+        self._pending = []
+        self._recent = {}         # digest → (segment, offset, length, codec) (このプロセスで書いたもの)
+
+    @property
+    def conn(self):
+        with self._lock:
+            if self._conn is None or self._pid != os.getpid():
+                os.makedirs(self.archive_dir, exist_ok=True)
+                conn = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS pages ("
+                    "id INTEGER PRIMARY KEY, request TEXT, url TEXT, kind TEXT, fetched_at REAL, status INTEGER, "
+                    "content_type TEXT, digest TEXT, segment TEXT, offset INTEGER, length INTEGER, codec TEXT, size INTEGER)"
+                )
+                conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS pages_request ON pages (request, fetched_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS pages_kind ON pages (kind, fetched_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest)")
+                conn.commit()
+                self._conn = conn
+                self._pid = os.getpid()
+                self._segment = None
+                self._pending = []
+                self._recent = {}
+            return self._conn
+
+    def exists(self):
+        """索引ファイルがあるか"""
+        return self._conn is not None or os.path.exists(self.index_path)
+
+    # --- write ---
+
+    def _segment_file(self, incoming):
+        rel, f = self._segment or (None, None)
+        if f is not None and f.tell() + incoming > CONFIG["segment_size"]:
+            f.close()
+            f = None
+        if f is None:
+            rel = os.path.join("segments", time.strftime("%Y%m"), f"{os.getpid()}-{uuid.uuid4().hex[:8]}.pack")
+            path = os.path.join(self.archive_dir, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = open(path, "ab")
+            self._segment = (rel, f)
+        return rel, f
+
+    def _location_of(self, digest):
+        location = self._recent.get(digest)
+        if location is None:
+            row = self.conn.execute(
+                "SELECT segment, offset, length, codec FROM pages WHERE digest = ? LIMIT 1", (digest,)
+            ).fetchone()
+            location = tuple(row) if row else None
+        return location
+
+    def put(self, request_line, url, content, status=200, content_type=None, fetched_at=None, kind=None):
+        """
+        ページを1件保存する
+
+        Args:
+            request_line: 正規化したリクエスト行 (response_cache.make_key() の2番目の戻り値)
+            url: URL
+            content: 本文 (bytes)
+            status: ステータスコード
+            content_type: Content-Type ヘッダー
+            fetched_at: 取得時刻 (epoch秒、省略時は現在)
+            kind: ページの種類 (省略時は response_cache.policy_for() の名前)
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        kind = kind or response_cache.policy_for(request_line)[0]
+        with self._lock:
+            conn = self.conn
+            location = self._location_of(digest)
+            if location is None:
+                codec, payload = _compress(content)
+                rel, f = self._segment_file(len(payload))
+                offset = f.tell()
+                f.write(payload)
+                f.flush()
+                location = (rel, offset, len(payload), codec)
+                stats["stored"] += 1
+            else:
+                stats["deduplicated"] += 1
+            self._recent[digest] = location
+            self._pending.append((request_line, url, kind, fetched_at or time.time(), status, content_type,
+                                  digest, *location, len(content)))
+            if len(self._pending) >= CONFIG["commit_every"]:
+                self._flush_locked(conn)
+
+    def put_response(self, method, url, response, params=None, data=None):
+        """http_client の応答を保存する"""
+        _, request_line = response_cache.make_key(method, url, params, data)
+        self.put(request_line, url, response.content, status=response.status_code,
+                 content_type=response.headers.get("Content-Type"))
+
+    def _flush_locked(self, conn):
+        if not self._pending:
+            return
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO pages (request, url, kind, fetched_at, status, content_type, digest, "
+                    "segment, offset, length, codec, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._pending,
+                )
+            self._pending = []
+        except sqlite3.Error as e:
+            print(f"DEBUG: Failed to save HTML archive index: {e}")
+
+    def flush(self):
+        """未コミットの索引をコミットする"""
+        with self._lock:
+            if self._pending and self._pid == os.getpid():
+                self._flush_locked(self.conn)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._segment is not None:
+                self._segment[1].close()
+                self._segment = None
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    # --- read ---
+
+    def _rows(self, sql, args=()):
+        if not self.exists():
+            return []
+        with self._lock:
+            cursor = self.conn.execute(sql, args)
+            return [dict(zip(ENTRY_COLUMNS, row)) for row in cursor]
+
+    def lookup(self, request_line, as_of=None):
+        """
+        リクエスト行に対応する版を取得する (as_of 以前で最新のもの)
+
+        Returns:
+            dict: 索引の1行 (ENTRY_COLUMNS)。なければ None
+        """
+        rows = self._rows(
+            f"SELECT {', '.join(ENTRY_COLUMNS)} FROM pages WHERE request = ? AND fetched_at <= ? "
+            "ORDER BY fetched_at DESC LIMIT 1",
+            (request_line, as_of if as_of is not None else float("inf")),
+        )
+        return rows[0] if rows else None
+
+    def history(self, method, url, params=None, data=None):
+        """同じリクエストの全版 (取得時刻順)"""
+        _, request_line = response_cache.make_key(method, url, params, data)
+        return self._rows(
+            f"SELECT {', '.join(ENTRY_COLUMNS)} FROM pages WHERE request = ? ORDER BY fetched_at", (request_line,)
+        )
+
+    def entries(self, kinds=None, since=None, until=None, latest=True):
+        """
+        索引の行を列挙する
+
+        Args:
+            kinds: 対象の種類 (省略時は全種類)
+            since, until: 取得時刻の範囲 (epoch秒)
+            latest: True の場合はリクエストごとに until 以前の最新版のみ
+
+        Returns:
+            list[dict]
+        """
+        where, args = [], []
+        if kinds:
+            where.append(f"kind IN ({','.join('?' * len(kinds))})")
+            args.extend(kinds)
+        if since is not None:
+            where.append("fetched_at >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("fetched_at <= ?")
+            args.append(until)
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        if latest:
+            # SQLite では MAX() と同じ行の列が返る
+            columns = ", ".join("MAX(fetched_at)" if c == "fetched_at" else c for c in ENTRY_COLUMNS)
+            sql = f"SELECT {columns} FROM pages{clause} GROUP BY request ORDER BY id"
+        else:
+            sql = f"SELECT {', '.join(ENTRY_COLUMNS)} FROM pages{clause} ORDER BY id"
+        return self._rows(sql, args)
+
+    def read(self, entry):
+        """エントリの本文 (bytes)"""
+        with open(os.path.join(self.archive_dir, entry["segment"]), "rb") as f:
+            f.seek(entry["offset"])
+            payload = f.read(entry["length"])
+        return _decompress(entry["codec"], payload)
+
+    def to_response(self, entry):
+        """エントリから requests.Response を組み立てる"""
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.url = entry["url"]
+        if entry["content_type"]:
+            response.headers["Content-Type"] = entry["content_type"]
+        response._content = self.read(entry)
+        response.from_cache = True
+        response.from_archive = True
+        return response
+
+    def summary(self):
+        """
+        種類ごとの件数と容量
+
+        Returns:
+            list[tuple]: (kind, 版の数, URL数, 元のバイト数)
+        """
+        if not self.exists():
+            return []
+        with self._lock:
+            return self.conn.execute(
+                "SELECT kind, COUNT(*), COUNT(DISTINCT request), SUM(size) FROM pages GROUP BY kind ORDER BY kind"
+            ).fetchall()
+
+    def import_response_cache(self, cache_dir=None):
+        """
+        response_cache に保存済みのページを取り込む (取得時刻はキャッシュのもの、取り込み済みは無視)
+
+        Returns:
+            int: 取り込んだエントリ数
+        """
+        import json
+
+        cache_dir = cache_dir or response_cache.CONFIG["cache_dir"]
+        entries_dir = os.path.join(cache_dir, "entries")
+        imported = 0
+        for root, _, files in os.walk(entries_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    with open(os.path.join(cache_dir, "blobs", meta["body"][:2], meta["body"]), "rb") as f:
+                        content = f.read()
+                except (OSError, ValueError, KeyError):
+                    continue
+                self.put(meta["request"], meta.get("url", ""), content, status=meta.get("status", 200),
+                         content_type=meta.get("headers", {}).get("Content-Type"),
+                         fetched_at=meta.get("fetched_at"))
+                imported += 1
+        self.flush()
+        return imported
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    """既定のアーカイブ (CONFIG["archive_dir"])"""
+    global _archive
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = HtmlArchive()
+    return _archive
+
+
+def close():
+    """既定のアーカイブを閉じる (未コミットの索引をコミット)"""
+    global _archive
+    with _archive_lock:
+        if _archive is not None:
+            _archive.close()
+            _archive = None
+
+
+atexit.register(close)
+
+
+def record(method, url, response, params=None, data=None):
+    """ネットワークから取得した 200 の応答を保存する (http_client から呼ばれる)"""
+    if not CONFIG["enabled"] or CONFIG["replay"] or response.status_code != 200:
+        return
+    try:
+        get_archive().put_response(method, url, response, params, data)
+    except (OSError, sqlite3.Error) as e:
+        print(f"HTML archive write failed: {e}")
+
+
+def replay_response(method, url, params=None, data=None):
+    """
+    再生モードの応答 (as_of 以前で最新の版)
+
+    Raises:
+        ArchiveMiss: アーカイブにない
+    """
+    _, request_line = response_cache.make_key(method, url, params, data)
+    entry = get_archive().lookup(request_line, CONFIG["as_of"])
+    if entry is None:
+        stats["misses"] += 1
+        raise ArchiveMiss(f"Not in HTML archive (replay mode): {method} {url}")
+    stats["replayed"] += 1
+    return get_archive().to_response(entry)
@@ -0,0 +1,132 @@
+"""
+HTML解析レイヤー
+C実装のパーサー (lxml) と部分解析 (必要な要素のみツリー化) で解析を高速化する
+
+lxml が未インストールの環境では html.parser にフォールバックする (結果は同じ)。
+各ページの抽出関数 (parse_race_result, parse_jra_race など) は make_soup() 経由でツリーを作る。
+
+    soup = make_soup(html, PAGE_FILTERS["race_result"])
+
+legacy() の中では従来通り html.parser で文書全体を解析する (scripts/verify_html_parse.py の比較用)。
+"""
+
+from contextlib import contextmanager
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    DEFAULT_PARSER = "lxml"
+except ImportError:
+    DEFAULT_PARSER = "html.parser"
+
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "parser": DEFAULT_PARSER,
+    "partial": True,  # False の場合はフィルタを無視して文書全体を解析する
+}
+
+
+class TagFilter(SoupStrainer):
+    """
+    タグ名・id・class のいずれかに一致する要素 (とその子孫) のみをツリー化するフィルタ
+
+    一致した要素の子孫はすべて保持されるため、select_one() 等はそのまま使える。
+    """
+
+    def __init__(self, names=(), ids=(), classes=()):
+        self.names = frozenset(names)
+        self.ids = frozenset(ids)
+        self.classes = frozenset(classes)
+        # bs4 < 4.13 は name に渡した関数を (タグ名, 属性) で呼び出す
+        super().__init__(self._matches_tag)
+
+    def _matches_tag(self, name, attrs=None):
+        if name in self.names:
+            return True
+        if not attrs:
+            return False
+        if self.ids and attrs.get("id") in self.ids:
+            return True
+        if self.classes:
+            value = attrs.get("class")
+            if value:
+                classes = value.split() if isinstance(value, str) else value
+                return not self.classes.isdisjoint(classes)
+        return False
+
+    # bs4 >= 4.13
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self._matches_tag(name, attrs)
+
+    def allow_string_creation(self, string):
+        return False
+
+
+# ページ種別ごとの解析対象
+PAGE_FILTERS = {
+    # race.netkeiba.com / nar.netkeiba.com の result.html
+    "race_result": TagFilter(
+        names=["title"],
+        ids=["All_Result_Table"],
+        classes=["RaceKaisaiWrap", "RaceNum", "RaceName", "RaceData01",
+                 "Icon_GradeType1", "Icon_GradeType2", "Icon_GradeType3"],
+    ),
+    # db.netkeiba.com/horse/result/ (戦績表)
+    "horse_result": TagFilter(names=["table"]),
+    # db.netkeiba.com/horse/ped/ (血統表)
+    "horse_ped": TagFilter(classes=["blood_table"]),
+    # race_list_sub.html (開催日のレース一覧)
+    "race_list": TagFilter(classes=["RaceList_Box", "RaceList_DataList"]),
+    # odds/index.html
+    "odds": TagFilter(ids=["Ninki"], classes=["RaceOdds_HorseList_Table"]),
+    # 騎手・調教師ページ (タイトルのみ使用)
+    "title": TagFilter(names=["title"]),
+    # JRA 月別一覧 (開催日へのリンク)
+    "jra_month": TagFilter(names=["a"]),
+    # JRA 開催日ページ (見出しとレースへのリンク)
+    "jra_day": TagFilter(names=["h1", "a"], classes=["header_line"]),
+}
+
+
+def configure(**kwargs):
+    """
+    解析設定を変更する
+
+    Args:
+        parser: BeautifulSoup のパーサー名 ("lxml" / "html.parser")
+        partial: False の場合は部分解析を行わない
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown html_parse option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+@contextmanager
+def legacy():
+    """従来の解析 (html.parser で文書全体) に一時的に切り替える"""
+    saved = dict(CONFIG)
+    CONFIG.update(parser="html.parser", partial=False)
+    try:
+        yield
+    finally:
+        CONFIG.update(saved)
+
+
+def make_soup(html, only=None):
+    """
+    HTMLを解析する
+
+    Args:
+        html: HTML文字列
+        only: 解析対象を絞る TagFilter (PAGE_FILTERS の値)。省略時は文書全体
+
+    Returns:
+        BeautifulSoup
+    """
+    if only is not None and CONFIG["partial"]:
+        return BeautifulSoup(html, CONFIG["parser"], parse_only=only)
+    return BeautifulSoup(html, CONFIG["parser"])
+
@@ -0,0 +1,339 @@
+"""
+共通HTTPクライアント
+ホストごとのコネクションプール(keep-alive)・リトライ・既知の文字コードを一元管理
+
+各スクレイパーは requests.get / requests.post を直接呼ばず、
+このモジュールの get() / post() を経由してアクセスする。
+アクセス間隔は rate_limit のホスト別予算で制御されるため、呼び出し側での time.sleep() は不要。
+応答 (429/503・応答時間・通信エラー) は rate_limit.HostController に記録され、レートが自動調整される。
+取得したページは response_cache のディスクキャッシュを経由する (オフライン再生にも対応)。
+ネットワークから取得したページは html_archive にも履歴として保存される (再解析用、再生モードではアーカイブから応答)。
+"""
+
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import html_archive
+    import rate_limit
+    import response_cache
+except ImportError:
+    from . import html_archive
+    from . import rate_limit
+    from . import response_cache
+
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
+}
+
+# ホストごとの既知の文字コード
+# apparent_encoding (chardet) はページ全体を走査するため、既知のものは固定で指定する
+HOST_CHARSETS = {
+    "race.netkeiba.com": "EUC-JP",
+    "nar.netkeiba.com": "EUC-JP",
+    "db.netkeiba.com": "EUC-JP",
+    "www.jra.go.jp": "cp932",
+}
+
+def _parse_host_overrides(value):
+    # "race.netkeiba.com=http://127.0.0.1:8765,*=http://127.0.0.1:8765"
+    overrides = {}
+    for item in (value or "").split(","):
+        host, sep, base = item.strip().partition("=")
+        if sep and host and base:
+            overrides[host] = base.rstrip("/")
+    return overrides
+
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "timeout": 10,          # 秒 (connect/read 共通) または (connect, read) のタプル
+    "max_retries": 3,       # 接続エラー・5xx・429 時の再試行回数
+    "backoff_factor": 1.0,  # 再試行間隔: backoff_factor * 2^(n-1) 秒
+    "pool_maxsize": 10,     # ホストごとの最大保持コネクション数
+    "host_overrides": _parse_host_overrides(os.environ.get("KEIBA_HTTP_HOST_OVERRIDES")),  # {ホスト or "*": 送信先}
+}
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """
+    クライアント設定を変更する (既存のセッションは破棄され、次回アクセス時に再生成)
+
+    Args:
+        timeout: タイムアウト秒数、または (connect, read) のタプル
+        max_retries: 最大リトライ回数
+        backoff_factor: リトライ間隔の係数
+        pool_maxsize: ホストごとの最大コネクション数
+        host_overrides: {ホスト名 or "*": 送信先のベースURL} (例: {"*": "http://127.0.0.1:8765"})
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown http_client option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+    close_all()
+
+
+def host_of(url):
+    """URLからホスト名を取り出す"""
+    return urlsplit(url).hostname or ""
+
+
+def target_url(url):
+    """送信先URL (host_overrides が設定されていれば差し替える)"""
+    overrides = CONFIG["host_overrides"]
+    if not overrides:
+        return url
+    parts = urlsplit(url)
+    base = overrides.get(parts.hostname) or overrides.get("*")
+    if not base:
+        return url
+    return f"{base}/{parts.hostname}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+
+def _build_session():
+    retry = Retry(
+        total=CONFIG["max_retries"],
+        connect=CONFIG["max_retries"],
+        read=CONFIG["max_retries"],
+        status=CONFIG["max_retries"],
+        backoff_factor=CONFIG["backoff_factor"],
+        status_forcelist=RETRY_STATUS_CODES,
+        # JRA の一覧ページは POST による画面遷移 (冪等) なので POST もリトライ対象にする
+        allowed_methods=frozenset(["GET", "HEAD", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=CONFIG["pool_maxsize"],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url):
+    """
+    ホストごとの共有Sessionを取得する (なければ生成)
+
+    Args:
+        url: アクセス先URL (またはホスト名)
+
+    Returns:
+        requests.Session
+    """
+    host = host_of(url) if "://" in url else url
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _build_session()
+                _sessions[host] = session
+    return session
+
+
+def close_all():
+    """全セッションを閉じる"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _apply_encoding(response, host, encoding=None):
+    if encoding:
+        response.encoding = encoding
+        return
+    # Content-Type に charset が明示されていればそれを尊重する
+    content_type = response.headers.get("Content-Type", "")
+    if "charset=" in content_type.lower():
+        return
+    known = HOST_CHARSETS.get(host)
+    if known:
+        response.encoding = known
+    elif content_type.startswith("text/"):
+        # 未知のホストのみ従来通り推定する
+        response.encoding = response.apparent_encoding
+
+
+def _serve_archived(method, url, params=None, data=None, encoding=None):
+    response = html_archive.replay_response(method, url, params, data)
+    _apply_encoding(response, host_of(url), encoding)
+    return response
+
+
+def _serve_cached(entry, method, url, encoding=None):
+    response = None
+    if entry is not None and (response_cache.is_offline() or entry.is_fresh()):
+        response = entry.to_response()
+    if response is None:
+        if response_cache.is_offline():
+            raise response_cache.OfflineCacheMiss(f"Not in response cache (offline mode): {method} {url}")
+        response_cache.stats["misses"] += 1
+        return None
+    response_cache.stats["hits"] += 1
+    _apply_encoding(response, host_of(url), encoding)
+    return response
+
+
+def _throttled_during_retries(response):
+    # urllib3 のリトライで吸収された 429 / 503 も制御の入力にする
+    retries = getattr(response.raw, "retries", None)
+    history = getattr(retries, "history", None) or ()
+    return any(h.status in rate_limit.THROTTLE_STATUS_CODES for h in history)
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value or response.status_code not in rate_limit.THROTTLE_STATUS_CODES:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def report_parse(url, ok):
+    """
+    取得したページの解析結果を報告する
+
+    正常なステータスで中身が空のページ (ブロック時の応答など) が続くと、ホストを一時停止する。
+    """
+    rate_limit.get_controller(host_of(url)).record_parse(ok)
+
+
+def is_live(response):
+    """
+    今取得した内容か (キャッシュ・アーカイブから返した、取得時刻が過去の本文でないか)
+
+    304 で再検証したレスポンスは今の内容として扱う。
+    """
+    return not getattr(response, "from_cache", False) or getattr(response, "revalidated", False)
+
+
+def cached_response(method, url, params=None, data=None, encoding=None):
+    """
+    ネットワークにアクセスせずに返せるキャッシュ済みレスポンスを取得する
+
+    オフライン再生モードではTTLに関係なく保存済みのものを返し、なければ OfflineCacheMiss。
+    アーカイブ再生モード (html_archive) ではアーカイブから返し、なければ ArchiveMiss。
+
+    Returns:
+        requests.Response: 有効なキャッシュがなければ None
+    """
+    if html_archive.is_replay():
+        return _serve_archived(method, url, params, data, encoding)
+    if not response_cache.is_enabled():
+        return None
+    return _serve_cached(response_cache.lookup(method, url, params, data), method, url, encoding)
+
+
+def request(method, url, params=None, data=None, headers=None, timeout=None, encoding=None,
+            rate_limited=True, cache=True):
+    """
+    共有Session経由でHTTPリクエストを送信する
+
+    Args:
+        method: "GET" / "POST"
+        url: URL
+        params: クエリパラメータ
+        data: POSTボディ
+        headers: 追加ヘッダー (DEFAULT_HEADERS に上書きマージ)
+        timeout: タイムアウト (省略時は CONFIG["timeout"])
+        encoding: 文字コードを明示する場合に指定 (省略時はホストの既知文字コード)
+        rate_limited: False の場合はレート制限の待機を行わない (呼び出し側で予約済みの場合)
+        cache: False の場合はディスクキャッシュの鮮度を見ず、保存もしない
+            (オフライン再生モードでは cache に関係なく保存済みのものを返す)
+
+    Returns:
+        requests.Response (キャッシュから返した場合は response.from_cache が True、
+        そのうち 304 で再検証したものは response.revalidated も True)
+    """
+    if html_archive.is_replay():
+        return _serve_archived(method, url, params, data, encoding)
+
+    host = host_of(url)
+    entry = None
+    # オフライン再生モードでは cache=False の要求もネットワークに出さない
+    if (cache or response_cache.is_offline()) and response_cache.is_enabled():
+        entry = response_cache.lookup(method, url, params, data)
+        cached = _serve_cached(entry, method, url, encoding)
+        if cached is not None:
+            return cached
+        # TTL切れのエントリは条件付きリクエストで再検証する
+        if entry is not None:
+            headers = {**entry.validators(), **(headers or {})}
+
+    session = get_session(url)
+    controller = rate_limit.get_controller(host)
+    if rate_limited:
+        rate_limit.get_bucket(host).acquire()
+    started = time.monotonic()
+    try:
+        response = session.request(
+            method,
+            target_url(url),
+            params=params,
+            data=data,
+            headers=headers,
+            timeout=timeout if timeout is not None else CONFIG["timeout"],
+        )
+    except requests.RequestException as e:
+        controller.record_error(e)
+        raise
+    controller.record_response(
+        response.status_code,
+        latency=time.monotonic() - started,
+        throttled=_throttled_during_retries(response),
+        retry_after=_retry_after_seconds(response),
+    )
+
+    if cache and response_cache.is_enabled():
+        if response.status_code == 304 and entry is not None:
+            cached = entry.to_response()
+            if cached is not None:
+                entry.touch()
+                response_cache.stats["revalidated"] += 1
+                # 本文は保存済みだが、今の内容であることはサーバーが確認済み
+                cached.revalidated = True
+                response = cached
+        elif response.status_code == 200:
+            try:
+                response_cache.store(method, url, response, params, data)
+            except OSError as e:
+                print(f"Response cache write failed: {e}")
+    if response.status_code == 200 and not getattr(response, "from_cache", False):
+        html_archive.record(method, url, response, params, data)
+
+    _apply_encoding(response, host, encoding)
+    return response
+
+
+def get(url, **kwargs):
+    """GETリクエスト (引数は request() を参照)"""
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    """POSTリクエスト (引数は request() を参照)"""
+    return request("POST", url, **kwargs)
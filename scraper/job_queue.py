@@ -0,0 +1,349 @@
+"""
+スクレイピングジョブキュー (SQLite)
+一括取得 (JRA/NAR のバックフィル) の進捗をタスク単位で永続化し、中断後は続きから再開する
+
+タスクの種類:
+    探索タスク: nar_day (開催日ページ), jra_month (月別一覧), jra_day (開催日ページ)
+    取得タスク: nar_race (race_id), jra_race (レースページURL)
+
+状態は pending → running → done / failed / skipped と遷移し、試行回数と最後のエラーを保持する。
+探索タスクの処理結果として次のタスク (開催日 → レース) がキューに追加される。
+対象期間外などで処理しなかったタスクは skipped になり (SkipTask)、期間を広げた実行で pending に戻せる。
+直近 REOPEN_DAYS 日以内の探索タスク (当月・当日など、後から開催が追加・確定しうるもの) は実行のたびに開き直す。
+取得タスクは保存 (save_callback) が終わってから done になるため、途中で落ちても取りこぼしはない。
+
+    queue = JobQueue()
+    queue.add("nar_day", ["20240105", "20240106"])
+    await drain_async(queue, {"nar_day": handle_day, "nar_race": handle_race})
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, "data", "scrape_jobs.db")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+# この日数以内の日付の探索タスクは done でも実行のたびに pending に戻す
+REOPEN_DAYS = 7
+
+Task = namedtuple("Task", ["id", "kind", "key", "payload", "attempts"])
+
+
+class SkipTask(Exception):
+    """
+    タスクを処理せずに skipped にする (対象期間外の開催日など)
+
+    done と違い、add(reset=True) で pending に戻せる。
+    """
+
+
+class JobQueue:
+    """
+    SQLite を使った永続ジョブキュー
+
+    複数プロセスから同じファイルを開いてもよい (claim はトランザクション内で行う)。
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or DEFAULT_DB_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        self.release_stale()
+
+    def _create_schema(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                owner INTEGER,
+                updated_at REAL,
+                UNIQUE (kind, key)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state, kind)")
+
+    @contextmanager
+    def _transaction(self):
+        # 接続は autocommit なので、まとめて書き込む箇所は明示的にトランザクションを張る
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def close(self):
+        """接続を閉じる"""
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def add(self, kind, keys, payload=None, reset=False):
+        """
+        タスクを追加する (登録済みのキーは無視)
+
+        Args:
+            kind: タスクの種類
+            keys: キーのリスト (日付文字列、race_id、URL など)
+            payload: 各タスクに付ける追加情報 (dict)
+            reset: True の場合、登録済みのタスクも pending に戻す (再取得)
+
+        Returns:
+            int: 新規に追加された件数
+        """
+        payload_json = json.dumps(payload, ensure_ascii=False) if payload else None
+        now = time.time()
+        rows = [(kind, str(k), payload_json, now) for k in keys]
+        with self._transaction():
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tasks (kind, key, payload, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            added = self.conn.total_changes - before
+            if reset:
+                self.conn.executemany(
+                    "UPDATE tasks SET state = 'pending', attempts = 0, last_error = NULL, owner = NULL "
+                    "WHERE kind = ? AND key = ? AND state != 'running'",
+                    [(kind, str(k)) for k in keys],
+                )
+        return added
+
+    def claim(self, kinds, limit=32):
+        """
+        pending のタスクをまとめて取得し running にする
+
+        Args:
+            kinds: 対象の種類 (リストの順に優先)
+            limit: 最大件数
+
+        Returns:
+            list[Task]
+        """
+        claimed = []
+        owner = os.getpid()
+        with self._transaction():
+            for kind in kinds:
+                remaining = limit - len(claimed)
+                if remaining <= 0:
+                    break
+                rows = self.conn.execute(
+                    "SELECT id, kind, key, payload, attempts FROM tasks "
+                    "WHERE state = 'pending' AND kind = ? ORDER BY id LIMIT ?",
+                    (kind, remaining),
+                ).fetchall()
+                claimed.extend(rows)
+            if claimed:
+                self.conn.executemany(
+                    "UPDATE tasks SET state = 'running', attempts = attempts + 1, owner = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    [(owner, time.time(), row[0]) for row in claimed],
+                )
+        return [
+            Task(row[0], row[1], row[2], json.loads(row[3]) if row[3] else {}, row[4] + 1)
+            for row in claimed
+        ]
+
+    def complete(self, task_ids):
+        """タスクを完了にする"""
+        with self._transaction():
+            self.conn.executemany(
+                "UPDATE tasks SET state = 'done', last_error = NULL, owner = NULL, updated_at = ? WHERE id = ?",
+                [(time.time(), task_id) for task_id in task_ids],
+            )
+
+    def fail(self, task_id, error):
+        """タスクを失敗にする (retry_failed() で再実行できる)"""
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE tasks SET state = 'failed', last_error = ?, owner = NULL, updated_at = ? WHERE id = ?",
+                (str(error)[:1000], time.time(), task_id),
+            )
+
+    def skip(self, task_id, reason=None):
+        """タスクを処理せずに skipped にする"""
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE tasks SET state = 'skipped', last_error = ?, owner = NULL, updated_at = ? WHERE id = ?",
+                (str(reason)[:1000] if reason else None, time.time(), task_id),
+            )
+
+    def keys(self, kind, state):
+        """指定した種類・状態のタスクのキー一覧"""
+        return [k for (k,) in self.conn.execute(
+            "SELECT key FROM tasks WHERE kind = ? AND state = ? ORDER BY id", (kind, state))]
+
+    def retry_failed(self, kind=None, keys=None, max_attempts=None):
+        """
+        失敗したタスクを pending に戻す
+
+        Args:
+            kind: 対象の種類 (省略時はすべて)
+            keys: 対象のキー (省略時はすべて)
+            max_attempts: 試行回数がこの値未満のものだけを戻す
+
+        Returns:
+            int: 戻した件数
+        """
+        sql = "UPDATE tasks SET state = 'pending', owner = NULL WHERE state = 'failed'"
+        params = []
+        if kind:
+            sql += " AND kind = ?"
+            params.append(kind)
+        if max_attempts:
+            sql += " AND attempts < ?"
+            params.append(max_attempts)
+        with self._transaction():
+            if keys is None:
+                return self.conn.execute(sql, params).rowcount
+            count = 0
+            for k in keys:
+                count += self.conn.execute(sql + " AND key = ?", params + [str(k)]).rowcount
+            return count
+
+    def release_stale(self):
+        """
+        実行中のまま残ったタスク (プロセスが終了しているもの) を pending に戻す
+
+        Returns:
+            int: 戻した件数
+        """
+        rows = self.conn.execute("SELECT DISTINCT owner FROM tasks WHERE state = 'running'").fetchall()
+        dead = [owner for (owner,) in rows if owner is None or not _process_alive(owner)]
+        if not dead:
+            return 0
+        with self._transaction():
+            count = 0
+            for owner in dead:
+                if owner is None:
+                    cur = self.conn.execute("UPDATE tasks SET state = 'pending' WHERE state = 'running' AND owner IS NULL")
+                else:
+                    cur = self.conn.execute(
+                        "UPDATE tasks SET state = 'pending', owner = NULL WHERE state = 'running' AND owner = ?", (owner,)
+                    )
+                count += cur.rowcount
+        if count:
+            print(f"🔁 Resuming {count} interrupted task(s)")
+        return count
+
+    def counts(self, kind=None):
+        """
+        状態ごとの件数
+
+        Returns:
+            dict: {kind: {state: count}}
+        """
+        sql = "SELECT kind, state, COUNT(*) FROM tasks"
+        params = []
+        if kind:
+            sql += " WHERE kind = ?"
+            params.append(kind)
+        sql += " GROUP BY kind, state"
+        result = {}
+        for k, state, n in self.conn.execute(sql, params):
+            result.setdefault(k, {})[state] = n
+        return result
+
+    def running(self):
+        """実行中 (他のプロセスが処理中のものを含む) のタスク数"""
+        return self.conn.execute("SELECT COUNT(*) FROM tasks WHERE state = 'running'").fetchone()[0]
+
+    def failures(self, kind=None, limit=50):
+        """失敗したタスクの (kind, key, attempts, last_error) 一覧"""
+        sql = "SELECT kind, key, attempts, last_error FROM tasks WHERE state = 'failed'"
+        params = []
+        if kind:
+            sql += " AND kind = ?"
+            params.append(kind)
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return False  # 同一プロセスの起動時点で running なら前回の残り
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+async def drain_async(queue, handlers, batch_size=32, progress_callback=None, reset_discovered=False, idle_poll=None):
+    """
+    キューが空になるまでタスクを処理する
+
+    Args:
+        queue: JobQueue
+        handlers: {kind: async def handler(task)}。handler は追加するタスクの
+            [(kind, key, payload)] または [(kind, key, payload, reset)] を返す (なければ None)。
+            reset=True のタスクは処理済みでも pending に戻す。例外を送出すると failed、SkipTask なら skipped になる
+        batch_size: 一度に取得して並行処理する件数
+        progress_callback: function(str) 進捗通知
+        reset_discovered: True の場合、処理済みのタスクが再発見されたら pending に戻す (強制再取得)
+        idle_poll: 複数プロセスで同じキューを処理する場合の待機間隔 (秒)。
+            pending がなくても他のプロセスが実行中のタスクがあれば (次のタスクが追加されうるので) 待って再確認する
+
+    Returns:
+        dict: queue.counts()
+    """
+    # 探索タスク (dict の先頭側) を優先して取得し、レースの一覧を先に広げる
+    kinds = list(handlers)
+
+    async def _run(task):
+        try:
+            new_tasks = await handlers[task.kind](task)
+        except SkipTask as e:
+            queue.skip(task.id, e)
+            return
+        except Exception as e:
+            print(f"  ❌ {task.kind} {task.key} failed (attempt {task.attempts}): {e}")
+            queue.fail(task.id, e)
+            return
+        for kind, key, payload, *reset in new_tasks or []:
+            queue.add(kind, [key], payload, reset=reset_discovered or bool(reset and reset[0]))
+        queue.complete([task.id])
+
+    while True:
+        tasks = queue.claim(kinds, limit=batch_size)
+        if not tasks:
+            # 終了したプロセスが残したタスクは release_stale() で pending に戻る
+            if idle_poll and (queue.release_stale() or queue.running()):
+                await asyncio.sleep(idle_poll)
+                continue
+            break
+        await asyncio.gather(*(_run(t) for t in tasks))
+        if progress_callback:
+            summary = ", ".join(
+                f"{kind}: {states.get(DONE, 0) + states.get(SKIPPED, 0)}/{sum(states.values())}"
+                for kind, states in queue.counts().items()
+            )
+            progress_callback(f"進捗 {summary}")
+
+    return queue.counts()
@@ -1,11 +1,20 @@
-import requests
-from bs4 import BeautifulSoup
 import pandas as pd
 import io
 import re
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import urllib.parse
-import time
+import asyncio
+
+try:
+    import http_client
+    from html_parse import make_soup, PAGE_FILTERS
+    from race_index import present_mask
+    from job_queue import SkipTask, SKIPPED, REOPEN_DAYS
+except ImportError:
+    from . import http_client
+    from .html_parse import make_soup, PAGE_FILTERS
+    from .race_index import present_mask
+    from .job_queue import SkipTask, SKIPPED, REOPEN_DAYS
 
 def scrape_jra_race(url, existing_race_ids=None):
     """
@@ -14,307 +23,332 @@ def scrape_jra_race(url, existing_race_ids=None):
     If existing_race_ids is provided and the race ID is found, returns None (skip).
     """
     print(f"Accessing URL: {url}...")
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36" 
-    }
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        # Netkeiba usually uses EUC-JP, JRA uses Shift_JIS. 
-        # Since this function is mostly used for Netkeiba (NAR/JRA-Backfill), default to EUC-JP.
-        # response.encoding = 'cp932' 
-        response.encoding = 'EUC-JP'
+        # Netkeiba uses EUC-JP, JRA uses Shift_JIS (cp932).
+        # http_client picks the known charset per host.
+        response = http_client.get(url)
         
         if response.status_code != 200:
             print(f"Error: Status code {response.status_code}")
             return None
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+        return parse_jra_race(response.text, url, existing_race_ids)
 
-        # --- Metadata Extraction ---
-        h1_elem = soup.select_one("div.header_line h1 .txt")
-        full_text = h1_elem.text.strip() if h1_elem else ""
-        if not full_text and soup.h1:
-            full_text = soup.h1.text.strip()
+    except Exception as e:
+        print(f"Error scraping JRA URL: {e}")
+        return None
 
-        date_text = ""
-        venue_text = ""
-        race_num_text = ""
-        kai = "01"
-        day = "01"
-        
-        # Extract Date
-        match_date = re.search(r'(\d{4}年\d{1,2}月\d{1,2}日)', full_text)
-        if match_date:
-            date_text = match_date.group(1)
-            
-        # Extract Venue, Kai, Day
-        venues_str = "札幌|函館|福島|新潟|東京|中山|中京|京都|阪神|小倉"
-        match_meta = re.search(rf'(\d+)回({venues_str})(\d+)日', full_text)
-        if match_meta:
-            kai = f"{int(match_meta.group(1)):02}"
-            venue_text = match_meta.group(2)
-            day = f"{int(match_meta.group(3)):02}"
-            
-        # Extract Race Num
-        match_race = re.search(r'(\d+)レース', full_text)
-        if match_race:
-            r_val = int(match_race.group(1))
-            race_num_text = f"{r_val}R"
-            r_num = f"{r_val:02}"
-        else:
-            race_num_text = "10R" # Fallback
-            r_num = "10"
-            
-        # Race Name
-        race_name_text = ""
-        name_elem = soup.select_one(".race_name")
-        if name_elem:
-            race_name_text = name_elem.text.strip()
-
-        # Grade
-        grade_text = ""
-        if "G1" in str(soup) or "ＧⅠ" in str(soup): grade_text = "G1"
-        elif "G2" in str(soup) or "ＧⅡ" in str(soup): grade_text = "G2"
-        elif "G3" in str(soup) or "ＧⅢ" in str(soup): grade_text = "G3"
-
-        # --- Added: Course, Distance, Weather, Condition ---
-        # JRA HTML structure varies, but often contained in specific divs or text lines.
-        # We will scan the entire header text or specific class for these patterns.
-        
-        # 1. Course & Distance (e.g., "芝2000メートル", "ダート1800メートル", "芝・1600m")
-        # Usually in the same block as race name or just below.
-        # We search the whole header area text.
-        header_text = soup.select_one("div.header_line").text if soup.select_one("div.header_line") else soup.text
-        
-        # Regex: Allow spaces, dots, etc. between Type and Dist
-        dist_type_match = re.search(r'(芝|ダ|ダート|障害)[^0-9]*(\d+)', header_text)
-        course_type = ""
-        distance = ""
-        
-        if dist_type_match:
-            c_val = dist_type_match.group(1)
-            d_val = dist_type_match.group(2)
-            
-            if "芝" in c_val: course_type = "芝"
-            elif "ダ" in c_val: course_type = "ダート"
-            elif "障" in c_val: course_type = "障害"
-            
-            distance = int(d_val)
-        
-        # 1.5 Rotation (Right/Left/Straight)
-        rotation = ""
-        # Often formatted as "(右)" or "（左）" 
-        rot_match = re.search(r'[（\(](右|左|直線)[）\)]', header_text)
-        if rot_match:
-            rotation = rot_match.group(1)
-        else:
-             # Fallback: Inference based on Venue
-             # Tokyo, Chukyo, Niigata -> Left (Default), others Right
-             # Niigata 1000m -> Straight
-             if "左" in header_text: rotation = "左"
-             elif "右" in header_text: rotation = "右"
-             elif "直線" in header_text: rotation = "直線"
 
-        
-        # 2. Weather (e.g., "天候：晴")
-        weather = ""
-        w_match = re.search(r'天候\s*[:：]\s*(\S+)', soup.text)
-        if w_match:
-            weather = w_match.group(1).strip()
-            
-        # 3. Condition (e.g., "芝：良", "ダート：稍重")
-        # Note: A race can have both if it's mixed, but usually we care about the main one or the one matching course_type.
-        condition = ""
-        
-        # Try specific pattern based on course type
-        if course_type == "芝":
-             c_match = re.search(r'芝\s*[:：]\s*(\S+)', soup.text)
-             if c_match: condition = c_match.group(1).strip()
-        elif course_type == "ダート":
-             c_match = re.search(r'ダート\s*[:：]\s*(\S+)', soup.text)
-             if c_match: condition = c_match.group(1).strip()
-        
-        # Fallback if generic or course type unknown, grab first one found
-        if not condition:
-             c_match_gen = re.search(r'(?:芝|ダート)\s*[:：]\s*(\S+)', soup.text)
-             if c_match_gen: condition = c_match_gen.group(1).strip()
-
-        # --- Table Extraction (Custom BS4 Parsing) ---
-        # Find table with "着順"
-        tables = soup.find_all('table')
-        target_table = None
-        for tbl in tables:
-            if "着順" in tbl.text and "馬名" in tbl.text:
-                target_table = tbl
-                break
-        
-        if not target_table:
-            print(f"Warning: Result table not found in {url} (Encoding: {response.encoding})")
+async def scrape_jra_race_async(url, fetcher, existing_race_ids=None):
+    """
+    Async counterpart of scrape_jra_race (parsing runs in the fetcher's worker pool).
+    """
+    print(f"Accessing URL: {url}...")
+
+    try:
+        response = await fetcher.fetch(url)
+
+        if response.status_code != 200:
+            print(f"Error: Status code {response.status_code}")
             return None
 
-        # Parse Rows
-        rows = target_table.find_all('tr')
-        data = []
-        
-        for row in rows:
-            # Skip header (usually th) or invalid rows
-            if row.find('th'):
-                continue
-                
-            cells = row.find_all('td')
-            if not cells:
-                continue
+        return await fetcher.parse(parse_jra_race, response.text, url, existing_race_ids)
 
-            # Correct Mapping based on standard JRA result table
-            
-            def get_text(idx):
-                if idx < len(cells):
-                    return cells[idx].get_text(strip=True)
-                return ""
-
-            # Extract Frame (Waku) from Image
-            waku_text = ""
-            if len(cells) > 1:
-                img = cells[1].find('img')
-                if img and 'alt' in img.attrs:
-                    # Example: "枠6緑" -> Extract number
-                    alt = img['alt']
-                    m = re.search(r'枠(\d+)', alt)
-                    if m:
-                        waku_text = m.group(1)
-                    else:
-                        waku_text = alt # Fallback
-            
-            # Extract Horse ID
-            horse_id = ""
-            if len(cells) > 3:
-                a_tag = cells[3].find('a')
-                if a_tag and 'href' in a_tag.attrs:
-                    href = a_tag['href']
-                    # /horse/2018105247/
-                    m = re.search(r'/horse/(\d+)', href)
-                    if m:
-                        horse_id = m.group(1)
-
-            # Let's try dynamic finding for Trainer.
-            trainer_raw = ""
-            for i, c in enumerate(cells):
-                txt = c.get_text(strip=True)
-                # Trainer often has "美浦" or "栗東" or "北海道"
-                if ("美浦" in txt or "栗東" in txt or "北海道" in txt or "川崎" in txt) and i > 5:
-                     trainer_raw = c.get_text(separator="\n", strip=True) # Use separator to keep split
-                     break
-            
-            # Separating Stable and Trainer
-            stable_val = ""
-            trainer_val = ""
-            
-            if trainer_raw:
-                # Remove extra spaces
-                # Example: "美浦\n\n青木"
-                parts = [p.strip() for p in trainer_raw.split('\n') if p.strip()]
-                if len(parts) >= 2:
-                    stable_val = parts[0]
-                    trainer_val = parts[1]
-                elif len(parts) == 1:
-                     # "北海道田中淳司" Combined case?
-                     # Try regex split if not separated by newline
-                     # Common stables: 美浦, 栗東, 北海道, 兵庫, etc.
-                     # But usually JRA is separated.
-                     
-                     # Simple heuristic: First 2 chars are stable?
-                     if parts[0].startswith("美浦") or parts[0].startswith("栗東"):
-                         stable_val = parts[0][:2]
-                         trainer_val = parts[0][2:].strip()
-                     else:
-                         trainer_val = parts[0] # Fallback
-            
-            # Re-mapping other cols
-            # 9: Corner? 10: 3F?
-            # We rely on text analysis for robustness if indices shift.
-            
-            row_data = {
-                '着 順': get_text(0),
-                '枠': waku_text,
-                '馬 番': get_text(2),
-                '馬名': get_text(3),
-                'horse_id': horse_id,
-                '性齢': get_text(4),
-                '斤量': get_text(5),
-                '騎手': get_text(6),
-                'タイム': get_text(7),
-                '着差': get_text(8),
-                # Index 9 seems to be corner/passing based on previous result? No wait.
-                # If 12 was corner..
-                # Let's stick to the ones that worked or leave blank if unsure, 
-                # but we need Trainer.
-                'コーナー 通過順': get_text(12) if len(cells) > 12 else "",
-                '厩舎': stable_val,   # NEW: Stable only
-                '調教師': trainer_val, # NEW: Trainer name
-                '人 気': get_text(9) if len(cells) > 9 else "", # Verify later
-                '単勝 オッズ': "0.0" 
-            }
-            data.append(row_data)
-
-        df = pd.DataFrame(data)
-        
-        # Add Metadata Columns
-        df['日付'] = date_text
-        df['会場'] = venue_text
-        df['レース番号'] = race_num_text
-        df['レース名'] = race_name_text
-        df['重賞'] = grade_text
-        df['距離'] = distance
-        df['コースタイプ'] = course_type
-        df['天候'] = weather
-        df['天候'] = weather
-        df['馬場状態'] = condition
-        df['回り'] = rotation
-        
-        # ID Generation
-        place_map = {
-            "札幌": "01", "函館": "02", "福島": "03", "新潟": "04", "東京": "05",
-            "中山": "06", "中京": "07", "京都": "08", "阪神": "09", "小倉": "10"
+    except Exception as e:
+        print(f"Error scraping JRA URL: {e}")
+        return None
+
+
+def parse_jra_race(html, url, existing_race_ids=None):
+    """
+    Parses a race result page fetched by scrape_jra_race.
+    """
+    # Whole document: weather/condition are searched in the page text
+    soup = make_soup(html)
+    page_text = soup.text
+
+    # --- Metadata Extraction ---
+    h1_elem = soup.select_one("div.header_line h1 .txt")
+    full_text = h1_elem.text.strip() if h1_elem else ""
+    if not full_text and soup.h1:
+        full_text = soup.h1.text.strip()
+
+    date_text = ""
+    venue_text = ""
+    race_num_text = ""
+    kai = "01"
+    day = "01"
+
+    # Extract Date
+    match_date = re.search(r'(\d{4}年\d{1,2}月\d{1,2}日)', full_text)
+    if match_date:
+        date_text = match_date.group(1)
+
+    # Extract Venue, Kai, Day
+    venues_str = "札幌|函館|福島|新潟|東京|中山|中京|京都|阪神|小倉"
+    match_meta = re.search(rf'(\d+)回({venues_str})(\d+)日', full_text)
+    if match_meta:
+        kai = f"{int(match_meta.group(1)):02}"
+        venue_text = match_meta.group(2)
+        day = f"{int(match_meta.group(3)):02}"
+
+    # Extract Race Num
+    match_race = re.search(r'(\d+)レース', full_text)
+    if match_race:
+        r_val = int(match_race.group(1))
+        race_num_text = f"{r_val}R"
+        r_num = f"{r_val:02}"
+    else:
+        race_num_text = "10R" # Fallback
+        r_num = "10"
+
+    # Race Name
+    race_name_text = ""
+    name_elem = soup.select_one(".race_name")
+    if name_elem:
+        race_name_text = name_elem.text.strip()
+
+    # Grade (search the markup as received instead of re-serializing the tree)
+    grade_text = ""
+    if "G1" in html or "ＧⅠ" in html: grade_text = "G1"
+    elif "G2" in html or "ＧⅡ" in html: grade_text = "G2"
+    elif "G3" in html or "ＧⅢ" in html: grade_text = "G3"
+
+    # --- Added: Course, Distance, Weather, Condition ---
+    # JRA HTML structure varies, but often contained in specific divs or text lines.
+    # We will scan the entire header text or specific class for these patterns.
+
+    # 1. Course & Distance (e.g., "芝2000メートル", "ダート1800メートル", "芝・1600m")
+    # Usually in the same block as race name or just below.
+    # We search the whole header area text.
+    header_line = soup.select_one("div.header_line")
+    header_text = header_line.text if header_line else page_text
+
+    # Regex: Allow spaces, dots, etc. between Type and Dist
+    dist_type_match = re.search(r'(芝|ダ|ダート|障害)[^0-9]*(\d+)', header_text)
+    course_type = ""
+    distance = ""
+
+    if dist_type_match:
+        c_val = dist_type_match.group(1)
+        d_val = dist_type_match.group(2)
+
+        if "芝" in c_val: course_type = "芝"
+        elif "ダ" in c_val: course_type = "ダート"
+        elif "障" in c_val: course_type = "障害"
+
+        distance = int(d_val)
+
+    # 1.5 Rotation (Right/Left/Straight)
+    rotation = ""
+    # Often formatted as "(右)" or "（左）" 
+    rot_match = re.search(r'[（\(](右|左|直線)[）\)]', header_text)
+    if rot_match:
+        rotation = rot_match.group(1)
+    else:
+         # Fallback: Inference based on Venue
+         # Tokyo, Chukyo, Niigata -> Left (Default), others Right
+         # Niigata 1000m -> Straight
+         if "左" in header_text: rotation = "左"
+         elif "右" in header_text: rotation = "右"
+         elif "直線" in header_text: rotation = "直線"
+
+
+    # 2. Weather (e.g., "天候：晴")
+    weather = ""
+    w_match = re.search(r'天候\s*[:：]\s*(\S+)', page_text)
+    if w_match:
+        weather = w_match.group(1).strip()
+
+    # 3. Condition (e.g., "芝：良", "ダート：稍重")
+    # Note: A race can have both if it's mixed, but usually we care about the main one or the one matching course_type.
+    condition = ""
+
+    # Try specific pattern based on course type
+    if course_type == "芝":
+         c_match = re.search(r'芝\s*[:：]\s*(\S+)', page_text)
+         if c_match: condition = c_match.group(1).strip()
+    elif course_type == "ダート":
+         c_match = re.search(r'ダート\s*[:：]\s*(\S+)', page_text)
+         if c_match: condition = c_match.group(1).strip()
+
+    # Fallback if generic or course type unknown, grab first one found
+    if not condition:
+         c_match_gen = re.search(r'(?:芝|ダート)\s*[:：]\s*(\S+)', page_text)
+         if c_match_gen: condition = c_match_gen.group(1).strip()
+
+    # --- Table Extraction (Custom BS4 Parsing) ---
+    # Find table with "着順"
+    tables = soup.find_all('table')
+    target_table = None
+    for tbl in tables:
+        if "着順" in tbl.text and "馬名" in tbl.text:
+            target_table = tbl
+            break
+
+    if not target_table:
+        print(f"Warning: Result table not found in {url}")
+        return None
+
+    # Parse Rows
+    rows = target_table.find_all('tr')
+    data = []
+
+    for row in rows:
+        # Skip header (usually th) or invalid rows
+        if row.find('th'):
+            continue
+
+        cells = row.find_all('td')
+        if not cells:
+            continue
+
+        # Correct Mapping based on standard JRA result table
+
+        def get_text(idx):
+            if idx < len(cells):
+                return cells[idx].get_text(strip=True)
+            return ""
+
+        # Extract Frame (Waku) from Image
+        waku_text = ""
+        if len(cells) > 1:
+            img = cells[1].find('img')
+            if img and 'alt' in img.attrs:
+                # Example: "枠6緑" -> Extract number
+                alt = img['alt']
+                m = re.search(r'枠(\d+)', alt)
+                if m:
+                    waku_text = m.group(1)
+                else:
+                    waku_text = alt # Fallback
+
+        # Extract Horse ID
+        horse_id = ""
+        if len(cells) > 3:
+            a_tag = cells[3].find('a')
+            if a_tag and 'href' in a_tag.attrs:
+                href = a_tag['href']
+                # /horse/2018105247/
+                m = re.search(r'/horse/(\d+)', href)
+                if m:
+                    horse_id = m.group(1)
+
+        # Let's try dynamic finding for Trainer.
+        trainer_raw = ""
+        for i, c in enumerate(cells):
+            txt = c.get_text(strip=True)
+            # Trainer often has "美浦" or "栗東" or "北海道"
+            if ("美浦" in txt or "栗東" in txt or "北海道" in txt or "川崎" in txt) and i > 5:
+                 trainer_raw = c.get_text(separator="\n", strip=True) # Use separator to keep split
+                 break
+
+        # Separating Stable and Trainer
+        stable_val = ""
+        trainer_val = ""
+
+        if trainer_raw:
+            # Remove extra spaces
+            # Example: "美浦\n\n青木"
+            parts = [p.strip() for p in trainer_raw.split('\n') if p.strip()]
+            if len(parts) >= 2:
+                stable_val = parts[0]
+                trainer_val = parts[1]
+            elif len(parts) == 1:
+                 # "北海道田中淳司" Combined case?
+                 # Try regex split if not separated by newline
+                 # Common stables: 美浦, 栗東, 北海道, 兵庫, etc.
+                 # But usually JRA is separated.
+
+                 # Simple heuristic: First 2 chars are stable?
+                 if parts[0].startswith("美浦") or parts[0].startswith("栗東"):
+                     stable_val = parts[0][:2]
+                     trainer_val = parts[0][2:].strip()
+                 else:
+                     trainer_val = parts[0] # Fallback
+
+        # Re-mapping other cols
+        # 9: Corner? 10: 3F?
+        # We rely on text analysis for robustness if indices shift.
+
+        row_data = {
+            '着 順': get_text(0),
+            '枠': waku_text,
+            '馬 番': get_text(2),
+            '馬名': get_text(3),
+            'horse_id': horse_id,
+            '性齢': get_text(4),
+            '斤量': get_text(5),
+            '騎手': get_text(6),
+            'タイム': get_text(7),
+            '着差': get_text(8),
+            # Index 9 seems to be corner/passing based on previous result? No wait.
+            # If 12 was corner..
+            # Let's stick to the ones that worked or leave blank if unsure, 
+            # but we need Trainer.
+            'コーナー 通過順': get_text(12) if len(cells) > 12 else "",
+            '厩舎': stable_val,   # NEW: Stable only
+            '調教師': trainer_val, # NEW: Trainer name
+            '人 気': get_text(9) if len(cells) > 9 else "", # Verify later
+            '単勝 オッズ': "0.0" 
         }
-        p_code = place_map.get(venue_text, "00")
-        
-        year = "2025"
-        if date_text:
-            year = date_text[:4]
-            
-        generated_id = f"{year}{p_code}{kai}{day}{r_num}"
-        
-        # SKIP CHECK
-        if existing_race_ids and generated_id in existing_race_ids:
-            print(f"Skipping {generated_id} (Already exists)")
-            return None
+        data.append(row_data)
 
-        df['race_id'] = generated_id
+    df = pd.DataFrame(data)
 
-        # Cleanups
-        if '単勝 オッズ' in df.columns:
-            df['単勝 オッズ'] = pd.to_numeric(df['単勝 オッズ'], errors='coerce').fillna(0.0)
+    # Add Metadata Columns
+    df['日付'] = date_text
+    df['会場'] = venue_text
+    df['レース番号'] = race_num_text
+    df['レース名'] = race_name_text
+    df['重賞'] = grade_text
+    df['距離'] = distance
+    df['コースタイプ'] = course_type
+    df['天候'] = weather
+    df['天候'] = weather
+    df['馬場状態'] = condition
+    df['回り'] = rotation
 
-        standard_columns = [
-            "日付","会場","レース番号","レース名","重賞","着 順","枠","馬 番","馬名","性齢","斤量","騎手",
-            "タイム","着差","人 気","単勝 オッズ","後3F","コーナー 通過順","厩舎","馬体重 (増減)","race_id",
-            "距離","コースタイプ","天候","馬場状態","回り"
-        ]
-        
-        for col in standard_columns:
-            if col not in df.columns:
-                df[col] = ""
-                
-        df = df[standard_columns]
-        
-        print(f"Scraped {len(df)} rows.")
-        return df
+    # ID Generation
+    place_map = {
+        "札幌": "01", "函館": "02", "福島": "03", "新潟": "04", "東京": "05",
+        "中山": "06", "中京": "07", "京都": "08", "阪神": "09", "小倉": "10"
+    }
+    p_code = place_map.get(venue_text, "00")
 
-    except Exception as e:
-        print(f"Error scraping JRA URL: {e}")
+    year = "2025"
+    if date_text:
+        year = date_text[:4]
+
+    generated_id = f"{year}{p_code}{kai}{day}{r_num}"
+
+    # SKIP CHECK
+    if existing_race_ids and generated_id in existing_race_ids:
+        print(f"Skipping {generated_id} (Already exists)")
         return None
 
+    df['race_id'] = generated_id
+
+    # Cleanups
+    if '単勝 オッズ' in df.columns:
+        df['単勝 オッズ'] = pd.to_numeric(df['単勝 オッズ'], errors='coerce').fillna(0.0)
+
+    standard_columns = [
+        "日付","会場","レース番号","レース名","重賞","着 順","枠","馬 番","馬名","性齢","斤量","騎手",
+        "タイム","着差","人 気","単勝 オッズ","後3F","コーナー 通過順","厩舎","馬体重 (増減)","race_id",
+        "距離","コースタイプ","天候","馬場状態","回り"
+    ]
+
+    for col in standard_columns:
+        if col not in df.columns:
+            df[col] = ""
+
+    df = df[standard_columns]
+
+    print(f"Scraped {len(df)} rows.")
+    return df
+
 
 # Parameter Map for Monthly Results (Reverse Engineered)
 JRA_MONTH_PARAMS = {
@@ -327,21 +361,23 @@ JRA_MONTH_PARAMS = {
     "2020": { "01": "83", "02": "51", "03": "1F", "04": "ED", "05": "BB", "06": "89", "07": "57", "08": "25", "09": "F3", "10": "62", "11": "30", "12": "FE" }
 }
 
-def scrape_jra_year(year_str, start_date=None, end_date=None, save_callback=None, existing_race_ids=None):
+JRA_BASE_URL = "https://www.jra.go.jp/JRADB/accessS.html"
+JRA_VENUES_PTN = "札幌|函館|福島|新潟|東京|中山|中京|京都|阪神|小倉"
+JRA_PLACE_MAP = {
+    "札幌": "01", "函館": "02", "福島": "03", "新潟": "04", "東京": "05",
+    "中山": "06", "中京": "07", "京都": "08", "阪神": "09", "小倉": "10"
+}
+
+def _jra_month_cnames(year_str, start_date=None, end_date=None):
     """
-    Scrapes races for a given year and date range.
-    year_str: "2024" or "2025"
-    start_date: datetime.date (optional)
-    end_date: datetime.date (optional)
-    save_callback: function(df) to save progress
+    Returns the list of (month, cname) to visit for the year (prints the period header).
+    Returns [] if the year is unsupported or in the future.
     """
-    
     if year_str not in JRA_MONTH_PARAMS:
         print(f"Year {year_str} not supported in parameter map.")
-        return
+        return []
 
     params = JRA_MONTH_PARAMS[year_str]
-    base_url = "https://www.jra.go.jp/JRADB/accessS.html"
     
     # Determine months to iterate
     start_m = 1
@@ -370,8 +406,9 @@ def scrape_jra_year(year_str, start_date=None, end_date=None, save_callback=None
         end_m = min(end_m, today.month)
     elif int(year_str) > today.year:
         print(f"Year {year_str} is in the future. Stopping.")
-        return
+        return []
     
+    cnames = []
     for m in range(start_m, end_m + 1):
         month = f"{m:02}"
         if month not in params:
@@ -385,167 +422,308 @@ def scrape_jra_year(year_str, start_date=None, end_date=None, save_callback=None
         except:
             prefix = "pw01skl10"
 
-        cname = f"{prefix}{year_str}{month}/{suffix}"
+        cnames.append((month, f"{prefix}{year_str}{month}/{suffix}"))
+    return cnames
+
+def parse_jra_month_page(html):
+    """Extracts the race-day CNAMEs (pw01srl...) from a monthly results page."""
+    soup = make_soup(html, PAGE_FILTERS["jra_month"])
+    
+    race_cnames = []
+    links = soup.find_all('a')
+    for link in links:
+        onclick = link.get('onclick', '')
+        match = re.search(r"doAction\('[^']+',\s*'([^']+)'\)", onclick)
+        if match:
+            c = match.group(1)
+            if c.startswith('pw01srl'):
+                race_cnames.append(c)
+    
+    return sorted(list(set(race_cnames)))
+
+def parse_jra_day_page(html):
+    """
+    Parses a race-day page.
+    Returns dict: header text, date (or None), year, place code, kai, day and
+    races = [(url, race_num)] sorted by race number (-1 when unknown).
+    """
+    soup_day = make_soup(html, PAGE_FILTERS["jra_day"])
+    
+    # Check date of this day page
+    d_h1 = soup_day.select_one("div.header_line h1 .txt")
+    full_d_text = d_h1.text.strip() if d_h1 else (soup_day.h1.text.strip() if soup_day.h1 else "")
+    
+    # Parse date from "2025年1月5日（日曜）1回中山1日"
+    # Need to match Date AND Venue/Kai/Day info for ID generation
+    # Pattern: YYYY年M月D日 ... K回VenueD日
+    
+    day_info = {
+        "text": full_d_text,
+        "date": None,
+        "year": None,
+        "p_code": "00",
+        "kai": "01",
+        "day": "01",
+        "races": [],
+    }
+    
+    match_day_date = re.search(r'(\d{4})年(\d{1,2})月(\d{1,2})日', full_d_text)
+    if match_day_date:
+        y, mo, d_day = map(int, match_day_date.groups())
+        day_info["date"] = datetime(y, mo, d_day).date()
+        day_info["year"] = y
+
+    # Parse Venue Info for ID Generation
+    match_meta = re.search(rf'(\d+)回({JRA_VENUES_PTN})(\d+)日', full_d_text)
+    if match_meta:
+        day_info["kai"] = f"{int(match_meta.group(1)):02}"
+        day_info["day"] = f"{int(match_meta.group(3)):02}"
+        day_info["p_code"] = JRA_PLACE_MAP.get(match_meta.group(2), "00")
+    
+    # Collect Race Links AND Race Numbers
+    # Need to pair Link with Race Number
+    race_list_items = []
+
+    all_anchors = soup_day.find_all('a')
+    for a in all_anchors:
+        onclick = a.get('onclick', '')
+        # Check for doAction with robust regex (handles single/double quotes, whitespace)
+        # Pattern: doAction('FormName', 'CNAME')
+        match_sde = re.search(r"doAction\s*\(\s*['\"][^'\"]+['\"]\s*,\s*['\"](pw01sde[^'\"]+)['\"]\s*\)", onclick)
+        href = a.get('href', '')
+        
+        final_url = ""
+        if match_sde:
+            final_url = f"{JRA_BASE_URL}?CNAME={match_sde.group(1)}"
+        elif 'pw01sde' in href:
+            # Fallback for simple hrefs
+            # href="accessS.html?CNAME=..." or just "?CNAME=..."
+            final_url = urllib.parse.urljoin(JRA_BASE_URL, href)
         
+        if final_url:
+            # Extract Race Number from anchor text (e.g. "1R", "11R")
+            # Or generic image alt?
+            # Usually text is "1R" or img alt="1R"
+            txt = a.text.strip()
+            img = a.find('img')
+            if not txt and img and 'alt' in img.attrs:
+                txt = img['alt']
+            
+            r_num = -1
+            r_num_match = re.search(r'(\d+)R', txt)
+            if r_num_match:
+                 r_num = int(r_num_match.group(1))
+                 
+            # Append even if Race Num is not found (fix for missing races)
+            race_list_items.append((final_url, r_num))
+    
+    # Deduplicate by URL (keep first found usually fine)
+    # Sort by Race Number (unknowns (-1) first or last?)
+    seen_urls = set()
+    unique_races = []
+    for url, r_num in race_list_items:
+        if url not in seen_urls:
+            unique_races.append((url, r_num))
+            seen_urls.add(url)
+    
+    unique_races.sort(key=lambda x: x[1]) # Sort by race num (-1 will be first)
+    day_info["races"] = unique_races
+    return day_info
+
+def _jra_day_in_range(day_info, start_date=None, end_date=None):
+    current_day_date = day_info["date"]
+    if current_day_date:
+        # Filtering
+        if start_date and current_day_date < start_date:
+            print(f"    Skipping day {current_day_date} (Before start date)")
+            return False
+        if end_date and current_day_date > end_date:
+            print(f"    Skipping day {current_day_date} (After end date)")
+            return False
+        print(f"    Processing Day: {current_day_date} ({day_info['text']})")
+    else:
+        print(f"    Processing Day (Date unknown): {day_info['text'][:20]}...")
+    return True
+
+def _jra_races_to_fetch(day_info, existing_race_ids=None):
+    """
+    PRE-FETCH OPTIMIZATION: drops races whose ID (YYYY PP KK DD RR) can be built
+    from the day page and already exists.
+    """
+    races = day_info["races"]
+    # Only if we successfully extracted Race Num and Venue info
+    known_day = day_info["p_code"] != "00" and day_info["date"]
+    generated_ids = [
+        f"{day_info['year']}{day_info['p_code']}{day_info['kai']}{day_info['day']}{r_num:02}"
+        if known_day and r_num != -1 else None
+        for _, r_num in races
+    ]
+    # One vectorized lookup for the whole day (see race_index.present_mask)
+    checkable = [rid for rid in generated_ids if rid is not None]
+    exists = iter(present_mask(checkable, existing_race_ids))
+    targets = []
+    for (r_link, _), generated_id in zip(races, generated_ids):
+        if generated_id is not None and next(exists):
+            continue
+        targets.append(r_link)
+    return targets
+
+def scrape_jra_year(year_str, start_date=None, end_date=None, save_callback=None, existing_race_ids=None):
+    """
+    Scrapes races for a given year and date range.
+    year_str: "2024" or "2025"
+    start_date: datetime.date (optional)
+    end_date: datetime.date (optional)
+    save_callback: function(df) to save progress
+    """
+    for month, cname in _jra_month_cnames(year_str, start_date, end_date):
         print(f"Fetching list for {year_str}/{month} (CNAME={cname})...")
         
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36" 
-            }
-            response = requests.post(base_url, data={"cname": cname}, headers=headers, timeout=10)
-            response.encoding = 'cp932'
+            response = http_client.post(JRA_BASE_URL, data={"cname": cname})
             
             if response.status_code != 200:
                 print(f"Failed to fetch {cname} (Status {response.status_code})")
                 continue
                 
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            race_cnames = []
-            links = soup.find_all('a')
-            for link in links:
-                onclick = link.get('onclick', '')
-                match = re.search(r"doAction\('[^']+',\s*'([^']+)'\)", onclick)
-                if match:
-                    c = match.group(1)
-                    if c.startswith('pw01srl'):
-                        race_cnames.append(c)
-            
-            race_cnames = sorted(list(set(race_cnames)))
+            race_cnames = parse_jra_month_page(response.text)
             print(f"  Found {len(race_cnames)} race days in month.")
             
             for day_cname in race_cnames:
-                resp_day = requests.post(base_url, data={"cname": day_cname}, headers=headers, timeout=10)
-                resp_day.encoding = 'cp932'
-                soup_day = BeautifulSoup(resp_day.text, 'html.parser')
-                
-                # Check date of this day page
-                day_date_text = ""
-                d_h1 = soup_day.select_one("div.header_line h1 .txt")
-                full_d_text = d_h1.text.strip() if d_h1 else (soup_day.h1.text.strip() if soup_day.h1 else "")
-                
-                # Parse date from "2025年1月5日（日曜）1回中山1日"
-                # Need to match Date AND Venue/Kai/Day info for ID generation
-                # Pattern: YYYY年M月D日 ... K回VenueD日
-                
-                current_day_date = None
-                kai_str = "01"
-                day_str = "01"
-                venue_str = ""
-                p_code = "00"
-                
-                match_day_date = re.search(r'(\d{4})年(\d{1,2})月(\d{1,2})日', full_d_text)
-                if match_day_date:
-                    y, mo, d_day = map(int, match_day_date.groups())
-                    current_day_date = datetime(y, mo, d_day).date()
-                    
-                    # Filtering
-                    if start_date and current_day_date < start_date:
-                        print(f"    Skipping day {current_day_date} (Before start date)")
-                        continue
-                    if end_date and current_day_date > end_date:
-                        print(f"    Skipping day {current_day_date} (After end date)")
-                        continue
-                    print(f"    Processing Day: {current_day_date} ({full_d_text})")
-                else:
-                    print(f"    Processing Day (Date unknown): {full_d_text[:20]}...")
-
-                # Parse Venue Info for ID Generation
-                venues_ptn = "札幌|函館|福島|新潟|東京|中山|中京|京都|阪神|小倉"
-                match_meta = re.search(rf'(\d+)回({venues_ptn})(\d+)日', full_d_text)
-                if match_meta:
-                    kai_str = f"{int(match_meta.group(1)):02}"
-                    venue_str = match_meta.group(2)
-                    day_str = f"{int(match_meta.group(3)):02}"
-                    
-                    place_map = {
-                        "札幌": "01", "函館": "02", "福島": "03", "新潟": "04", "東京": "05",
-                        "中山": "06", "中京": "07", "京都": "08", "阪神": "09", "小倉": "10"
-                    }
-                    p_code = place_map.get(venue_str, "00")
-                
-                # Collect Race Links AND Race Numbers
-                # Need to pair Link with Race Number
-                race_list_items = []
-
-                all_anchors = soup_day.find_all('a')
-                for a in all_anchors:
-                    onclick = a.get('onclick', '')
-                    # Check for doAction with robust regex (handles single/double quotes, whitespace)
-                    # Pattern: doAction('FormName', 'CNAME')
-                    match_sde = re.search(r"doAction\s*\(\s*['\"][^'\"]+['\"]\s*,\s*['\"](pw01sde[^'\"]+)['\"]\s*\)", onclick)
-                    href = a.get('href', '')
-                    
-                    final_url = ""
-                    if match_sde:
-                        final_url = f"{base_url}?CNAME={match_sde.group(1)}"
-                    elif 'pw01sde' in href:
-                        # Fallback for simple hrefs
-                        if 'CNAME=' in href:
-                             final_url = urllib.parse.urljoin(base_url, href)
-                        else:
-                             # If href="accessS.html?CNAME=..."
-                             # or just "?CNAME=..."
-                             final_url = urllib.parse.urljoin(base_url, href)
-                    
-                    if final_url:
-                        # Extract Race Number from anchor text (e.g. "1R", "11R")
-                        # Or generic image alt?
-                        # Usually text is "1R" or img alt="1R"
-                        txt = a.text.strip()
-                        img = a.find('img')
-                        if not txt and img and 'alt' in img.attrs:
-                            txt = img['alt']
-                        
-                        r_num = -1
-                        r_num_match = re.search(r'(\d+)R', txt)
-                        if r_num_match:
-                             r_num = int(r_num_match.group(1))
-                             
-                        # Append even if Race Num is not found (fix for missing races)
-                        race_list_items.append((final_url, r_num))
-                
-                # Deduplicate by URL (keep first found usually fine)
-                # Sort by Race Number (unknowns (-1) first or last?)
-                seen_urls = set()
-                unique_races = []
-                for url, r_num in race_list_items:
-                    if url not in seen_urls:
-                        unique_races.append((url, r_num))
-                        seen_urls.add(url)
+                resp_day = http_client.post(JRA_BASE_URL, data={"cname": day_cname})
+                day_info = parse_jra_day_page(resp_day.text)
+                if not _jra_day_in_range(day_info, start_date, end_date):
+                    continue
                 
-                unique_races.sort(key=lambda x: x[1]) # Sort by race num (-1 will be first)
-                
-                print(f"      -> {len(unique_races)} races found.")
-
-                for r_link, r_num in unique_races:
-                    # PRE-FETCH OPTIMIZATION
-                    # Construct ID
-                    # Only if we successfully extracted Race Num and Venue info
-                    if r_num != -1 and p_code != "00" and current_day_date:
-                         # ID: YYYY PP KK DD RR
-                         # y is from match_day_date loop var (int)
-                         # p_code, kai_str, day_str strings
-                         
-                         # Ensure year is from the day page date
-                         y_str = str(y)
-                         r_num_str = f"{r_num:02}"
-                         
-                         generated_id = f"{y_str}{p_code}{kai_str}{day_str}{r_num_str}"
-                         
-                         if existing_race_ids and generated_id in existing_race_ids:
-                             # print(f"        [Skip] {generated_id} (Pre-check)")
-                             continue
-                    
+                print(f"      -> {len(day_info['races'])} races found.")
+
+                for r_link in _jra_races_to_fetch(day_info, existing_race_ids):
                     # If not skipped, fetch
                     df = scrape_jra_race(r_link, existing_race_ids=existing_race_ids)
                     
                     if df is not None and not df.empty:
                         if save_callback:
                             save_callback(df)
-                        time.sleep(1)
         
         except Exception as e:
             print(f"Error processing month {month}: {e}")
 
+async def scrape_jra_year_async(year_str, fetcher, start_date=None, end_date=None, save_callback=None, existing_race_ids=None):
+    """
+    Async counterpart of scrape_jra_year.
+    Month lists, day pages and races are fetched concurrently under the per-host budget.
+    """
+    async def _race(r_link):
+        df = await scrape_jra_race_async(r_link, fetcher, existing_race_ids=existing_race_ids)
+        if df is not None and not df.empty:
+            if save_callback:
+                save_callback(df)
+
+    async def _day(day_cname):
+        resp_day = await fetcher.fetch(JRA_BASE_URL, method="POST", data={"cname": day_cname})
+        day_info = await fetcher.parse(parse_jra_day_page, resp_day.text)
+        if not _jra_day_in_range(day_info, start_date, end_date):
+            return
+        print(f"      -> {len(day_info['races'])} races found.")
+        await asyncio.gather(*(_race(r) for r in _jra_races_to_fetch(day_info, existing_race_ids)))
+
+    async def _month(month, cname):
+        print(f"Fetching list for {year_str}/{month} (CNAME={cname})...")
+        try:
+            response = await fetcher.fetch(JRA_BASE_URL, method="POST", data={"cname": cname})
+            if response.status_code != 200:
+                print(f"Failed to fetch {cname} (Status {response.status_code})")
+                return
+            race_cnames = await fetcher.parse(parse_jra_month_page, response.text)
+            print(f"  Found {len(race_cnames)} race days in month.")
+            await asyncio.gather(*(_day(c) for c in race_cnames))
+        except Exception as e:
+            print(f"Error processing month {month}: {e}")
+
+    await asyncio.gather(*(_month(m, c) for m, c in _jra_month_cnames(year_str, start_date, end_date)))
+
+def _jra_cname_date(cname):
+    """Date encoded in a day / race CNAME (...YYYYMMDD/xx), or None."""
+    m = re.search(r'(\d{8})(?:/|$)', cname)
+    if not m:
+        return None
+    try:
+        return datetime.strptime(m.group(1), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+def _jra_date_wanted(day, start_date=None, end_date=None):
+    # Days not held yet are skipped too; they are revived once they fall in range
+    if day is None:
+        return True
+    return (not start_date or day >= start_date) and (not end_date or day <= end_date) and day <= date.today()
+
+def _jra_recent(day):
+    return day is not None and day >= date.today() - timedelta(days=REOPEN_DAYS)
+
+def enqueue_jra_months(queue, year_str, start_date=None, end_date=None, reset=False):
+    """
+    Registers the jra_month discovery tasks of a year in the job queue.
+    reset=True re-opens months that were already processed (force mode).
+    Recent months (race days may still be added) are re-opened on every run, and
+    jra_day tasks skipped as out of range by an earlier run are revived if they are now in range.
+    """
+    recent = date.today() - timedelta(days=REOPEN_DAYS)
+    added = 0
+    for month, cname in _jra_month_cnames(year_str, start_date, end_date):
+        current = (int(year_str), int(month)) >= (recent.year, recent.month)
+        added += queue.add("jra_month", [cname], {"year": year_str, "month": month}, reset=reset or current)
+    revived = [k for k in queue.keys("jra_day", SKIPPED)
+               if _jra_date_wanted(_jra_cname_date(k), start_date, end_date)
+               and (_jra_cname_date(k) is None or str(_jra_cname_date(k).year) == year_str)]
+    if revived:
+        queue.add("jra_day", revived, reset=True)
+        print(f"  Re-opened {len(revived)} previously skipped race day(s) for {year_str}")
+    return added
+
+def jra_backfill_handlers(fetcher, start_date=None, end_date=None, save_callback=None, existing_race_ids=None):
+    """
+    Job queue handlers for the JRA backfill (jra_month -> jra_day -> jra_race).
+    A jra_race task is done only after save_callback has stored the race.
+    """
+    async def _post(cname):
+        response = await fetcher.fetch(JRA_BASE_URL, method="POST", data={"cname": cname})
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response.text
+
+    async def handle_month(task):
+        race_cnames = await fetcher.parse(parse_jra_month_page, await _post(task.key))
+        print(f"  {task.payload.get('year')}/{task.payload.get('month')}: Found {len(race_cnames)} race days in month.")
+        # Recent days are re-opened so that races published later are picked up
+        return [("jra_day", c, None, _jra_recent(_jra_cname_date(c))) for c in race_cnames]
+
+    async def handle_day(task):
+        # Out-of-range days are skipped (not done) so that a wider range later still processes them
+        day = _jra_cname_date(task.key)
+        if not _jra_date_wanted(day, start_date, end_date):
+            raise SkipTask(f"{day} outside {start_date} - {end_date}")
+        day_info = await fetcher.parse(parse_jra_day_page, await _post(task.key))
+        if not _jra_day_in_range(day_info, start_date, end_date):
+            raise SkipTask(f"{day_info['date']} outside {start_date} - {end_date}")
+        print(f"      -> {len(day_info['races'])} races found.")
+        reopen = _jra_recent(day_info["date"])
+        return [("jra_race", url, None, reopen) for url in _jra_races_to_fetch(day_info, existing_race_ids)]
+
+    async def handle_race(task):
+        response = await fetcher.fetch(task.key)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        # Parse without the skip check so that "no result table" (retry later) and
+        # "already stored" (done) can be told apart, as in the NAR handler
+        df = await fetcher.parse(parse_jra_race, response.text, task.key)
+        if df is None or df.empty:
+            raise RuntimeError("No result data")
+        race_id = df['race_id'].iloc[0]
+        if existing_race_ids and race_id in existing_race_ids:
+            print(f"Skipping {race_id} (Already exists)")
+            return
+        if save_callback:
+            save_callback(df)
+
+    return {"jra_month": handle_month, "jra_day": handle_day, "jra_race": handle_race}
@@ -0,0 +1,283 @@
+"""
+騎手・調教師名の解決
+出馬表では省略名 (例: "ルメール" / "矢作") しか表示されないため、プロフィールページのタイトルから正式名を取得する
+
+解析中は lookup() でキャッシュを引き、未解決のURLは保留しておく。
+ページの解析が終わってから resolve_pending() で保留分をまとめて並行取得する (ホスト別の予算内)。
+
+    names = NameResolver()
+    jockey = names.lookup(href, "ルメール")   # 未解決なら省略名のまま (保留に追加)
+    ...
+    names.resolve_pending()                  # 保留分を並行取得
+    jockey = names.lookup(href, "ルメール")   # 正式名
+
+キャッシュは SQLite (data/name_cache.db) に保存し、書き込みはまとめてコミットする。
+従来の data/name_cache.json がある場合は初回に取り込む。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import http_client
+    from html_parse import make_soup, PAGE_FILTERS
+except ImportError:
+    from . import http_client
+    from .html_parse import make_soup, PAGE_FILTERS
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, "data", "name_cache.db")
+LEGACY_JSON_PATH = os.path.join(PROJECT_ROOT, "data", "name_cache.json")
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "max_workers": 8,     # 保留分を取得する同時リクエスト数 (実際の間隔は http_client のホスト別予算に従う)
+    "commit_every": 64,   # 未コミットの書き込みがこの件数に達したらコミットする
+    "timeout": 5,
+}
+
+# タイトルの形式: "松山弘平の騎手成績..." / "矢作芳人の調教師成績..." / "...のプロフィール"
+TITLE_MARKERS = ("の騎手", "の調教師", "のプロフィール")
+
+
+def configure(**kwargs):
+    """
+    名前解決の設定を変更する
+
+    Args:
+        max_workers: 同時リクエスト数
+        commit_every: まとめてコミットする件数
+        timeout: リクエストのタイムアウト秒数
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown name_resolver option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+def name_from_title(title, default_name):
+    """プロフィールページのタイトルから正式名を取り出す (見つからなければ default_name)"""
+    for marker in TITLE_MARKERS:
+        if marker in title:
+            return title.split(marker)[0] or default_name
+    return default_name
+
+
+def fetch_full_name(url, default_name):
+    """
+    プロフィールページを取得して正式名を返す
+
+    Returns:
+        str: 正式名 (タイトルから取れなければ default_name)。通信エラー時は None
+    """
+    try:
+        res = http_client.get(url, timeout=CONFIG["timeout"])
+    except Exception as e:
+        print(f"DEBUG: Resolution failed for {url}: {e}")
+        return None
+    if res.status_code != 200:
+        return None
+    soup = make_soup(res.text, PAGE_FILTERS["title"])
+    title = soup.title.string if soup.title and soup.title.string else ""
+    return name_from_title(title, default_name)
+
+
+class NameStore:
+    """
+    URL → 正式名 のキー・バリューストア (SQLite)
+
+    読み込みは起動時にメモリへ展開した dict から行い、書き込みはバッファしてまとめてコミットする。
+    複数のスレッド・プロセスから使ってよい。
+    """
+
+    def __init__(self, db_path=None, legacy_json_path=LEGACY_JSON_PATH):
+        self.db_path = db_path or DEFAULT_DB_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS names (url TEXT PRIMARY KEY, name TEXT NOT NULL, updated_at REAL)"
+        )
+        self.conn.commit()
+        self.names = dict(self.conn.execute("SELECT url, name FROM names"))
+        self._dirty = {}
+        if not self.names and legacy_json_path and os.path.exists(legacy_json_path):
+            self._import_json(legacy_json_path)
+        print(f"DEBUG: Loaded Name Cache ({len(self.names)} entries)")
+
+    def _import_json(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"DEBUG: Failed to load Name Cache: {e}")
+            return
+        self.put_many(legacy)
+        self.flush()
+        print(f"DEBUG: Imported {len(legacy)} names from {os.path.basename(path)}")
+
+    def __contains__(self, url):
+        return url in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, url, default=None):
+        return self.names.get(url, default)
+
+    def put_many(self, items):
+        """
+        名前を登録する (commit_every 件たまるとコミット)
+
+        Args:
+            items: {url: name}
+        """
+        if not items:
+            return
+        with self._lock:
+            self.names.update(items)
+            self._dirty.update(items)
+            pending = len(self._dirty)
+        if pending >= CONFIG["commit_every"]:
+            self.flush()
+
+    def flush(self):
+        """未コミットの書き込みを1トランザクションでコミットする"""
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            rows = [(url, name, now) for url, name in self._dirty.items()]
+            try:
+                with self.conn:
+                    self.conn.executemany("INSERT OR REPLACE INTO names (url, name, updated_at) VALUES (?, ?, ?)", rows)
+                self._dirty.clear()
+            except sqlite3.Error as e:
+                print(f"DEBUG: Failed to save Name Cache: {e}")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+
+class NameResolver:
+    """
+    解析中に見つかった未解決のURLを保留し、まとめて並行に解決する
+    """
+
+    def __init__(self, store=None):
+        self._store = store
+        self._pending = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._background = None
+
+    @property
+    def store(self):
+        # SQLite は最初に使うときに開く (モジュール読み込み時にファイルを作らない)
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = NameStore()
+        return self._store
+
+    @property
+    def pending(self):
+        """保留中の {url: 省略名}"""
+        with self._lock:
+            return dict(self._pending)
+
+    def lookup(self, url, default_name):
+        """
+        キャッシュ済みの正式名を返す。未解決なら保留に追加して default_name を返す
+        """
+        if not url:
+            return default_name
+        name = self.store.get(url)
+        if name is not None:
+            return name
+        with self._lock:
+            self._pending.setdefault(url, default_name)
+        return default_name
+
+    def resolve_pending(self, urls=None):
+        """
+        保留中のURLを並行に取得してキャッシュに登録する
+
+        Args:
+            urls: 解決を待つURL (省略時は保留中のすべて)。
+                別スレッドが取得中のURLはその完了を待つ
+
+        Returns:
+            dict: 今回解決した {url: 正式名}
+        """
+        store = self.store
+        with self._lock:
+            if urls is None:
+                todo, self._pending = self._pending, {}
+            else:
+                todo = {url: self._pending.pop(url) for url in set(urls) if url in self._pending}
+            todo = {url: name for url, name in todo.items() if url not in store and url not in self._inflight}
+            waiting = [self._inflight[url] for url in (urls or ()) if url in self._inflight]
+            done = threading.Event()
+            for url in todo:
+                self._inflight[url] = done
+
+        resolved = {}
+        try:
+            if todo:
+                workers = max(1, min(CONFIG["max_workers"], len(todo)))
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="names") as pool:
+                    results = pool.map(lambda item: (item[0], item[1], fetch_full_name(*item)), todo.items())
+                    for url, default_name, full_name in results:
+                        if full_name is None:
+                            continue  # 通信エラーは登録せず、次回再取得する
+                        if full_name != default_name:
+                            print(f"DEBUG: Resolved {default_name} -> {full_name}")
+                        # 取り出せなかった場合も省略名を登録し、再取得しない
+                        resolved[url] = full_name
+                store.put_many(resolved)
+                store.flush()
+        finally:
+            with self._lock:
+                for url in todo:
+                    self._inflight.pop(url, None)
+            done.set()
+
+        for event in waiting:
+            event.wait()
+        return resolved
+
+    def resolve_pending_in_background(self):
+        """resolve_pending() をバックグラウンドで実行する (結果は次回以降の lookup() に反映)"""
+        if self._background is not None and self._background.is_alive():
+            return self._background
+        self._background = threading.Thread(target=self.resolve_pending, daemon=True)
+        self._background.start()
+        return self._background
+
+    def resolve(self, url, default_name):
+        """1件をその場で解決する (保留せずに取得)"""
+        name = self.lookup(url, default_name)
+        if url and url not in self.store:
+            self.resolve_pending([url])
+            name = self.store.get(url, default_name)
+        return name
+
+    def close(self):
+        if self._background is not None:
+            self._background.join()
+            self._background = None
+        if self._store is not None:
+            self._store.close()
+            self._store = None
@@ -0,0 +1,278 @@
+"""
+発走時刻に合わせたオッズの定期取得 (ポーラー)
+当日の全レースのオッズを、発走が近いレースほど短い間隔で並行に取得し続ける
+
+- 発走時刻はスケジュール (todays_data.json / todays_data_nar.json の post_time) から読む。
+  スケジュールファイルが更新されれば読み直す
+- 取得間隔は発走までの残り時間で決まる (CONFIG["intervals"]、既定は 5分前以降30秒・早い時間帯は10分)
+- リクエストは AsyncFetcher 経由で並行に送る。レートはホスト別予算 (rate_limit) に従う
+- 取得したオッズは odds_store にスナップショットとして保存され (scrape_odds_for_race_async)、
+  スケジュールファイルの horses に書き戻される (アプリが読む)。subscribe() した関数にも通知する
+
+    poller = OddsPoller("JRA")
+    poller.subscribe(lambda race, horses: ...)   # 同期関数・コルーチン関数のどちらでもよい
+    run_async(poller.run())                      # 当日の全レースが締め切られるまで取得する
+
+コマンドライン: python scraper/auto_scraper.py --poll-odds --mode JRA
+              (--alerts を付けると utils/alert.py の EVAlertEngine で期待値アラートを出す)
+"""
+
+import asyncio
+import inspect
+import json
+import os
+import time
+from datetime import datetime
+
+try:
+    from async_fetch import AsyncFetcher, run as run_async
+except ImportError:
+    from .async_fetch import AsyncFetcher, run as run_async
+
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    # (発走まで何分以内か, 取得間隔 秒)。上から順に最初に一致したものを使う (None はそれ以外すべて)
+    "intervals": [(5, 30), (15, 60), (30, 180), (None, 600)],
+    "close_after": 120,       # 発走後この秒数までは取得する (締切直前のオッズ)
+    "retry_interval": 30,     # 取得に失敗したときの再試行間隔 (秒)
+    "max_in_flight": 8,       # 同時リクエスト数
+    "tick": 1.0,              # 取得対象を確認する間隔 (秒)
+    "publish_interval": 5.0,  # スケジュールファイルへの書き戻し間隔 (秒)
+}
+
+
+def configure(**kwargs):
+    """
+    ポーラーの設定を変更する
+
+    Args:
+        intervals: [(発走まで何分以内か or None, 取得間隔 秒)]
+        close_after: 発走後に取得を続ける秒数
+        retry_interval: 失敗時の再試行間隔 (秒)
+        max_in_flight: 同時リクエスト数
+        tick: 取得対象を確認する間隔 (秒)
+        publish_interval: スケジュールファイルへの書き戻し間隔 (秒)
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown odds_poller option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+def poll_interval(seconds_to_post):
+    """発走までの残り秒数に対する取得間隔 (発走時刻が不明な場合は None を渡す)"""
+    for minutes, interval in CONFIG["intervals"]:
+        if minutes is None or (seconds_to_post is not None and seconds_to_post <= minutes * 60):
+            return interval
+    return CONFIG["intervals"][-1][1]
+
+
+class OddsPoller:
+    """
+    当日のレースのオッズを発走時刻に合わせて取得し続ける
+    """
+
+    def __init__(self, mode="JRA", schedule_path=None):
+        try:
+            import auto_scraper
+        except ImportError:
+            from . import auto_scraper
+        self._scraper = auto_scraper
+        self.mode = mode
+        self.schedule_path = schedule_path or auto_scraper._schedule_path(mode)
+        self.races = {}            # race_id → {"race": エントリ, "post": 発走 epoch秒, "next_due": 次回取得時刻}
+        self.subscribers = []
+        self.stats = {"polls": 0, "errors": 0, "published": 0}
+        self._schedule_mtime = None
+        self._day = None
+        self._updates = {}         # スケジュールファイルに未反映の race_id → (horses, 取得時刻)
+        self._in_flight = set()
+
+    def subscribe(self, callback):
+        """取得のたびに callback(race, horses) を呼ぶ (race はスケジュールのエントリ)"""
+        self.subscribers.append(callback)
+
+    # --- schedule ---
+
+    def load_schedule(self, now=None):
+        """スケジュールファイルが更新されていれば当日のレースを読み直す"""
+        now = now or time.time()
+        today = datetime.fromtimestamp(now).strftime("%Y-%m-%d")
+        try:
+            mtime = os.stat(self.schedule_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._schedule_mtime and today == self._day:
+            return
+        try:
+            with open(self.schedule_path, "r", encoding="utf-8") as f:
+                schedule = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Schedule unreadable, keeping current races: {e}")
+            return
+        self._schedule_mtime, self._day = mtime, today
+
+        races = {}
+        for race in schedule.get("races", []):
+            if race.get("date") != today:
+                continue
+            known = self.races.get(race["id"])
+            races[race["id"]] = {
+                "race": race,
+                "post": self._scraper._post_timestamp(race),
+                "next_due": known["next_due"] if known else now,
+            }
+        added = len(set(races) - set(self.races))
+        self.races = races
+        with_time = sum(1 for r in races.values() if r["post"] is not None)
+        print(f"Odds poller: {len(races)} race(s) today ({with_time} with post time, {added} new)")
+
+    def _is_open(self, entry, now):
+        if entry["post"] is None:
+            return True  # 発走時刻が不明なレースは当日中取得する
+        return now <= entry["post"] + CONFIG["close_after"]
+
+    def due(self, now=None):
+        """今取得すべきレース (発走が近い順)"""
+        now = now or time.time()
+        entries = [e for rid, e in self.races.items()
+                   if rid not in self._in_flight and self._is_open(e, now) and e["next_due"] <= now]
+        return sorted(entries, key=lambda e: e["post"] if e["post"] is not None else float("inf"))
+
+    # --- polling ---
+
+    async def poll_race(self, entry, fetcher):
+        """1レース分のオッズを取得して通知する"""
+        race = entry["race"]
+        rid = race["id"]
+        self._in_flight.add(rid)
+        try:
+            horses = await self._scraper.scrape_odds_for_race_async(
+                rid, fetcher, mode=self.mode, race_date=race.get("date"), post_time=entry["post"],
+                cache=False,  # 発走前は取得間隔が HTTP キャッシュの期限より短いため、毎回取得する
+            )
+        except Exception as e:
+            horses = None
+            print(f"  Odds poll failed for {rid}: {e}")
+        finally:
+            self._in_flight.discard(rid)
+
+        now = time.time()
+        self.stats["polls"] += 1
+        if not horses:
+            self.stats["errors"] += 1
+            entry["next_due"] = now + min(CONFIG["retry_interval"], poll_interval(self._to_post(entry, now)))
+            return
+        entry["next_due"] = now + poll_interval(self._to_post(entry, now))
+        self._updates[rid] = (horses, now)
+        for callback in self.subscribers:
+            try:
+                result = callback(race, horses)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"  Odds subscriber failed for {rid}: {e}")
+
+    @staticmethod
+    def _to_post(entry, now):
+        return None if entry["post"] is None else entry["post"] - now
+
+    def publish_schedule(self):
+        """取得したオッズをスケジュールファイルの horses に書き戻す (アプリが読む)"""
+        if not self._updates:
+            return
+        updates, self._updates = self._updates, {}
+        try:
+            with open(self.schedule_path, "r", encoding="utf-8") as f:
+                schedule = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Schedule unreadable, odds not published: {e}")
+            return
+        for race in schedule.get("races", []):
+            if race.get("id") in updates:
+                horses, fetched_at = updates[race["id"]]
+                race["horses"] = horses
+                race["odds_updated_at"] = datetime.fromtimestamp(fetched_at).strftime("%Y-%m-%d %H:%M:%S")
+        self._scraper._write_json_atomic(self.schedule_path, schedule)
+        # 自分の書き込みで読み直さないようにする
+        try:
+            self._schedule_mtime = os.stat(self.schedule_path).st_mtime_ns
+        except OSError:
+            pass
+        self.stats["published"] += len(updates)
+
+    def open_races(self, now=None):
+        now = now or time.time()
+        return [e for e in self.races.values() if self._is_open(e, now)]
+
+    async def run(self, duration=None, fetcher=None):
+        """
+        当日の全レースが締め切られるまで (または duration 秒経つまで) 取得を続ける
+
+        Returns:
+            dict: stats
+        """
+        own_fetcher = fetcher is None
+        if own_fetcher:
+            fetcher = AsyncFetcher(max_in_flight=CONFIG["max_in_flight"])
+        started = time.time()
+        last_publish = 0.0
+        tasks = set()
+        try:
+            while True:
+                now = time.time()
+                self.load_schedule(now)
+                if duration is not None and now - started >= duration:
+                    break
+                if not self.open_races(now) and not tasks:
+                    print("Odds poller: all of today's races are closed.")
+                    break
+                for entry in self.due(now):
+                    task = asyncio.ensure_future(self.poll_race(entry, fetcher))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if now - last_publish >= CONFIG["publish_interval"]:
+                    self.publish_schedule()
+                    last_publish = now
+                await asyncio.sleep(CONFIG["tick"])
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.publish_schedule()
+            if own_fetcher:
+                fetcher.close()
+        print(f"Odds poller finished: {self.stats['polls']} polls ({self.stats['errors']} failed)")
+        return self.stats
+
+
+def run_odds_poller(mode="JRA", duration=None, subscribers=(), alert_engine=None):
+    """
+    同期コードからポーラーを実行する
+
+    Args:
+        mode: "JRA" / "NAR"
+        duration: 実行する秒数 (省略時は当日の全レースが締め切られるまで)
+        subscribers: 取得のたびに呼ぶ関数 callback(race, horses)
+        alert_engine: utils.alert.EVAlertEngine (オッズの更新ごとに期待値アラートを判定する)
+    """
+    poller = OddsPoller(mode)
+    for callback in subscribers:
+        poller.subscribe(callback)
+    if alert_engine is None:
+        return run_async(poller.run(duration=duration))
+    poller.subscribe(alert_engine.on_odds)
+
+    async def _run():
+        # 送信キューはイベントループの中で開始・停止する (停止時に残りを送り切る)
+        sender = alert_engine.sender
+        if sender is not None:
+            sender.start()
+        try:
+            return await poller.run(duration=duration)
+        finally:
+            if sender is not None:
+                await sender.stop()
+            print(f"Alerts: {alert_engine.stats['alerts']} horse(s) in {alert_engine.stats['updates']} update(s)")
+
+    return run_async(_run())
@@ -1,15 +1,77 @@
 """
 オッズ取得の安定化
 リトライ処理と複数ソースからの取得
+
+取得したオッズは SQLite (data/odds_cache.db, WAL) にキャッシュする。エントリごとに取得時刻を持ち、
+有効期限は発走までの残り時間で決まる (CONFIG["ttl_rules"]、発走後しばらく経ったものは確定オッズとして期限なし)。
+複数の Streamlit セッションから同時に使ってよい。従来の odds_cache.json がある場合は初回に取り込む。
 """
 
-import requests
-from bs4 import BeautifulSoup
+import sqlite3
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 import json
 import os
 
+try:
+    import http_client
+    import odds_store
+    from html_parse import make_soup
+except ImportError:
+    from . import http_client
+    from . import odds_store
+    from .html_parse import make_soup
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.path.join(PROJECT_ROOT, "data", "odds_cache.db")
+# 従来は実行時のカレントディレクトリに書かれていた
+LEGACY_JSON_PATHS = (os.path.join(PROJECT_ROOT, "odds_cache.json"), os.path.abspath("odds_cache.json"))
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    # (発走まで何分以内か, 有効期限 秒)。上から順に最初に一致したものを使う
+    # 発走まで -10分以内 (= 発走から10分以上経過) は確定オッズとして期限なし (None)、None の行はそれ以外すべて
+    "ttl_rules": [(-10, None), (5, 30), (30, 120), (120, 600), (None, 1800)],
+    "default_ttl": 300,   # 発走時刻が分からないエントリの有効期限 (秒)
+    "commit_every": 16,   # 未コミットの書き込みがこの件数に達したらコミットする
+    "max_workers": 4,     # get_odds_batch の同時取得数 (実際の間隔は http_client のホスト別予算に従う)
+}
+
+
+def configure(**kwargs):
+    """
+    オッズ取得の設定を変更する
+
+    Args:
+        ttl_rules: [(発走まで何分以内か or None, 有効期限 秒 or None)]
+        default_ttl: 発走時刻が不明なエントリの有効期限 (秒)
+        commit_every: まとめてコミットする件数
+        max_workers: 一括取得の同時取得数
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown odds_scraper option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+def ttl_for(post_time, now=None):
+    """
+    キャッシュの有効期限 (秒)。None は期限なし
+
+    Args:
+        post_time: 発走時刻 (epoch秒、不明なら None)
+    """
+    if post_time is None:
+        return CONFIG["default_ttl"]
+    to_post = post_time - (now or time.time())
+    for minutes, ttl in CONFIG["ttl_rules"]:
+        if minutes is None or to_post <= minutes * 60:
+            return ttl
+    return CONFIG["ttl_rules"][-1][1]
+
 
 def retry_on_failure(max_retries=3, delay=2):
     """
@@ -39,35 +101,138 @@ def retry_on_failure(max_retries=3, delay=2):
     return decorator
 
 
+class OddsCacheStore:
+    """
+    race_id → オッズ のキャッシュ (SQLite)
+
+    読み込みは毎回データベースから行う (他のセッションの書き込みも見える)。
+    書き込みはバッファしてまとめてコミットする。複数のスレッド・プロセスから使ってよい。
+    """
+
+    def __init__(self, db_path=None, legacy_json_paths=LEGACY_JSON_PATHS):
+        self.db_path = db_path or DEFAULT_CACHE_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS odds ("
+            "race_id TEXT PRIMARY KEY, odds TEXT NOT NULL, fetched_at REAL, post_time REAL, source TEXT)"
+        )
+        self.conn.commit()
+        self._dirty = {}
+        if self.conn.execute("SELECT COUNT(*) FROM odds").fetchone()[0] == 0:
+            for path in dict.fromkeys(legacy_json_paths or ()):
+                if os.path.exists(path):
+                    self._import_json(path)
+
+    def _import_json(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+            fetched_at = os.path.getmtime(path)
+        except Exception as e:
+            print(f"Odds cache import failed: {e}")
+            return
+        for race_id, odds in legacy.items():
+            self.put(race_id, odds, fetched_at=fetched_at, source="legacy")
+        self.flush()
+        print(f"Imported {len(legacy)} cached odds from {path}")
+
+    @staticmethod
+    def _decode(row):
+        race_id, odds, fetched_at, post_time, source = row
+        odds = {int(k) if str(k).isdigit() else k: v for k, v in json.loads(odds).items()}
+        return race_id, {"odds": odds, "fetched_at": fetched_at, "post_time": post_time, "source": source}
+
+    def get_many(self, race_ids):
+        """
+        Returns:
+            dict: {race_id: {"odds", "fetched_at", "post_time", "source"}} (キャッシュにあるもののみ)
+        """
+        ids = list(dict.fromkeys(str(r) for r in race_ids))
+        result = {}
+        with self._lock:
+            for rid in ids:
+                if rid in self._dirty:
+                    result[rid] = self._decode(self._dirty[rid])[1]
+            rest = [r for r in ids if r not in result]
+            for i in range(0, len(rest), 500):
+                part = rest[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT race_id, odds, fetched_at, post_time, source FROM odds "
+                    f"WHERE race_id IN ({','.join('?' * len(part))})",
+                    part,
+                )
+                result.update(self._decode(row) for row in rows)
+        return result
+
+    def get(self, race_id):
+        return self.get_many([race_id]).get(str(race_id))
+
+    def is_fresh(self, entry, post_time=None, now=None):
+        """エントリが有効期限内か (post_time 省略時はエントリに保存された発走時刻)"""
+        if entry is None:
+            return False
+        now = now or time.time()
+        ttl = ttl_for(post_time if post_time is not None else entry.get("post_time"), now)
+        return ttl is None or now - (entry.get("fetched_at") or 0) < ttl
+
+    def expired(self, race_ids, post_times=None, now=None):
+        """キャッシュにない、または期限切れのレース (順序を保つ)"""
+        post_times = post_times or {}
+        entries = self.get_many(race_ids)
+        return [rid for rid in dict.fromkeys(str(r) for r in race_ids)
+                if not self.is_fresh(entries.get(rid), post_times.get(rid), now)]
+
+    def put(self, race_id, odds, post_time=None, source="", fetched_at=None):
+        """オッズを登録する (commit_every 件たまるとコミット)"""
+        row = (str(race_id), json.dumps(odds, ensure_ascii=False), fetched_at or time.time(), post_time, source)
+        with self._lock:
+            self._dirty[row[0]] = row
+            pending = len(self._dirty)
+        if pending >= CONFIG["commit_every"]:
+            self.flush()
+
+    def flush(self):
+        """未コミットの書き込みを1トランザクションでコミットする"""
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = list(self._dirty.values())
+            try:
+                with self.conn:
+                    # 発走時刻が分からない書き込みでは保存済みの発走時刻を残す
+                    self.conn.executemany(
+                        "INSERT INTO odds (race_id, odds, fetched_at, post_time, source) VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT(race_id) DO UPDATE SET odds = excluded.odds, fetched_at = excluded.fetched_at, "
+                        "post_time = COALESCE(excluded.post_time, odds.post_time), source = excluded.source",
+                        rows,
+                    )
+                self._dirty.clear()
+            except sqlite3.Error as e:
+                print(f"Cache save failed: {e}")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.close()
+
+
 class OddsScraper:
     """
     オッズ取得クラス（複数ソース対応）
     """
 
-    def __init__(self):
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
-        self.cache_file = "odds_cache.json"
-        self.cache = self._load_cache()
-
-    def _load_cache(self):
-        """キャッシュを読み込み"""
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+    def __init__(self, cache_path=None):
+        self.cache = OddsCacheStore(cache_path)
+        self.cache_file = self.cache.db_path
+        self._in_batch = False  # get_odds_batch 中はコミットを最後にまとめる
 
     def _save_cache(self):
         """キャッシュを保存"""
-        try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Cache save failed: {e}")
+        self.cache.flush()
 
     @retry_on_failure(max_retries=3, delay=2)
     def _get_odds_netkeiba(self, race_id):
@@ -82,15 +247,14 @@ class OddsScraper:
         """
         url = f"https://race.netkeiba.com/odds/index.html?race_id={race_id}&type=b1"
 
-        time.sleep(1)  # Be polite
-
-        response = requests.get(url, headers=self.headers, timeout=10)
-        response.encoding = response.apparent_encoding
+        # Politeness is handled by the per-host budget in http_client.
+        # Freshness is decided by the odds cache (ttl_rules / force), so bypass the HTTP response cache
+        response = http_client.get(url, cache=False)
 
         if response.status_code != 200:
             raise Exception(f"HTTP {response.status_code}")
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = make_soup(response.text)
 
         odds_dict = {}
 
@@ -145,22 +309,25 @@ class OddsScraper:
         # Placeholder: return empty
         return {}
 
-    def get_odds_multi_source(self, race_id):
+    def get_odds_multi_source(self, race_id, post_time=None, force=False):
         """
         複数ソースからオッズを取得
 
         Args:
             race_id: レースID
+            post_time: 発走時刻 (epoch秒)。キャッシュの有効期限の判定に使う
+            force: True の場合はキャッシュが有効でも取得し直す
 
         Returns:
             dict: {馬番: オッズ} or None
         """
         print(f"📊 Fetching odds for race {race_id}...")
 
-        # Check cache first
-        if race_id in self.cache:
-            print("  ✅ Using cached odds")
-            return self.cache[race_id]
+        # Check cache first (valid until the TTL for the time-to-post expires)
+        entry = self.cache.get(race_id)
+        if not force and self.cache.is_fresh(entry, post_time):
+            print(f"  ✅ Using cached odds ({time.time() - entry['fetched_at']:.0f}s old)")
+            return entry["odds"]
 
         odds = None
 
@@ -170,8 +337,10 @@ class OddsScraper:
             odds = self._get_odds_netkeiba(race_id)
             if odds:
                 print(f"  ✅ Got odds from netkeiba ({len(odds)} horses)")
-                self.cache[race_id] = odds
-                self._save_cache()
+                odds_store.record(race_id, odds, source="netkeiba", post_time=post_time)
+                self.cache.put(race_id, odds, post_time=post_time, source="netkeiba")
+                if not self._in_batch:
+                    self.cache.flush()
                 return odds
         except Exception as e:
             print(f"  ⚠️ netkeiba failed: {e}")
@@ -182,46 +351,59 @@ class OddsScraper:
             odds = self._get_odds_jra(race_id)
             if odds:
                 print(f"  ✅ Got odds from JRA ({len(odds)} horses)")
-                self.cache[race_id] = odds
-                self._save_cache()
+                odds_store.record(race_id, odds, source="jra", post_time=post_time)
+                self.cache.put(race_id, odds, post_time=post_time, source="jra")
+                if not self._in_batch:
+                    self.cache.flush()
                 return odds
         except Exception as e:
             print(f"  ⚠️ JRA failed: {e}")
 
         # Priority 3: Use cached odds from previous fetch (if available)
-        if race_id in self.cache:
+        if entry is not None:
             print("  ⚠️ Using stale cached odds")
-            return self.cache[race_id]
+            return entry["odds"]
 
         print("  ❌ All sources failed")
         return None
 
-    def get_odds_batch(self, race_ids):
+    def get_odds_batch(self, race_ids, post_times=None, only_expired=True):
         """
         複数レースのオッズを一括取得
 
         Args:
             race_ids: レースIDのリスト
+            post_times: {race_id: 発走時刻 (epoch秒)} (キャッシュの有効期限の判定に使う)
+            only_expired: True の場合はキャッシュが期限切れ (またはない) のレースだけ取得する
 
         Returns:
             dict: {race_id: {馬番: オッズ}}
         """
-        results = {}
+        post_times = {str(k): v for k, v in (post_times or {}).items()}
+        race_ids = [str(r) for r in race_ids]
+        targets = self.cache.expired(race_ids, post_times) if only_expired else race_ids
+        print(f"Odds batch: {len(targets)}/{len(race_ids)} race(s) to fetch ({len(race_ids) - len(targets)} cached)")
 
-        for i, race_id in enumerate(race_ids, 1):
-            print(f"\n[{i}/{len(race_ids)}] Processing {race_id}...")
-
-            odds = self.get_odds_multi_source(race_id)
-            if odds:
-                results[race_id] = odds
-            else:
-                results[race_id] = {}
+        results = {}
+        if targets:
+            # Spacing between requests comes from the per-host budget in http_client
+            def _fetch(race_id):
+                return race_id, self.get_odds_multi_source(race_id, post_times.get(race_id), force=True)
 
-            # Polite delay between requests
-            if i < len(race_ids):
-                time.sleep(2)
+            self._in_batch = True
+            try:
+                with ThreadPoolExecutor(max_workers=CONFIG["max_workers"]) as pool:
+                    for race_id, odds in pool.map(_fetch, targets):
+                        results[race_id] = odds or {}
+            finally:
+                self._in_batch = False
+                self.cache.flush()
 
-        return results
+        cached = self.cache.get_many([r for r in race_ids if r not in results])
+        for race_id in race_ids:
+            if race_id not in results:
+                results[race_id] = cached[race_id]["odds"] if race_id in cached else {}
+        return {race_id: results[race_id] for race_id in race_ids}
 
 
 if __name__ == "__main__":
@@ -232,6 +414,7 @@ if __name__ == "__main__":
     test_race_id = "202506050101"
 
     odds = scraper.get_odds_multi_source(test_race_id)
+    scraper._save_cache()
 
     if odds:
         print("\n✅ Odds retrieved successfully:")
@@ -0,0 +1,319 @@
+"""
+オッズ履歴ストア (時系列スナップショット)
+取得したオッズを捨てずにスナップショットとして追記し、オッズの推移や「その時点で得られたオッズ」での
+期待値判断の再現に使う (過去のオッズは再取得できない)
+
+レイアウト (data/odds):
+    data/odds/20260118/snapshots.parquet       統合済みのスナップショット (race_id・馬番・時刻順)
+    data/odds/20260118/part-*.parquet          未統合の追記分 (append() 1回につき1ファイル)
+
+列: race_id (str), number (int), ts (取得時刻 epoch秒), win, place_min, place_max, source, post_time (発走時刻 epoch秒、不明は NaN)
+同じ race_id・ts の行の集まりが1つのスナップショット。パーティションはレース日 (省略時は取得日)。
+圧縮は Parquet の zstd。1日分の読み込みは1回のスキャンで行い、最新・発走X分前の抽出はベクトル演算で行う:
+
+    append("202606050811", horses, source="api", post_time=post_ts)
+    latest("202606050811")                         # 最新のスナップショット
+    before_post("202606050811", minutes=10)        # 発走10分前の時点で得られたオッズ
+    day_before_post("20260118", minutes=5)         # その日の全レースの発走5分前オッズ
+    series("202606050811")                         # 全スナップショット
+
+環境変数 KEIBA_ODDS_DIR で保存先を変更できる。
+"""
+
+import glob
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    from file_lock import FileLock
+except ImportError:
+    from .file_lock import FileLock
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLUMNS = ["race_id", "number", "ts", "win", "place_min", "place_max", "source", "post_time"]
+COMPACTED_NAME = "snapshots.parquet"
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "enabled": True,
+    "root": os.environ.get("KEIBA_ODDS_DIR") or os.path.join(PROJECT_ROOT, "data", "odds"),
+    "compact_every": 64,     # 未統合の追記分がこの件数に達したら統合する
+    "compression": "zstd",
+}
+
+
+def configure(**kwargs):
+    """
+    オッズ履歴ストアの設定を変更する
+
+    Args:
+        enabled: False の場合は record() で保存しない
+        root: 保存先ディレクトリ
+        compact_every: 統合する追記分の件数
+        compression: Parquet の圧縮方式
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown odds_store option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+def _day_key(value):
+    """レース日を YYYYMMDD にする (date / datetime / 'YYYY-MM-DD' / 'YYYY年MM月DD日' / 'YYYYMMDD')"""
+    if value is None:
+        return datetime.now().strftime("%Y%m%d")
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y%m%d")
+    digits = "".join(ch for ch in str(value) if ch.isdigit())
+    if len(digits) != 8:
+        raise ValueError(f"Invalid race day: {value}")
+    return digits
+
+
+def snapshot_frame(race_id, horses, ts=None, source="", post_time=None):
+    """
+    取得結果をスナップショットの行にする
+
+    Args:
+        horses: scrape_odds_for_race() の戻り値 ([{number, odds, place_odds_min, place_odds_max}])
+                または {馬番: 単勝オッズ} (OddsScraper)
+    """
+    if isinstance(horses, dict):
+        horses = [{"number": k, "odds": v} for k, v in horses.items()]
+    rows = []
+    for h in horses or []:
+        try:
+            number = int(h.get("number"))
+        except (TypeError, ValueError):
+            continue
+        rows.append((number, h.get("odds"), h.get("place_odds_min"), h.get("place_odds_max")))
+    df = pd.DataFrame(rows, columns=["number", "win", "place_min", "place_max"])
+    df.insert(0, "race_id", str(race_id))
+    df.insert(2, "ts", float(ts if ts is not None else time.time()))
+    for col in ("win", "place_min", "place_max"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    df["number"] = df["number"].astype("int16")
+    df["source"] = source or ""
+    df["post_time"] = np.float64(post_time) if post_time is not None else np.nan
+    return df[COLUMNS]
+
+
+def _pick_latest(df, cutoff=None):
+    """レースごとに、時刻が cutoff (スカラーまたは行ごとの配列) 以前で最新のスナップショットの行"""
+    if cutoff is not None:
+        df = df[df["ts"].to_numpy() <= np.asarray(cutoff)]
+    if df.empty:
+        return df
+    latest = df.groupby("race_id")["ts"].transform("max")
+    return df[df["ts"] == latest].reset_index(drop=True)
+
+
+class OddsStore:
+    """
+    レース日ごとのオッズ履歴 (追記専用、複数プロセスから追記してよい)
+    """
+
+    def __init__(self, root=None):
+        self.root = root or CONFIG["root"]
+        self._compacting = threading.Lock()
+
+    def _day_dir(self, day):
+        return os.path.join(self.root, _day_key(day))
+
+    def _lock(self, day_dir):
+        return FileLock(os.path.join(day_dir, ".lock"))
+
+    def days(self):
+        """保存済みのレース日 (YYYYMMDD、昇順)"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if d.isdigit() and len(d) == 8)
+
+    # --- write ---
+
+    def append(self, race_id, horses, ts=None, source="", race_date=None, post_time=None):
+        """
+        スナップショットを1件追記する
+
+        Args:
+            race_id: レースID
+            horses: 各馬のオッズ (snapshot_frame() を参照)
+            ts: 取得時刻 (epoch秒、省略時は現在)
+            source: 取得元 ("api" / "html" など)
+            race_date: パーティションにするレース日 (省略時は取得日)
+            post_time: 発走時刻 (epoch秒)。分かれば保存しておくと発走X分前の抽出に使える
+
+        Returns:
+            int: 追記した行数
+        """
+        df = snapshot_frame(race_id, horses, ts, source, post_time)
+        if df.empty:
+            return 0
+        if race_date is None and ts is not None:
+            race_date = datetime.fromtimestamp(ts)
+        day_dir = self._day_dir(race_date)
+        os.makedirs(day_dir, exist_ok=True)
+        path = os.path.join(day_dir, f"part-{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex[:6]}.parquet")
+        tmp = path + ".tmp"
+        df.to_parquet(tmp, index=False, compression=CONFIG["compression"])
+        os.replace(tmp, path)
+        if len(glob.glob(os.path.join(day_dir, "part-*.parquet"))) >= CONFIG["compact_every"]:
+            self.compact(race_date)
+        return len(df)
+
+    def compact(self, day):
+        """その日の追記分を統合済みファイルにまとめる (race_id・馬番・時刻順)"""
+        day_dir = self._day_dir(day)
+        if not os.path.isdir(day_dir):
+            return 0
+        with self._compacting, self._lock(day_dir):
+            parts = sorted(glob.glob(os.path.join(day_dir, "part-*.parquet")))
+            if not parts:
+                return 0
+            df = self._read_paths(self._paths(day_dir))
+            df = df.sort_values(["race_id", "number", "ts"]).reset_index(drop=True)
+            target = os.path.join(day_dir, COMPACTED_NAME)
+            tmp = f"{target}.{uuid.uuid4().hex[:8]}.tmp"
+            df.to_parquet(tmp, index=False, compression=CONFIG["compression"])
+            os.replace(tmp, target)
+            for path in parts:
+                os.remove(path)
+        return len(parts)
+
+    # --- read ---
+
+    @staticmethod
+    def _paths(day_dir):
+        paths = sorted(glob.glob(os.path.join(day_dir, "part-*.parquet")))
+        compacted = os.path.join(day_dir, COMPACTED_NAME)
+        if os.path.exists(compacted):
+            paths.insert(0, compacted)
+        return paths
+
+    @staticmethod
+    def _read_paths(paths, race_ids=None, columns=None):
+        if not paths:
+            return pd.DataFrame(columns=columns or COLUMNS)
+        import pyarrow.parquet as pq
+
+        filters = [("race_id", "in", [str(r) for r in race_ids])] if race_ids else None
+        table = pq.ParquetDataset(paths, filters=filters).read(columns=columns)
+        df = table.to_pandas()
+        # 統合中に同じ追記分を二重に読んだ場合に備える
+        return df.drop_duplicates([c for c in ("race_id", "number", "ts") if c in df.columns])
+
+    def read_day(self, day, race_ids=None, columns=None):
+        """
+        1日分のスナップショットを1回のスキャンで読む
+
+        Args:
+            day: レース日
+            race_ids: 対象のレース (省略時は全レース、Parquet のフィルタで絞り込む)
+            columns: 読む列 (省略時は全列)
+
+        Returns:
+            pd.DataFrame (時刻順)
+        """
+        day_dir = self._day_dir(day)
+        if not os.path.isdir(day_dir):
+            return pd.DataFrame(columns=columns or COLUMNS)
+        with self._lock(day_dir):
+            df = self._read_paths(self._paths(day_dir), race_ids, columns)
+        if "ts" in df.columns:
+            df = df.sort_values("ts", kind="stable")
+        return df.reset_index(drop=True)
+
+    def _find_day(self, race_id):
+        """race_id のスナップショットがある最新のレース日"""
+        for day in reversed(self.days()):
+            if not self.read_day(day, race_ids=[race_id], columns=["race_id"]).empty:
+                return day
+        return None
+
+    def series(self, race_id, day=None):
+        """レースの全スナップショット (時刻順)。day 省略時は保存済みの日を新しい順に探す"""
+        day = day or self._find_day(race_id)
+        if day is None:
+            return pd.DataFrame(columns=COLUMNS)
+        return self.read_day(day, race_ids=[race_id])
+
+    def latest(self, race_id, day=None):
+        """レースの最新のスナップショット"""
+        return _pick_latest(self.series(race_id, day))
+
+    def at(self, race_id, when, day=None):
+        """時刻 when (epoch秒 / datetime) の時点で得られていた最新のスナップショット"""
+        if hasattr(when, "timestamp"):
+            when = when.timestamp()
+        return _pick_latest(self.series(race_id, day), when)
+
+    def before_post(self, race_id, minutes, day=None, post_time=None):
+        """
+        発走 minutes 分前の時点で得られていたスナップショット
+
+        Args:
+            post_time: 発走時刻 (epoch秒)。省略時はスナップショットに保存された発走時刻
+        """
+        df = self.series(race_id, day)
+        if post_time is None:
+            known = df["post_time"].dropna()
+            if known.empty:
+                return df.iloc[0:0]
+            post_time = known.iloc[-1]
+        return _pick_latest(df, post_time - minutes * 60)
+
+    def day_latest(self, day):
+        """その日の全レースの最新のスナップショット"""
+        return _pick_latest(self.read_day(day))
+
+    def day_before_post(self, day, minutes, post_times=None):
+        """
+        その日の全レースについて、発走 minutes 分前の時点で得られていたスナップショット
+
+        Args:
+            post_times: {race_id: 発走時刻 (epoch秒)}。省略時はスナップショットに保存された発走時刻
+        """
+        df = self.read_day(day)
+        if df.empty:
+            return df
+        if post_times is not None:
+            post = df["race_id"].map({str(k): v for k, v in post_times.items()}).astype("float64")
+        else:
+            post = df.groupby("race_id")["post_time"].transform("max")
+        df = df[post.notna().to_numpy()]
+        cutoff = (post[post.notna()] - minutes * 60).to_numpy()
+        return _pick_latest(df, cutoff)
+
+
+_store = None
+
+
+def get_store():
+    """既定のオッズ履歴ストア (CONFIG["root"])"""
+    global _store
+    if _store is None or _store.root != CONFIG["root"]:
+        _store = OddsStore()
+    return _store
+
+
+def record(race_id, horses, source="", race_date=None, post_time=None):
+    """
+    取得したオッズを既定のストアに追記する (スクレイパーから呼ばれる。失敗しても取得処理は止めない)
+
+    時刻は追記時点になるため、HTTP キャッシュから返した本文 (http_client.is_live() が False) は記録しないこと。
+    """
+    if not CONFIG["enabled"] or not horses:
+        return 0
+    try:
+        return get_store().append(race_id, horses, source=source, race_date=race_date, post_time=post_time)
+    except Exception as e:
+        print(f"Odds history write failed: {e}")
+        return 0
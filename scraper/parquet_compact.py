@@ -0,0 +1,299 @@
+"""
+Parquet のストリーミング重複排除・統合 (コンパクション)
+ファイル全体を読み込まずにレコードバッチ単位で重複を除く。メモリはキー数に比例し、行の幅 (列数) にはよらない
+
+1. キーの走査: キー列だけをバッチで読み、(race_id, horse_id) などのキーを uint64 にハッシュして、
+   キーごとの最後の出現位置 (取り込み順の通し行番号) をソート済み配列に保持する (1キー 16 バイト)
+2. 書き出し: 全列をバッチで読み直し、最後の出現位置の行だけを一時ファイルに書いて原子的に置き換える
+
+入力ファイルの順序が取り込み順 (後のファイル・後の行が新しい)。ファイル間で型が異なる列は
+共通の型 (数値どうしは float64、それ以外は文字列) に揃え、ない列は null で埋める。
+
+    deduplicate(["database.parquet", "part-1.parquet"], "database.parquet")   # 後の行を残す
+    ParquetSink("data/raw/database.parquet").compact(streaming=True)           # ベース + 断片
+    compact_dataset("JRA")                                                       # 分割データセットの各パーティション
+
+ハッシュは 64bit のため、異なるキーが衝突する確率は おおよそ キー数² / 2^65 (1000万キーで約 3e-6)。
+コマンドライン: python scripts/compact_parquet.py --mode JRA
+"""
+
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_KEYS = ("race_id", "horse_id")
+KEY_SEPARATOR = "\x1f"
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "batch_rows": 200_000,       # 1回に読む行数
+    "row_group_size": 131_072,   # 出力の行グループの行数
+    "compression": "snappy",
+}
+
+
+def configure(**kwargs):
+    """
+    コンパクションの設定を変更する
+
+    Args:
+        batch_rows: 1回に読む行数
+        row_group_size: 出力の行グループの行数
+        compression: 出力の Parquet の圧縮方式
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown parquet_compact option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+class LastSeen:
+    """
+    キーのハッシュ → 最後の出現位置 (ハッシュ順のソート済み配列)
+    """
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.rows = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.rows.nbytes
+
+    def add(self, hashes, start):
+        """
+        1バッチ分のハッシュを登録する (同じキーは後の位置で上書き)
+
+        Args:
+            hashes: np.ndarray[uint64]
+            start: バッチ先頭の通し行番号
+        """
+        if len(hashes) == 0:
+            return
+        # バッチ内の最後の出現: 逆順にした配列での最初の出現
+        uniq, first_rev = np.unique(hashes[::-1], return_index=True)
+        rows = start + len(hashes) - 1 - first_rev
+        pos = np.searchsorted(self.keys, uniq)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == uniq[found]
+        self.rows[pos[found]] = rows[found]
+        new = ~found
+        if new.any():
+            self.keys = np.insert(self.keys, pos[new], uniq[new])
+            self.rows = np.insert(self.rows, pos[new], rows[new])
+
+    def is_last(self, hashes, start):
+        """バッチの各行がそのキーの最後の出現か"""
+        pos = np.searchsorted(self.keys, hashes)
+        return self.rows[pos] == start + np.arange(len(hashes))
+
+
+def hash_keys(batch, keys):
+    """
+    キー列を連結して uint64 にハッシュする (数値の race_id と文字列の race_id は同じキーになる)
+
+    Args:
+        batch: pyarrow.RecordBatch / Table
+        keys: キー列 (バッチにない列は空文字として扱う)
+
+    Returns:
+        np.ndarray[uint64]
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    parts = []
+    for key in keys:
+        index = batch.schema.get_field_index(key)
+        if index < 0:
+            parts.append(pa.array([""] * batch.num_rows, pa.string()))
+            continue
+        text = pc.cast(batch.column(index), pa.string())
+        text = pc.replace_substring_regex(text, r"\.0$", "")
+        parts.append(pc.fill_null(text, ""))
+    joined = pc.binary_join_element_wise(*parts, KEY_SEPARATOR) if len(parts) > 1 else parts[0]
+    return pd.util.hash_array(joined.to_numpy(zero_copy_only=False), categorize=False)
+
+
+def _common_type(types):
+    import pyarrow as pa
+
+    types = [t for t in types if not pa.types.is_null(t)]
+    if not types:
+        return pa.null()
+    if all(t == types[0] for t in types):
+        return types[0]
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return pa.large_string()
+
+
+def unified_schema(paths):
+    """入力ファイルのスキーマを揃える (列は最初に現れた順、メタデータのみ参照)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {}
+    for path in paths:
+        for field in pq.read_schema(path):
+            if not field.name.startswith("__index_level_"):
+                types.setdefault(field.name, []).append(field.type)
+    return pa.schema([(name, _common_type(found)) for name, found in types.items()])
+
+
+def _conform(batch, schema):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    arrays = []
+    for field in schema:
+        index = batch.schema.get_field_index(field.name)
+        if index < 0:
+            arrays.append(pa.nulls(batch.num_rows, field.type))
+        elif batch.column(index).type != field.type:
+            arrays.append(pc.cast(batch.column(index), field.type))
+        else:
+            arrays.append(batch.column(index))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _batches(paths, columns, batch_rows):
+    import pyarrow.parquet as pq
+
+    for path in paths:
+        parquet = pq.ParquetFile(path)
+        names = parquet.schema_arrow.names
+        read_cols = None if columns is None else [c for c in columns if c in names]
+        if read_cols == []:
+            # キー列がないファイルも行数を合わせるため1列だけ読む (キーは空として扱う)
+            read_cols = names[:1]
+        yield from parquet.iter_batches(batch_size=batch_rows, columns=read_cols)
+
+
+def deduplicate(sources, output, keys=DEFAULT_KEYS, batch_rows=None, row_group_size=None, compression=None,
+                progress_callback=None):
+    """
+    Parquet ファイル群をストリーミングで重複排除して1つのファイルに書く (同じキーは後の行を残す)
+
+    Args:
+        sources: 入力ファイル (取り込み順)。output と同じファイルを含んでよい
+        output: 出力先 (一時ファイルに書いてから置き換える)
+        keys: 重複判定に使う列 (どの入力にもない列は使わない。1列もなければ重複排除せずに統合だけ行う)
+        batch_rows / row_group_size / compression: 省略時は CONFIG
+        progress_callback: function(str) 進捗通知
+
+    Returns:
+        dict: rows_in, rows_out, duplicates, keys (ユニークキー数), key_bytes (キー索引のメモリ), seconds
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sources = [p for p in sources if os.path.exists(p)]
+    batch_rows = batch_rows or CONFIG["batch_rows"]
+    row_group_size = row_group_size or CONFIG["row_group_size"]
+    compression = compression or CONFIG["compression"]
+    started = time.monotonic()
+
+    schema = unified_schema(sources)
+    keys = [k for k in (keys or []) if k in schema.names]
+
+    # 1. キーの走査 (キー列のみ)
+    seen = LastSeen()
+    rows_in = 0
+    if keys:
+        for batch in _batches(sources, keys, batch_rows):
+            seen.add(hash_keys(batch, keys), rows_in)
+            rows_in += batch.num_rows
+        if progress_callback:
+            progress_callback(f"キー走査 {rows_in} 行 | ユニーク {len(seen)} キー ({seen.nbytes / 1e6:.1f} MB)")
+
+    # 2. 最後の出現の行だけを書き出す
+    directory = os.path.dirname(os.path.abspath(output))
+    tmp = os.path.join(directory, f".{os.path.basename(output)}.{uuid.uuid4().hex[:8]}.tmp")
+    rows_out, position = 0, 0
+    pending, pending_rows = [], 0
+    writer = pq.ParquetWriter(tmp, schema, compression=compression, write_statistics=True)
+    try:
+        for batch in _batches(sources, None, batch_rows):
+            if keys:
+                mask = seen.is_last(hash_keys(batch, keys), position)
+                position += batch.num_rows
+                batch = batch.filter(pa.array(mask))
+            if batch.num_rows:
+                pending.append(_conform(batch, schema))
+                pending_rows += batch.num_rows
+            if pending_rows >= row_group_size:
+                writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=row_group_size)
+                rows_out += pending_rows
+                pending, pending_rows = [], 0
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=row_group_size)
+            rows_out += pending_rows
+        writer.close()
+        writer = None
+        os.replace(tmp, output)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    if not keys:
+        rows_in = rows_out
+    stats = {
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "duplicates": rows_in - rows_out,
+        "keys": len(seen),
+        "key_bytes": seen.nbytes,
+        "seconds": time.monotonic() - started,
+    }
+    if progress_callback:
+        progress_callback(f"重複排除 {rows_in} → {rows_out} 行 ({stats['duplicates']} 件削除, {stats['seconds']:.1f}s)")
+    return stats
+
+
+def compact_dataset(mode="JRA", keys=None, progress_callback=None):
+    """
+    分割データセット (race_dataset) の各パーティションをストリーミングで重複排除する
+
+    パーティション内の並び (日付・horse_id 順) はそのまま残る。
+
+    Args:
+        mode: "JRA" / "NAR"
+        keys: 重複判定に使う列 (省略時はデータセット作成時の重複判定列)
+
+    Returns:
+        dict: partitions, rows_in, rows_out, duplicates, seconds
+    """
+    try:
+        import race_dataset
+    except ImportError:
+        from . import race_dataset
+
+    meta = race_dataset.info(mode)
+    if meta is None:
+        raise FileNotFoundError(f"No {mode} dataset. Build it first: python scripts/build_dataset.py --mode {mode}")
+    keys = keys or meta.get("subset") or list(DEFAULT_KEYS)
+    started = time.monotonic()
+    total = {"partitions": 0, "rows_in": 0, "rows_out": 0, "duplicates": 0}
+    with race_dataset._lock(mode):
+        for part in race_dataset.partitions(mode):
+            stats = deduplicate([part["path"]], part["path"], keys=keys,
+                                row_group_size=race_dataset.CONFIG["row_group_size"],
+                                compression=race_dataset.CONFIG["compression"])
+            total["partitions"] += 1
+            for name in ("rows_in", "rows_out", "duplicates"):
+                total[name] += stats[name]
+            if progress_callback and stats["duplicates"]:
+                progress_callback(f"{part['year']}/{part['venue']}: {stats['duplicates']} 件削除")
+        meta["rows"] = total["rows_out"]
+        race_dataset._save_meta(race_dataset.dataset_path(mode), meta)
+    total["seconds"] = time.monotonic() - started
+    return total
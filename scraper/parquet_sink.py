@@ -0,0 +1,357 @@
+"""
+追記型 Parquet シンク
+スクレイピング結果をレース単位の小さな Parquet 断片として追記し、重複排除・統合 (コンパクション) は別途まとめて行う
+
+レイアウト (target = data/raw/database.parquet の場合):
+    data/raw/database.parquet                          統合済みのベース (既存の読み込み側はこれを読む)
+    data/raw/database_parts/_manifest.json             コミット済み断片の一覧
+    data/raw/database_parts/year=2024/part-*.parquet   未統合の断片 (年ごとに分割)
+    data/raw/database_parts/_race_ids.npy ほか          取得済み race_id の索引 (race_index)
+
+- append(): 断片を書いてからマニフェストに登録する (登録がコミット)。コストはレースの行数に比例
+- read(): ベース + マニフェストに登録済みの断片を一貫したスナップショットとして読み、重複排除して返す
+- load_index(): 取得済み race_id の索引 (追記のたびに更新され、全件を読まずに存在確認できる)
+- compact(): ベースと断片を統合して重複排除・日付ソートし、ベースを原子的に置き換える。
+  断片が compact_every 件たまるとバックグラウンドで実行され、close() で最後に実行される。
+  compact(streaming=True) はベースを読み込まずにバッチ単位で重複排除する (parquet_compact)
+
+従来の「全件読み込み → concat → drop_duplicates → 全件書き込み」をレースごとに行う方式 (O(n²)) を置き換える。
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+try:
+    from file_lock import FileLock
+    from race_index import RaceIndex
+except ImportError:
+    from .file_lock import FileLock
+    from .race_index import RaceIndex
+
+
+MANIFEST_NAME = "_manifest.json"
+
+
+def _year_of(df):
+    """断片のパーティション (race_id の先頭4桁、なければ日付列の年)"""
+    if "race_id" in df.columns and len(df) > 0:
+        rid = str(df["race_id"].iloc[0])
+        if rid[:4].isdigit():
+            return rid[:4]
+    if "日付" in df.columns and len(df) > 0:
+        text = str(df["日付"].iloc[0])
+        if text[:4].isdigit():
+            return text[:4]
+    return "unknown"
+
+
+def write_parquet_atomic(df, path):
+    """
+    DataFrame を一時ファイルに書いてから置き換える (書き込み途中のファイルを読ませない)
+
+    数値と文字列が混在する列 (着順の「中止」など) は pyarrow が変換できないため、文字列に揃えて再試行する。
+    """
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        try:
+            df.to_parquet(tmp, index=False, compression="snappy")
+        except Exception:
+            df = df.copy()
+            for col in df.columns:
+                if df[col].dtype == object:
+                    df[col] = df[col].map(lambda v: v if v is None or isinstance(v, str) or pd.isna(v) else str(v))
+            df.to_parquet(tmp, index=False, compression="snappy")
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class ParquetSink:
+    """
+    追記専用の Parquet データセット
+
+    複数プロセスから同じ target に追記してもよい (マニフェストの更新はファイルロックで排他)。
+    """
+
+    def __init__(self, target_path, subset=("race_id", "馬名"), compact_every=200, sort_by_date=True,
+                 dataset_mode=None):
+        """
+        Args:
+            target_path: 統合先の Parquet ファイル (例: data/raw/database.parquet)
+            subset: 重複判定に使う列 (後から追記した行を残す)
+            compact_every: 未統合の断片がこの件数に達したらバックグラウンドで統合する (0 で無効)
+            sort_by_date: 統合時に日付・race_id順に並べる
+            dataset_mode: "JRA" / "NAR" を指定すると、統合時に分割データセット (race_dataset) の
+                          該当パーティションと馬ごとの戦績索引 (horse_history) も更新する (作成済みの場合のみ)
+        """
+        self.target_path = target_path
+        self.dataset_dir = os.path.splitext(target_path)[0] + "_parts"
+        self.manifest_path = os.path.join(self.dataset_dir, MANIFEST_NAME)
+        self.subset = list(subset) if subset else []
+        self.compact_every = compact_every
+        self.sort_by_date = sort_by_date
+        self.dataset_mode = dataset_mode
+        self._manifest_lock = FileLock(os.path.join(self.dataset_dir, ".manifest.lock"))
+        self._compact_lock = FileLock(os.path.join(self.dataset_dir, ".compact.lock"))
+        self._compact_thread = None
+        self.rows_appended = 0
+        self.index = RaceIndex(self.dataset_dir, target_path)
+
+    # --- manifest ---
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"fragments": []}
+
+    def _save_manifest(self, manifest):
+        os.makedirs(self.dataset_dir, exist_ok=True)
+        tmp = f"{self.manifest_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, self.manifest_path)
+
+    # --- write ---
+
+    def append(self, df):
+        """
+        行を追記する (断片ファイル1つ + マニフェスト登録)
+
+        Returns:
+            int: 追記した行数
+        """
+        if df is None or df.empty:
+            return 0
+
+        if "race_id" in df.columns:
+            # 重複判定がベース側と一致するよう文字列に揃える
+            df = df.assign(race_id=df["race_id"].astype(str))
+        year = _year_of(df)
+        rel_path = os.path.join(f"year={year}", f"part-{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex[:6]}.parquet")
+        abs_path = os.path.join(self.dataset_dir, rel_path)
+        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+        write_parquet_atomic(df, abs_path)
+
+        with self._manifest_lock:
+            manifest = self._load_manifest()
+            manifest["fragments"].append({"path": rel_path, "rows": len(df), "year": year})
+            self._save_manifest(manifest)
+            pending = len(manifest["fragments"])
+        self.index.add(df)
+
+        self.rows_appended += len(df)
+        if self.compact_every and pending >= self.compact_every:
+            self.compact_in_background()
+        return len(df)
+
+    # --- read ---
+
+    def _dedup(self, df):
+        subset = [c for c in self.subset if c in df.columns]
+        if subset:
+            df = df.drop_duplicates(subset=subset, keep="last")
+        return df
+
+    def _read_files(self, paths, columns=None):
+        frames = []
+        for path in paths:
+            try:
+                frames.append(pd.read_parquet(path, columns=columns))
+            except FileNotFoundError:
+                continue
+            except Exception:
+                # 列指定で存在しない列がある断片など
+                if columns is None:
+                    raise
+                frame = pd.read_parquet(path)
+                frames.append(frame[[c for c in columns if c in frame.columns]])
+        if not frames:
+            return pd.DataFrame(columns=columns) if columns else pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def read(self, columns=None):
+        """
+        ベースとコミット済み断片を合わせたスナップショットを読む (重複排除済み)
+
+        Args:
+            columns: 読む列 (省略時は全列)。重複判定列は自動的に含める
+
+        Returns:
+            pd.DataFrame
+        """
+        read_cols = None
+        if columns is not None:
+            read_cols = list(dict.fromkeys(list(columns) + self.subset))
+        with self._manifest_lock:
+            manifest = self._load_manifest()
+            paths = []
+            if os.path.exists(self.target_path):
+                paths.append(self.target_path)
+            paths.extend(os.path.join(self.dataset_dir, f["path"]) for f in manifest["fragments"])
+            df = self._read_files(paths, read_cols)
+        df = self._dedup(df).reset_index(drop=True)
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+        return df
+
+    def load_index(self):
+        """
+        取得済み race_id の索引を読む (索引がない・ベースが外部で書き換えられた場合は作り直す)
+
+        Returns:
+            race_index.RaceIdSet
+        """
+        return self.index.load(lambda: [self.read(columns=["race_id", "日付", "会場"])])
+
+    def race_ids(self):
+        """スナップショットに含まれる race_id の集合"""
+        df = self.read(columns=["race_id"])
+        if "race_id" not in df.columns:
+            return set()
+        return set(df["race_id"].astype(str))
+
+    def row_count(self):
+        """ベースと未統合の断片の行数の合計 (重複排除前、ファイルのメタデータのみ参照)"""
+        import pyarrow.parquet as pq
+
+        total = 0
+        if os.path.exists(self.target_path):
+            total += pq.ParquetFile(self.target_path).metadata.num_rows
+        total += sum(f["rows"] for f in self._load_manifest()["fragments"])
+        return total
+
+    def pending_fragments(self):
+        """未統合の断片数"""
+        return len(self._load_manifest()["fragments"])
+
+    # --- compaction ---
+
+    def compact(self, streaming=False, force=False):
+        """
+        断片をベースに統合する (重複排除・日付ソートしてベースを置き換え、統合済みの断片を削除)
+
+        Args:
+            streaming: True ならベースを読み込まずにバッチ単位で重複排除する (parquet_compact)。
+                       メモリはキー数に比例する。日付ソートは行わず取り込み順のまま
+            force: 断片がなくてもベースを統合し直す (ベース自体の重複を除く)
+
+        Returns:
+            int: 統合後のベースの行数 (統合する断片がなければ None)
+        """
+        with self._compact_lock:
+            with self._manifest_lock:
+                fragments = list(self._load_manifest()["fragments"])
+            has_base = os.path.exists(self.target_path)
+            if not fragments and not (force and has_base):
+                return None
+
+            fragment_paths = [os.path.join(self.dataset_dir, f["path"]) for f in fragments]
+            staged = f"{self.target_path}.compact.tmp"
+            if streaming:
+                try:
+                    import parquet_compact
+                except ImportError:
+                    from . import parquet_compact
+                stats = parquet_compact.deduplicate(([self.target_path] if has_base else []) + fragment_paths,
+                                                    staged, keys=self.subset)
+                total = stats["rows_out"]
+                # 派生データの更新に使うのは断片の行だけ (断片は小さいのでそのまま読む)
+                fresh = self._read_files(fragment_paths) if self.dataset_mode else None
+            else:
+                fresh = self._read_files(fragment_paths)
+                total = self._compact_in_memory(fresh, has_base, staged)
+
+            merged = {f["path"] for f in fragments}
+            with self._manifest_lock:
+                # ベースの置き換えと断片の登録解除を同じロック内で行い、読み込み側に中間状態を見せない
+                os.replace(staged, self.target_path)
+                self.index.note_base_rewritten()
+                manifest = self._load_manifest()
+                manifest["fragments"] = [f for f in manifest["fragments"] if f["path"] not in merged]
+                self._save_manifest(manifest)
+
+            for rel in merged:
+                try:
+                    os.remove(os.path.join(self.dataset_dir, rel))
+                except OSError:
+                    pass
+
+            print(f"  -> Compacted {len(fragments)} fragment(s) into {os.path.basename(self.target_path)} (Total {total})")
+            if self.dataset_mode and fresh is not None and len(fresh):
+                self._refresh_derived(fresh)
+            return total
+
+    def _compact_in_memory(self, fresh, has_base, staged):
+        """ベースと断片を読み込んで重複排除・日付ソートし、staged に書く (行数を返す)"""
+        base = self._read_files([self.target_path] if has_base else [])
+        combined = self._dedup(pd.concat([base, fresh], ignore_index=True))
+
+        if self.sort_by_date and "日付" in combined.columns:
+            try:
+                date_obj = pd.to_datetime(combined["日付"], format="%Y年%m月%d日", errors="coerce")
+                sort_cols = ["_date_obj"] + (["race_id"] if "race_id" in combined.columns else [])
+                combined = (combined.assign(_date_obj=date_obj)
+                            .sort_values(sort_cols, kind="stable")
+                            .drop(columns=["_date_obj"]))
+            except Exception:
+                pass
+
+        write_parquet_atomic(combined.reset_index(drop=True), staged)
+        return len(combined)
+
+    def _refresh_derived(self, df):
+        """統合した断片の行で、作成済みの分割データセット・馬ごとの戦績索引を更新する"""
+        try:
+            import race_dataset
+            import horse_history
+        except ImportError:
+            from . import race_dataset
+            from . import horse_history
+        df = self._dedup(df)
+        if race_dataset.exists(self.dataset_mode):
+            try:
+                n = race_dataset.update(self.dataset_mode, df)
+                print(f"  -> Updated {n} partition(s) of the {self.dataset_mode} dataset")
+            except Exception as e:
+                print(f"Dataset update failed (rebuild with scripts/build_dataset.py): {e}")
+        if horse_history.exists(self.dataset_mode):
+            try:
+                n = horse_history.update(self.dataset_mode, df)
+                print(f"  -> Added {n} run(s) to the {self.dataset_mode} horse history")
+            except Exception as e:
+                print(f"Horse history update failed (rebuild with scripts/build_horse_history.py): {e}")
+
+    def compact_in_background(self):
+        """バックグラウンドスレッドで compact() を実行する (実行中なら何もしない)"""
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return
+        self._compact_thread = threading.Thread(target=self._compact_safely, daemon=True)
+        self._compact_thread.start()
+
+    def _compact_safely(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"Compaction failed (fragments are kept): {e}")
+
+    def close(self, compact=True):
+        """
+        バックグラウンド統合の完了を待ち、残りの断片を統合する
+
+        Returns:
+            int: ベースの行数
+        """
+        if self._compact_thread is not None:
+            self._compact_thread.join()
+            self._compact_thread = None
+        if compact:
+            self.compact()
+        return self.row_count()
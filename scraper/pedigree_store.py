@@ -0,0 +1,281 @@
+"""
+血統ストア
+馬ごとの血統 (父・母・母父) を horse_id をキーに SQLite (data/pedigree.db) に保存する
+
+血統は馬ごとに不変なので、一度取得した馬は二度と取得しない。
+レースデータ (database.parquet 等) 側は書き換えず、読み込み側が horse_id で結合する:
+
+    store = get_store()
+    df = store.join(df)                  # father / mother / bms が空の行を埋める
+    missing = store.missing(horse_ids)   # まだ取得していない馬
+
+書き込みはバッファしてまとめてコミットする。複数のスレッド・プロセスから使ってよい (WAL)。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, "data", "pedigree.db")
+
+PEDIGREE_COLUMNS = ("father", "mother", "bms")
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "db_path": DEFAULT_DB_PATH,
+    "commit_every": 100,  # 未コミットの書き込みがこの件数に達したらコミットする
+    "query_chunk": 500,   # IN 句1回あたりの horse_id 数
+}
+
+
+def configure(**kwargs):
+    """
+    血統ストアの設定を変更する
+
+    Args:
+        db_path: 既定のストアのファイル (変更すると get_store() が新しいストアを返す)
+        commit_every: まとめてコミットする件数
+        query_chunk: 一括取得で1回に問い合わせる horse_id 数
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown pedigree_store option(s): {sorted(unknown)}")
+    previous_path = CONFIG["db_path"]
+    CONFIG.update(kwargs)
+    if CONFIG["db_path"] != previous_path:
+        close()
+
+
+def clean_horse_ids(values):
+    """horse_id を文字列に揃える (数値化で付いた '.0' を除く)"""
+    return pd.Series(values, dtype=object).astype(str).str.replace(r"\.0$", "", regex=True)
+
+
+def _has_value(series):
+    return series.notna() & ~series.astype(str).isin(["", "nan", "None", "unknown"])
+
+
+class PedigreeStore:
+    """
+    horse_id → {father, mother, bms} のストア (SQLite)
+
+    接続は最初に使うときに開く (読み込み専用の利用でファイルがなければ作らない)。
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or CONFIG["db_path"]
+        self._conn = None
+        self._lock = threading.RLock()
+        self._dirty = {}
+
+    @property
+    def conn(self):
+        with self._lock:
+            if self._conn is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+                conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS pedigree ("
+                    "horse_id TEXT PRIMARY KEY, father TEXT, mother TEXT, bms TEXT, fetched_at REAL)"
+                )
+                conn.commit()
+                self._conn = conn
+            return self._conn
+
+    def exists(self):
+        """ストアのファイルがあるか"""
+        return self._conn is not None or os.path.exists(self.db_path)
+
+    def __len__(self):
+        if not self.exists():
+            return 0
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pedigree").fetchone()[0] + len(self._dirty)
+
+    # --- read ---
+
+    def get(self, horse_id):
+        """1頭の血統 (なければ None)"""
+        return self.get_many([horse_id]).get(str(horse_id))
+
+    def get_many(self, horse_ids):
+        """
+        複数の馬の血統をまとめて取得する
+
+        Returns:
+            dict: {horse_id: {father, mother, bms}} (ストアにある馬のみ。血統のなかった馬は father が空)
+        """
+        ids = list(dict.fromkeys(str(h) for h in horse_ids if h))
+        result = {}
+        if not ids or not self.exists():
+            return result
+        with self._lock:
+            for hid in ids:
+                if hid in self._dirty:
+                    result[hid] = self._dirty[hid]
+            rest = [h for h in ids if h not in result]
+            chunk = CONFIG["query_chunk"]
+            for i in range(0, len(rest), chunk):
+                part = rest[i:i + chunk]
+                rows = self.conn.execute(
+                    f"SELECT horse_id, father, mother, bms FROM pedigree WHERE horse_id IN ({','.join('?' * len(part))})",
+                    part,
+                )
+                for hid, father, mother, bms in rows:
+                    result[hid] = {"father": father, "mother": mother, "bms": bms}
+        return result
+
+    def missing(self, horse_ids):
+        """ストアにない horse_id (順序を保つ)"""
+        ids = list(dict.fromkeys(str(h) for h in horse_ids if h))
+        known = self.get_many(ids)
+        return [h for h in ids if h not in known]
+
+    def join(self, df, horse_col="horse_id", overwrite=False):
+        """
+        df の father / mother / bms をストアの血統で埋める (df を更新して返す)
+
+        Args:
+            df: horse_id 列を含む DataFrame
+            horse_col: horse_id の列名
+            overwrite: True の場合、値がある行もストアの値で置き換える
+        """
+        if df is None or df.empty or horse_col not in df.columns or not self.exists():
+            return df
+        for col in PEDIGREE_COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+
+        need = pd.Series(True, index=df.index) if overwrite else ~_has_value(df["father"])
+        if not need.any():
+            return df
+        hids = clean_horse_ids(df.loc[need, horse_col]).set_axis(df.index[need])
+        profiles = {h: p for h, p in self.get_many(hids.unique()).items() if p.get("father")}
+        if not profiles:
+            return df
+        for col in PEDIGREE_COLUMNS:
+            values = hids.map({h: p.get(col) for h, p in profiles.items()})
+            values = values[values.notna()]
+            df.loc[values.index, col] = values
+        return df
+
+    # --- write ---
+
+    def put_many(self, profiles):
+        """
+        血統を登録する (commit_every 件たまるとコミット)。father が空のものは登録しない
+
+        Args:
+            profiles: {horse_id: {father, mother, bms}}
+        """
+        items = {str(h): {c: p.get(c) for c in PEDIGREE_COLUMNS} for h, p in profiles.items() if p and p.get("father")}
+        return self._put(items)
+
+    def put_empty(self, horse_ids):
+        """
+        ページに血統が載っていなかった馬を空の血統 (father が空) で登録する。
+        missing() に出なくなるので次回から取得しない。join() では使わない
+
+        Args:
+            horse_ids: 登録する horse_id
+        """
+        return self._put({str(h): dict.fromkeys(PEDIGREE_COLUMNS, "") for h in horse_ids if h})
+
+    def _put(self, items):
+        if not items:
+            return 0
+        with self._lock:
+            self._dirty.update(items)
+            pending = len(self._dirty)
+        if pending >= CONFIG["commit_every"]:
+            self.flush()
+        return len(items)
+
+    def import_frame(self, df, horse_col="horse_id"):
+        """
+        レースデータに既に入っている血統を取り込む (ストアにある馬は上書きしない。空の血統で登録した馬は埋める)
+
+        Returns:
+            int: 新たに登録した馬の数
+        """
+        if df is None or df.empty or horse_col not in df.columns or "father" not in df.columns:
+            return 0
+        known = df[_has_value(df["father"])].copy()
+        known[horse_col] = clean_horse_ids(known[horse_col]).to_numpy()
+        known = known[known[horse_col].str.isdigit()].drop_duplicates(horse_col, keep="last")
+        if known.empty:
+            return 0
+        now = time.time()
+        known = known.reindex(columns=[horse_col, *PEDIGREE_COLUMNS]).astype(object)
+        known = known.where(known.notna(), None)
+        rows = [(*row, now) for row in known.itertuples(index=False, name=None)]
+        with self._lock:
+            before = self.conn.total_changes
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO pedigree (horse_id, father, mother, bms, fetched_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(horse_id) DO UPDATE SET father = excluded.father, mother = excluded.mother, "
+                    "bms = excluded.bms, fetched_at = excluded.fetched_at "
+                    "WHERE pedigree.father IS NULL OR pedigree.father = ''",
+                    rows,
+                )
+            return self.conn.total_changes - before
+
+    def flush(self):
+        """未コミットの書き込みを1トランザクションでコミットする"""
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            rows = [(h, p["father"], p["mother"], p["bms"], now) for h, p in self._dirty.items()]
+            try:
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO pedigree (horse_id, father, mother, bms, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                self._dirty.clear()
+            except sqlite3.Error as e:
+                print(f"DEBUG: Failed to save pedigree store: {e}")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """既定の血統ストア (CONFIG["db_path"])"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PedigreeStore()
+    return _store
+
+
+def close():
+    """既定の血統ストアを閉じる (未コミットの書き込みをコミット)"""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
+
+
+def join_pedigree(df, horse_col="horse_id"):
+    """既定の血統ストアで df の空の血統列を埋める (ストアがなければ何もしない)"""
+    return get_store().join(df, horse_col=horse_col)
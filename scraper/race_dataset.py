@@ -0,0 +1,489 @@
+"""
+年・開催場で分割したレース結果データセット (Parquet、述語プッシュダウンで読む)
+database.parquet / database_nar.parquet (1ファイル) を毎回全件読む代わりに、必要な期間・開催場・馬・列だけを読む
+
+レイアウト (data/raw/dataset):
+    data/raw/dataset/JRA/_dataset.json                         データセットの情報 (元ファイル・重複判定列・行数)
+    data/raw/dataset/JRA/_common_metadata                      全パーティション共通のスキーマ
+    data/raw/dataset/JRA/year=2025/venue=東京/part-0.parquet    1年・1開催場分 (日付・horse_id順、行グループ統計つき)
+
+- 各ファイルには 日付 を解析した race_date (date32) 列を持たせる。期間の条件はパーティション (year) と
+  行グループの最小・最大値で絞り込まれ、該当しないファイル・行グループは読まない
+- 開催場の条件はパーティション (venue) で、horse_id / race_id の条件は読み込み時のフィルタで絞り込む
+- 列は指定した列だけを読む (データセットにない列は無視する)
+- ParquetSink の統合時に、追記された行のパーティションだけを書き換える (dataset_mode を指定したシンク)
+
+    build("JRA")                                              # database.parquet から作る (初回・作り直し)
+    read("JRA", columns=["horse_id", "着順"], start="2024-01-01", venues=["東京", "中山"])
+    read("NAR", horse_ids={"2019100001", "2019100002"})
+
+データセットがない場合、read() は元の Parquet を読んで同じ条件で絞り込む (結果は同じ、速度は従来どおり)。
+コマンドライン: python scripts/build_dataset.py --mode JRA
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import date, datetime
+
+import pandas as pd
+
+try:
+    from file_lock import FileLock
+except ImportError:
+    from .file_lock import FileLock
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# モード → (元の Parquet, 重複判定列)
+SOURCES = {
+    "JRA": (os.path.join(PROJECT_ROOT, "data", "raw", "database.parquet"), ["race_id", "馬名"]),
+    "NAR": (os.path.join(PROJECT_ROOT, "data", "raw", "database_nar.parquet"), ["race_id", "馬 番"]),
+}
+
+DATE_COLUMN = "race_date"
+VENUE_COLUMNS = ["会場", "開催地"]
+PART_NAME = "part-0.parquet"
+META_NAME = "_dataset.json"
+SCHEMA_NAME = "_common_metadata"
+UNKNOWN_VENUE = "unknown"
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "root": os.environ.get("KEIBA_DATASET_DIR") or os.path.join(PROJECT_ROOT, "data", "raw", "dataset"),
+    "row_group_size": 8192,   # 行グループの行数 (小さいほど期間条件で読み飛ばせる範囲が細かくなる)
+    "compression": "zstd",
+    "fragment_readahead": 16,  # 並行して読むファイル数 (パーティションが小さいため既定の 4 より多くする)
+}
+
+
+def configure(**kwargs):
+    """
+    データセットの設定を変更する
+
+    Args:
+        root: 保存先ディレクトリ (モードごとのサブディレクトリを作る)
+        row_group_size: 行グループの行数
+        compression: Parquet の圧縮方式
+        fragment_readahead: 並行して読むファイル数
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown race_dataset option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+def dataset_path(mode="JRA"):
+    """モードのデータセットのディレクトリ"""
+    return os.path.join(CONFIG["root"], mode)
+
+
+def exists(mode="JRA"):
+    """データセットが作成済みか"""
+    return os.path.exists(os.path.join(dataset_path(mode), META_NAME))
+
+
+def info(mode="JRA"):
+    """データセットの情報 (_dataset.json、未作成なら None)"""
+    try:
+        with open(os.path.join(dataset_path(mode), META_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _lock(mode):
+    os.makedirs(CONFIG["root"], exist_ok=True)
+    return FileLock(os.path.join(CONFIG["root"], f".{mode}.lock"))
+
+
+# --- partition keys ---
+
+def parse_race_dates(values):
+    """
+    日付列 ('2025/07/26' / '2025-07-26' / '2025年07月26日') を datetime64 にする (解析できない値は NaT)
+    """
+    text = pd.Series(values, copy=False).astype("str")
+    dates = pd.Series(pd.NaT, index=text.index, dtype="datetime64[ns]")
+    for fmt, marker in (("%Y年%m月%d日", "年"), ("%Y/%m/%d", "/"), ("%Y-%m-%d", "-")):
+        todo = dates.isna() & text.str.contains(marker, regex=False)
+        if todo.any():
+            dates[todo] = pd.to_datetime(text[todo], format=fmt, errors="coerce")
+    return dates
+
+
+def _venue_key(value):
+    """開催場をパーティション名に使える文字列にする"""
+    if value is None or pd.isna(value) or not str(value).strip():
+        return UNKNOWN_VENUE
+    text = str(value).strip()
+    for ch in ("/", "\\", "=", "%"):
+        text = text.replace(ch, "_")
+    return text
+
+
+def _id_text(series):
+    return series.astype("str").str.replace(r"\.0$", "", regex=True)
+
+
+def _prepare(df):
+    """
+    race_date 列とパーティションキーを付け、日付・horse_id 順に並べる
+
+    Returns:
+        (pd.DataFrame, np.ndarray 年, np.ndarray 開催場)
+    """
+    df = df.copy()
+    for col in ("race_id", "horse_id"):
+        if col in df.columns:
+            df[col] = _id_text(df[col])
+    if "日付" in df.columns:
+        df[DATE_COLUMN] = parse_race_dates(df["日付"])
+    else:
+        df[DATE_COLUMN] = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+
+    years = df[DATE_COLUMN].dt.year
+    if "race_id" in df.columns:
+        # 日付が解析できない行は race_id の先頭4桁を使う
+        rid_year = pd.to_numeric(df["race_id"].str[:4], errors="coerce")
+        years = years.fillna(rid_year)
+    years = years.fillna(0).astype("int16")
+
+    venue_col = next((c for c in VENUE_COLUMNS if c in df.columns), None)
+    venues = df[venue_col].map(_venue_key) if venue_col else pd.Series(UNKNOWN_VENUE, index=df.index)
+
+    sort_cols = [DATE_COLUMN] + (["horse_id"] if "horse_id" in df.columns else [])
+    order = df.sort_values(sort_cols, kind="stable").index
+    df = df.loc[order].reset_index(drop=True)
+    return df, years.loc[order].to_numpy(), venues.loc[order].to_numpy()
+
+
+def _normalize(df):
+    """数値と文字列が混在する列 (着順の「中止」など) を文字列に揃える"""
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(lambda v: v if v is None or isinstance(v, str) or pd.isna(v) else str(v))
+    return df
+
+
+def _schema_of(df):
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False).remove_metadata()
+    index = schema.get_field_index(DATE_COLUMN)
+    return schema.set(index, pa.field(DATE_COLUMN, pa.date32()))
+
+
+def _to_table(df, schema):
+    import pyarrow as pa
+
+    missing = [f.name for f in schema if f.name not in df.columns]
+    if missing:
+        df = df.assign(**{name: None for name in missing})
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False).replace_schema_metadata(None)
+
+
+def _partition_file(root, year, venue):
+    return os.path.join(root, f"year={year}", f"venue={venue}", PART_NAME)
+
+
+def _write_partition(path, table):
+    """パーティションのファイルを原子的に書き換える (一時ファイルは読み込み側が無視する '.' 始まり)"""
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        pq.write_table(table, tmp, row_group_size=CONFIG["row_group_size"],
+                       compression=CONFIG["compression"], write_statistics=True)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _save_meta(root, meta):
+    tmp = os.path.join(root, f".{META_NAME}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(root, META_NAME))
+
+
+def schema(mode="JRA"):
+    """データセットの列のスキーマ (パーティション列を除く)"""
+    import pyarrow.parquet as pq
+
+    return pq.read_schema(os.path.join(dataset_path(mode), SCHEMA_NAME))
+
+
+# --- write ---
+
+def build(mode="JRA", source=None, progress_callback=None):
+    """
+    元の Parquet (ベース + 未統合の断片) からデータセットを作り直す
+
+    別ディレクトリに書いてから置き換えるため、作成中も読み込み側は前の版を読める。
+
+    Args:
+        mode: "JRA" / "NAR"
+        source: 元の Parquet (省略時はモードの既定)
+        progress_callback: function(str) 進捗通知
+
+    Returns:
+        dict: rows, partitions, seconds
+    """
+    import pyarrow.parquet as pq
+
+    try:
+        from parquet_sink import ParquetSink
+    except ImportError:
+        from .parquet_sink import ParquetSink
+
+    default_source, subset = SOURCES[mode]
+    source = source or default_source
+    started = time.monotonic()
+    df = ParquetSink(source, subset=subset, compact_every=0).read()
+    if df.empty:
+        raise ValueError(f"No rows to build the {mode} dataset from: {source}")
+
+    df, years, venues = _prepare(df)
+    df = _normalize(df)
+    table_schema = _schema_of(df)
+    table = _to_table(df, table_schema)
+
+    root = dataset_path(mode)
+    staging = f"{root}.build-{uuid.uuid4().hex[:8]}"
+    keys = pd.DataFrame({"year": years, "venue": venues})
+    groups = keys.groupby(["year", "venue"], sort=True).indices
+    for n, ((year, venue), idx) in enumerate(groups.items(), 1):
+        _write_partition(_partition_file(staging, year, venue), table.take(idx))
+        if progress_callback and n % 20 == 0:
+            progress_callback(f"データセット作成 {n}/{len(groups)} パーティション")
+    pq.write_metadata(table_schema, os.path.join(staging, SCHEMA_NAME))
+    _save_meta(staging, {
+        "mode": mode,
+        "source": os.path.abspath(source),
+        "subset": subset,
+        "rows": len(df),
+        "partitions": len(groups),
+        "built_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    })
+
+    with _lock(mode):
+        previous = f"{root}.old-{uuid.uuid4().hex[:8]}"
+        if os.path.exists(root):
+            os.replace(root, previous)
+        os.replace(staging, root)
+    shutil.rmtree(previous, ignore_errors=True)
+
+    elapsed = time.monotonic() - started
+    print(f"Built {mode} dataset: {len(df)} rows in {len(groups)} partitions ({elapsed:.1f}s) -> {root}")
+    return {"rows": len(df), "partitions": len(groups), "seconds": elapsed}
+
+
+def update(mode, df):
+    """
+    行を追加・更新する (該当する年・開催場のパーティションだけを書き換える)
+
+    重複判定列 (_dataset.json の subset) が同じ行は後から渡した行を残す。データセットが未作成なら何もしない。
+
+    Args:
+        mode: "JRA" / "NAR"
+        df: 追加する行 (元の Parquet と同じ列)
+
+    Returns:
+        int: 書き換えたパーティション数
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    meta = info(mode)
+    if meta is None or df is None or df.empty:
+        return 0
+    root = dataset_path(mode)
+    df, years, venues = _prepare(df)
+    df = _normalize(df)
+    sort_cols = [DATE_COLUMN] + (["horse_id"] if "horse_id" in df.columns else [])
+
+    with _lock(mode):
+        table_schema = schema(mode)
+        added = [c for c in df.columns if c not in table_schema.names]
+        if added:
+            table_schema = pa.unify_schemas([table_schema, _schema_of(df[added + [DATE_COLUMN]])])
+
+        keys = pd.DataFrame({"year": years, "venue": venues})
+        groups = keys.groupby(["year", "venue"], sort=True).indices
+        for (year, venue), idx in groups.items():
+            path = _partition_file(root, year, venue)
+            part = df.iloc[idx]
+            if os.path.exists(path):
+                current = pq.read_table(path).to_pandas(date_as_object=False)
+                part = pd.concat([current, part], ignore_index=True)
+                subset = [c for c in meta.get("subset", []) if c in part.columns]
+                if subset:
+                    part = part.drop_duplicates(subset=subset, keep="last")
+                part = _normalize(part.sort_values(sort_cols, kind="stable"))
+            _write_partition(path, _to_table(part, table_schema))
+
+        if added:
+            pq.write_metadata(table_schema, os.path.join(root, SCHEMA_NAME))
+        current = partitions(mode)
+        meta["partitions"] = len(current)
+        meta["rows"] = sum(p["rows"] for p in current)
+        meta["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        _save_meta(root, meta)
+    return len(groups)
+
+
+# --- read ---
+
+def partitions(mode="JRA"):
+    """
+    パーティションの一覧 (ファイルのメタデータのみ参照)
+
+    Returns:
+        list[dict]: year, venue, rows, row_groups, path
+    """
+    import pyarrow.parquet as pq
+
+    root = dataset_path(mode)
+    result = []
+    if not os.path.isdir(root):
+        return result
+    for year_dir in sorted(os.listdir(root)):
+        if not year_dir.startswith("year="):
+            continue
+        for venue_dir in sorted(os.listdir(os.path.join(root, year_dir))):
+            path = os.path.join(root, year_dir, venue_dir, PART_NAME)
+            if not venue_dir.startswith("venue=") or not os.path.exists(path):
+                continue
+            metadata = pq.ParquetFile(path).metadata
+            result.append({
+                "year": int(year_dir.split("=", 1)[1]),
+                "venue": venue_dir.split("=", 1)[1],
+                "rows": metadata.num_rows,
+                "row_groups": metadata.num_row_groups,
+                "path": path,
+            })
+    return result
+
+
+def _as_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+def _filter_expression(start, end, venues, horse_ids, race_ids):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    terms = []
+    if start is not None:
+        terms += [ds.field("year") >= start.year, ds.field(DATE_COLUMN) >= pa.scalar(start, pa.date32())]
+    if end is not None:
+        terms += [ds.field("year") <= end.year, ds.field(DATE_COLUMN) <= pa.scalar(end, pa.date32())]
+    if venues is not None:
+        terms.append(ds.field("venue").isin([_venue_key(v) for v in venues]))
+    if horse_ids is not None:
+        terms.append(ds.field("horse_id").isin([str(h) for h in horse_ids]))
+    if race_ids is not None:
+        terms.append(ds.field("race_id").isin([str(r) for r in race_ids]))
+    expression = None
+    for term in terms:
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def _open(mode):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    keys = pa.schema([("year", pa.int16()), ("venue", pa.string())])
+    full_schema = pa.unify_schemas([schema(mode), keys])
+    return ds.dataset(dataset_path(mode), format="parquet", schema=full_schema,
+                      partitioning=ds.partitioning(keys, flavor="hive"))
+
+
+def read(mode="JRA", columns=None, start=None, end=None, venues=None, horse_ids=None, race_ids=None, sort=False):
+    """
+    条件に合う行・列だけを読む
+
+    Args:
+        mode: "JRA" / "NAR"
+        columns: 読む列 (省略時は全列、データセットにない列は無視する)。race_date (date) も指定できる
+        start, end: 期間 (両端を含む。str / date / datetime)
+        venues: 開催場 (会場) のリスト
+        horse_ids: horse_id の集合
+        race_ids: race_id の集合
+        sort: True の場合はパーティションをまたいで日付・horse_id 順に並べる
+              (False は年・開催場ごとに日付・horse_id 順。データセットがない場合は常に並べる)
+
+    Returns:
+        pd.DataFrame
+    """
+    start, end = _as_date(start), _as_date(end)
+    if not exists(mode):
+        return _read_source(mode, columns, start, end, venues, horse_ids, race_ids)
+
+    dataset = _open(mode)
+    names = [n for n in schema(mode).names if n != DATE_COLUMN]
+    wanted = names if columns is None else [c for c in dict.fromkeys(columns) if c in names or c == DATE_COLUMN]
+    sort_cols = [DATE_COLUMN] + (["horse_id"] if "horse_id" in names else []) if sort else []
+    read_cols = list(dict.fromkeys(wanted + sort_cols))
+
+    table = dataset.to_table(columns=read_cols, fragment_readahead=CONFIG["fragment_readahead"],
+                             filter=_filter_expression(start, end, venues, horse_ids, race_ids))
+    df = table.to_pandas(date_as_object=False)
+    if sort_cols and len(df):
+        df = df.sort_values(sort_cols, kind="stable")
+    return df[wanted].reset_index(drop=True)
+
+
+def _read_source(mode, columns, start, end, venues, horse_ids, race_ids):
+    """データセットがない場合: 元の Parquet を読んで同じ条件で絞り込む (日付・horse_id 順)"""
+    import pyarrow.parquet as pq
+
+    try:
+        from parquet_sink import ParquetSink
+    except ImportError:
+        from .parquet_sink import ParquetSink
+
+    source, subset = SOURCES[mode]
+    if not os.path.exists(source):
+        return pd.DataFrame(columns=[c for c in columns or [] if c != DATE_COLUMN])
+    available = pq.read_schema(source).names
+    read_cols = None
+    if columns is not None:
+        needed = list(columns) + ["日付", "horse_id", "race_id"] + VENUE_COLUMNS
+        read_cols = [c for c in dict.fromkeys(needed) if c in available]
+    df = ParquetSink(source, subset=subset, compact_every=0).read(columns=read_cols)
+
+    df, _, venue_keys = _prepare(df)
+
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df[DATE_COLUMN] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df[DATE_COLUMN] <= pd.Timestamp(end)
+    if venues is not None:
+        mask &= pd.Series(venue_keys, index=df.index).isin([_venue_key(v) for v in venues])
+    if horse_ids is not None and "horse_id" in df.columns:
+        mask &= df["horse_id"].isin({str(h) for h in horse_ids})
+    if race_ids is not None and "race_id" in df.columns:
+        mask &= df["race_id"].isin({str(r) for r in race_ids})
+    df = df[mask.to_numpy()]
+
+    if columns is None:
+        wanted = [c for c in df.columns if c != DATE_COLUMN]
+    else:
+        wanted = [c for c in dict.fromkeys(columns) if c in df.columns]
+    return df[wanted].reset_index(drop=True)
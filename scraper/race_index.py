@@ -0,0 +1,292 @@
+"""
+取得済み race_id の索引
+「どのレースを既に持っているか」をデータベース全体を読まずに答えるための小さな永続索引
+
+レイアウト (ParquetSink の断片ディレクトリ内、target = data/raw/database.parquet の場合):
+    data/raw/database_parts/_race_ids.npy      取得済み race_id (数値化してソートした int64 配列)
+    data/raw/database_parts/_coverage.json     日付 × 会場 ごとのレース数と、索引作成時のベースファイルの状態
+
+- ParquetSink.append() が追記のたびに add() で更新する (複数プロセスからの更新はファイルロックで排他)
+- ベースファイルがシンク以外から書き換えられた場合 (サイズ・更新時刻が記録と異なる) は初回の load() で作り直す
+- 存在確認は np.searchsorted による一括判定 (RaceIdSet.contains())
+
+    ids = load_race_ids("data/raw/database_nar.parquet")
+    targets = [rid for rid, hit in zip(race_ids, present_mask(race_ids, ids)) if not hit]
+"""
+
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    from file_lock import FileLock
+except ImportError:
+    from .file_lock import FileLock
+
+
+IDS_NAME = "_race_ids.npy"
+COVERAGE_NAME = "_coverage.json"
+DATE_FORMAT = "%Y年%m月%d日"
+
+
+def to_numeric_ids(race_ids):
+    """
+    race_id (文字列・数値) を int64 配列にする (数字以外を含むものは除外)
+
+    Returns:
+        np.ndarray[int64]
+    """
+    s = pd.Series(list(race_ids), dtype=object).astype(str).str.strip()
+    s = s[s.str.fullmatch(r"\d{1,18}")]
+    return s.astype(np.int64).to_numpy()
+
+
+class RaceIdSet:
+    """
+    取得済み race_id の集合 (ソート済み int64 配列)
+
+    set と同じように `rid in ids` / len() / 反復 (文字列) が使え、pickle してワーカープロセスに渡せる。
+    dates には取得済みのレース日 (datetime64[D]) が入る (索引から読み込んだ場合のみ)。
+    """
+
+    def __init__(self, ids=None, dates=None):
+        arr = np.asarray(ids if ids is not None else [], dtype=np.int64)
+        self.ids = np.unique(arr)
+        self.dates = dates
+
+    @classmethod
+    def from_strings(cls, race_ids, dates=None):
+        return cls(to_numeric_ids(race_ids), dates)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return len(self.ids) > 0
+
+    def __iter__(self):
+        return (str(i) for i in self.ids)
+
+    def __contains__(self, race_id):
+        try:
+            value = int(race_id)
+        except (TypeError, ValueError):
+            return False
+        pos = np.searchsorted(self.ids, value)
+        return bool(pos < len(self.ids) and self.ids[pos] == value)
+
+    def contains(self, race_ids):
+        """
+        複数の race_id を一括で判定する (整数配列を渡すと変換なしで判定する)
+
+        Returns:
+            np.ndarray[bool]: race_ids と同じ順序
+        """
+        values, valid = _as_int64(race_ids)
+        result = np.zeros(len(values), dtype=bool)
+        if len(self.ids) and valid.any():
+            pos = np.minimum(np.searchsorted(self.ids, values), len(self.ids) - 1)
+            result = valid & (self.ids[pos] == values)
+        return result
+
+
+def _as_int64(race_ids):
+    """race_id を int64 配列と有効フラグにする (数値にできないものは無効)"""
+    if isinstance(race_ids, np.ndarray) and race_ids.dtype.kind in "iu":
+        return race_ids.astype(np.int64, copy=False), np.ones(len(race_ids), dtype=bool)
+    race_ids = list(race_ids)
+    try:
+        values = np.fromiter((int(r) for r in race_ids), dtype=np.int64, count=len(race_ids))
+        return values, np.ones(len(race_ids), dtype=bool)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    values = np.zeros(len(race_ids), dtype=np.int64)
+    valid = np.zeros(len(race_ids), dtype=bool)
+    for i, r in enumerate(race_ids):
+        try:
+            values[i] = int(r)
+            valid[i] = True
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return values, valid
+
+
+def present_mask(race_ids, existing):
+    """
+    race_ids のうち existing に含まれるものを判定する (RaceIdSet なら一括判定、set 等は1件ずつ)
+
+    Returns:
+        list[bool]
+    """
+    race_ids = list(race_ids)
+    if not existing or not race_ids:
+        return [False] * len(race_ids)
+    if isinstance(existing, RaceIdSet):
+        return existing.contains(race_ids).tolist()
+    return [rid in existing for rid in race_ids]
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+class RaceIndex:
+    """
+    Parquet データセット (ParquetSink) に対応する永続 race_id 索引
+    """
+
+    def __init__(self, dataset_dir, base_path):
+        """
+        Args:
+            dataset_dir: 索引ファイルを置くディレクトリ (ParquetSink.dataset_dir)
+            base_path: 統合済みのベース Parquet (シンク以外による書き換えの検出に使う)
+        """
+        self.dataset_dir = dataset_dir
+        self.base_path = base_path
+        self.ids_path = os.path.join(dataset_dir, IDS_NAME)
+        self.coverage_path = os.path.join(dataset_dir, COVERAGE_NAME)
+        self._lock = FileLock(os.path.join(dataset_dir, ".index.lock"))
+
+    # --- storage ---
+
+    def _read(self):
+        try:
+            ids = np.load(self.ids_path)
+            with open(self.coverage_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        return ids, meta
+
+    def _write(self, ids, meta):
+        os.makedirs(self.dataset_dir, exist_ok=True)
+        suffix = uuid.uuid4().hex[:8]
+        tmp_ids = f"{self.ids_path}.{suffix}.tmp.npy"
+        tmp_meta = f"{self.coverage_path}.{suffix}.tmp"
+        np.save(tmp_ids, np.asarray(ids, dtype=np.int64))
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_ids, self.ids_path)
+        os.replace(tmp_meta, self.coverage_path)
+
+    @staticmethod
+    def _merge(ids, coverage, df):
+        """df の行のうち未登録のレースを ids / coverage に加える"""
+        if df is None or df.empty or "race_id" not in df.columns:
+            return ids, coverage
+        cols = ["race_id"] + [c for c in ("日付", "会場") if c in df.columns]
+        races = df[cols].drop_duplicates("race_id")
+        numeric = to_numeric_ids(races["race_id"])
+        races = races[races["race_id"].astype(str).str.strip().str.fullmatch(r"\d{1,18}")]
+        if len(ids):
+            pos = np.minimum(np.searchsorted(ids, numeric), len(ids) - 1)
+            new = ids[pos] != numeric
+        else:
+            new = np.ones(len(numeric), dtype=bool)
+        if not new.any():
+            return ids, coverage
+
+        new_races = races[new]
+        if "日付" in new_races.columns:
+            dates = pd.to_datetime(new_races["日付"], format=DATE_FORMAT, errors="coerce").dt.strftime("%Y-%m-%d")
+            venues = new_races["会場"].astype(str) if "会場" in new_races.columns else pd.Series("", index=new_races.index)
+            counts = pd.DataFrame({"date": dates, "venue": venues}).dropna().groupby(["date", "venue"]).size()
+            for (d, venue), n in counts.items():
+                day = coverage.setdefault(d, {})
+                day[venue] = day.get(venue, 0) + int(n)
+        return np.union1d(ids, numeric[new]), coverage
+
+    # --- public ---
+
+    def rebuild(self, frames):
+        """
+        索引を作り直す
+
+        Args:
+            frames: race_id / 日付 / 会場 列を含む DataFrame の反復
+        """
+        with self._lock:
+            ids, coverage = np.empty(0, dtype=np.int64), {}
+            for df in frames:
+                ids, coverage = self._merge(ids, coverage, df)
+            self._write(ids, {"base": _file_signature(self.base_path), "coverage": coverage})
+        print(f"  -> Built race_id index ({len(ids)} races)")
+        return ids, coverage
+
+    def add(self, df):
+        """追記された行を索引に反映する"""
+        with self._lock:
+            ids, meta = self._read()
+            if ids is None:
+                return  # 索引がまだない (次回の load() でまとめて作る)
+            new_ids, coverage = self._merge(ids, meta["coverage"], df)
+            if len(new_ids) != len(ids):
+                meta["coverage"] = coverage
+                self._write(new_ids, meta)
+
+    def note_base_rewritten(self):
+        """シンクがベースを置き換えた (内容は索引済み) ことを記録する"""
+        with self._lock:
+            ids, meta = self._read()
+            if ids is not None:
+                meta["base"] = _file_signature(self.base_path)
+                self._write(ids, meta)
+
+    def is_current(self):
+        """索引があり、ベースファイルが索引作成後にシンク以外から書き換えられていないか"""
+        ids, meta = self._read()
+        return ids is not None and meta.get("base") == _file_signature(self.base_path)
+
+    def load(self, rebuild_frames=None):
+        """
+        索引を読む (古い・存在しない場合は rebuild_frames() の結果から作り直す)
+
+        Args:
+            rebuild_frames: 作り直しに使う DataFrame の反復を返す関数
+
+        Returns:
+            RaceIdSet (dates に取得済みのレース日)
+        """
+        ids, meta = self._read()
+        if (ids is None or meta.get("base") != _file_signature(self.base_path)) and rebuild_frames is not None:
+            ids, coverage = self.rebuild(rebuild_frames())
+        else:
+            coverage = meta["coverage"] if meta else {}
+        if ids is None:
+            return RaceIdSet()
+        dates = np.array(sorted(coverage), dtype="datetime64[D]")
+        return RaceIdSet(ids, dates)
+
+    def coverage(self):
+        """
+        日付 × 会場 ごとの取得済みレース数
+
+        Returns:
+            pd.DataFrame: columns = [date, venue, races]
+        """
+        _, meta = self._read()
+        rows = [(d, venue, n) for d, venues in (meta or {}).get("coverage", {}).items() for venue, n in venues.items()]
+        df = pd.DataFrame(rows, columns=["date", "venue", "races"])
+        df["date"] = pd.to_datetime(df["date"])
+        return df.sort_values(["date", "venue"]).reset_index(drop=True)
+
+
+def load_race_ids(parquet_path):
+    """
+    Parquet データセットの取得済み race_id を索引から読む (必要なら索引を作る)
+
+    Returns:
+        RaceIdSet
+    """
+    try:
+        from parquet_sink import ParquetSink
+    except ImportError:
+        from .parquet_sink import ParquetSink
+    return ParquetSink(parquet_path).load_index()
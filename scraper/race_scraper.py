@@ -1,24 +1,116 @@
-import requests
-from bs4 import BeautifulSoup
 import pandas as pd
-import io
+import numpy as np
 import re
-import time
 from datetime import datetime
+from pandas.io.parsers import TextParser
+
+try:
+    import http_client
+    from html_parse import make_soup, PAGE_FILTERS
+except ImportError:
+    from . import http_client
+    from .html_parse import make_soup, PAGE_FILTERS
+
+_CELL_WHITESPACE = re.compile(r"[\r\n]+|\s{2,}")
+
+
+def _cell_text(cell):
+    # Same whitespace normalization as pd.read_html
+    return _CELL_WHITESPACE.sub(" ", cell.get_text()).strip()
+
+
+def _expand_cells(cells):
+    texts = []
+    for cell in cells:
+        try:
+            span = int(cell.get('colspan', 1))
+        except ValueError:
+            span = 1
+        texts.append(_cell_text(cell))
+        texts.extend([""] * (span - 1))
+    return texts
+
+
+def extract_horse_results(table):
+    """
+    Walks the rows of a horse result table once and returns typed columns.
+
+    Header names are normalized (whitespace removed). Cell values are typed by
+    the same parser pd.read_html uses (TextParser, thousands=','): columns whose
+    values are all numeric become numbers, the rest stay strings (NaN when blank).
+    Rows whose cell count does not match the header (notes, separators) are skipped.
+
+    Returns:
+        dict: {column name: numpy array}
+    """
+    header = None
+    rows = []
+    for tr in table.find_all('tr'):
+        ths = tr.find_all('th', recursive=False)
+        if header is None and ths:
+            header = [re.sub(r'\s+', '', h) for h in _expand_cells(ths)]
+            continue
+        tds = tr.find_all('td', recursive=False)
+        if not tds:
+            continue
+        rows.append(_expand_cells(tds))
+
+    if header is None:
+        return {}
+
+    width = len(header)
+    rows = [r for r in rows if len(r) == width]
+
+    # keep the first of duplicated headers
+    keep = [i for i, name in enumerate(header) if name not in header[:i]]
+    names = [header[i] for i in keep]
+    body = [[r[i] for i in keep] for r in rows]
+    frame = TextParser([names] + body, header=0, thousands=',').read()
+    return {name: frame[name].to_numpy() for name in names}
+
+
+def run_style_from_passing(passing):
+    """
+    Vectorized RaceScraper.extract_run_style over a Series of passing strings.
+    Uses the first corner position; unknown/blank -> 3.
+    """
+    passing = pd.Series(passing)
+    first = pd.to_numeric(
+        passing.where(passing.map(lambda v: isinstance(v, str)))
+        .str.replace(r'[^0-9-]', '', regex=True)
+        .str.extract(r'(\d+)', expand=False),
+        errors='coerce'
+    )
+    style = np.select(
+        [first == 1, first <= 4, first <= 9, first > 9],
+        [1, 2, 3, 4],
+        default=3
+    )
+    return pd.Series(style, index=passing.index, dtype='int64')
+
 
 class RaceScraper:
-    def __init__(self):
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
+    def _get_html(self, url):
+        # Politeness (per-host request budget) is enforced inside http_client
+        try:
+            response = http_client.get(url)
+            if response.status_code == 200:
+                return response.text
+        except Exception as e:
+            print(f"Error fetching {url}: {e}")
+        return None
 
     def _get_soup(self, url):
+        html = self._get_html(url)
+        if html is None:
+            return None
+        return make_soup(html)
+
+    async def _get_html_async(self, url, fetcher):
         try:
-            time.sleep(1) # Be polite
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.encoding = response.apparent_encoding
+            response = await fetcher.fetch(url)
             if response.status_code == 200:
-                return BeautifulSoup(response.text, 'html.parser')
+                return response.text
         except Exception as e:
             print(f"Error fetching {url}: {e}")
         return None
@@ -29,10 +121,27 @@ class RaceScraper:
         If target_date is provided, filters for races STRICTLY BEFORE that date.
         Returns a DataFrame of past races.
         """
-        url = f"https://db.netkeiba.com/horse/result/{horse_id}/"
-        soup = self._get_soup(url)
-        if not soup:
+        html = self._get_html(f"https://db.netkeiba.com/horse/result/{horse_id}/")
+        if html is None:
+            return pd.DataFrame()
+        return self.parse_past_races(html, target_date=target_date, n_samples=n_samples, horse_id=horse_id)
+
+    async def get_past_races_async(self, horse_id, fetcher, target_date=None, n_samples=5):
+        """
+        Async counterpart of get_past_races.
+        Downloads through the AsyncFetcher and parses in its worker pool.
+        """
+        html = await self._get_html_async(f"https://db.netkeiba.com/horse/result/{horse_id}/", fetcher)
+        if html is None:
             return pd.DataFrame()
+        return await fetcher.parse(self.parse_past_races, html, target_date, n_samples, horse_id)
+
+    def parse_past_races(self, html, target_date=None, n_samples=5, horse_id=""):
+        """
+        Parses a horse result page (db.netkeiba.com/horse/result/) into a DataFrame.
+        See get_past_races for the filtering semantics.
+        """
+        soup = make_soup(html, PAGE_FILTERS["horse_result"])
 
         # The results are usually in a table with class "db_h_race_results"
         table = soup.select_one("table.db_h_race_results")
@@ -49,13 +158,10 @@ class RaceScraper:
 
         # Parse table
         try:
-            df = pd.read_html(io.StringIO(str(table)))[0]
+            df = pd.DataFrame(extract_horse_results(table))
             
             # Basic cleaning
             df = df.dropna(how='all')
-            
-            # Normalize column names (remove spaces/newlines)
-            df.columns = df.columns.astype(str).str.replace(r'\s+', '', regex=True)
 
             # Filter rows that look like actual races (Date column exists)
             if '日付' in df.columns:
@@ -81,7 +187,7 @@ class RaceScraper:
             
             # Process Run Style (Leg Type)
             if '通過' in df.columns:
-                df['run_style_val'] = df['通過'].apply(self.extract_run_style)
+                df['run_style_val'] = run_style_from_passing(df['通過'])
             else:
                 df['run_style_val'] = 3 # Unknown
 
@@ -117,25 +223,13 @@ class RaceScraper:
             
             # Extract Surface and Distance from 'raw_distance'
             if 'raw_distance' in df.columns:
-                def parse_dist(x):
-                    if not isinstance(x, str): return None, None
-                    # "芝1600", "ダ1200", "障3000"
-                    # Sometimes "芝1600" or just "1600"
-                    surf = None
-                    dist = None
-                    if '芝' in x: surf = '芝'
-                    elif 'ダ' in x: surf = 'ダ'
-                    elif '障' in x: surf = '障'
-                    
-                    # Extract number
-                    match = re.search(r'(\d+)', x)
-                    if match:
-                        dist = int(match.group(1))
-                    return surf, dist
-
-                parsed = df['raw_distance'].apply(parse_dist)
-                df['course_type'] = parsed.apply(lambda x: x[0])
-                df['distance'] = parsed.apply(lambda x: x[1])
+                # "芝1600", "ダ1200", "障3000" (sometimes just "1600")
+                raw = df['raw_distance'].astype(object).where(df['raw_distance'].map(lambda v: isinstance(v, str)))
+                surface = pd.Series(None, index=df.index, dtype=object)
+                for mark in ('障', 'ダ', '芝'):  # later marks take precedence
+                    surface = surface.mask(raw.str.contains(mark, na=False), mark)
+                df['course_type'] = surface
+                df['distance'] = pd.to_numeric(raw.str.extract(r'(\d+)', expand=False), errors='coerce')
             else:
                 df['course_type'] = None
                 df['distance'] = None
@@ -309,9 +403,29 @@ class RaceScraper:
         """
         # Use pedigree page for reliable bloodline data
         url = f"https://db.netkeiba.com/horse/ped/{horse_id}/"
-        soup = self._get_soup(url)
-        if not soup:
+        html = self._get_html(url)
+        if html is None:
             return None
+        profile = self.parse_horse_profile(html, horse_id=horse_id)
+        # Every horse has a pedigree; an empty one usually means a block page
+        http_client.report_parse(url, bool(profile and profile.get("father")))
+        return profile
+
+    async def get_horse_profile_async(self, horse_id, fetcher):
+        """Async counterpart of get_horse_profile."""
+        url = f"https://db.netkeiba.com/horse/ped/{horse_id}/"
+        html = await self._get_html_async(url, fetcher)
+        if html is None:
+            return None
+        profile = await fetcher.parse(self.parse_horse_profile, html, horse_id)
+        http_client.report_parse(url, bool(profile and profile.get("father")))
+        return profile
+
+    def parse_horse_profile(self, html, horse_id=""):
+        """
+        Parses a pedigree page (db.netkeiba.com/horse/ped/) into {father, mother, bms}.
+        """
+        soup = make_soup(html, PAGE_FILTERS["horse_ped"])
         
         # Parse Blood Table
         # table class="blood_table"
@@ -0,0 +1,443 @@
+"""
+ホスト単位のレート制限 (トークンバケット)
+固定 time.sleep() の代わりに、ホストごとのリクエスト予算でアクセス間隔を制御する
+
+同期アクセス (http_client) と非同期アクセス (async_fetch) は同じバケットを共有するため、
+同一プロセス内ではどの経路から呼んでもホストへのリクエストレートは予算内に収まる。
+
+HOST_RATES は上限値で、実際のレートはホストごとの HostController が応答に応じて調整する (AIMD):
+    - 429 / 503 (リトライ中のものを含む): レートを半減し、Retry-After があればその間ホストを停止
+    - 応答時間の急増: レートを少し下げる
+    - 正常な応答: 上限に向けて少しずつ戻す
+    - 連続した失敗 (通信エラー・5xx・解析失敗): サーキットブレーカーでホストを一定時間停止
+状態は metrics() で取得できる。
+
+複数プロセスで予算を共有する場合 (worker_pool) は configure(shared_dir=...) または
+環境変数 KEIBA_RATE_LIMIT_DIR でディレクトリを指定する。バケットの状態 (残高・レート・停止期限) は
+ホストごとのファイルに置かれ、ファイルロックで排他して更新するため、全プロセス合計のレートが予算内に収まる。
+"""
+
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+
+try:
+    from file_lock import FileLock
+except ImportError:
+    from .file_lock import FileLock
+
+
+# ホストごとの予算 (リクエスト/秒, バースト許容数)
+HOST_RATES = {
+    "db.netkeiba.com": (1.0, 1),
+    "race.netkeiba.com": (2.0, 2),
+    "nar.netkeiba.com": (2.0, 2),
+    "www.jra.go.jp": (1.0, 1),
+}
+DEFAULT_RATE = (1.0, 1)
+
+# 適応制御の設定 (変更は configure() 経由で行う)
+CONFIG = {
+    "adaptive": True,          # False の場合は HOST_RATES の固定レート
+    "min_rate": 0.1,           # レートの下限 (リクエスト/秒)
+    "decrease_factor": 0.5,    # 429 / 503 を受けたときの倍率
+    "latency_factor": 0.8,     # 応答時間が急増したときの倍率
+    "increase_step": 0.05,     # 正常な応答ごとに戻すレート (リクエスト/秒)
+    "latency_spike": 3.0,      # 平均応答時間のこの倍を超えたら急増とみなす
+    "latency_warmup": 5,       # 急増の判定を始めるまでの応答数
+    "failure_threshold": 5,    # 連続失敗がこの回数に達したらホストを停止する
+    "cooldown": 30.0,          # 停止秒数 (再度停止するたびに倍増)
+    "max_cooldown": 600.0,
+    "shared_dir": os.environ.get("KEIBA_RATE_LIMIT_DIR") or None,  # プロセス間で共有するバケットの置き場所
+}
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class TokenBucket:
+    """
+    スレッドセーフなトークンバケット
+
+    reserve() はトークンを即座に予約し、利用可能になるまでの待ち秒数を返す。
+    トークンの前借り(負の残高)を許すため、同時に予約した呼び出し元は到着順に間隔を空けて実行される。
+    停止 (pause) 中は補充しない。残高は停止明けの時点のものとして数え、停止中の予約は停止明けから間隔を空ける。
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate, burst=None):
+        """予算を変更する (残高はそのまま引き継ぐ)"""
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+            if burst is not None:
+                self.burst = max(1, int(burst))
+                self._tokens = min(self._tokens, float(self.burst))
+
+    def _refill(self):
+        # _last は残高を数えた時刻 (停止中は停止明け)。それより前には補充しない
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + max(0.0, now - self._last) * self.rate)
+        self._last = max(self._last, now)
+        return now
+
+    def reserve(self, tokens=1):
+        """
+        トークンを予約する
+
+        Returns:
+            float: 実行可能になるまでの待ち秒数 (0 なら即時)
+        """
+        with self._lock:
+            now = self._refill()
+            self._tokens -= tokens
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return wait + (self._last - now)
+
+    def pause(self, seconds):
+        """指定秒数の間、トークンを払い出さない (以降の予約は停止明けから 1/rate 秒間隔で実行される)"""
+        with self._lock:
+            now = self._refill()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._last = max(self._last, self._paused_until)
+
+    def paused_for(self):
+        """停止の残り秒数"""
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def acquire(self, tokens=1):
+        """トークンが利用可能になるまでブロックする"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        """トークンが利用可能になるまで待機する (イベントループはブロックしない)"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    プロセス間で共有するトークンバケット
+
+    残高・レート・停止期限をファイルに保存し、予約のたびにファイルロック内で読み書きする。
+    時刻はプロセス間で比較できるよう time.time() を使う。
+    set_rate() / pause() も全プロセスに反映される (429 を受けたプロセスの減速が他のプロセスにも効く)。
+    """
+
+    def __init__(self, path, rate, burst=1):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._file_lock = FileLock(path + ".lock")
+        with self._file_lock:
+            if self._load() is None:
+                self._save({"rate": self.rate, "burst": self.burst, "tokens": float(self.burst),
+                            "last": time.time(), "paused_until": 0.0})
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.rate = state["rate"]
+        self.burst = state["burst"]
+        return state
+
+    def _save(self, state):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def _update(self, func):
+        """ロック内で状態を読み、func(state, now) で更新して保存する (func の戻り値を返す)"""
+        with self._file_lock:
+            now = time.time()
+            state = self._load() or {"rate": self.rate, "burst": self.burst, "tokens": float(self.burst),
+                                     "last": now, "paused_until": 0.0}
+            # last は残高を数えた時刻 (停止中は停止明け)。それより前には補充しない
+            elapsed = max(0.0, now - state["last"])
+            state["tokens"] = min(float(state["burst"]), state["tokens"] + elapsed * state["rate"])
+            state["last"] = max(state["last"], now)
+            result = func(state, now)
+            self._save(state)
+            self.rate = state["rate"]
+            self.burst = state["burst"]
+            return result
+
+    def set_rate(self, rate, burst=None):
+        def _apply(state, now):
+            state["rate"] = float(rate)
+            if burst is not None:
+                state["burst"] = max(1, int(burst))
+                state["tokens"] = min(state["tokens"], float(state["burst"]))
+        self._update(_apply)
+
+    def reserve(self, tokens=1):
+        def _apply(state, now):
+            state["tokens"] -= tokens
+            wait = 0.0 if state["tokens"] >= 0 else -state["tokens"] / state["rate"]
+            return wait + (state["last"] - now)
+        return self._update(_apply)
+
+    def pause(self, seconds):
+        def _apply(state, now):
+            state["paused_until"] = max(state["paused_until"], now + seconds)
+            state["last"] = max(state["last"], state["paused_until"])
+        self._update(_apply)
+
+    def paused_for(self):
+        with self._file_lock:
+            state = self._load()
+        if state is None:
+            return 0.0
+        return max(0.0, state["paused_until"] - time.time())
+
+
+_buckets = {}
+_controllers = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(host):
+    """ホストのバケットを取得する (なければ HOST_RATES から生成)"""
+    bucket = _buckets.get(host)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(host)
+            if bucket is None:
+                rate, burst = HOST_RATES.get(host, DEFAULT_RATE)
+                if CONFIG["shared_dir"]:
+                    bucket = SharedTokenBucket(_shared_path(host), rate, burst)
+                else:
+                    bucket = TokenBucket(rate, burst)
+                _buckets[host] = bucket
+    return bucket
+
+
+def _shared_path(host):
+    return os.path.join(CONFIG["shared_dir"], f"{host}.json")
+
+
+def reset_shared_state():
+    """
+    共有バケットの状態ファイルを削除する (前回の実行で下がったレートや停止を持ち越さない)
+
+    ワーカーを起動する前にコーディネーターから呼ぶ。
+    """
+    shared_dir = CONFIG["shared_dir"]
+    if not shared_dir:
+        return
+    for path in glob.glob(os.path.join(shared_dir, "*.json")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    with _buckets_lock:
+        _buckets.clear()
+        _controllers.clear()
+
+
+def configure_host(host, rate, burst=1):
+    """
+    ホストの予算を設定する
+
+    Args:
+        host: ホスト名 (例: "db.netkeiba.com")
+        rate: 1秒あたりのリクエスト数
+        burst: 連続で許容するリクエスト数
+    """
+    HOST_RATES[host] = (rate, burst)
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        controller = _controllers.get(host)
+    if bucket is not None:
+        bucket.set_rate(rate, burst)
+    if controller is not None:
+        controller.rate = float(rate)
+
+
+def configure(**kwargs):
+    """
+    適応制御の設定を変更する
+
+    Args:
+        adaptive: False の場合は適応制御を行わない
+        min_rate, decrease_factor, latency_factor, increase_step: レート調整 (AIMD) のパラメータ
+        latency_spike, latency_warmup: 応答時間の急増判定
+        failure_threshold, cooldown, max_cooldown: サーキットブレーカー
+        shared_dir: プロセス間で予算を共有する場合のディレクトリ (None でプロセス内のみ)
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown rate_limit option(s): {sorted(unknown)}")
+    shared_changed = "shared_dir" in kwargs and kwargs["shared_dir"] != CONFIG["shared_dir"]
+    CONFIG.update(kwargs)
+    if shared_changed:
+        # 作成済みのバケットは共有の有無が異なるため作り直す
+        if CONFIG["shared_dir"]:
+            os.makedirs(CONFIG["shared_dir"], exist_ok=True)
+        with _buckets_lock:
+            _buckets.clear()
+            _controllers.clear()
+
+
+class HostController:
+    """
+    ホストごとの適応レート制御とサーキットブレーカー
+
+    調整結果はホストの TokenBucket に反映されるため、同期・非同期どちらの経路にも効く。
+    """
+
+    def __init__(self, host, bucket):
+        self.host = host
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self.rate = bucket.rate
+        self.latency_avg = None
+        self.consecutive_failures = 0
+        self.consecutive_parse_failures = 0
+        self.trips = 0
+        self.cooldown = CONFIG["cooldown"]
+        self.counters = {"responses": 0, "throttled": 0, "errors": 0, "parse_failures": 0, "slow": 0}
+
+    @property
+    def ceiling(self):
+        return HOST_RATES.get(self.host, DEFAULT_RATE)[0]
+
+    def _set_rate(self, rate):
+        rate = min(self.ceiling, max(CONFIG["min_rate"], rate))
+        if rate != self.rate:
+            self.rate = rate
+            self.bucket.set_rate(rate)
+
+    def _trip(self, reason):
+        # 呼び出し元でロックを保持していること
+        seconds = min(self.cooldown, CONFIG["max_cooldown"])
+        self.trips += 1
+        self.cooldown = min(self.cooldown * 2, CONFIG["max_cooldown"])
+        self.consecutive_failures = 0
+        self.consecutive_parse_failures = 0
+        self._set_rate(CONFIG["min_rate"])
+        self.bucket.pause(seconds)
+        print(f"⛔ Circuit open for {self.host}: {reason} (pausing {seconds:.0f}s)")
+
+    def record_response(self, status, latency=None, throttled=False, retry_after=None):
+        """
+        応答を記録してレートを調整する
+
+        Args:
+            status: HTTPステータス
+            latency: 応答時間 (秒)
+            throttled: トランスポート層のリトライ中に 429 / 503 を受けていた場合 True
+            retry_after: Retry-After ヘッダーの秒数
+        """
+        if not CONFIG["adaptive"]:
+            return
+        with self._lock:
+            self.counters["responses"] += 1
+            if throttled or status in THROTTLE_STATUS_CODES:
+                self.counters["throttled"] += 1
+                self._set_rate(self.rate * CONFIG["decrease_factor"])
+                if retry_after:
+                    self.bucket.pause(min(retry_after, CONFIG["max_cooldown"]))
+            if status >= 500 or status == 429:
+                self.counters["errors"] += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= CONFIG["failure_threshold"]:
+                    self._trip(f"{self.consecutive_failures} consecutive HTTP {status}")
+                return
+
+            self.consecutive_failures = 0
+            self.cooldown = CONFIG["cooldown"]
+            if latency is not None:
+                avg = self.latency_avg
+                warm = self.counters["responses"] > CONFIG["latency_warmup"]
+                if avg is not None and warm and latency > avg * CONFIG["latency_spike"]:
+                    self.counters["slow"] += 1
+                    self._set_rate(self.rate * CONFIG["latency_factor"])
+                    self.latency_avg = 0.8 * avg + 0.2 * latency
+                    return
+                self.latency_avg = latency if avg is None else 0.8 * avg + 0.2 * latency
+            if not throttled:
+                self._set_rate(self.rate + CONFIG["increase_step"])
+
+    def record_error(self, error):
+        """通信エラー (接続失敗・タイムアウト) を記録する"""
+        if not CONFIG["adaptive"]:
+            return
+        with self._lock:
+            self.counters["errors"] += 1
+            self.consecutive_failures += 1
+            self._set_rate(self.rate * CONFIG["decrease_factor"])
+            if self.consecutive_failures >= CONFIG["failure_threshold"]:
+                self._trip(f"{self.consecutive_failures} consecutive errors ({type(error).__name__})")
+
+    def record_parse(self, ok):
+        """
+        解析結果を記録する (200 でも中身が空のページが続く場合はブロックされているとみなす)
+        """
+        if not CONFIG["adaptive"]:
+            return
+        with self._lock:
+            if ok:
+                self.consecutive_parse_failures = 0
+                return
+            self.counters["parse_failures"] += 1
+            self.consecutive_parse_failures += 1
+            if self.consecutive_parse_failures >= CONFIG["failure_threshold"]:
+                self._trip(f"{self.consecutive_parse_failures} consecutive parse failures")
+
+    def snapshot(self):
+        """現在の状態"""
+        with self._lock:
+            return {
+                "rate": round(self.rate, 3),
+                "ceiling": self.ceiling,
+                "paused_for": round(self.bucket.paused_for(), 1),
+                "latency_avg": round(self.latency_avg, 3) if self.latency_avg is not None else None,
+                "consecutive_failures": self.consecutive_failures,
+                "consecutive_parse_failures": self.consecutive_parse_failures,
+                "trips": self.trips,
+                **self.counters,
+            }
+
+
+
+def get_controller(host):
+    """ホストの HostController を取得する (なければ生成)"""
+    controller = _controllers.get(host)
+    if controller is None:
+        bucket = get_bucket(host)
+        with _buckets_lock:
+            controller = _controllers.get(host)
+            if controller is None:
+                controller = HostController(host, bucket)
+                _controllers[host] = controller
+    return controller
+
+
+def metrics():
+    """
+    ホストごとの制御状態
+
+    Returns:
+        dict: {host: {rate, ceiling, paused_for, latency_avg, trips, responses, throttled, ...}}
+    """
+    with _buckets_lock:
+        controllers = list(_controllers.values())
+    return {c.host: c.snapshot() for c in controllers}
@@ -0,0 +1,210 @@
+"""
+アーカイブからの再解析
+html_archive に保存したページに現在の抽出処理を実行し直し、データベースを作り直す (ネットワークには一切アクセスしない)
+
+解析処理を修正したときは、再取得や個別の修正スクリプトの代わりにこれを実行する:
+
+    result = run_reparse("NAR", workers=8)            # data/raw/database_nar_reparsed.parquet を作る
+    result = run_reparse("NAR", workers=8, replace=True)  # 作り直したものでデータベースを置き換える
+
+- 各ワーカープロセスは html_archive の再生モードで scrape_race_data / scrape_jra_race をそのまま実行する
+  (戦績・血統・騎手名などの付随ページもアーカイブから読む)
+- レースはワーカー間で分担し、各ワーカーは自分専用の断片 (parquet_sink) に書き込む。統合は最後に1回だけ行う
+- アーカイブにないレース (アーカイブ導入前に取得したもの) と再解析に失敗したレースは現在のデータベースの行を引き継ぐ
+"""
+
+import contextlib
+import io
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+try:
+    import horse_history
+    import html_archive
+    import race_dataset
+    import worker_pool
+    from parquet_sink import ParquetSink
+    from race_index import RaceIdSet
+except ImportError:
+    from . import horse_history
+    from . import html_archive
+    from . import race_dataset
+    from . import worker_pool
+    from .parquet_sink import ParquetSink
+    from .race_index import RaceIdSet
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = {
+    "NAR": (os.path.join(PROJECT_ROOT, "data", "raw", "database_nar.parquet"), ["race_id", "馬 番"]),
+    "JRA": (os.path.join(PROJECT_ROOT, "data", "raw", "database.parquet"), ["race_id", "馬名"]),
+}
+RESULT_HOSTS = {"NAR": "nar.netkeiba.com", "JRA": "race.netkeiba.com"}
+
+
+def archived_race_tasks(mode, archive=None, as_of=None):
+    """
+    アーカイブにあるレース結果ページを再解析タスクにする
+
+    Returns:
+        list[tuple]: ("race", race_id) (netkeiba) / ("jra", url) (JRA公式)
+    """
+    archive = archive or html_archive.get_archive()
+    kinds = ["race_result"] + (["jra_result"] if mode == "JRA" else [])
+    tasks = {}
+    for entry in archive.entries(kinds=kinds, until=as_of):
+        if entry["status"] != 200:
+            continue
+        parts = urlsplit(entry["url"])
+        if entry["kind"] == "jra_result":
+            tasks[entry["url"]] = ("jra", entry["url"])
+        elif parts.hostname == RESULT_HOSTS[mode]:
+            race_id = parse_qs(parts.query).get("race_id", [""])[0]
+            if race_id:
+                tasks[race_id] = ("race", race_id)
+    return list(tasks.values())
+
+
+_worker = {}
+
+
+def _init_worker(settings, output_path, subset, as_of, verbose):
+    worker_pool._apply_settings(settings)
+    html_archive.configure(replay=True, as_of=as_of)
+    _worker["sink"] = ParquetSink(output_path, subset=subset, compact_every=0)
+    _worker["verbose"] = verbose
+
+
+def _reparse_chunk(mode, tasks):
+    """ワーカー: タスクをまとめて再解析し、自分の断片に追記する"""
+    try:
+        import auto_scraper
+        import jra_scraper
+    except ImportError:
+        from . import auto_scraper
+        from . import jra_scraper
+
+    frames, failed = [], []
+    output = contextlib.nullcontext() if _worker["verbose"] else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        for kind, key in tasks:
+            try:
+                if kind == "jra":
+                    df = jra_scraper.scrape_jra_race(key)
+                else:
+                    df = auto_scraper.scrape_race_data(key, mode)
+            except Exception:
+                df = None
+            if df is None or df.empty:
+                failed.append(key)
+            else:
+                frames.append(df)
+        auto_scraper.NAMES.close()
+    rows = 0
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+        _worker["sink"].append(df)
+        rows = len(df)
+    return len(tasks), rows, failed
+
+
+def _carry_over_unarchived(target_path, output_sink):
+    """アーカイブにないレースの行を現在のデータベースから引き継ぐ"""
+    if not os.path.exists(target_path):
+        return 0
+    current = ParquetSink(target_path, subset=output_sink.subset)
+    current.compact()
+    df = current.read()
+    if df.empty or "race_id" not in df.columns:
+        return 0
+    done = output_sink.read(columns=["race_id"])
+    reparsed = RaceIdSet.from_strings(done["race_id"].unique()) if "race_id" in done.columns else RaceIdSet()
+    keep = df[~reparsed.contains(df["race_id"])]
+    if not keep.empty:
+        output_sink.append(keep)
+    return keep["race_id"].nunique()
+
+
+def run_reparse(mode="NAR", target_path=None, output_path=None, workers=None, as_of=None, chunk_size=20,
+                replace=False, verbose=False, progress_callback=None):
+    """
+    アーカイブのレース結果ページを現在の抽出処理で解析し直し、データベースを作り直す
+
+    Args:
+        mode: "NAR" / "JRA"
+        target_path: 現在のデータベース (省略時はモードの既定)
+        output_path: 出力先 (省略時は <target>_reparsed.parquet)
+        workers: ワーカープロセス数 (省略時はCPU数)
+        as_of: この時刻 (epoch秒) 以前に取得した版を使う (None は最新)
+        chunk_size: ワーカーに一度に渡すレース数
+        replace: True の場合、出力で target を置き換える (元のファイルは <target>.bak に残す)
+        verbose: True の場合はワーカーのスクレイパー出力を表示する
+        progress_callback: function(str) 進捗通知
+
+    Returns:
+        dict: races (再解析したレース数), rows, carried (引き継いだレース数), failed (race_id / URL), output
+    """
+    default_target, subset = TARGETS[mode]
+    target_path = target_path or default_target
+    output_path = output_path or os.path.splitext(target_path)[0] + "_reparsed.parquet"
+    workers = workers or os.cpu_count() or 1
+
+    archive = html_archive.get_archive()
+    archive.flush()
+    tasks = archived_race_tasks(mode, archive, as_of)
+    print(f"=== Re-parse {mode}: {len(tasks)} archived races, {workers} process(es) -> {output_path} ===")
+
+    # 出力は毎回作り直す
+    sink = ParquetSink(output_path, subset=subset, compact_every=0)
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    shutil.rmtree(sink.dataset_dir, ignore_errors=True)
+    sink = ParquetSink(output_path, subset=subset, compact_every=0)
+
+    done, rows, failed = 0, 0, []
+    started = time.monotonic()
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    if chunks:
+        ctx = multiprocessing.get_context("spawn")
+        initargs = (worker_pool._settings(), output_path, subset, as_of, verbose)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=initargs) as pool:
+            futures = [pool.submit(_reparse_chunk, mode, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                n, r, f = future.result()
+                done, rows = done + n, rows + r
+                failed.extend(f)
+                elapsed = time.monotonic() - started
+                msg = f"再解析 {done}/{len(tasks)} レース | {rows} 行 | {done / elapsed if elapsed > 0 else 0.0:.1f} レース/s"
+                print(msg)
+                if progress_callback:
+                    progress_callback(msg)
+
+    carried = _carry_over_unarchived(target_path, sink)
+    if carried:
+        print(f"  -> Carried over {carried} races not in the archive from {target_path}")
+    sink.close()
+    if failed:
+        print(f"⚠️ {len(failed)} races could not be re-parsed (current rows kept): {failed[:10]}")
+
+    if replace:
+        if os.path.exists(target_path):
+            shutil.copy2(target_path, target_path + ".bak")
+        os.replace(output_path, target_path)
+        shutil.rmtree(sink.dataset_dir, ignore_errors=True)
+        print(f"Replaced {target_path} (previous version: {target_path}.bak)")
+        output_path = target_path
+        if os.path.abspath(target_path) == os.path.abspath(default_target):
+            if race_dataset.exists(mode):
+                race_dataset.build(mode)
+            if horse_history.exists(mode):
+                horse_history.build(mode)
+
+    print(f"Re-parse finished in {time.monotonic() - started:.0f}s")
+    return {"races": done - len(failed), "rows": rows, "carried": carried, "failed": failed, "output": output_path}
@@ -0,0 +1,345 @@
+"""
+HTTPレスポンスのディスクキャッシュ
+URL(+パラメータ)をキーに取得済みページを保存し、URLの種類ごとのTTLで再利用する
+
+- 本文はハッシュ値で保存 (content-addressed): 同じ内容のページは1つのファイルを共有する
+- TTL切れのエントリは ETag / Last-Modified で条件付き再検証し、304 なら保存済みの本文を使う
+- 確定したレース結果は二度と変わらないため、期限なしで保存する
+- オフライン再生モード: ネットワークに一切アクセスせず、キャッシュのみから応答する
+  (キャッシュにないURLは OfflineCacheMiss)。CI でのスクレイピング処理の実行に使う
+- 掃除 (gc): どのエントリからも参照されなくなった本文 (オッズなど内容が変わるたびに残る古い本文) と、
+  期限切れから gc_retain 秒たった未確定のエントリを削除する。store() の中で gc_interval 秒ごとに実行される
+
+http_client.request() から利用されるため、各スクレイパー側での対応は不要。
+環境変数 KEIBA_HTTP_OFFLINE=1 でオフライン再生、KEIBA_HTTP_CACHE_DIR で保存先を変更できる。
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from urllib.parse import urlencode
+
+import requests
+
+try:
+    from file_lock import FileLock
+except ImportError:
+    from .file_lock import FileLock
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "enabled": True,
+    "offline": os.environ.get("KEIBA_HTTP_OFFLINE", "") not in ("", "0"),
+    "cache_dir": os.environ.get("KEIBA_HTTP_CACHE_DIR") or os.path.join(PROJECT_ROOT, "data", "cache", "http"),
+    "gc_interval": 3600,     # 自動の掃除の間隔 (秒、0 は自動で行わない)
+    "gc_retain": 86400,      # 期限切れの未確定エントリをオフライン再生用に残す秒数
+}
+
+FOREVER = None
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# URLの種類ごとのキャッシュ方針 (上から順に最初に一致したものを使う)
+# (名前, パターン, TTL秒 (None は期限なし), 確定判定マーカー, 未確定時のTTL秒)
+# 確定判定マーカーがある場合、本文にマーカーを含むときのみ期限なしとし、
+# 含まない (結果未掲載など) ときは未確定時のTTLを使う
+CACHE_POLICIES = [
+    ("race_result", re.compile(r"//(race|nar)\.netkeiba\.com/race/result\.html"), FOREVER, b"All_Result_Table", 5 * MINUTE),
+    ("db_race", re.compile(r"//db\.netkeiba\.com/race/\d+"), FOREVER, None, None),
+    ("jra_result", re.compile(r"//www\.jra\.go\.jp/.*pw01sde"), FOREVER, None, None),
+    ("jra_list", re.compile(r"//www\.jra\.go\.jp/.*pw01s(kl|rl)"), DAY, None, None),
+    ("shutuba", re.compile(r"/race/shutuba(_past)?\.html"), 10 * MINUTE, None, None),
+    ("odds", re.compile(r"/api/api_get_jra_odds\.html|/odds/index\.html"), MINUTE, None, None),
+    ("race_list", re.compile(r"/top/race_list(_sub)?\.html"), 30 * MINUTE, None, None),
+    ("horse_ped", re.compile(r"//db\.netkeiba\.com/horse/ped/"), 30 * DAY, None, None),
+    ("horse_result", re.compile(r"//db\.netkeiba\.com/horse/(result/)?\d"), DAY, None, None),
+    ("profile", re.compile(r"//db\.netkeiba\.com/(jockey|trainer)/"), 30 * DAY, None, None),
+]
+# 一致しないURLは毎回再検証する (保存はするのでオフライン再生には使える)
+DEFAULT_POLICY = ("default", None, 0, None, None)
+
+# 再現に必要なレスポンスヘッダー
+STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+# 書き込み途中 (本文を書いてからエントリを書くまで) の本文を掃除しないための猶予 (秒)
+BLOB_GRACE = 10 * MINUTE
+
+stats = {"hits": 0, "misses": 0, "revalidated": 0, "stored": 0}
+
+_next_gc = 0.0
+
+
+class OfflineCacheMiss(requests.exceptions.ConnectionError):
+    """オフライン再生モードでキャッシュにないURLを要求した"""
+
+
+def configure(**kwargs):
+    """
+    キャッシュ設定を変更する
+
+    Args:
+        enabled: False の場合はキャッシュを使わない
+        offline: True の場合はキャッシュのみから応答する (ネットワーク不使用)
+        cache_dir: 保存先ディレクトリ
+        gc_interval: 自動の掃除の間隔 (秒、0 は自動で行わない)
+        gc_retain: 期限切れの未確定エントリを残す秒数
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown response_cache option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+def is_enabled():
+    return CONFIG["enabled"] or CONFIG["offline"]
+
+
+def is_offline():
+    return CONFIG["offline"]
+
+
+def policy_for(request_line):
+    for policy in CACHE_POLICIES:
+        if policy[1].search(request_line):
+            return policy
+    return DEFAULT_POLICY
+
+
+def _request_line(method, url, params=None, data=None):
+    line = url
+    if params:
+        line += ("&" if "?" in url else "?") + urlencode(sorted(dict(params).items()))
+    if data:
+        body = urlencode(sorted(dict(data).items())) if isinstance(data, dict) else str(data)
+        line = f"{line} {body}"
+    return f"{method.upper()} {line}"
+
+
+def _write_atomic(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class CacheEntry:
+    """キャッシュ済みレスポンス1件 (メタデータ + 本文)"""
+
+    def __init__(self, key, request_line, meta):
+        self.key = key
+        self.request_line = request_line
+        self.meta = meta
+
+    def is_fresh(self, now=None):
+        if self.meta.get("final"):
+            return True
+        _, _, ttl, marker, pending_ttl = policy_for(self.request_line)
+        if marker is not None:
+            ttl = pending_ttl
+        if ttl is FOREVER:
+            return True
+        age = (now or time.time()) - self.meta.get("fetched_at", 0)
+        return age < ttl
+
+    def validators(self):
+        """条件付きリクエスト用のヘッダー"""
+        headers = {}
+        stored = self.meta.get("headers", {})
+        if stored.get("ETag"):
+            headers["If-None-Match"] = stored["ETag"]
+        if stored.get("Last-Modified"):
+            headers["If-Modified-Since"] = stored["Last-Modified"]
+        return headers
+
+    def touch(self):
+        """304 で再検証できた場合に取得時刻を更新する"""
+        self.meta["fetched_at"] = time.time()
+        _write_atomic(_meta_path(self.key), json.dumps(self.meta, ensure_ascii=False).encode("utf-8"))
+
+    def to_response(self):
+        """保存済みの内容から requests.Response を組み立てる (本文がなければ None)"""
+        try:
+            with open(_blob_path(self.meta["body"]), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+        response = requests.Response()
+        response.status_code = self.meta.get("status", 200)
+        response.url = self.meta.get("url", "")
+        response.headers.update(self.meta.get("headers", {}))
+        response._content = content
+        response.from_cache = True
+        return response
+
+
+def _meta_path(key):
+    return os.path.join(CONFIG["cache_dir"], "entries", key[:2], key + ".json")
+
+
+def _blob_path(digest):
+    return os.path.join(CONFIG["cache_dir"], "blobs", digest[:2], digest)
+
+
+def make_key(method, url, params=None, data=None):
+    """リクエストのキャッシュキー (sha256) と正規化したリクエスト行を返す"""
+    request_line = _request_line(method, url, params, data)
+    return hashlib.sha256(request_line.encode("utf-8")).hexdigest(), request_line
+
+
+def lookup(method, url, params=None, data=None):
+    """
+    キャッシュエントリを取得する
+
+    Returns:
+        CacheEntry: 見つからなければ None
+    """
+    key, request_line = make_key(method, url, params, data)
+    try:
+        with open(_meta_path(key), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return CacheEntry(key, request_line, meta)
+
+
+def store(method, url, response, params=None, data=None):
+    """
+    200 のレスポンスを保存する
+
+    Returns:
+        CacheEntry: 保存しなかった場合は None
+    """
+    if response.status_code != 200:
+        return None
+    key, request_line = make_key(method, url, params, data)
+    content = response.content
+    digest = hashlib.sha256(content).hexdigest()
+    blob = _blob_path(digest)
+    if os.path.exists(blob):
+        # 既存の本文を使い回す場合も更新時刻を進め、掃除の猶予に入れる
+        os.utime(blob)
+    else:
+        _write_atomic(blob, content)
+
+    _, _, ttl, marker, _ = policy_for(request_line)
+    if marker is not None:
+        final = marker in content
+    else:
+        final = ttl is FOREVER
+
+    meta = {
+        "url": url,
+        "request": request_line,
+        "status": response.status_code,
+        "headers": {h: response.headers[h] for h in STORED_HEADERS if h in response.headers},
+        "fetched_at": time.time(),
+        "body": digest,
+        "final": final,
+    }
+    _write_atomic(_meta_path(key), json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+    stats["stored"] += 1
+    _maybe_gc()
+    return CacheEntry(key, request_line, meta)
+
+
+def _ttl_of(entry):
+    _, _, ttl, marker, pending_ttl = policy_for(entry.request_line)
+    return pending_ttl if marker is not None else ttl
+
+
+def _maybe_gc():
+    global _next_gc
+    interval = CONFIG["gc_interval"]
+    now = time.time()
+    if not interval or now < _next_gc:
+        return
+    _next_gc = now + interval
+    # 前回の掃除の時刻はプロセス間で共有する (ワーカーごとに走らせない)
+    marker = os.path.join(CONFIG["cache_dir"], ".gc")
+    try:
+        if now - os.path.getmtime(marker) < interval:
+            return
+    except OSError:
+        pass
+    try:
+        gc()
+    except TimeoutError:
+        pass  # 他のプロセスが掃除中
+    except OSError as e:
+        print(f"Response cache gc failed: {e}")
+
+
+def gc(retain=None, now=None):
+    """
+    参照されなくなった本文と、期限切れから retain 秒たった未確定のエントリを削除する
+
+    Args:
+        retain: 期限切れの未確定エントリを残す秒数 (省略時は CONFIG["gc_retain"])
+        now: 現在時刻 (省略時は time.time())
+
+    Returns:
+        dict: entries (削除したエントリ数), blobs (削除した本文の数), bytes (削除した本文のバイト数)
+    """
+    retain = CONFIG["gc_retain"] if retain is None else retain
+    now = now or time.time()
+    cache_dir = CONFIG["cache_dir"]
+    removed = {"entries": 0, "blobs": 0, "bytes": 0}
+    with FileLock(os.path.join(cache_dir, ".gc.lock"), timeout=0):
+        referenced = set()
+        entries_dir = os.path.join(cache_dir, "entries")
+        for root, _, files in os.walk(entries_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                entry = CacheEntry(name[:-5], meta.get("request", ""), meta)
+                ttl = _ttl_of(entry)
+                expired_for = now - meta.get("fetched_at", 0) - (ttl or 0)
+                if not meta.get("final") and ttl is not FOREVER and expired_for > retain:
+                    try:
+                        os.remove(path)
+                        removed["entries"] += 1
+                    except OSError:
+                        pass
+                    continue
+                referenced.add(meta.get("body"))
+
+        blobs_dir = os.path.join(cache_dir, "blobs")
+        for root, _, files in os.walk(blobs_dir):
+            for name in files:
+                if name in referenced or name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                    if now - info.st_mtime < BLOB_GRACE:
+                        continue
+                    os.remove(path)
+                except OSError:
+                    continue
+                removed["blobs"] += 1
+                removed["bytes"] += info.st_size
+
+        _write_atomic(os.path.join(cache_dir, ".gc"), b"")
+    if removed["entries"] or removed["blobs"]:
+        print(f"Response cache gc: removed {removed['entries']} entries, "
+              f"{removed['blobs']} blobs ({removed['bytes'] / 1e6:.1f} MB)")
+    return removed
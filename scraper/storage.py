@@ -0,0 +1,598 @@
+"""
+競馬データベース (SQLite) の共通ストレージ層
+レース結果 (race_results) と前処理済み特徴量 (processed_data_jra / processed_data_nar) を1つのAPIで扱う
+
+db/database.py と ml/db_helper.py の KeibaDatabase はこのモジュールの薄いラッパー。
+
+    storage = get_storage()                          # 既定は keiba_data.db (KEIBA_DB_PATH で変更可)
+    df = storage.processed_race("202606050811", mode="JRA")
+    storage.save_processed(df_proc, mode="NAR")
+    with storage.connection() as conn:               # 接続プールから借りる
+        conn.execute("SELECT ...", params)
+
+- 接続はプールして使い回す (Streamlit の複数セッション・スレッドから同時に使ってよい)
+- WAL モードなので読み込みは書き込み中も止まらない。mmap・ページキャッシュも接続ごとに設定する
+- SQL の値はすべてプレースホルダで渡す (文は接続ごとにキャッシュされ再利用される)。
+  テーブル名・列名はスキーマ定義 (TABLES) とフレームの列から作り、引用符で囲む
+"""
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "db_path": os.environ.get("KEIBA_DB_PATH") or os.path.join(PROJECT_ROOT, "keiba_data.db"),
+    "pool_size": 4,                  # プールする接続数 (同時に借りられる接続の上限)
+    "busy_timeout": 30.0,            # ロック待ちの上限 (秒)
+    "mmap_size": 256 * 1024 * 1024,  # メモリマップする大きさ (バイト、0 で無効)
+    "cache_size_kb": 64 * 1024,      # 接続ごとのページキャッシュ (KB)
+    "cached_statements": 256,        # 接続ごとにキャッシュする準備済みの文の数
+    "insert_chunk": 5000,            # executemany 1回あたりの行数
+    "ingest_batch_rows": 50000,      # 一括取り込みで Parquet から1回に読む行数
+    "ingest_commit_rows": 500000,    # 一括取り込みでコミットする行数
+    "ingest_cache_kb": 512 * 1024,   # 一括取り込み中のページキャッシュ (KB)
+}
+
+MODES = ("JRA", "NAR")
+
+# テーブルのスキーマ定義。key は型を固定する列 (その他の列はフレームの dtype から決める)、
+# unique は upsert のキー (一意索引)、indexes は作成する索引、date は日付列
+TABLES = {
+    "results": {
+        "key": {"race_id": "TEXT", "horse_id": "TEXT", "日付": "TEXT"},
+        "unique": ("race_id", "horse_id"),
+        "indexes": ["race_id", "horse_id", "日付", "会場", "馬名"],
+        "date": "日付",
+    },
+    "processed": {
+        "key": {"race_id": "TEXT", "horse_id": "TEXT", "date": "TEXT"},
+        "unique": ("race_id", "horse_id"),
+        "indexes": ["race_id", "horse_id", "date"],
+        "date": "date",
+    },
+}
+LOAD_MODES = ("replace", "append", "upsert")
+RESULTS_TABLE = "race_results"
+
+
+def configure(**kwargs):
+    """
+    ストレージ層の設定を変更する
+
+    Args:
+        db_path: 既定のデータベースファイル
+        pool_size: プールする接続数
+        busy_timeout: ロック待ちの上限 (秒)
+        mmap_size: メモリマップする大きさ (バイト)
+        cache_size_kb: 接続ごとのページキャッシュ (KB)
+        cached_statements: 接続ごとにキャッシュする準備済みの文の数
+        insert_chunk: executemany 1回あたりの行数
+        ingest_batch_rows: 一括取り込みで Parquet から1回に読む行数
+        ingest_commit_rows: 一括取り込みでコミットする行数
+        ingest_cache_kb: 一括取り込み中のページキャッシュ (KB)
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown storage option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+def processed_table(mode):
+    """モードの前処理済みテーブル名 (processed_data_jra / processed_data_nar)"""
+    mode = str(mode).upper()
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode} (expected one of {MODES})")
+    return f"processed_data_{mode.lower()}"
+
+
+def _table_spec(table):
+    if table == RESULTS_TABLE:
+        return TABLES["results"]
+    if table in (processed_table(m) for m in MODES):
+        return TABLES["processed"]
+    raise ValueError(f"Unknown table: {table}")
+
+
+def quote_ident(name):
+    """識別子 (テーブル名・列名) を SQL 用に引用符で囲む"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_type(series):
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(series):
+        return "REAL"
+    return "TEXT"
+
+
+def _sql_rows(df):
+    """
+    executemany に渡す行の反復にする (列ごとに Python の値のリストに変換する)
+
+    NaN は SQLite 側で NULL になる。日時は 'YYYY-MM-DD HH:MM:SS'、拡張型の欠損 (pd.NA) は None にする。
+    """
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime("%Y-%m-%d %H:%M:%S")
+        elif isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+            series = series.astype(object).where(series.notna(), None)
+        columns.append(series.tolist())
+    return zip(*columns)
+
+
+class ConnectionPool:
+    """
+    SQLite 接続のプール
+
+    接続は必要になったときに pool_size 本まで作り、返却されたものを使い回す。
+    上限まで貸し出し中の場合は返却を待つ。
+    """
+
+    def __init__(self, db_path, size=None):
+        self.db_path = db_path
+        self.size = size or CONFIG["pool_size"]
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=CONFIG["busy_timeout"], check_same_thread=False,
+                               cached_statements=CONFIG["cached_statements"])
+        conn.execute(f"PRAGMA busy_timeout = {int(CONFIG['busy_timeout'] * 1000)}")
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        except sqlite3.Error as e:
+            # 読み込み専用の場所などでは既定のジャーナルのまま使う
+            print(f"⚠️ WAL mode unavailable for {self.db_path}: {e}")
+        conn.execute(f"PRAGMA mmap_size = {int(CONFIG['mmap_size'])}")
+        conn.execute(f"PRAGMA cache_size = {-int(CONFIG['cache_size_kb'])}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def acquire(self):
+        if self._closed:
+            raise RuntimeError(f"Connection pool for {self.db_path} is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get(timeout=CONFIG["busy_timeout"])
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """空いている接続を閉じる (貸し出し中の接続は返却時に閉じる)"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class KeibaStorage:
+    """
+    レース結果と前処理済み特徴量のデータベース
+    """
+
+    def __init__(self, db_path=None, pool_size=None):
+        self.db_path = db_path or CONFIG["db_path"]
+        self.pool = ConnectionPool(self.db_path, pool_size)
+
+    # --- connections ---
+
+    @contextmanager
+    def connection(self):
+        """プールから接続を借りる (with を抜けると返却される。未コミットの変更は取り消される)"""
+        with self.pool.connection() as conn:
+            yield conn
+
+    @contextmanager
+    def transaction(self):
+        """1つのトランザクションで書き込む (例外時はロールバック)"""
+        with self.pool.connection() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def connect(self):
+        """プール外の専用接続 (プールと同じ PRAGMA 設定。呼び出し側で close() する)"""
+        return self.pool._open()
+
+    def close(self):
+        self.pool.close()
+
+    # --- generic ---
+
+    def query(self, sql, params=()):
+        """SELECT を実行して DataFrame を返す (値は params で渡す)"""
+        with self.connection() as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def execute(self, sql, params=()):
+        """書き込みの文を1つ実行してコミットする"""
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def table_exists(self, table):
+        with self.connection() as conn:
+            row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        return row is not None
+
+    def columns(self, table):
+        """テーブルの列名 (テーブルがなければ空)"""
+        with self.connection() as conn:
+            return [row[1] for row in conn.execute(f"PRAGMA table_info({quote_ident(table)})")]
+
+    def _table_columns(self, conn, table):
+        return [row[1] for row in conn.execute(f"PRAGMA table_info({quote_ident(table)})")]
+
+    def create_table(self, conn, table, df, spec=None):
+        """スキーマ定義とフレームの列からテーブルを作る (既にあれば何もしない)"""
+        key_types = (spec or _table_spec(table))["key"]
+        cols = [f"{quote_ident(c)} {key_types.get(c) or _sql_type(df[c])}" for c in df.columns]
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {quote_ident(table)} ({', '.join(cols)})")
+
+    def _add_missing_columns(self, conn, table, df, spec=None):
+        existing = set(self._table_columns(conn, table))
+        key_types = (spec or _table_spec(table))["key"]
+        for col in df.columns:
+            if col not in existing:
+                col_type = key_types.get(col) or _sql_type(df[col])
+                conn.execute(f"ALTER TABLE {quote_ident(table)} ADD COLUMN {quote_ident(col)} {col_type}")
+
+    def create_indexes(self, conn, table):
+        """スキーマ定義の索引のうち、テーブルにある列の分を作る"""
+        existing = set(self._table_columns(conn, table))
+        for col in _table_spec(table)["indexes"]:
+            if col in existing:
+                name = quote_ident(f"idx_{table}_{col}")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {quote_ident(table)}({quote_ident(col)})")
+
+    def ensure_unique_key(self, conn, table, dedupe=True):
+        """
+        upsert のキー (race_id, horse_id) の一意索引を作る
+
+        テーブルにキーの列がなければ作らない。一意索引のない既存のテーブル (to_sql で作ったもの) に
+        重複があれば、dedupe=True のときは後から書いた行を残して削除し、False のときは索引を作らずに残す。
+
+        Returns:
+            bool: 一意索引があるか
+        """
+        key = _table_spec(table)["unique"]
+        missing = [c for c in key if c not in self._table_columns(conn, table)]
+        if missing:
+            print(f"⚠️ {table}: no {missing} column(s), skipping the unique key")
+            return False
+        name = quote_ident(f"ux_{table}_key")
+        cols = ", ".join(quote_ident(c) for c in key)
+        sql = f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {quote_ident(table)}({cols})"
+        try:
+            conn.execute(sql)
+        except sqlite3.IntegrityError:
+            if not dedupe:
+                print(f"⚠️ {table}: duplicate ({', '.join(key)}) rows, skipping the unique key")
+                return False
+            removed = conn.execute(
+                f"DELETE FROM {quote_ident(table)} WHERE rowid NOT IN"
+                f" (SELECT MAX(rowid) FROM {quote_ident(table)} GROUP BY {cols})"
+            ).rowcount
+            print(f"⚠️ {table}: removed {removed} duplicate ({', '.join(key)}) rows before adding the unique key")
+            conn.execute(sql)
+        return True
+
+    def _replace_null_keys(self, conn, table, df, key, replaced):
+        """
+        キーに欠損 (NULL) がある行を upsert する
+
+        一意索引は NULL 同士を別の値として扱うため ON CONFLICT では更新されない。代わりに、同じキー
+        (NULL を含めて一致) の既存の行をこの取り込みで最初に出てきたときに削除してから追加する。
+
+        Args:
+            replaced: この取り込みで削除済みのキーの集合 (更新する)
+        """
+        keys = df[list(key)].astype(object).where(df[list(key)].notna(), None)
+        fresh = {k for k in keys.itertuples(index=False, name=None) if k not in replaced}
+        if fresh:
+            where = " AND ".join(f"{quote_ident(c)} IS ?" for c in key)
+            conn.executemany(f"DELETE FROM {quote_ident(table)} WHERE {where}", sorted(fresh, key=str))
+            replaced.update(fresh)
+
+    @contextmanager
+    def _ingest_pragmas(self, conn):
+        """一括取り込み中だけ同期を止め、ページキャッシュを大きくする (終了時に元に戻す)"""
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"PRAGMA cache_size = {-int(CONFIG['ingest_cache_kb'])}")
+        try:
+            yield
+        finally:
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute(f"PRAGMA cache_size = {-int(CONFIG['cache_size_kb'])}")
+
+    @staticmethod
+    def _insert_sql(table, columns, upsert_key=None):
+        names = ", ".join(quote_ident(c) for c in columns)
+        marks = ", ".join("?" * len(columns))
+        sql = f"INSERT INTO {quote_ident(table)} ({names}) VALUES ({marks})"
+        if upsert_key:
+            updates = [f"{quote_ident(c)} = excluded.{quote_ident(c)}" for c in columns if c not in upsert_key]
+            target = ", ".join(quote_ident(c) for c in upsert_key)
+            sql += f" ON CONFLICT ({target}) DO " + (f"UPDATE SET {', '.join(updates)}" if updates else "NOTHING")
+        return sql
+
+    def bulk_load(self, table, frames, how="upsert", progress_callback=None):
+        """
+        フレームの列 (反復可能) をテーブルに一括で取り込む
+
+        Args:
+            table: RESULTS_TABLE または processed_table(mode)
+            frames: DataFrame の反復 (Parquet のバッチなど。列は最初のフレームに揃える)
+            how: "upsert" (race_id, horse_id が同じ行は更新、それ以外は追加。テーブルは作り直さない。
+                 horse_id などキーに欠損がある行は、同じキーの既存の行をまとめて置き換える)
+                 / "replace" (作業用テーブルに取り込んでから差し替える。取り込み中も既存のテーブルを読める)
+                 / "append" (追加のみ)
+            progress_callback: function(str) 進捗通知
+
+        Returns:
+            dict: rows (取り込んだ行数), seconds, rows_per_sec
+        """
+        if how not in LOAD_MODES:
+            raise ValueError(f"how must be one of {LOAD_MODES}: {how}")
+        spec = _table_spec(table)
+        target = f"{table}__ingest" if how == "replace" else table
+        upsert_key = spec["unique"] if how == "upsert" else None
+
+        started = time.monotonic()
+        rows = pending = 0
+        columns = sql = None
+        replaced = set()   # upsert でキーに欠損がある行として置き換えたキー
+        with self.pool.connection() as conn, self._ingest_pragmas(conn):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if how == "replace":
+                    conn.execute(f"DROP TABLE IF EXISTS {quote_ident(target)}")
+                for df in frames:
+                    if df is None or df.empty:
+                        continue
+                    df = df.loc[:, ~df.columns.duplicated()]
+                    if columns is None:
+                        columns = list(df.columns)
+                        if upsert_key and not set(upsert_key) <= set(columns):
+                            raise ValueError(f"Upsert needs columns {upsert_key} in the input")
+                        self.create_table(conn, target, df, spec)
+                        self._add_missing_columns(conn, target, df, spec)
+                        if upsert_key:
+                            self.ensure_unique_key(conn, target)
+                        sql = self._insert_sql(target, columns, upsert_key)
+                    df = df.reindex(columns=columns)
+                    if upsert_key:
+                        null_key = df[list(upsert_key)].isna().any(axis=1)
+                        if null_key.any():
+                            self._replace_null_keys(conn, target, df[null_key], upsert_key, replaced)
+                    step = CONFIG["insert_chunk"]
+                    for start in range(0, len(df), step):
+                        conn.executemany(sql, _sql_rows(df.iloc[start:start + step]))
+                    rows += len(df)
+                    pending += len(df)
+                    if pending >= CONFIG["ingest_commit_rows"]:
+                        conn.commit()
+                        conn.execute("BEGIN IMMEDIATE")
+                        pending = 0
+                    elapsed = time.monotonic() - started
+                    msg = f"{table}: {rows:,} 行 | {rows / elapsed if elapsed > 0 else 0.0:,.0f} 行/s"
+                    print(msg)
+                    if progress_callback:
+                        progress_callback(msg)
+
+                if columns is None:
+                    # 入力が空の場合は何も変えない
+                    conn.rollback()
+                    return {"rows": 0, "seconds": time.monotonic() - started, "rows_per_sec": 0.0}
+                if how == "replace":
+                    conn.execute(f"DROP TABLE IF EXISTS {quote_ident(table)}")
+                    conn.execute(f"ALTER TABLE {quote_ident(target)} RENAME TO {quote_ident(table)}")
+                    # 取り込んだ行はそのまま残す (重複やキーの列がなければ一意索引を作らない)
+                    self.ensure_unique_key(conn, table, dedupe=False)
+                # 新しいテーブルの索引は取り込み後にまとめて作る (既存の索引はそのまま)
+                self.create_indexes(conn, table)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        elapsed = time.monotonic() - started
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        print(f"✅ {table}: {how} {rows:,} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+        return {"rows": rows, "seconds": elapsed, "rows_per_sec": rate}
+
+    def ingest_parquet(self, path, table, how="upsert", columns=None, batch_size=None, progress_callback=None):
+        """
+        Parquet ファイルをバッチで読みながら取り込む (ファイル全体をメモリに読まない)
+
+        Args:
+            path: Parquet ファイル
+            table: RESULTS_TABLE または processed_table(mode)
+            how: "upsert" / "replace" / "append" (bulk_load() を参照)
+            columns: 取り込む列 (省略時は全列)
+            batch_size: 1回に読む行数 (省略時は CONFIG["ingest_batch_rows"])
+            progress_callback: function(str) 進捗通知
+
+        Returns:
+            dict: bulk_load() の結果
+        """
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        batches = parquet.iter_batches(batch_size=batch_size or CONFIG["ingest_batch_rows"], columns=columns)
+        return self.bulk_load(table, (batch.to_pandas() for batch in batches), how, progress_callback)
+
+    def write_frame(self, table, df, if_exists="replace"):
+        """
+        フレームをテーブルに書き込む (bulk_load() を参照)
+
+        Args:
+            table: RESULTS_TABLE または processed_table(mode)
+            df: 書き込む DataFrame
+            if_exists: "replace" / "append" / "upsert"
+
+        Returns:
+            int: 書き込んだ行数
+        """
+        return self.bulk_load(table, [df], if_exists)["rows"]
+
+    # --- race results (race_results) ---
+
+    def save_results(self, df, if_exists="replace"):
+        """レース結果を保存する"""
+        return self.write_frame(RESULTS_TABLE, df, if_exists)
+
+    def race_results(self, race_id):
+        """レースの結果"""
+        return self.query(f"SELECT * FROM {RESULTS_TABLE} WHERE race_id = ?", (str(race_id),))
+
+    def horse_results(self, horse_id, limit=10):
+        """馬の過去走 (新しい順)"""
+        return self.query(f"SELECT * FROM {RESULTS_TABLE} WHERE horse_id = ? ORDER BY 日付 DESC LIMIT ?",
+                          (str(horse_id), int(limit)))
+
+    def results_between(self, start_date, end_date):
+        """日付範囲のレース結果 (新しい順)"""
+        return self.query(f"SELECT * FROM {RESULTS_TABLE} WHERE 日付 BETWEEN ? AND ? ORDER BY 日付 DESC",
+                          (start_date, end_date))
+
+    def results_by_venue(self, venue, limit=100):
+        """会場のレース結果 (新しい順)"""
+        return self.query(f"SELECT * FROM {RESULTS_TABLE} WHERE 会場 = ? ORDER BY 日付 DESC LIMIT ?",
+                          (venue, int(limit)))
+
+    def all_results(self):
+        return self.query(f"SELECT * FROM {RESULTS_TABLE}")
+
+    def results_stats(self):
+        """レース結果の件数と期間"""
+        with self.connection() as conn:
+            total, races, horses, first, last = conn.execute(
+                f"SELECT COUNT(*), COUNT(DISTINCT race_id), COUNT(DISTINCT horse_id), MIN(日付), MAX(日付)"
+                f" FROM {RESULTS_TABLE}"
+            ).fetchone()
+        return {"total_rows": total, "unique_races": races, "unique_horses": horses, "date_range": (first, last)}
+
+    # --- processed features (processed_data_{mode}) ---
+
+    def save_processed(self, df, mode="JRA", if_exists="replace"):
+        """前処理済みデータを保存する"""
+        return self.write_frame(processed_table(mode), df, if_exists)
+
+    def ingest_processed(self, path, mode="JRA", how="upsert", progress_callback=None):
+        """前処理済みの Parquet を取り込む (既定は (race_id, horse_id) で upsert)"""
+        return self.ingest_parquet(path, processed_table(mode), how, progress_callback=progress_callback)
+
+    def processed(self, mode="JRA", limit=None):
+        """前処理済みデータ (limit 省略時は全件)"""
+        sql = f"SELECT * FROM {processed_table(mode)}"
+        if limit:
+            return self.query(sql + " LIMIT ?", (int(limit),))
+        return self.query(sql)
+
+    def processed_race(self, race_id, mode="JRA"):
+        return self.query(f"SELECT * FROM {processed_table(mode)} WHERE race_id = ?", (str(race_id),))
+
+    def processed_horse(self, horse_id, mode="JRA", limit=10):
+        return self.query(f"SELECT * FROM {processed_table(mode)} WHERE horse_id = ? ORDER BY date DESC LIMIT ?",
+                          (str(horse_id), int(limit)))
+
+    def processed_stats(self, mode="JRA"):
+        """前処理済みデータの件数・期間・勝率"""
+        return self.query(
+            "SELECT COUNT(*) AS total_records, COUNT(DISTINCT race_id) AS unique_races,"
+            " COUNT(DISTINCT horse_id) AS unique_horses, MIN(date) AS earliest_date,"
+            f" MAX(date) AS latest_date, AVG(target_win) AS win_rate FROM {processed_table(mode)}"
+        ).iloc[0].to_dict()
+
+    def feature_names(self, mode="JRA"):
+        return self.columns(processed_table(mode))
+
+    def latest_date(self, mode="JRA"):
+        with self.connection() as conn:
+            row = conn.execute(f"SELECT MAX(date) FROM {processed_table(mode)}").fetchone()
+        return row[0] if row else None
+
+    def race_ids(self, mode="JRA"):
+        """
+        前処理済みデータにある race_id (文字列のリスト)
+
+        Raises:
+            LookupError: テーブルがない場合
+        """
+        table = processed_table(mode)
+        if not self.table_exists(table):
+            raise LookupError(f"Table '{table}' not found")
+        with self.connection() as conn:
+            return [str(row[0]) for row in conn.execute(f"SELECT DISTINCT race_id FROM {table}")]
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage(db_path=None):
+    """データベースファイルごとに1つのストレージ (接続プール) を共有する"""
+    path = os.path.abspath(db_path or CONFIG["db_path"])
+    with _storages_lock:
+        storage = _storages.get(path)
+        if storage is None:
+            storage = _storages[path] = KeibaStorage(path)
+        return storage
+
+
+def close():
+    """共有しているストレージの接続をすべて閉じる"""
+    with _storages_lock:
+        for storage in _storages.values():
+            storage.close()
+        _storages.clear()
+
+
+atexit.register(close)
@@ -0,0 +1,210 @@
+"""
+マルチプロセス一括取得 (ワーカープール)
+JRA/NAR のバックフィルを N 個のプロセスで並行に処理し、解析・DataFrame 構築 (GIL を保持する CPU 処理) をコア数に応じて分散する
+
+- タスクは共有のジョブキュー (job_queue.JobQueue, SQLite) から各ワーカーが取得する
+- リクエストの予算は rate_limit の共有バケット (ファイルロック) で全ワーカー合計に対して適用する。
+  ワーカー数を増やしても外部へのリクエストレートは変わらない
+- 各ワーカーは自分専用の断片 (parquet_sink, ファイル名にPIDを含む) に書き込み、統合はコーディネーターが最後に1回だけ行う
+- コーディネーター (呼び出し元のプロセス) はキューの件数・保存行数・行/秒を定期的に報告する
+
+    counts = run_backfill_pool("NAR", start_date, end_date, workers=8, target_path=CSV_FILE_PATH_NAR,
+                               subset=["race_id", "馬 番"], existing_race_ids=existing)
+
+ワーカーは spawn で起動する。http_client / response_cache / html_archive / pedigree_store / rate_limit / html_parse の設定と
+ホスト別の予算はコーディネーターのものを引き継ぐ (環境変数 KEIBA_HTTP_HOST_OVERRIDES も子プロセスに渡る)。
+"""
+
+import multiprocessing
+import os
+import time
+
+try:
+    import html_archive
+    import html_parse
+    import http_client
+    import pedigree_store
+    import rate_limit
+    import response_cache
+    from async_fetch import AsyncFetcher, run as run_async
+    from job_queue import JobQueue, drain_async
+    from parquet_sink import ParquetSink
+except ImportError:
+    from . import html_archive
+    from . import html_parse
+    from . import http_client
+    from . import pedigree_store
+    from . import rate_limit
+    from . import response_cache
+    from .async_fetch import AsyncFetcher, run as run_async
+    from .job_queue import JobQueue, drain_async
+    from .parquet_sink import ParquetSink
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SHARED_DIR = os.path.join(PROJECT_ROOT, "data", "rate_limit")
+
+# 変更は configure() 経由で行う
+CONFIG = {
+    "max_in_flight": 8,     # ワーカーごとの同時リクエスト数 (実際のレートは共有予算に従う)
+    "parse_workers": 2,     # ワーカーごとの解析スレッド数 (CPU並列はプロセス数で稼ぐ)
+    "batch_size": 16,       # ワーカーが一度に取得するタスク数
+    "idle_poll": 1.0,       # pending がないときに他のワーカーの完了を待つ間隔 (秒)
+    "report_interval": 5.0, # 進捗を報告する間隔 (秒)
+}
+
+
+def configure(**kwargs):
+    """
+    ワーカープールの設定を変更する
+
+    Args:
+        max_in_flight: ワーカーごとの同時リクエスト数
+        parse_workers: ワーカーごとの解析スレッド数
+        batch_size: 一度に取得するタスク数
+        idle_poll: 他のワーカーの完了を待つ間隔 (秒)
+        report_interval: 進捗の報告間隔 (秒)
+    """
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown worker_pool option(s): {sorted(unknown)}")
+    CONFIG.update(kwargs)
+
+
+def _settings():
+    """子プロセスに引き継ぐ設定 (spawn ではモジュールが読み直されるため明示的に渡す)"""
+    return {
+        "http_client": dict(http_client.CONFIG),
+        "response_cache": dict(response_cache.CONFIG),
+        "html_parse": dict(html_parse.CONFIG),
+        "html_archive": dict(html_archive.CONFIG),
+        "pedigree_store": dict(pedigree_store.CONFIG),
+        "rate_limit": dict(rate_limit.CONFIG),
+        "host_rates": dict(rate_limit.HOST_RATES),
+        "worker_pool": dict(CONFIG),
+    }
+
+
+def _apply_settings(settings):
+    http_client.configure(**settings["http_client"])
+    response_cache.configure(**settings["response_cache"])
+    html_parse.configure(**settings["html_parse"])
+    html_archive.configure(**settings["html_archive"])
+    pedigree_store.configure(**settings["pedigree_store"])
+    rate_limit.HOST_RATES.update(settings["host_rates"])
+    rate_limit.configure(**settings["rate_limit"])
+    configure(**settings["worker_pool"])
+
+
+def _worker_main(settings, mode, queue_path, target_path, subset, start_date, end_date, existing_race_ids, force):
+    """ワーカープロセスの本体: キューが空になり、他のワーカーの処理も終わるまでタスクを処理する"""
+    _apply_settings(settings)
+    try:
+        import auto_scraper
+    except ImportError:
+        from . import auto_scraper
+
+    queue = JobQueue(queue_path)
+    # 統合はコーディネーターが行う (ワーカーは断片を追記するだけ)
+    sink = ParquetSink(target_path, subset=subset, compact_every=0, dataset_mode=mode)
+
+    def save(df):
+        sink.append(df)
+
+    async def _drain():
+        async with AsyncFetcher(max_in_flight=CONFIG["max_in_flight"], parse_workers=CONFIG["parse_workers"]) as fetcher:
+            if mode == "NAR":
+                handlers = auto_scraper.nar_backfill_handlers(fetcher, save, existing_race_ids)
+            else:
+                handlers = auto_scraper.jra_backfill_handlers(fetcher, start_date=start_date, end_date=end_date,
+                                                              save_callback=save, existing_race_ids=existing_race_ids)
+            return await drain_async(queue, handlers, batch_size=CONFIG["batch_size"],
+                                     reset_discovered=force, idle_poll=CONFIG["idle_poll"])
+
+    try:
+        run_async(_drain())
+    finally:
+        auto_scraper.NAMES.close()
+        queue.close()
+    print(f"  [worker {os.getpid()}] done: {sink.rows_appended} rows")
+
+
+def _progress_line(queue, saved_rows, elapsed):
+    summary = ", ".join(
+        f"{kind}: {states.get('done', 0) + states.get('skipped', 0)}/{sum(states.values())}" for kind, states in queue.counts().items()
+    )
+    rate = saved_rows / elapsed if elapsed > 0 else 0.0
+    return f"進捗 {summary} | 保存 {saved_rows} 行 ({rate:.1f} 行/s) | {elapsed:.0f}s"
+
+
+def run_backfill_pool(mode, start_date, end_date, workers, target_path, subset, existing_race_ids=None,
+                      force=False, queue=None, progress_callback=None):
+    """
+    ジョブキューのタスクを N 個のワーカープロセスで処理する
+
+    探索タスク (nar_day / jra_month) は呼び出し元で queue に登録しておくこと。
+
+    Args:
+        mode: "NAR" / "JRA"
+        start_date, end_date: 対象期間 (datetime.date、JRA の開催日の絞り込みに使う)
+        workers: ワーカープロセス数
+        target_path: 保存先の Parquet ファイル (mode のデータベース)
+        subset: 重複判定に使う列 (ParquetSink)
+        existing_race_ids: 取得済みの race_id (スキップする)
+        force: True の場合、処理済みのタスクが再発見されたら再取得する
+        queue: JobQueue (省略時は既定のキュー)
+        progress_callback: function(str) 進捗通知
+
+    Returns:
+        dict: queue.counts()
+    """
+    own_queue = queue is None
+    queue = queue or JobQueue()
+    # 最後の統合で分割データセットと戦績索引も更新する (作成済みの場合)
+    sink = ParquetSink(target_path, subset=subset, compact_every=0, dataset_mode=mode)
+
+    # 全ワーカーで1つの予算を共有する
+    if not rate_limit.CONFIG["shared_dir"]:
+        rate_limit.configure(shared_dir=DEFAULT_SHARED_DIR)
+    rate_limit.reset_shared_state()
+
+    ctx = multiprocessing.get_context("spawn")
+    settings = _settings()
+    args = (settings, mode, queue.db_path, target_path, list(subset), start_date, end_date,
+            existing_race_ids, force)
+    procs = [ctx.Process(target=_worker_main, args=args, name=f"scrape-worker-{i}") for i in range(workers)]
+
+    print(f"=== Worker pool: {workers} process(es), shared budget in {rate_limit.CONFIG['shared_dir']} ===")
+    base_rows = sink.row_count()
+    started = time.monotonic()
+    for p in procs:
+        p.start()
+
+    try:
+        while any(p.is_alive() for p in procs):
+            for p in procs:
+                p.join(timeout=CONFIG["report_interval"] / len(procs))
+            msg = _progress_line(queue, sink.row_count() - base_rows, time.monotonic() - started)
+            print(msg)
+            if progress_callback:
+                progress_callback(msg)
+    except KeyboardInterrupt:
+        print("Interrupted: stopping workers (progress is kept in the job queue)")
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join()
+        raise
+    finally:
+        failed = [p for p in procs if p.exitcode not in (0, None)]
+        for p in failed:
+            print(f"⚠️ {p.name} exited with code {p.exitcode}")
+
+    # 異常終了したワーカーのタスクは次回の実行で再開される
+    queue.release_stale()
+    counts = queue.counts()
+    sink.close()
+    if own_queue:
+        queue.close()
+    print(f"Worker pool finished in {time.monotonic() - started:.0f}s")
+    return counts
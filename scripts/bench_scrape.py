@@ -0,0 +1,325 @@
+"""
+スクレイピング処理のオフラインベンチマーク
+ローカルのフィクスチャーサーバー (scripts/fixture_server.py) に向けて実際のスクレイピング経路を実行し、
+ページ/秒・解析時間 (ms/ページ)・メモリ使用量を計測する。本番サイトには一切アクセスしない。
+
+シナリオ:
+    race_result / race_result_async   レース結果 + 全出走馬の戦績・血統
+    shutuba                           出馬表 (オッズ・戦績の付与を含む)
+    odds                              オッズ (JRA は API、NAR は HTML)
+    nar_year / nar_year_async         NAR 一括取得 (開催日一覧 → レース)
+    jra_year / jra_year_async         JRA 一括取得 (月 → 開催日 → レース)
+    parse                             各ページ種別の解析のみ (通信なし)
+
+Usage:
+    python scripts/bench_scrape.py
+    python scripts/bench_scrape.py --latency 0.05 --jitter 0.05 --error-rate 0.02
+    python scripts/bench_scrape.py --scenario nar_year --scenario nar_year_async --days 3
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scraper'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import auto_scraper
+import html_archive
+import http_client
+import odds_store
+import pedigree_store
+import jra_scraper
+import rate_limit
+import response_cache
+from async_fetch import AsyncFetcher, run as run_async
+from fixture_server import FixtureServer
+from name_resolver import NameResolver, NameStore
+from race_scraper import RaceScraper
+
+BENCH_HOSTS = ["race.netkeiba.com", "nar.netkeiba.com", "db.netkeiba.com", "www.jra.go.jp"]
+START_DATE = datetime.date(2025, 1, 5)
+
+
+def _jra_race_ids(n):
+    # 2025年 東京 (05) 5回 1日目から12レースずつ
+    return [f"202505050{1 + i // 12}{1 + i % 12:02d}" for i in range(n)]
+
+
+def _nar_race_ids(server, n):
+    ids = []
+    day = START_DATE
+    while len(ids) < n:
+        _, _, html = server.page("nar.netkeiba.com", "/top/race_list_sub.html", {"kaisai_date": day.strftime("%Y%m%d")})
+        ids.extend(auto_scraper.parse_race_list_ids(html))
+        day += datetime.timedelta(days=1)
+    return ids[:n]
+
+
+def _reset_state(tmp_dir):
+    """シナリオ間でプロセス内キャッシュを捨てる (毎回同じ条件で計測する)"""
+    auto_scraper.HORSE_HISTORY_CACHE.clear()
+    auto_scraper.HORSE_PROFILE_CACHE.clear()
+    if auto_scraper.NAMES is not None:
+        auto_scraper.NAMES.close()
+    db_path = os.path.join(tmp_dir, f"names-{time.time_ns()}.db")
+    auto_scraper.NAMES = NameResolver(NameStore(db_path, legacy_json_path=None))
+    pedigree_store.configure(db_path=os.path.join(tmp_dir, f"pedigree-{time.time_ns()}.db"))
+
+
+def build_scenarios(server, args):
+    """{名前: (説明, 実行関数)}。実行関数は保存した行数を返す"""
+    end_date = START_DATE + datetime.timedelta(days=args.days - 1)
+    jra_ids = _jra_race_ids(args.races)
+    nar_ids = _nar_race_ids(server, args.races)
+
+    def _collector():
+        rows = []
+        return rows, lambda df: rows.append(len(df))
+
+    def race_result():
+        total = 0
+        for rid in jra_ids:
+            df = auto_scraper.scrape_race_data(rid, mode="JRA")
+            total += 0 if df is None else len(df)
+        for rid in nar_ids:
+            df = auto_scraper.scrape_race_data(rid, mode="NAR")
+            total += 0 if df is None else len(df)
+        return total
+
+    def race_result_async():
+        async def _all():
+            async with AsyncFetcher(max_in_flight=args.in_flight) as fetcher:
+                jobs = [auto_scraper.scrape_race_data_async(rid, fetcher, mode="JRA") for rid in jra_ids]
+                jobs += [auto_scraper.scrape_race_data_async(rid, fetcher, mode="NAR") for rid in nar_ids]
+                return await asyncio.gather(*jobs)
+        return sum(0 if df is None else len(df) for df in run_async(_all()))
+
+    def shutuba():
+        total = 0
+        for rid in jra_ids:
+            df = auto_scraper.scrape_shutuba_data(rid, mode="JRA", history_df=pd.DataFrame())
+            total += 0 if df is None else len(df)
+        return total
+
+    def odds():
+        total = 0
+        for rid in jra_ids:
+            total += len(auto_scraper.scrape_odds_for_race(rid, mode="JRA") or [])
+        for rid in nar_ids:
+            total += len(auto_scraper.scrape_odds_for_race(rid, mode="NAR") or [])
+        return total
+
+    def nar_year():
+        rows, save = _collector()
+        auto_scraper.scrape_nar_year("2025", START_DATE, end_date, save_callback=save)
+        return sum(rows)
+
+    def nar_year_async():
+        rows, save = _collector()
+
+        async def _all():
+            async with AsyncFetcher(max_in_flight=args.in_flight) as fetcher:
+                await auto_scraper.scrape_nar_year_async("2025", fetcher, START_DATE, end_date, save_callback=save)
+        run_async(_all())
+        return sum(rows)
+
+    def jra_year():
+        rows, save = _collector()
+        jra_scraper.scrape_jra_year("2025", START_DATE, end_date, save_callback=save)
+        return sum(rows)
+
+    def jra_year_async():
+        rows, save = _collector()
+
+        async def _all():
+            async with AsyncFetcher(max_in_flight=args.in_flight) as fetcher:
+                await jra_scraper.scrape_jra_year_async("2025", fetcher, START_DATE, end_date, save_callback=save)
+        run_async(_all())
+        return sum(rows)
+
+    return {
+        "race_result": (f"{len(jra_ids)} JRA + {len(nar_ids)} NAR results", race_result),
+        "race_result_async": (f"{len(jra_ids)} JRA + {len(nar_ids)} NAR results (async)", race_result_async),
+        "shutuba": (f"{len(jra_ids)} JRA cards", shutuba),
+        "odds": (f"{len(jra_ids)} JRA (API) + {len(nar_ids)} NAR (HTML)", odds),
+        "nar_year": (f"NAR {args.days} day(s)", nar_year),
+        "nar_year_async": (f"NAR {args.days} day(s) (async)", nar_year_async),
+        "jra_year": (f"JRA {args.days} day(s)", jra_year),
+        "jra_year_async": (f"JRA {args.days} day(s) (async)", jra_year_async),
+    }
+
+
+def _max_rss_mb():
+    if resource is None:
+        return float("nan")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_scenario(server, name, desc, func, args, tmp_dir):
+    _reset_state(tmp_dir)
+    server.reset_stats()
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    out = io.StringIO()
+    redirect = contextlib.redirect_stdout(out) if args.quiet else contextlib.nullcontext()
+    t0 = time.perf_counter()
+    with redirect:
+        rows = func()
+        auto_scraper.NAMES.close()
+    elapsed = time.perf_counter() - t0
+
+    peak_mb = float("nan")
+    if args.tracemalloc:
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    stats = dict(server.stats)
+    return {
+        "scenario": name,
+        "desc": desc,
+        "seconds": elapsed,
+        "pages": stats["requests"],
+        "errors": stats["errors"],
+        "pages_per_s": stats["requests"] / elapsed if elapsed > 0 else 0.0,
+        "mb_per_s": stats["bytes"] / elapsed / (1024 * 1024) if elapsed > 0 else 0.0,
+        "rows": rows,
+        "peak_mb": peak_mb,
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+
+def bench_parse(server, iterations):
+    """ページ種別ごとの解析時間 (通信なし)"""
+    scraper = RaceScraper()
+    jra_rid = _jra_race_ids(1)[0]
+    nar_rid = _nar_race_ids(server, 1)[0]
+    day = START_DATE.strftime("%Y%m%d")
+    jra_day_cname = f"pw01srl1005{START_DATE.year}0101{day}/00"
+    jra_race_cname = f"pw01sde1005{START_DATE.year}010101{day}/00"
+    jra_race_url = f"{jra_scraper.JRA_BASE_URL}?CNAME={jra_race_cname}"
+    horse_id = scraper_horse_id(server, jra_rid)
+
+    cases = [
+        ("race_result", ("race.netkeiba.com", "/race/result.html", {"race_id": jra_rid}),
+         lambda html: auto_scraper.parse_race_result(html, jra_rid)),
+        ("horse_result", ("db.netkeiba.com", f"/horse/result/{horse_id}/", {}),
+         lambda html: scraper.parse_past_races(html, n_samples=None)),
+        ("horse_ped", ("db.netkeiba.com", f"/horse/ped/{horse_id}/", {}),
+         scraper.parse_horse_profile),
+        ("race_list", ("nar.netkeiba.com", "/top/race_list_sub.html", {"kaisai_date": day}),
+         auto_scraper.parse_race_list_ids),
+        ("odds_html", ("nar.netkeiba.com", "/odds/index.html", {"race_id": nar_rid}),
+         auto_scraper.parse_odds_html),
+        ("jra_month", ("www.jra.go.jp", "/JRADB/accessS.html", {"cname": f"pw01skl10{START_DATE:%Y%m}/3F"}),
+         jra_scraper.parse_jra_month_page),
+        ("jra_day", ("www.jra.go.jp", "/JRADB/accessS.html", {"cname": jra_day_cname}),
+         jra_scraper.parse_jra_day_page),
+        ("jra_result", ("www.jra.go.jp", "/JRADB/accessS.html", {"cname": jra_race_cname}),
+         lambda html: jra_scraper.parse_jra_race(html, jra_race_url)),
+    ]
+
+    results = []
+    for kind, (host, path, params), parse in cases:
+        _, _, html = server.page(host, path, params)
+        with contextlib.redirect_stdout(io.StringIO()):
+            parse(html)  # ウォームアップ
+            t0 = time.perf_counter()
+            for _ in range(iterations):
+                parse(html)
+            elapsed = time.perf_counter() - t0
+        results.append((kind, len(html.encode("utf-8")), elapsed / iterations * 1000))
+    return results
+
+
+def scraper_horse_id(server, race_id):
+    _, _, html = server.page("race.netkeiba.com", "/race/result.html", {"race_id": race_id})
+    return str(auto_scraper.parse_race_result(html, race_id)["horse_id"].iloc[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline scraping throughput benchmark")
+    parser.add_argument("--scenario", action="append", help="Run only these scenarios (repeatable; 'parse' for parsing only)")
+    parser.add_argument("--races", type=int, default=6, help="Races per scenario for result/shutuba/odds")
+    parser.add_argument("--days", type=int, default=1, help="Days for the bulk (year) scenarios")
+    parser.add_argument("--rows", type=int, default=14, help="Runners per race")
+    parser.add_argument("--latency", type=float, default=0.0, help="Server delay per response (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random server delay up to this (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 503")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Per-host request budget (req/s)")
+    parser.add_argument("--in-flight", type=int, default=8, help="AsyncFetcher max_in_flight")
+    parser.add_argument("--parse-iterations", type=int, default=20, help="Iterations per page kind for 'parse'")
+    parser.add_argument("--tracemalloc", action="store_true", help="Record Python heap peak per scenario (slower)")
+    parser.add_argument("--verbose", action="store_true", help="Show scraper output")
+    args = parser.parse_args()
+    args.quiet = not args.verbose
+
+    server = FixtureServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           rows=args.rows).start()
+    tmp_dir = tempfile.mkdtemp(prefix="bench_scrape_")
+    try:
+        response_cache.configure(enabled=False)
+        html_archive.configure(archive_dir=os.path.join(tmp_dir, "archive"))
+        odds_store.configure(root=os.path.join(tmp_dir, "odds"))
+        http_client.configure(host_overrides={"*": server.base_url}, backoff_factor=0.05)
+        for host in BENCH_HOSTS:
+            rate_limit.configure_host(host, args.rate, max(1, int(args.rate)))
+
+        print(f"Fixture server: {server.base_url} (latency={args.latency}s jitter={args.jitter}s "
+              f"error_rate={args.error_rate}) rate={args.rate}/s in_flight={args.in_flight}")
+
+        scenarios = build_scenarios(server, args)
+        selected = args.scenario or list(scenarios) + ["parse"]
+        unknown = set(selected) - set(scenarios) - {"parse"}
+        if unknown:
+            print(f"Unknown scenario(s): {sorted(unknown)}. Available: {list(scenarios) + ['parse']}")
+            return 1
+
+        results = []
+        for name in selected:
+            if name == "parse":
+                continue
+            desc, func = scenarios[name]
+            print(f"▶ {name}: {desc} ...", flush=True)
+            results.append(run_scenario(server, name, desc, func, args, tmp_dir))
+
+        if results:
+            print()
+            print(f"{'scenario':18s} {'sec':>7s} {'pages':>6s} {'err':>4s} {'pages/s':>8s} {'MB/s':>6s} "
+                  f"{'rows':>6s} {'heap MB':>8s} {'rss MB':>7s}")
+            for r in results:
+                print(f"{r['scenario']:18s} {r['seconds']:7.2f} {r['pages']:6d} {r['errors']:4d} "
+                      f"{r['pages_per_s']:8.1f} {r['mb_per_s']:6.2f} {r['rows']:6d} "
+                      f"{r['peak_mb']:8.1f} {r['max_rss_mb']:7.1f}")
+
+        if "parse" in selected:
+            print()
+            print(f"{'page kind':13s} {'KB':>6s} {'ms/page':>8s}")
+            for kind, size, ms in bench_parse(server, args.parse_iterations):
+                print(f"{kind:13s} {size / 1024:6.1f} {ms:8.2f}")
+        return 0
+    finally:
+        if auto_scraper.NAMES is not None:
+            auto_scraper.NAMES.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+レース結果の Parquet から年・開催場で分割したデータセットを作る (scraper/race_dataset.py)
+作成後は読み込み側が期間・開催場・馬・列の条件で必要な部分だけを読む。以降の追記分は
+スクレイパーの統合 (ParquetSink.compact) のたびに該当パーティションだけが更新される。
+
+Usage:
+    python scripts/build_dataset.py --mode JRA                  # data/raw/database.parquet -> data/raw/dataset/JRA
+    python scripts/build_dataset.py --mode NAR --source other.parquet
+    python scripts/build_dataset.py --mode JRA --summary        # パーティションの一覧
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scraper'))
+
+import race_dataset
+
+
+def print_summary(mode):
+    parts = race_dataset.partitions(mode)
+    if not parts:
+        print(f"No {mode} dataset ({race_dataset.dataset_path(mode)})")
+        return
+    meta = race_dataset.info(mode) or {}
+    print(f"{mode} dataset: {meta.get('rows', 0)} rows, updated {meta.get('updated_at', '?')}")
+    print(f"{'year':>6s} {'venue':10s} {'rows':>9s} {'row groups':>11s}")
+    for p in parts:
+        print(f"{p['year']:6d} {p['venue']:10s} {p['rows']:9d} {p['row_groups']:11d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the year/venue partitioned race results dataset")
+    parser.add_argument("--mode", choices=["JRA", "NAR"], required=True, help="Database to partition")
+    parser.add_argument("--source", help="Parquet to read (default: data/raw/database[_nar].parquet)")
+    parser.add_argument("--root", help="Dataset directory (default: data/raw/dataset)")
+    parser.add_argument("--row-group-size", type=int, default=None, help="Rows per row group")
+    parser.add_argument("--summary", action="store_true", help="Only list the partitions")
+    args = parser.parse_args()
+
+    if args.root:
+        race_dataset.configure(root=args.root)
+    if args.row_group_size:
+        race_dataset.configure(row_group_size=args.row_group_size)
+
+    if not args.summary:
+        race_dataset.build(args.mode, source=args.source, progress_callback=print)
+    print_summary(args.mode)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
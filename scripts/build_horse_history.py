@@ -0,0 +1,50 @@
+"""
+馬ごとの戦績索引を作る (scraper/horse_history.py)
+出馬表の補完は、索引があればデータベース全体を読み込まずに各馬の出走をメモリマップから取り出す。
+以降の追記分はスクレイパーの統合 (ParquetSink.compact) のたびに索引へ加えられる。
+
+Usage:
+    python scripts/build_horse_history.py --mode JRA
+    python scripts/build_horse_history.py --mode NAR --show 2019100001 --before 2025-07-26
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scraper'))
+
+import horse_history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the memory-mapped horse history index")
+    parser.add_argument("--mode", choices=["JRA", "NAR"], required=True, help="Database to index")
+    parser.add_argument("--root", help="Index directory (default: data/raw/history)")
+    parser.add_argument("--show", help="Print the runs of this horse_id instead of building")
+    parser.add_argument("--before", help="With --show: only runs before this date (YYYY-MM-DD)")
+    parser.add_argument("--limit", type=int, default=None, help="With --show: latest N runs")
+    args = parser.parse_args()
+
+    if args.root:
+        horse_history.configure(root=args.root)
+
+    if not args.show:
+        horse_history.build(args.mode)
+        return 0
+
+    started = time.perf_counter()
+    history = horse_history.get_history(args.mode)
+    if history is None:
+        print(f"No {args.mode} horse history. Build it first: python scripts/build_horse_history.py --mode {args.mode}")
+        return 1
+    runs = history.runs(args.show, before=args.before, limit=args.limit)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(runs.drop(columns=["date_obj"]).to_string(index=False))
+    print(f"{len(runs)} run(s) in {elapsed:.1f} ms ({history.meta['horses']} horses, {history.meta['rows']} runs indexed)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
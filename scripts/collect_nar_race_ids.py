@@ -4,16 +4,20 @@ NAR 2022-2026年の実際のrace_idを収集
 netkeibaのトップページやカレンダーから実際のIDを取得
 """
 
-import requests
+import os
+import sys
 from bs4 import BeautifulSoup
 import re
 import time
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scraper import http_client
+
 def get_race_ids_from_url(url):
     """URLからrace_idを抽出"""
     try:
-        resp = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
-        resp.encoding = 'EUC-JP'
+        resp = http_client.get(url)
         soup = BeautifulSoup(resp.text, 'html.parser')
         
         links = soup.find_all('a', href=True)
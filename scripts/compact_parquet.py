@@ -0,0 +1,62 @@
+"""
+レース結果の Parquet をストリーミングで重複排除・統合する (scraper/parquet_compact.py)
+ファイル全体を読み込まないため、メモリはキー数 (1キー 16 バイト) に比例し、データベースの大きさによらない。
+
+Usage:
+    python scripts/compact_parquet.py --mode JRA                 # ベース + 未統合の断片を統合 (ParquetSink)
+    python scripts/compact_parquet.py --mode NAR --dataset       # 分割データセットの各パーティション
+    python scripts/compact_parquet.py --target other.parquet --keys race_id horse_id
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scraper'))
+
+import parquet_compact
+import race_dataset
+from parquet_sink import ParquetSink
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming deduplication and compaction of race result Parquet files")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--mode", choices=["JRA", "NAR"], help="Compact data/raw/database[_nar].parquet and its fragments")
+    target.add_argument("--target", help="Deduplicate this Parquet file in place")
+    parser.add_argument("--dataset", action="store_true", help="With --mode: compact the partitioned dataset instead")
+    parser.add_argument("--keys", nargs="+", help="Key columns (default: the database's dedup subset)")
+    parser.add_argument("--batch-rows", type=int, default=None, help="Rows read per batch")
+    args = parser.parse_args()
+
+    if args.batch_rows:
+        parquet_compact.configure(batch_rows=args.batch_rows)
+
+    if args.target:
+        stats = parquet_compact.deduplicate([args.target], args.target,
+                                            keys=args.keys or parquet_compact.DEFAULT_KEYS, progress_callback=print)
+        print(f"{args.target}: {stats['rows_in']} -> {stats['rows_out']} rows "
+              f"({stats['keys']} keys, {stats['key_bytes'] / 1e6:.1f} MB key index, {stats['seconds']:.1f}s)")
+        return 0
+
+    if args.dataset:
+        try:
+            stats = parquet_compact.compact_dataset(args.mode, keys=args.keys, progress_callback=print)
+        except FileNotFoundError as e:
+            print(e)
+            return 1
+        print(f"{args.mode} dataset: {stats['partitions']} partition(s), {stats['rows_in']} -> {stats['rows_out']} rows "
+              f"({stats['seconds']:.1f}s)")
+        return 0
+
+    path, subset = race_dataset.SOURCES[args.mode]
+    sink = ParquetSink(path, subset=args.keys or subset, compact_every=0, dataset_mode=args.mode)
+    total = sink.compact(streaming=True, force=True)
+    if total is None:
+        print(f"Nothing to compact ({path})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,441 @@
+"""
+ローカル HTTP スタンドインサーバー (ベンチマーク・オフライン検証用)
+data/test/fixtures のテンプレートから netkeiba / JRA のページを生成して返す
+
+http_client のホスト差し替え (host_overrides) と組み合わせて使う:
+    server = FixtureServer(latency=0.05, error_rate=0.02).start()
+    http_client.configure(host_overrides={"*": server.base_url})
+
+リクエストは "{base}/{元のホスト}{パス}" の形で届く。race_id・horse_id・日付に応じて
+内容 (馬・日付・会場) が決まるため、同じURLには常に同じページを返す。
+
+テンプレートの書式:
+    {{name}}                               値の埋め込み
+    <!--repeat:rows--> ... <!--/repeat:rows-->   行ごとに繰り返すブロック
+
+Usage:
+    python scripts/fixture_server.py --port 8765 --latency 0.05 --error-rate 0.02
+    KEIBA_HTTP_HOST_OVERRIDES="*=http://127.0.0.1:8765" python scraper/auto_scraper.py --mode NAR ...
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "scraper"))
+
+from http_client import HOST_CHARSETS  # noqa: E402
+
+FIXTURE_DIR = os.path.join(PROJECT_ROOT, "data", "test", "fixtures")
+
+JRA_VENUES = {
+    "01": "札幌", "02": "函館", "03": "福島", "04": "新潟", "05": "東京",
+    "06": "中山", "07": "中京", "08": "京都", "09": "阪神", "10": "小倉",
+}
+NAR_VENUES = {
+    "30": "門別", "35": "盛岡", "42": "浦和", "43": "船橋", "44": "大井",
+    "45": "川崎", "46": "金沢", "47": "笠松", "48": "名古屋", "50": "園田", "54": "高知", "55": "佐賀",
+}
+
+_TOKEN = re.compile(r"\{\{(\w+)\}\}")
+_REPEAT = re.compile(r"<!--repeat:(\w+)-->(.*?)<!--/repeat:\1-->", re.S)
+
+
+def _hash(*parts):
+    return zlib.crc32("/".join(str(p) for p in parts).encode())
+
+
+def render(template, values, blocks=None):
+    """
+    テンプレートを展開する
+
+    Args:
+        template: テンプレート文字列
+        values: {name: 値}
+        blocks: {ブロック名: [行ごとの値 dict]}
+    """
+    blocks = blocks or {}
+
+    def _block(m):
+        return "".join(render(m.group(2), {**values, **row}) for row in blocks.get(m.group(1), []))
+
+    text = _REPEAT.sub(_block, template)
+    return _TOKEN.sub(lambda m: str(values.get(m.group(1), "")), text)
+
+
+class FixtureServer:
+    """
+    テンプレートからページを生成する HTTP サーバー (別スレッドで動作)
+
+    stats に処理件数 (requests, errors, bytes, kinds) を記録する。
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_statuses=(503,), retry_after=0, rows=14, races_per_day=12, venues_per_day=2,
+                 history_rows=20, horse_pool=5000, seed=0):
+        """
+        Args:
+            host, port: 待ち受けアドレス (port=0 は空きポート)
+            latency: 応答までの固定遅延 (秒)
+            jitter: 遅延に加える一様乱数の上限 (秒)
+            error_rate: エラーを返す確率 (0〜1)
+            error_statuses: 返すエラーのステータス (429 / 503 など)
+            retry_after: エラー時の Retry-After ヘッダー (秒)
+            rows: 1レースの頭数
+            races_per_day: 1会場あたりのレース数
+            venues_per_day: 1日あたりの開催会場数
+            history_rows: 馬の戦績の行数
+            horse_pool: 馬の総数 (レース間で同じ馬が出走し、馬単位のキャッシュが効く)
+            seed: エラー注入の乱数シード
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.retry_after = retry_after
+        self.rows = rows
+        self.races_per_day = races_per_day
+        self.venues_per_day = venues_per_day
+        self.history_rows = history_rows
+        self.horse_pool = horse_pool
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0, "kinds": {}}
+        self.templates = {}
+        for name in os.listdir(FIXTURE_DIR):
+            with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+                self.templates[os.path.splitext(name)[0]] = f.read()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server._handle(self, b"")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                server._handle(self, self.rfile.read(length))
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {"requests": 0, "errors": 0, "bytes": 0, "kinds": {}}
+
+    # --- request handling ---
+
+    def _handle(self, handler, body):
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        parts = urlsplit(handler.path)
+        host, _, path = parts.path.lstrip("/").partition("/")
+        params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        params.update({k: v[0] for k, v in parse_qs(body.decode("ascii", "ignore")).items()})
+
+        with self._lock:
+            self.stats["requests"] += 1
+            inject = self.error_rate and self._random.random() < self.error_rate
+            status = self._random.choice(self.error_statuses) if inject else None
+
+        if status is not None:
+            with self._lock:
+                self.stats["errors"] += 1
+            self._send(handler, status, b"error", "text/plain", {"Retry-After": str(self.retry_after)})
+            return
+
+        page = self.page(host, "/" + path, params)
+        if page is None:
+            self._send(handler, 404, b"not found", "text/plain")
+            return
+        kind, content_type, text = page
+        payload = text.encode(HOST_CHARSETS.get(host, "utf-8"), errors="replace")
+        with self._lock:
+            self.stats["bytes"] += len(payload)
+            self.stats["kinds"][kind] = self.stats["kinds"].get(kind, 0) + 1
+        # charset は付けない (http_client がホストの既知の文字コードで解釈する)
+        self._send(handler, 200, payload, content_type)
+
+    def _send(self, handler, status, payload, content_type, headers=None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    # --- page generation ---
+
+    def page(self, host, path, params):
+        """
+        URLに対応するページを生成する
+
+        Returns:
+            (種別, Content-Type, 本文) / 対応するページがなければ None
+        """
+        if host in ("race.netkeiba.com", "nar.netkeiba.com"):
+            nar = host.startswith("nar")
+            race_id = params.get("race_id", "")
+            if path == "/race/result.html":
+                return "race_result", "text/html", self._race_page("race_result", race_id, nar)
+            if path == "/race/shutuba.html":
+                return "shutuba", "text/html", self._race_page("shutuba", race_id, nar)
+            if path == "/odds/index.html":
+                return "odds_html", "text/html", self._race_page("odds_index", race_id, nar)
+            if path == "/api/api_get_jra_odds.html":
+                return "odds_api", "application/json", self._odds_api(race_id, params.get("type", "1"))
+            if path == "/top/race_list_sub.html":
+                return "race_list", "text/html", self._race_list(params.get("kaisai_date", ""), nar)
+        elif host == "db.netkeiba.com":
+            m = re.match(r"/horse/result/(\d+)", path)
+            if m:
+                return "horse_result", "text/html", self._horse_result(m.group(1))
+            m = re.match(r"/horse/ped/(\d+)", path)
+            if m:
+                return "horse_ped", "text/html", self._horse_ped(m.group(1))
+            m = re.match(r"/(jockey|trainer)/(?:result/recent/)?(\w+)", path)
+            if m:
+                role = "騎手" if m.group(1) == "jockey" else "調教師"
+                return "profile", "text/html", render(
+                    self.templates["profile"], {"full_name": f"{role}{m.group(2)}", "role": role})
+        elif host == "www.jra.go.jp" and path == "/JRADB/accessS.html":
+            cname = params.get("cname") or params.get("CNAME") or ""
+            if cname.startswith("pw01skl"):
+                return "jra_month", "text/html", self._jra_month(cname)
+            if cname.startswith("pw01srl"):
+                return "jra_day", "text/html", self._jra_day(cname)
+            if cname.startswith("pw01sde"):
+                return "jra_race", "text/html", self._jra_race(cname)
+        return None
+
+    def _horse_id(self, key, i):
+        return str(2015000000 + _hash(key, i) % self.horse_pool)
+
+    def _race_values(self, race_id, nar):
+        venues = NAR_VENUES if nar else JRA_VENUES
+        code = race_id[4:6]
+        venue = venues.get(code) or list(venues.values())[_hash(code) % len(venues)]
+        if nar and len(race_id) == 12 and race_id[6:10].isdigit():
+            # NAR の race_id は YYYY PP MMDD RR
+            try:
+                day = date(int(race_id[:4]), int(race_id[6:8]), int(race_id[8:10]))
+            except ValueError:
+                day = date(int(race_id[:4] or 2025), 1, 1)
+        else:
+            day = date(int(race_id[:4] or 2025), 1, 1) + timedelta(days=_hash(race_id[:10]) % 360)
+        distance = 1000 + 200 * (_hash(race_id, "d") % 10)
+        return {
+            "race_id": race_id,
+            "date": day.strftime("%Y/%m/%d"),
+            "date_jp": f"{day.year}年{day.month}月{day.day}日",
+            "venue": venue,
+            "other_venue": "阪神" if venue != "阪神" else "中山",
+            "race_num": int(race_id[-2:] or 1),
+            "race_name": f"ベンチマーク{int(race_id[-2:] or 1)}R",
+            "surface": "ダ" if nar or distance < 1400 else "芝",
+            "surface_long": "ダート" if nar or distance < 1400 else "芝",
+            "distance": distance,
+            "rotation": "右",
+            "stable": "大井" if nar else "美浦",
+        }
+
+    def _entry_rows(self, key):
+        rows = []
+        for i in range(1, self.rows + 1):
+            odds = 1.5 + (_hash(key, i, "o") % 2000) / 10
+            hid = self._horse_id(key, i)
+            rows.append({
+                "i": i,
+                "i2": f"{i:02d}",
+                "waku": (i + 1) // 2,
+                "horse_id": hid,
+                "horse_name": f"ホース{hid[-4:]}",
+                "jockey_id": f"{_hash(key, i, 'j') % 300:05d}",
+                "trainer_id": f"{_hash(key, i, 't') % 300:05d}",
+                "odds": f"{odds:.1f}",
+                "odds_min": f"{1 + odds / 5:.1f}",
+                "odds_max": f"{1 + odds / 3:.1f}",
+                "margin": "" if i == 1 else "1/2",
+            })
+        return rows
+
+    def _race_page(self, template, race_id, nar):
+        values = self._race_values(race_id, nar)
+        return render(self.templates[template], values, {"rows": self._entry_rows(race_id)})
+
+    def _odds_api(self, race_id, odds_type):
+        values = {**self._race_values(race_id, False), "odds_type": odds_type}
+        rows = self._entry_rows(race_id)
+        if odds_type == "2":
+            # 複勝は [下限, 上限, 人気]
+            rows = [{**row, "odds": row["odds_min"]} for row in rows]
+        return render(self.templates["odds_api"], values, {"rows": rows})
+
+    def _race_list(self, kaisai_date, nar):
+        try:
+            day = date(int(kaisai_date[:4]), int(kaisai_date[4:6]), int(kaisai_date[6:8]))
+        except ValueError:
+            return ""
+        codes = list(NAR_VENUES if nar else JRA_VENUES)
+        venues = []
+        for v in range(self.venues_per_day):
+            code = codes[(day.toordinal() + v) % len(codes)]
+            items = []
+            for r in range(1, self.races_per_day + 1):
+                if nar:
+                    race_id = f"{day.year}{code}{day:%m%d}{r:02d}"
+                else:
+                    race_id = f"{day.year}{code}05{day.day:02d}{r:02d}"
+                items.append(render(self.templates["race_list_item"],
+                                    {"race_id": race_id, "race_num": r, "race_name": f"ベンチマーク{r}R"}))
+            name = (NAR_VENUES if nar else JRA_VENUES)[code]
+            header = f"{name}競馬場TOP" if nar else f"5回 {name} {day.day}日目"
+            venues.append({"venue_header": header, "items": "\n".join(items)})
+        return render(self.templates["race_list_sub"], {}, {"venues": venues})
+
+    def _horse_result(self, horse_id):
+        rows = []
+        start = date(2025, 12, 28)
+        for i in range(1, self.history_rows + 1):
+            day = start - timedelta(days=14 * i + _hash(horse_id) % 7)
+            rank = 1 + _hash(horse_id, i) % 16
+            distance = 1000 + 200 * (_hash(horse_id, i, "d") % 10)
+            rows.append({
+                "i": i,
+                "i2": f"{i:02d}",
+                "date": day.strftime("%Y/%m/%d"),
+                "date_key": day.strftime("%Y%m%d"),
+                "race_num": 1 + i % 12,
+                "race_id": f"{day.year}06050{i % 9}{1 + i % 12:02d}",
+                "race_name": f"過去レース{i}",
+                "waku": 1 + i % 8,
+                "odds": f"{1.5 + rank * 2.3:.1f}",
+                "rank": rank,
+                "jockey_id": f"{_hash(horse_id, i, 'j') % 300:05d}",
+                "surface": "ダ" if distance < 1400 else "芝",
+                "distance": distance,
+            })
+        return render(self.templates["horse_result"], {"horse_name": f"ホース{horse_id[-4:]}"}, {"rows": rows})
+
+    def _horse_ped(self, horse_id):
+        n = _hash(horse_id, "ped")
+        return render(self.templates["horse_ped"], {
+            "horse_name": f"ホース{horse_id[-4:]}",
+            "sire": f"父馬{n % 200}", "sire_id": f"{2000100000 + n % 200}",
+            "dam": f"母馬{n % 5000}", "dam_id": f"{2010100000 + n % 5000}",
+            "bms": f"母父馬{n % 300}",
+        })
+
+    # JRA の CNAME (ベンチマーク用の簡略形式)
+    #   日: pw01srl10 PP YYYY KK DD YYYYMMDD /00
+    #   レース: pw01sde10 PP YYYY KK DD RR YYYYMMDD /00
+
+    def _jra_month(self, cname):
+        m = re.search(r"pw01skl\d\d(\d{4})(\d{2})", cname)
+        if not m:
+            return ""
+        year, month = int(m.group(1)), int(m.group(2))
+        days = []
+        day = date(year, month, 1)
+        codes = list(JRA_VENUES)
+        while day.month == month:
+            if day.weekday() >= 5:  # 土日
+                for v in range(self.venues_per_day):
+                    code = codes[(day.toordinal() // 7 + v * 3) % len(codes)]
+                    days.append({
+                        "day_label": f"{day.month}月{day.day}日",
+                        "venue": JRA_VENUES[code],
+                        "day_cname": f"pw01srl10{code}{year}05{day.day:02d}{day:%Y%m%d}/00",
+                    })
+            day += timedelta(days=1)
+        return render(self.templates["jra_month"], {"year": year, "month": month}, {"days": days})
+
+    def _jra_day_values(self, cname, kind):
+        m = re.search(rf"{kind}10(\d\d)(\d{{4}})(\d\d)(\d\d)(\d\d)?(\d{{8}})", cname)
+        if not m:
+            return None
+        code, year, kai, dd, rr, ymd = m.groups()
+        day = date(int(ymd[:4]), int(ymd[4:6]), int(ymd[6:8]))
+        return {
+            "code": code, "year": year, "kai": int(kai), "day": int(dd), "ymd": ymd, "rr": rr,
+            "venue": JRA_VENUES.get(code, "中山"),
+            "date_jp": f"{day.year}年{day.month}月{day.day}日",
+        }
+
+    def _jra_day(self, cname):
+        values = self._jra_day_values(cname, "pw01srl")
+        if values is None:
+            return ""
+        races = [{
+            "i": r,
+            "race_name": f"ベンチマーク{r}R",
+            "race_cname": f"pw01sde10{values['code']}{values['year']}{values['kai']:02d}{values['day']:02d}{r:02d}{values['ymd']}/00",
+        } for r in range(1, self.races_per_day + 1)]
+        return render(self.templates["jra_day"], values, {"races": races})
+
+    def _jra_race(self, cname):
+        values = self._jra_day_values(cname, "pw01sde")
+        if values is None:
+            return ""
+        race_id = f"{values['year']}{values['code']}{values['kai']:02d}{values['day']:02d}{values['rr']}"
+        race = self._race_values(race_id, False)
+        values = {**race, **values, "race_num": int(values["rr"])}
+        return render(self.templates["jra_race"], values, {"rows": self._entry_rows(race_id)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in server for netkeiba / JRA pages")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fixed delay per response (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay up to this (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected error")
+    parser.add_argument("--error-status", type=int, action="append", help="Injected status (default 503)")
+    args = parser.parse_args()
+
+    server = FixtureServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, error_statuses=args.error_status or (503,))
+    print(f"Serving fixtures on {server.base_url}")
+    print(f'  export KEIBA_HTTP_HOST_OVERRIDES="*={server.base_url}"')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
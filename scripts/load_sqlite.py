@@ -0,0 +1,61 @@
+"""
+Parquet を SQLite (keiba_data.db) に一括で取り込む
+バッチで読みながら executemany で書き込み、(race_id, horse_id) で upsert する (scraper/storage.py)。
+1日分だけ増えたデータの取り込みでもテーブル全体を作り直さない。
+
+Usage:
+    python scripts/load_sqlite.py --mode NAR                                # ml/processed_data_nar.parquet を upsert
+    python scripts/load_sqlite.py --mode JRA --replace                      # 作り直す
+    python scripts/load_sqlite.py --results data/raw/database.parquet       # race_results テーブル
+    python scripts/load_sqlite.py --mode JRA --source other.parquet --db other.db
+"""
+
+import argparse
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, 'scraper'))
+
+import storage
+
+
+PROCESSED_PATHS = {
+    "JRA": os.path.join(PROJECT_ROOT, "ml", "processed_data.parquet"),
+    "NAR": os.path.join(PROJECT_ROOT, "ml", "processed_data_nar.parquet"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load parquet into the SQLite database")
+    parser.add_argument("--mode", choices=["JRA", "NAR"], help="Load processed features into processed_data_{mode}")
+    parser.add_argument("--source", help="Parquet to load (default: ml/processed_data[_nar].parquet)")
+    parser.add_argument("--results", help="Load this race results parquet into race_results")
+    parser.add_argument("--replace", action="store_true", help="Rebuild the table instead of upserting")
+    parser.add_argument("--db", help="SQLite database (default: keiba_data.db)")
+    parser.add_argument("--batch-rows", type=int, default=None, help="Rows read per parquet batch")
+    args = parser.parse_args()
+
+    if not args.mode and not args.results:
+        parser.error("--mode or --results is required")
+    if args.batch_rows:
+        storage.configure(ingest_batch_rows=args.batch_rows)
+    db = storage.get_storage(args.db)
+    how = "replace" if args.replace else "upsert"
+
+    jobs = []
+    if args.mode:
+        jobs.append((args.source or PROCESSED_PATHS[args.mode], storage.processed_table(args.mode)))
+    if args.results:
+        jobs.append((args.results, storage.RESULTS_TABLE))
+    for path, table in jobs:
+        if not os.path.exists(path):
+            print(f"❌ {path} not found")
+            return 1
+        print(f"=== {how} {path} -> {db.db_path}:{table} ===")
+        db.ingest_parquet(path, table, how=how)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+HTMLアーカイブからデータベースを作り直す
+解析処理 (parse_race_result / parse_jra_race / 戦績・血統の解析) を修正した後、
+再取得せずにアーカイブ済みのページへ現在の抽出処理を並列で実行し直す (scraper/reparse.py)。
+
+Usage:
+    python scripts/reparse_archive.py --summary
+    python scripts/reparse_archive.py --import-cache                # 既存の response_cache をアーカイブに取り込む
+    python scripts/reparse_archive.py --mode NAR --workers 8        # data/raw/database_nar_reparsed.parquet
+    python scripts/reparse_archive.py --mode JRA --workers 8 --replace
+    python scripts/reparse_archive.py --mode NAR --as-of 2026-01-31 # この日までに取得した版で再解析
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scraper'))
+
+import html_archive
+from reparse import run_reparse
+
+
+def print_summary(archive):
+    rows = archive.summary()
+    if not rows:
+        print(f"Archive is empty ({archive.archive_dir})")
+        return
+    print(f"Archive: {archive.archive_dir} (new entries: {html_archive.codec_name()})")
+    print(f"{'kind':14s} {'versions':>9s} {'urls':>8s} {'raw MB':>9s}")
+    for kind, versions, urls, size in rows:
+        print(f"{kind:14s} {versions:9d} {urls:8d} {(size or 0) / 1e6:9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-parse archived pages with the current extractors")
+    parser.add_argument("--mode", choices=["JRA", "NAR"], help="Database to rebuild")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--output", help="Output parquet (default: <database>_reparsed.parquet)")
+    parser.add_argument("--replace", action="store_true", help="Replace the database with the result (keeps .bak)")
+    parser.add_argument("--as-of", help="Use page versions fetched up to this date (YYYY-MM-DD)")
+    parser.add_argument("--archive-dir", help="Archive directory (default: data/archive/html)")
+    parser.add_argument("--import-cache", action="store_true", help="Import pages from the response cache first")
+    parser.add_argument("--summary", action="store_true", help="Show archive contents")
+    parser.add_argument("--verbose", action="store_true", help="Show scraper output of the workers")
+    args = parser.parse_args()
+
+    if args.archive_dir:
+        html_archive.configure(archive_dir=args.archive_dir)
+    archive = html_archive.get_archive()
+
+    if args.import_cache:
+        print(f"Imported {archive.import_response_cache()} cached pages")
+    if args.summary:
+        print_summary(archive)
+    if not args.mode:
+        if not (args.summary or args.import_cache):
+            parser.error("--mode is required to re-parse")
+        return 0
+
+    as_of = None
+    if args.as_of:
+        try:
+            as_of = (datetime.strptime(args.as_of, "%Y-%m-%d") + timedelta(days=1)).timestamp()
+        except ValueError:
+            parser.error("Invalid --as-of date. Use YYYY-MM-DD")
+
+    result = run_reparse(args.mode, output_path=args.output, workers=args.workers, as_of=as_of,
+                         replace=args.replace, verbose=args.verbose)
+    print(f"Races: {result['races']} re-parsed, {result['carried']} carried over, {len(result['failed'])} failed"
+          f" | {result['rows']} rows -> {result['output']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,7 @@ import pandas as pd
 import gc
 import os
 import shutil
+import sys
 from typing import Set, Optional
 
 
@@ -15,13 +16,21 @@ def deduplicate_in_chunks(csv_path: str, chunk_size: int = 10000) -> None:
     チャンク単位で重複削除を実行(メモリ効率的)
     
     Args:
-        csv_path: 重複削除対象のCSVファイルパス
+        csv_path: 重複削除対象のCSVファイルパス (.parquet の場合は parquet_compact でストリーミング処理し、後の行を残す)
         chunk_size: 一度に処理する行数
     """
     if not os.path.exists(csv_path):
         print(f"  ⚠️  ファイルが存在しません: {csv_path}")
         return
     
+    if csv_path.endswith('.parquet'):
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scraper'))
+        import parquet_compact
+        stats = parquet_compact.deduplicate([csv_path], csv_path, keys=['race_id', 'horse_id'],
+                                            batch_rows=max(chunk_size, 10000))
+        print(f"  ✅ 重複削除完了: {stats['rows_in']} → {stats['rows_out']} rows ({stats['duplicates']} duplicates removed)")
+        return
+    
     print(f"  🔄 チャンク単位で重複削除中... (chunk_size={chunk_size})")
     
     seen: Set[str] = set()
@@ -194,10 +203,17 @@ def fetch_with_retry(url: str, headers: dict, max_retries: int = 3, timeout: int
     """
     import requests
     import time
+
+    try:
+        # プロジェクト内ではホストごとの共有セッション(keep-alive)を使う
+        from scraper import http_client
+        fetch = http_client.get
+    except ImportError:
+        fetch = requests.get
     
     for attempt in range(max_retries):
         try:
-            resp = requests.get(url, headers=headers, timeout=timeout)
+            resp = fetch(url, headers=headers, timeout=timeout)
             
             # レート制限検知
             if resp.status_code == 403 or resp.status_code == 429:
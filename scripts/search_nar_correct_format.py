@@ -4,16 +4,20 @@ NAR 2022-2025年のレースを正しい形式で探索
 YYYYVVMMDDNN (12桁)
 """
 
-import requests
+import os
+import sys
 from bs4 import BeautifulSoup
 import time
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scraper import http_client
+
 def check_race_exists(race_id):
     """レースIDが有効か確認"""
     url = f'https://nar.netkeiba.com/race/result.html?race_id={race_id}'
     try:
-        resp = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
-        resp.encoding = 'EUC-JP'
+        resp = http_client.get(url)
         soup = BeautifulSoup(resp.text, 'html.parser')
         
         tables = soup.find_all('table')
@@ -4,11 +4,16 @@ NAR 2022-2026年のレースIDを徹底調査
 全競馬場、全月を体系的に探索
 """
 
-import requests
+import os
+import sys
 from bs4 import BeautifulSoup
 import time
 from datetime import datetime
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scraper import http_client
+
 # NAR競馬場コード
 venues = {
     '30': '門別', '35': '盛岡', '36': '水沢', '42': '浦和',
@@ -21,8 +26,7 @@ def check_race_exists(race_id):
     """レースIDが有効か確認"""
     url = f'https://nar.netkeiba.com/race/result.html?race_id={race_id}'
     try:
-        resp = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
-        resp.encoding = 'EUC-JP'
+        resp = http_client.get(url)
         soup = BeautifulSoup(resp.text, 'html.parser')
         
         tables = soup.find_all('table')
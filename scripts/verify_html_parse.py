@@ -0,0 +1,126 @@
+"""
+HTML解析レイヤーの一致確認
+レスポンスキャッシュ (data/cache/http) に保存済みのページを、
+従来の解析 (html.parser・文書全体) と高速解析 (lxml・部分解析) の両方で抽出し、結果が一致するか確認する
+保存済みのページでの一致は tests/test_html_parse.py (python -m pytest tests) で確認する。こちらは実際の取得ページ向け
+
+Usage:
+    python scripts/verify_html_parse.py [--kind race_result] [--limit 200]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scraper'))
+
+import html_parse
+import http_client
+import response_cache
+from auto_scraper import parse_race_result, parse_race_list_ids, parse_odds_html
+from jra_scraper import parse_jra_race, parse_jra_month_page, parse_jra_day_page
+from race_scraper import RaceScraper
+
+scraper = RaceScraper()
+
+
+def _race_id(url):
+    m = re.search(r'race_id=(\d+)', url)
+    return m.group(1) if m else ""
+
+
+# (種別, リクエスト行のパターン, 抽出関数(html, url))
+EXTRACTORS = [
+    ("race_result", r"/race/result\.html", lambda html, url: parse_race_result(html, _race_id(url))),
+    ("horse_result", r"db\.netkeiba\.com/horse/result/", lambda html, url: scraper.parse_past_races(html, n_samples=None)),
+    ("horse_ped", r"db\.netkeiba\.com/horse/ped/", lambda html, url: scraper.parse_horse_profile(html)),
+    ("race_list", r"/top/race_list_sub\.html", lambda html, url: parse_race_list_ids(html)),
+    ("odds", r"/odds/index\.html", lambda html, url: parse_odds_html(html)),
+    ("jra_result", r"pw01sde", lambda html, url: parse_jra_race(html, url)),
+    ("jra_month", r"pw01skl", lambda html, url: parse_jra_month_page(html)),
+    ("jra_day", r"pw01srl", lambda html, url: parse_jra_day_page(html)),
+]
+
+
+def iter_cached_pages():
+    entries_dir = os.path.join(response_cache.CONFIG["cache_dir"], "entries")
+    for root, _, files in os.walk(entries_dir):
+        for name in files:
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(root, name), encoding="utf-8") as f:
+                meta = json.load(f)
+            entry = response_cache.CacheEntry(name[:-5], meta["request"], meta)
+            response = entry.to_response()
+            if response is None:
+                continue
+            host = http_client.host_of(meta["url"])
+            response.encoding = http_client.HOST_CHARSETS.get(host) or response.apparent_encoding
+            yield meta["request"], meta["url"], response.text
+
+
+def same(a, b):
+    if isinstance(a, pd.DataFrame) or isinstance(b, pd.DataFrame):
+        if not (isinstance(a, pd.DataFrame) and isinstance(b, pd.DataFrame)):
+            return False
+        return a.reset_index(drop=True).equals(b.reset_index(drop=True))
+    return a == b
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kind", type=str, help="Only check this page kind")
+    parser.add_argument("--limit", type=int, default=0, help="Max pages per kind (0 = all)")
+    args = parser.parse_args()
+
+    print(f"Parser: {html_parse.CONFIG['parser']} (partial={html_parse.CONFIG['partial']})")
+
+    results = {}
+    for request_line, url, html in iter_cached_pages():
+        for kind, pattern, extract in EXTRACTORS:
+            if not re.search(pattern, request_line):
+                continue
+            if args.kind and kind != args.kind:
+                break
+            stat = results.setdefault(kind, {"pages": 0, "mismatch": [], "legacy": 0.0, "fast": 0.0})
+            if args.limit and stat["pages"] >= args.limit:
+                break
+
+            t0 = time.perf_counter()
+            with html_parse.legacy():
+                expected = extract(html, url)
+            t1 = time.perf_counter()
+            actual = extract(html, url)
+            t2 = time.perf_counter()
+
+            stat["pages"] += 1
+            stat["legacy"] += t1 - t0
+            stat["fast"] += t2 - t1
+            if not same(expected, actual):
+                stat["mismatch"].append(url)
+            break
+
+    if not results:
+        print("No cached pages found. Run a scrape first to populate the response cache.")
+        return 1
+
+    failed = False
+    for kind, stat in sorted(results.items()):
+        n = stat["pages"]
+        print(f"{kind:13s} pages={n:5d}  legacy={stat['legacy'] / n * 1000:7.1f}ms  "
+              f"fast={stat['fast'] / n * 1000:7.1f}ms  mismatch={len(stat['mismatch'])}")
+        for url in stat["mismatch"][:5]:
+            print(f"    ❌ {url}")
+        failed = failed or bool(stat["mismatch"])
+
+    print("✅ All extractors match" if not failed else "❌ Mismatches found")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
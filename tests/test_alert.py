@@ -0,0 +1,67 @@
+"""
+期待値アラート (utils/alert.py の EVAlertEngine) のテスト
+RaceAlert と同じく期待値の高い馬が2頭以上のレースだけ通知し、同じ段階では通知し直さない。
+"""
+
+import json
+import os
+import sys
+
+from conftest import PROJECT_ROOT
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from utils.alert import EVAlertEngine, save_predictions  # noqa: E402
+
+
+def _engine(**kwargs):
+    engine = EVAlertEngine(**kwargs)
+    engine.set_predictions("202405050811", [1, 2, 3], [0.2, 0.1, 0.01], names=["A", "B", "C"])
+    return engine
+
+
+def _odds(*pairs):
+    return [{"number": n, "odds": o} for n, o in pairs]
+
+
+def test_single_high_ev_horse_does_not_alert():
+    engine = _engine()
+    assert engine.on_odds("202405050811", _odds((1, 7.0), (2, 5.0), (3, 200.0))) is None
+
+
+def test_race_alert_counts_all_high_ev_horses():
+    engine = _engine()
+    # 1番: EV 0.4、2番: EV 0.5 → 2頭で通知
+    alert = engine.on_odds("202405050811", _odds((1, 7.0), (2, 15.0), (3, 200.0)))
+    assert alert["high_ev_count"] == 2
+    assert [h["number"] for h in alert["high_ev_horses"]] == [2, 1]
+    assert alert["new_count"] == 2
+    # 同じ段階のままなら通知しない
+    assert engine.on_odds("202405050811", _odds((1, 7.0), (2, 15.0))) is None
+    # 1番だけ上の段階へ: 高期待値の馬は2頭のまま、新しく上がったのは1頭
+    alert = engine.on_odds("202405050811", _odds((1, 8.0), (2, 15.0)))
+    assert alert["high_ev_count"] == 2
+    assert alert["new_count"] == 1
+    assert {h["number"]: h["new"] for h in alert["high_ev_horses"]} == {1: True, 2: False}
+
+
+def test_min_horses_one_alerts_single_horse():
+    engine = _engine(min_horses=1)
+    alert = engine.on_odds("202405050811", _odds((1, 7.0), (2, 5.0)))
+    assert alert["high_ev_count"] == 1
+
+
+def test_predictions_file_round_trip(tmp_path):
+    path = str(tmp_path / "predictions.json")
+    save_predictions("202405050811", [1, 2, 3], [0.2, 0.1, 0.01], factors=[1.0, 1.0, float("nan")],
+                     names=["A", "B", "C"], race_name="テスト", venue="東京", path=path)
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["202405050811"]["factors"][2] is None
+
+    log_path = str(tmp_path / "alerts.jsonl")
+    engine = EVAlertEngine(predictions_path=path, log_path=log_path)
+    alert = engine.on_odds({"id": "202405050811"}, _odds((1, 7.0), (2, 15.0), (3, 500.0)))
+    assert alert["venue"] == "東京"
+    assert [h["number"] for h in alert["high_ev_horses"]] == [2, 1]
+    assert os.path.exists(log_path)
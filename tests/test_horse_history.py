@@ -0,0 +1,47 @@
+"""
+馬ごとの戦績索引 (scraper/horse_history.py) のテスト
+任意の文字列列 (天候・会場など) がないデータベースでも作成・追加ができる。
+"""
+
+import pandas as pd
+import pytest
+
+import horse_history
+
+
+@pytest.fixture
+def history_root(tmp_path):
+    root = horse_history.CONFIG["root"]
+    horse_history.configure(root=str(tmp_path))
+    yield tmp_path
+    horse_history.configure(root=root)
+    horse_history._opened.clear()
+
+
+def _results(horse_ids, race_ids, dates):
+    # 天候・会場・馬場状態などの任意の文字列列はない
+    return pd.DataFrame({
+        "horse_id": horse_ids,
+        "race_id": race_ids,
+        "日付": dates,
+        "着 順": ["1", "3", "2"][:len(horse_ids)],
+        "騎手": ["武豊", "ルメール", "武豊"][:len(horse_ids)],
+    })
+
+
+def test_build_and_update_without_optional_text_columns(history_root):
+    df = _results(["2019101234", "2019101234", "2020105678"],
+                  ["202405050811", "202406010101", "202405050811"],
+                  ["2024/05/05", "2024/06/01", "2024/05/05"])
+    meta = horse_history.build("JRA", df)
+    assert meta["rows"] == 3
+
+    added = horse_history.update("JRA", _results(["2020105678"], ["202406010102"], ["2024/06/01"]))
+    assert added == 1
+
+    history = horse_history.get_history("JRA")
+    runs = history.runs("2020105678")
+    assert runs["race_id"].tolist() == ["202406010102", "202405050811"]
+    assert runs["rank"].tolist() == ["1", "2"]
+    assert runs["weather"].isna().all()
+    assert runs["venue"].isna().all()
@@ -0,0 +1,235 @@
+"""
+HTML解析レイヤーの一致テスト (ベースラインの出力と比較)
+data/test/fixtures のテンプレート (scripts/fixture_server.py) から生成したページを現在のスクレイパーで取得・解析し、
+ベースライン (commit 2d7ef69、pd.read_html / BeautifulSoup(html.parser)) が同じページから作った出力
+(tests/fixtures/html_parse_expected.json) と一致することを確認する。高速解析 (lxml・部分解析) と
+従来の解析 (html_parse.legacy()) の両方で比べる。
+
+期待値はベースラインのチェックアウトで作り直す (ベースラインのコードを同じページに対して実行する):
+    git worktree add /tmp/keiba-baseline 2d7ef69
+    python tests/test_html_parse.py --update /tmp/keiba-baseline
+"""
+
+import datetime
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXPECTED_PATH = os.path.join(PROJECT_ROOT, "tests", "fixtures", "html_parse_expected.json")
+
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+
+from fixture_server import FixtureServer  # noqa: E402
+
+DAY = datetime.date(2025, 1, 5)
+JRA_RACE_ID = "202505050111"
+HORSE_ID = "2015001234"
+JRA_RACE_URL = "https://www.jra.go.jp/JRADB/accessS.html?CNAME=pw01sde1005202505010520250105/00"
+
+CASES = ("race_result_jra", "race_result_nar", "shutuba_jra", "odds_jra", "odds_nar",
+         "horse_past", "horse_profile", "jra_race", "jra_year", "nar_year")
+
+# 取得件数を抑えたページ生成 (頭数・レース数・戦績の行数)
+SERVER_OPTIONS = {"rows": 6, "races_per_day": 2, "venues_per_day": 1, "history_rows": 6}
+
+
+def _plain(value):
+    """抽出結果を JSON で比べられる形にする (DataFrame は列と行のリスト)"""
+    if isinstance(value, pd.DataFrame):
+        frame = value.reset_index(drop=True)
+        return {
+            "columns": [str(c) for c in frame.columns],
+            "rows": [[_plain(v) for v in row] for row in frame.itertuples(index=False, name=None)],
+        }
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return value.isoformat()
+    if value is None or (not isinstance(value, str) and pd.api.types.is_scalar(value) and pd.isna(value)):
+        return None
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def run_cases(server, auto_scraper, jra_scraper, race_scraper):
+    """
+    ベースラインにもある公開関数で各ページを取得・解析する
+
+    Returns:
+        dict: {ケース名: _plain() した結果}
+    """
+    _, _, race_list = server.page("nar.netkeiba.com", "/top/race_list_sub.html", {"kaisai_date": DAY.strftime("%Y%m%d")})
+    nar_race_id = re.findall(r"race_id=(\d{12})", race_list)[0]
+    scraper = race_scraper.RaceScraper()
+
+    def _collect(func, *args):
+        frames = []
+        func(*args, save_callback=frames.append)
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    cases = {
+        "race_result_jra": lambda: auto_scraper.scrape_race_data(JRA_RACE_ID, "JRA"),
+        "race_result_nar": lambda: auto_scraper.scrape_race_data(nar_race_id, "NAR"),
+        "shutuba_jra": lambda: auto_scraper.scrape_shutuba_data(JRA_RACE_ID, "JRA", history_df=pd.DataFrame()),
+        "odds_jra": lambda: auto_scraper.scrape_odds_for_race(JRA_RACE_ID, "JRA"),
+        "odds_nar": lambda: auto_scraper.scrape_odds_for_race(nar_race_id, "NAR"),
+        "horse_past": lambda: scraper.get_past_races(HORSE_ID),
+        "horse_profile": lambda: scraper.get_horse_profile(HORSE_ID),
+        "jra_race": lambda: jra_scraper.scrape_jra_race(JRA_RACE_URL),
+        "jra_year": lambda: _collect(jra_scraper.scrape_jra_year, "2025", DAY, DAY),
+        "nar_year": lambda: _collect(auto_scraper.scrape_nar_year, "2025", DAY, DAY),
+    }
+    return {name: _plain(cases[name]()) for name in CASES}
+
+
+def _expected():
+    with open(EXPECTED_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def outputs():
+    """現在のスクレイパーの出力 (高速解析・従来の解析)。通信はローカルのページ生成サーバーに向ける"""
+    import auto_scraper
+    import html_archive
+    import html_parse
+    import http_client
+    import jra_scraper
+    import odds_store
+    import pedigree_store
+    import race_scraper
+    import rate_limit
+    import response_cache
+    from name_resolver import NameResolver, NameStore
+
+    saved = {
+        "response_cache": dict(response_cache.CONFIG), "html_archive": dict(html_archive.CONFIG),
+        "odds_store": dict(odds_store.CONFIG), "pedigree_store": dict(pedigree_store.CONFIG),
+        "http_client": dict(http_client.CONFIG), "host_rates": dict(rate_limit.HOST_RATES),
+    }
+    names = auto_scraper.NAMES
+    server = FixtureServer(**SERVER_OPTIONS).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            response_cache.configure(enabled=False, offline=False)
+            html_archive.configure(enabled=False)
+            odds_store.configure(root=os.path.join(tmp, "odds"))
+            http_client.configure(host_overrides={"*": server.base_url})
+            for host in list(rate_limit.HOST_RATES):
+                rate_limit.configure_host(host, 1000, 1000)
+
+            results = {}
+            for label in ("fast", "legacy"):
+                # 名前・血統のキャッシュは毎回空から (ページから取り直す)
+                auto_scraper.HORSE_HISTORY_CACHE.clear()
+                auto_scraper.HORSE_PROFILE_CACHE.clear()
+                auto_scraper.NAMES = NameResolver(NameStore(os.path.join(tmp, f"names-{label}.db"), legacy_json_path=None))
+                pedigree_store.configure(db_path=os.path.join(tmp, f"pedigree-{label}.db"))
+                try:
+                    if label == "legacy":
+                        with html_parse.legacy():
+                            results[label] = run_cases(server, auto_scraper, jra_scraper, race_scraper)
+                    else:
+                        results[label] = run_cases(server, auto_scraper, jra_scraper, race_scraper)
+                finally:
+                    auto_scraper.NAMES.close()
+                    pedigree_store.close()
+            yield results
+        finally:
+            server.stop()
+            auto_scraper.NAMES = names
+            response_cache.configure(**saved["response_cache"])
+            html_archive.configure(**saved["html_archive"])
+            odds_store.configure(**saved["odds_store"])
+            pedigree_store.configure(**saved["pedigree_store"])
+            http_client.configure(**saved["http_client"])
+            for host, (rate, burst) in saved["host_rates"].items():
+                rate_limit.configure_host(host, rate, burst)
+
+
+@pytest.mark.parametrize("label", ["fast", "legacy"])
+@pytest.mark.parametrize("name", CASES)
+def test_matches_baseline_output(outputs, label, name):
+    assert outputs[label][name] == _expected()[name]
+
+
+def test_odds_html_matches_api():
+    from auto_scraper import parse_odds_api, parse_odds_html
+
+    server = FixtureServer(**SERVER_OPTIONS)
+    try:
+        pages = {t: json.loads(server.page("race.netkeiba.com", "/api/api_get_jra_odds.html",
+                                           {"race_id": JRA_RACE_ID, "type": t})[2]) for t in ("1", "2")}
+        html = server.page("race.netkeiba.com", "/odds/index.html", {"race_id": JRA_RACE_ID})[2]
+    finally:
+        server.httpd.server_close()
+    from_api = {h["number"]: h for h in parse_odds_api(pages["1"], pages["2"]) if h["odds"] > 0}
+    from_html = {h["number"]: h for h in parse_odds_html(html)}
+    assert from_html
+    assert from_api == from_html
+
+
+def _update_from_baseline(baseline_dir):
+    """
+    ベースラインのチェックアウトのスクレイパーを同じページに対して実行し、期待値を書く
+
+    ベースラインは requests で直接取得し time.sleep で待つため、送信先をページ生成サーバーに差し替え、待機は省く。
+    JRA のページはベースラインが EUC-JP として読んでいた (user-026 でホストの既知の文字コード cp932 に修正) ため、
+    解析結果を比べられるよう文字コードはホストのものに固定する。
+    """
+    import requests
+
+    server = FixtureServer(**SERVER_OPTIONS).start()
+    send = requests.Session.request
+
+    class _HostCharsetResponse(requests.Response):
+        @property
+        def encoding(self):
+            return "cp932"
+
+        @encoding.setter
+        def encoding(self, value):
+            pass
+
+    def _request(session, method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        local = f"{server.base_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        response = send(session, method, local, *args, **kwargs)
+        if parts.netloc == "www.jra.go.jp":
+            response.__class__ = _HostCharsetResponse
+        return response
+
+    requests.Session.request = _request
+    time.sleep = lambda seconds: None
+    sys.path.insert(0, os.path.join(os.path.abspath(baseline_dir), "scraper"))
+    os.chdir(tempfile.mkdtemp())
+    import auto_scraper
+    import jra_scraper
+    import race_scraper
+
+    # 名前のキャッシュは空から (ページから取り直す)、保存しない
+    auto_scraper.NAME_CACHE.clear()
+    auto_scraper.save_name_cache = lambda: None
+    try:
+        outputs = run_cases(server, auto_scraper, jra_scraper, race_scraper)
+    finally:
+        server.stop()
+    os.makedirs(os.path.dirname(EXPECTED_PATH), exist_ok=True)
+    with open(EXPECTED_PATH, "w", encoding="utf-8") as f:
+        json.dump(outputs, f, ensure_ascii=False, indent=1)
+    print(f"Wrote {EXPECTED_PATH}")
+
+
+if __name__ == "__main__" and "--update" in sys.argv:
+    _update_from_baseline(sys.argv[sys.argv.index("--update") + 1])
@@ -0,0 +1,53 @@
+"""
+HTTPクライアントのオフライン再生のテスト
+KEIBA_HTTP_OFFLINE では cache=False の要求 (オッズ・スケジュールの取り直し) もネットワークに出さない。
+"""
+
+import asyncio
+import socket
+
+import pytest
+import requests
+
+import http_client
+import response_cache
+from async_fetch import AsyncFetcher
+
+ODDS_URL = "https://race.netkeiba.com/api/api_get_jra_odds.html?race_id=202405050811&type=1"
+MISSING_URL = "https://race.netkeiba.com/api/api_get_jra_odds.html?race_id=202405050812&type=1"
+
+
+@pytest.fixture
+def offline_cache(tmp_path, monkeypatch):
+    saved = dict(response_cache.CONFIG)
+    response_cache.configure(enabled=True, offline=False, cache_dir=str(tmp_path), gc_interval=0)
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b'{"status": "result"}'
+    response_cache.store("GET", ODDS_URL, response)
+    response_cache.configure(offline=True)
+
+    def _no_network(*args, **kwargs):
+        raise AssertionError("network access in offline mode")
+
+    monkeypatch.setattr(socket.socket, "connect", _no_network)
+    yield
+    response_cache.configure(**saved)
+
+
+def test_offline_request_without_cache_is_served_from_cache(offline_cache):
+    response = http_client.get(ODDS_URL, cache=False)
+    assert response.from_cache
+    assert response.content == b'{"status": "result"}'
+    with pytest.raises(response_cache.OfflineCacheMiss):
+        http_client.get(MISSING_URL, cache=False)
+
+
+def test_offline_async_fetch_without_cache_is_served_from_cache(offline_cache):
+    async def _fetch(url):
+        async with AsyncFetcher(max_in_flight=1) as fetcher:
+            return await fetcher.fetch(url, cache=False)
+
+    assert asyncio.run(_fetch(ODDS_URL)).from_cache
+    with pytest.raises(response_cache.OfflineCacheMiss):
+        asyncio.run(_fetch(MISSING_URL))
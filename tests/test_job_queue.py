@@ -0,0 +1,145 @@
+"""
+ジョブキューの探索タスクの再オープンのテスト
+期間外で処理しなかった開催日は skipped になり、期間を広げた実行で処理される。直近の開催日は毎回開き直す。
+結果表のないレースは failed になり、再実行で取り直す。
+"""
+
+import asyncio
+import os
+from datetime import date, timedelta
+
+import pytest
+
+import jra_scraper
+from conftest import PROJECT_ROOT
+from job_queue import DONE, FAILED, PENDING, SKIPPED, JobQueue, drain_async
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(str(tmp_path / "jobs.db"))
+    yield q
+    q.close()
+
+
+def _states(queue, kind):
+    return {key: state for key, state in queue.conn.execute("SELECT key, state FROM tasks WHERE kind = ?", (kind,))}
+
+
+def _day_cname(day):
+    return f"pw01srl1005{day.year}0101{day:%Y%m%d}/00"
+
+
+class _Response:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+
+class _Fetcher:
+    """jra_backfill_handlers 用の最小限の fetcher (本文は要求した CNAME、解析結果は固定の開催日)"""
+
+    def __init__(self, month_days):
+        self.month_days = month_days
+
+    async def fetch(self, url, method="GET", data=None):
+        return _Response((data or {}).get("cname", url))
+
+    async def parse(self, fn, text, *args):
+        if fn is jra_scraper.parse_jra_month_page:
+            return [_day_cname(d) for d in self.month_days]
+        if fn is jra_scraper.parse_jra_day_page:
+            return {"text": text, "date": jra_scraper._jra_cname_date(text), "year": "", "p_code": "00",
+                    "kai": "", "day": "", "races": []}
+        raise AssertionError(f"unexpected parse: {fn.__name__}")
+
+
+def _drain(queue, fetcher, start, end):
+    handlers = jra_scraper.jra_backfill_handlers(fetcher, start_date=start, end_date=end)
+    return asyncio.run(drain_async(queue, handlers))
+
+
+def test_out_of_range_days_are_skipped_then_revived(queue):
+    days = [date(2024, 3, 2), date(2024, 3, 16), date(2024, 3, 30)]
+    fetcher = _Fetcher(days)
+    queue.add("jra_month", ["pw01skl10202403/00"], {"year": "2024", "month": "03"})
+
+    _drain(queue, fetcher, date(2024, 3, 10), date(2024, 3, 20))
+    states = _states(queue, "jra_day")
+    assert states[_day_cname(days[0])] == SKIPPED
+    assert states[_day_cname(days[1])] == DONE
+    assert states[_day_cname(days[2])] == SKIPPED
+
+    # 期間を広げると skipped の開催日だけが pending に戻る (月の一覧は取り直さない)
+    jra_scraper.enqueue_jra_months(queue, "2024", date(2024, 3, 1), date(2024, 3, 31))
+    states = _states(queue, "jra_day")
+    assert states[_day_cname(days[0])] == PENDING
+    assert states[_day_cname(days[1])] == DONE
+    assert states[_day_cname(days[2])] == PENDING
+
+
+def test_recent_discovery_tasks_are_reopened(queue):
+    today = date.today()
+    old = today - timedelta(days=60)
+    queue.add("jra_day", [_day_cname(old), _day_cname(today)])
+    queue.complete([row[0] for row in queue.conn.execute("SELECT id FROM tasks")])
+
+    async def handle_month(task):
+        return [("jra_day", _day_cname(old), None, jra_scraper._jra_recent(old)),
+                ("jra_day", _day_cname(today), None, jra_scraper._jra_recent(today))]
+
+    queue.add("jra_month", ["month"])
+    asyncio.run(drain_async(queue, {"jra_month": handle_month}))
+    states = _states(queue, "jra_day")
+    assert states[_day_cname(old)] == DONE
+    assert states[_day_cname(today)] == PENDING
+
+
+def test_current_month_is_reopened(queue):
+    year = str(date.today().year)
+    cnames = jra_scraper._jra_month_cnames(year)
+    if not cnames:
+        pytest.skip(f"No month parameters for {year}")
+    jra_scraper.enqueue_jra_months(queue, year)
+    queue.complete([row[0] for row in queue.conn.execute("SELECT id FROM tasks")])
+    jra_scraper.enqueue_jra_months(queue, year)
+    states = _states(queue, "jra_month")
+    assert states[cnames[-1][1]] == PENDING
+
+
+class _RaceFetcher:
+    """jra_race 用の fetcher (URL → ページ。解析は実際の関数を呼ぶ)"""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    async def fetch(self, url, method="GET", data=None):
+        return _Response(self.pages[url])
+
+    async def parse(self, fn, *args):
+        return fn(*args)
+
+
+def test_race_without_result_table_fails(queue):
+    with open(os.path.join(PROJECT_ROOT, "data", "test", "fixtures", "jra_race.html"), encoding="utf-8") as f:
+        page = f.read()
+    published, pending = "https://www.jra.go.jp/race/1", "https://www.jra.go.jp/race/2"
+    fetcher = _RaceFetcher({published: page, pending: "<html><body>準備中</body></html>"})
+    saved = []
+    handlers = jra_scraper.jra_backfill_handlers(fetcher, save_callback=saved.append)
+    queue.add("jra_race", [published, pending])
+    asyncio.run(drain_async(queue, handlers))
+
+    states = _states(queue, "jra_race")
+    assert states[published] == DONE
+    assert states[pending] == FAILED
+    assert len(saved) == 1
+
+    # 保存済みのレースは保存せずに done にする
+    race_id = saved[0]["race_id"].iloc[0]
+    handlers = jra_scraper.jra_backfill_handlers(fetcher, save_callback=saved.append, existing_race_ids={race_id})
+    queue.add("jra_race", [published], reset=True)
+    asyncio.run(drain_async(queue, handlers))
+    assert _states(queue, "jra_race")[published] == DONE
+    assert len(saved) == 1
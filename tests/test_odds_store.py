@@ -0,0 +1,81 @@
+"""
+オッズ履歴ストア (scraper/odds_store.py) のテスト
+追記したスナップショットを統合の前後で同じように読み戻せる。race_id の絞り込みは Parquet のフィルタで行う。
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import odds_store
+from odds_store import OddsStore
+
+DAY = "20260118"
+RACE = "202606050811"
+OTHER = "202606050812"
+POST = 1_768_700_000.0  # 発走時刻 (epoch秒)
+
+
+def _horses(win1, win2):
+    return [{"number": 1, "odds": win1, "place_odds_min": 1.1, "place_odds_max": 1.5},
+            {"number": "2", "odds": win2}, {"number": "取消", "odds": 0}]
+
+
+@pytest.fixture
+def store(tmp_path):
+    saved = dict(odds_store.CONFIG)
+    odds_store.configure(compact_every=1000)
+    s = OddsStore(str(tmp_path / "odds"))
+    # 発走30分前・12分前・3分前の3回取得。別レースは発走時刻なし
+    for minutes, win1 in ((30, 3.0), (12, 2.6), (3, 2.4)):
+        s.append(RACE, _horses(win1, win1 * 2), ts=POST - minutes * 60, source="api", race_date=DAY, post_time=POST)
+    s.append(OTHER, {5: 9.9}, ts=POST - 600, source="html", race_date=DAY)
+    yield s
+    odds_store.configure(**saved)
+
+
+def _check(store):
+    series = store.series(RACE)
+    assert len(series) == 6
+    assert series["ts"].is_monotonic_increasing
+    assert set(series["race_id"]) == {RACE}
+
+    latest = store.latest(RACE, day=DAY)
+    assert latest.set_index("number")["win"].to_dict() == {1: 2.4, 2: 4.8}
+    assert latest["place_min"].isna().tolist() == [False, True]
+    assert store.before_post(RACE, minutes=10, day=DAY)["win"].tolist() == [2.6, 5.2]
+    assert store.before_post(RACE, minutes=60, day=DAY).empty
+    assert store.before_post(OTHER, minutes=5, day=DAY).empty  # 発走時刻が分からない
+    assert store.at(OTHER, POST, day=DAY)["win"].tolist() == [9.9]
+
+    assert store.day_before_post(DAY, minutes=5)["win"].tolist() == [2.6, 5.2]
+    assert store.day_before_post(DAY, minutes=5, post_times={OTHER: POST})["race_id"].tolist() == [OTHER]
+    assert store.read_day(DAY, race_ids=[OTHER], columns=["race_id", "win"]).to_dict("list") == {
+        "race_id": [OTHER], "win": [9.9]}
+
+
+def test_round_trip_before_and_after_compaction(store):
+    assert store.days() == [DAY]
+    _check(store)
+    assert store.compact(DAY) == 4
+    _check(store)
+    # 統合後の追記も読める
+    store.append(RACE, _horses(2.2, 4.4), ts=POST - 60, race_date=DAY, post_time=POST)
+    assert store.latest(RACE)["win"].tolist() == [2.2, 4.4]
+    assert store.compact(DAY) == 1
+    assert len(pd.read_parquet(os.path.join(store.root, DAY, odds_store.COMPACTED_NAME))) == 9
+
+
+def test_record_respects_config(tmp_path):
+    saved = dict(odds_store.CONFIG)
+    try:
+        odds_store.configure(root=str(tmp_path / "odds"), enabled=False)
+        assert odds_store.record(RACE, {1: 2.0}, race_date=DAY) == 0
+        odds_store.configure(enabled=True)
+        assert odds_store.record(RACE, {1: 2.0}, race_date=DAY) == 1
+        assert odds_store.get_store().latest(RACE)["win"].tolist() == [2.0]
+        with pytest.raises(ValueError):
+            odds_store.configure(compact_evry=1)
+    finally:
+        odds_store.configure(**saved)
@@ -0,0 +1,43 @@
+"""
+血統ストア (scraper/pedigree_store.py) のテスト
+ページに血統が載っていなかった馬は空の血統で登録され、次回は取得対象にならない。
+"""
+
+import pandas as pd
+import pytest
+
+import auto_scraper
+import pedigree_store
+from pedigree_store import PedigreeStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    saved = dict(pedigree_store.CONFIG)
+    pedigree_store.configure(db_path=str(tmp_path / "pedigree.db"))
+    yield pedigree_store.get_store()
+    pedigree_store.close()
+    pedigree_store.configure(**saved)
+
+
+def test_batch_without_father_is_not_fetched_again(store):
+    batch = {
+        "2015001234": {"father": "スクリーンヒーロー", "mother": "ハハ", "bms": "サンデーサイレンス"},
+        "2015009999": {"father": "", "mother": "", "bms": ""},
+    }
+    assert auto_scraper.save_batch_bloodline(None, batch) == 1
+    pedigree_store.close()
+
+    reopened = PedigreeStore(store.db_path)
+    assert reopened.missing(["2015001234", "2015009999", "2015000001"]) == ["2015000001"]
+    df = reopened.join(pd.DataFrame({"horse_id": ["2015001234", "2015009999"]}))
+    assert df["father"].tolist() == ["スクリーンヒーロー", None]
+    reopened.close()
+
+
+def test_import_fills_empty_entries(store):
+    store.put_empty(["2015009999"])
+    store.flush()
+    df = pd.DataFrame({"horse_id": ["2015009999"], "father": ["キタサンブラック"], "mother": ["M"], "bms": ["B"]})
+    assert store.import_frame(df) == 1
+    assert store.get("2015009999")["father"] == "キタサンブラック"
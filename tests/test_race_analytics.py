@@ -0,0 +1,61 @@
+"""
+レース分析クエリ (ml/race_analytics.py) のテスト
+同じ人気の馬が複数いるレースでも、DuckDB・pandas のどちらで計算しても行の並びによらず同じ指標になる。
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+from conftest import PROJECT_ROOT
+
+sys.path.append(os.path.join(PROJECT_ROOT, "ml"))
+
+import race_analytics  # noqa: E402
+
+
+def _race(race_id, rows):
+    """rows: (馬番, 人気, 単勝) のリスト"""
+    return pd.DataFrame({
+        "race_id": race_id, "日付": "2025/01/05", "開催地": "中山", "レース名": f"R{race_id}",
+        "馬 番": [r[0] for r in rows], "人 気": [r[1] for r in rows], "単勝": [r[2] for r in rows],
+    })
+
+
+# 2番人気が2頭 (馬番 3 と 7)。馬番の大きい方 (7番、6.0倍) の値を2番人気として使う
+TIED = [(1, 1, 2.0), (3, 2, 4.0), (7, 2, 6.0), (5, 3, 9.0)]
+PLAIN = [(2, 1, 1.5), (4, 2, 3.5), (6, 3, 8.0)]
+
+
+def _write(tmp_path, tied_rows):
+    path = str(tmp_path / "db.parquet")
+    pd.concat([_race("202501010101", tied_rows), _race("202501010102", PLAIN)], ignore_index=True).to_parquet(path)
+    return path
+
+
+@pytest.fixture(params=["duckdb", "pandas"])
+def engine(request, monkeypatch):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb")
+    else:
+        monkeypatch.setattr(race_analytics, "duckdb", None)
+    return request.param
+
+
+@pytest.mark.parametrize("order", [TIED, TIED[::-1]], ids=["file_order", "reversed"])
+def test_tied_popularity_uses_horse_number(tmp_path, engine, order):
+    df = race_analytics.hard_race_metrics(_write(tmp_path, order))
+    tied = df.set_index("race_id").loc["202501010101"]
+    assert tied["odds_gap_1_2"] == pytest.approx(4.0)
+    assert tied["odds_gap_2_3"] == pytest.approx(3.0)
+    assert list(df["race_id"]) == ["202501010101", "202501010102"]
+
+
+def test_engines_agree(tmp_path, monkeypatch):
+    pytest.importorskip("duckdb")
+    path = _write(tmp_path, TIED[::-1])
+    fast = race_analytics.hard_race_metrics(path)
+    monkeypatch.setattr(race_analytics, "duckdb", None)
+    pd.testing.assert_frame_equal(fast, race_analytics.hard_race_metrics(path), check_dtype=False)
@@ -0,0 +1,96 @@
+"""
+年・開催場で分割したデータセット (scraper/race_dataset.py) のテスト
+作成したデータセットから条件つきで読んだ結果が元の Parquet を絞り込んだ結果と一致し、
+条件に合わないパーティションは読まない。シンクの統合で該当パーティションだけが更新される。
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import horse_history
+import race_dataset
+from parquet_sink import ParquetSink
+
+VENUES = ("中山", "京都")
+
+
+def _rows():
+    rows = []
+    for year in (2023, 2024):
+        for month in (1, 6):
+            for venue_no, venue in enumerate(VENUES, 1):
+                race_id = f"{year}0{venue_no}0{month}0101"
+                for number in (1, 2):
+                    rows.append({"race_id": race_id, "日付": f"{year}年{month:02d}月05日", "会場": venue,
+                                 "馬名": f"H{number}", "horse_id": f"20190000{venue_no}{number}",
+                                 "着順": number, "単勝": 2.0 * number})
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    path = str(tmp_path / "database.parquet")
+    _rows().to_parquet(path)
+    monkeypatch.setitem(race_dataset.SOURCES, "JRA", (path, ["race_id", "馬名"]))
+    saved = dict(race_dataset.CONFIG), dict(horse_history.CONFIG)
+    race_dataset.configure(root=str(tmp_path / "dataset"), row_group_size=2)
+    horse_history.configure(root=str(tmp_path / "history"))
+    yield path
+    race_dataset.configure(**saved[0])
+    horse_history.configure(**saved[1])
+
+
+QUERIES = [
+    {},
+    {"start": "2024-01-01"},
+    {"start": "2023-03-01", "end": "2024-02-01", "venues": ["京都"]},
+    {"horse_ids": ["2019000011"], "columns": ["race_id", "着順"]},
+    {"race_ids": ["202302060101"], "columns": ["馬名", "race_date"]},
+]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_dataset_matches_source(source, query):
+    expected = race_dataset.read("JRA", **query)  # データセットがなければ元の Parquet を絞り込む
+    race_dataset.build("JRA")
+    assert race_dataset.exists("JRA")
+    actual = race_dataset.read("JRA", sort=True, **query)
+    assert len(expected) > 0
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_filters_skip_other_partitions(source):
+    race_dataset.build("JRA")
+    parts = race_dataset.partitions("JRA")
+    assert [(p["year"], p["venue"], p["rows"]) for p in parts] == [
+        (year, venue, 4) for year in (2023, 2024) for venue in sorted(VENUES)]
+
+    # 条件に合わないパーティションを壊しても、読まないので結果は変わらない
+    for p in parts:
+        if p["year"] == 2023 or p["venue"] == "京都":
+            with open(p["path"], "wb") as f:
+                f.write(b"not a parquet file")
+    df = race_dataset.read("JRA", start="2024-01-01", venues=["中山"], columns=["race_id", "日付"])
+    assert sorted(df["race_id"].unique()) == ["202401010101", "202401060101"]
+    with pytest.raises(Exception):
+        race_dataset.read("JRA", venues=["京都"])
+
+
+def test_sink_compaction_updates_partitions(source):
+    race_dataset.build("JRA")
+    before = {(p["year"], p["venue"]): os.path.getmtime(p["path"]) for p in race_dataset.partitions("JRA")}
+
+    sink = ParquetSink(source, subset=["race_id", "馬名"], compact_every=0, dataset_mode="JRA")
+    update = pd.DataFrame({"race_id": ["202401060101", "202401060101"], "日付": "2024年06月05日", "会場": "中山",
+                           "馬名": ["H1", "H3"], "horse_id": ["2019000011", "2019000013"], "着順": [5, 1],
+                           "単勝": [9.9, 1.5]})
+    sink.append(update)
+    sink.close()
+
+    df = race_dataset.read("JRA", race_ids=["202401060101"], columns=["馬名", "着順"], sort=True)
+    assert sorted(df.itertuples(index=False, name=None)) == [("H1", 5), ("H2", 2), ("H3", 1)]
+    assert race_dataset.info("JRA")["rows"] == 17
+    after = {(p["year"], p["venue"]): os.path.getmtime(p["path"]) for p in race_dataset.partitions("JRA")}
+    assert [key for key in after if after[key] != before[key]] == [(2024, "中山")]
@@ -0,0 +1,65 @@
+"""
+取得済み race_id の索引 (scraper/race_index.py) のテスト
+追記のたびに索引が更新され、ベースがシンク以外から書き換えられた場合は読み込み時に作り直す。
+"""
+
+import numpy as np
+import pandas as pd
+
+from parquet_sink import ParquetSink, write_parquet_atomic
+from race_index import RaceIdSet, load_race_ids, present_mask
+
+
+def _race(race_id, date="2024年01月06日", venue="中山", horses=("A", "B")):
+    return pd.DataFrame({"race_id": race_id, "日付": date, "会場": venue, "馬名": list(horses)})
+
+
+def test_race_id_set_lookup():
+    ids = RaceIdSet.from_strings(["202406010102", "202406010101", "202406010101", "abc"])
+    assert len(ids) == 2
+    assert "202406010101" in ids and 202406010102 in ids
+    assert "202406010103" not in ids and "abc" not in ids and None not in ids
+    assert ids.contains(["202406010102", "x", "1"]).tolist() == [True, False, False]
+    assert ids.contains(np.array([202406010101, 5])).tolist() == [True, False]
+    assert present_mask(["202406010101", "202406010103"], ids) == [True, False]
+    assert present_mask(["a", "b"], {"b"}) == [False, True]
+
+
+def test_appends_update_index(tmp_path):
+    target = str(tmp_path / "database.parquet")
+    sink = ParquetSink(target, compact_every=0)
+    sink.append(_race("202406010101"))
+    assert len(load_race_ids(target)) == 1  # 初回の読み込みで索引を作る
+
+    sink.append(_race("202406010102", venue="京都"))
+    sink.append(_race("202406010102", venue="京都"))  # 登録済みのレースは数えない
+    sink.append(_race("202406010201", date="2024年01月07日"))
+    ids = load_race_ids(target)
+    assert sorted(ids) == ["202406010101", "202406010102", "202406010201"]
+    assert ids.dates.astype(str).tolist() == ["2024-01-06", "2024-01-07"]
+    coverage = sink.index.coverage()
+    assert list(coverage.itertuples(index=False, name=None)) == [
+        (pd.Timestamp("2024-01-06"), "中山", 1),
+        (pd.Timestamp("2024-01-06"), "京都", 1),
+        (pd.Timestamp("2024-01-07"), "中山", 1),
+    ]
+
+    # 統合してもベースの書き換えは記録されるので作り直さない
+    sink.close()
+    assert sink.index.is_current()
+    assert sorted(load_race_ids(target)) == sorted(ids)
+
+
+def test_external_rewrite_rebuilds_index(tmp_path):
+    target = str(tmp_path / "database.parquet")
+    sink = ParquetSink(target, compact_every=0)
+    sink.append(_race("202406010101"))
+    sink.close()
+    assert "202406010101" in load_race_ids(target)
+
+    # シンクを通さずにベースを置き換える
+    write_parquet_atomic(pd.concat([_race("202405050505"), _race("202405050506")], ignore_index=True), target)
+    assert not sink.index.is_current()
+    ids = load_race_ids(target)
+    assert sorted(ids) == ["202405050505", "202405050506"]
+    assert sink.index.is_current()
@@ -0,0 +1,57 @@
+"""
+ホスト単位のレート制限 (scraper/rate_limit.py) のテスト
+停止 (サーキットブレーカー・Retry-After) 中は補充せず、停止明けの予約も 1/rate 秒間隔で実行される。
+"""
+
+import pytest
+
+import rate_limit
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", c)
+    monkeypatch.setattr(rate_limit.time, "time", c)
+    return c
+
+
+def _fire_times(bucket, clock, offsets):
+    times = []
+    start = clock.now
+    for offset in offsets:
+        clock.now = start + offset
+        times.append(round(clock.now + bucket.reserve() - start, 6))
+    return times
+
+
+def test_pause_does_not_refill(clock):
+    bucket = rate_limit.TokenBucket(1.0, 1)
+    bucket.pause(4)
+    assert _fire_times(bucket, clock, [0.0, 1.1, 2.2]) == [4.0, 5.0, 6.0]
+    # 停止明け後は通常どおり補充される
+    clock.now += 10
+    assert bucket.reserve() == 0.0
+
+
+def test_pause_with_burst_spaces_waiters_after_the_pause(clock):
+    bucket = rate_limit.TokenBucket(2.0, 2)
+    clock.now += 1
+    bucket.pause(3)
+    assert _fire_times(bucket, clock, [0.0, 1.0, 2.0, 2.5]) == [3.0, 3.0, 3.5, 4.0]
+
+
+def test_shared_bucket_pause_does_not_refill(clock, tmp_path):
+    bucket = rate_limit.SharedTokenBucket(str(tmp_path / "host.json"), 1.0, 1)
+    bucket.pause(4)
+    assert _fire_times(bucket, clock, [0.0, 1.1, 2.2]) == [4.0, 5.0, 6.0]
+    other = rate_limit.SharedTokenBucket(str(tmp_path / "host.json"), 1.0, 1)
+    assert round(other.reserve(), 6) == round(7.0 - 2.2, 6)
@@ -0,0 +1,47 @@
+"""
+ストレージ層 (scraper/storage.py) の一括取り込みのテスト
+replace は取り込んだ行を削除しない。upsert はキーに欠損 (horse_id なし) がある行も重複させない。
+"""
+
+import pandas as pd
+import pytest
+
+from storage import RESULTS_TABLE, KeibaStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    s = KeibaStorage(str(tmp_path / "keiba.db"))
+    yield s
+    s.close()
+
+
+def _count(storage, where=""):
+    return storage.query(f"SELECT COUNT(*) AS n FROM race_results {where}")["n"].iloc[0]
+
+
+def test_replace_without_horse_id_keeps_all_rows(storage):
+    df = pd.DataFrame({"race_id": ["202401010101"] * 3, "馬名": ["A", "B", "C"], "日付": ["2024-01-01"] * 3})
+    storage.bulk_load(RESULTS_TABLE, [df], how="replace")
+    assert _count(storage) == 3
+
+
+def test_replace_with_duplicate_keys_keeps_all_rows(storage):
+    df = pd.DataFrame({"race_id": ["1", "1"], "horse_id": ["h", "h"], "馬名": ["A", "A"]})
+    storage.bulk_load(RESULTS_TABLE, [df], how="replace")
+    assert _count(storage) == 2
+
+
+def test_upsert_replaces_rows_with_missing_horse_id(storage):
+    df = pd.DataFrame({"race_id": ["1", "1", "1", "2"], "horse_id": ["h1", None, None, None],
+                       "馬名": ["A", "B", "C", "D"], "着 順": [1, 2, 3, 1]})
+    storage.bulk_load(RESULTS_TABLE, [df], how="upsert")
+    storage.bulk_load(RESULTS_TABLE, [df], how="upsert")
+    assert _count(storage) == 4
+
+    # 同じ取り込みの中で後のバッチに出てきた同じキーの行は消さない
+    updated = df.assign(**{"着 順": [1, 3, 2, 1]})
+    storage.bulk_load(RESULTS_TABLE, [updated.iloc[:2], updated.iloc[2:]], how="upsert")
+    assert _count(storage) == 4
+    rows = storage.query('SELECT "馬名", "着 順" FROM race_results WHERE horse_id IS NULL ORDER BY "馬名"')
+    assert rows["着 順"].tolist() == [3, 2, 1]
@@ -1,12 +1,39 @@
 """
 リアルタイム監視・アラート機能
 期待値の高いレースを自動検出
+
+- RaceAlert: 予測結果のリストから注目レースをまとめて抽出する (バッチ)
+- EVAlertEngine: レースごとの予測を保持し、オッズが更新されたレースだけ期待値を計算し直す (イベント駆動)。
+  OddsPoller.subscribe() にそのまま渡せる。RaceAlert と同じく、期待値の高い馬が min_horses 頭 (既定 2) 以上の
+  レースだけが対象。high_ev_count / high_ev_horses はその時点で閾値を超えている全馬で、
+  アラートは新たに段階を上がった馬がいるときだけ出る (上がった馬は new=True)
+- save_predictions(): アプリで計算した予測を保存する。--poll-odds --alerts のポーラーが読み込む
+- AsyncAlertSender: 通知をまとめて非同期に送る (失敗時は再試行)。通知先 (Notifier) は差し替えられる
+
+    sender = AsyncAlertSender([LineNotifier(token), SlackNotifier(webhook_url)])
+    engine = EVAlertEngine(sender=sender, log_path="alerts.jsonl")
+    engine.set_predictions(race_id, numbers, probs, factors=mark_factors, names=names)
+    poller.subscribe(engine.on_odds)
+
+コマンドライン: python scraper/auto_scraper.py --poll-odds --alerts  (通知先は LINE_NOTIFY_TOKEN / SLACK_WEBHOOK_URL)
 """
 
+import asyncio
 import json
 import os
+import tempfile
+import time
 from datetime import datetime
 
+import numpy as np
+
+# 期待値の段階。馬ごとに、より上の段階に上がったときだけ通知する
+ALERT_BANDS = (0.3, 0.5, 1.0)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# アプリが保存し、ポーラーのアラートが読む予測
+PREDICTIONS_PATH = os.environ.get("KEIBA_ALERT_PREDICTIONS") or os.path.join(PROJECT_ROOT, "data", "alert_predictions.json")
+
 
 class RaceAlert:
     """
@@ -194,6 +221,438 @@ def send_slack_notification(message, webhook_url):
         return False
 
 
+class EVAlertEngine:
+    """
+    オッズ更新ごとの期待値アラート
+
+    レースごとの予測 (馬番・AI勝率・印補正) を配列で保持し、オッズのスナップショットが届いたレースだけ
+    EV = AI勝率 × 印補正 × 単勝オッズ - 1 をまとめて計算する。
+    アラートは馬ごと・段階 (bands) ごとに1回だけ出す (EVが上の段階に上がったときに再度出る)。
+    """
+
+    def __init__(self, bands=ALERT_BANDS, safety_threshold=0.03, sender=None, log_path=None, min_horses=2,
+                 predictions_path=None):
+        """
+        Args:
+            bands: 期待値の段階 (昇順)。最小の段階を超えた馬がアラート対象
+            safety_threshold: AI勝率がこれ未満の馬は対象外 (アプリの確率不足の除外と同じ)
+            sender: AsyncAlertSender (省略時は通知しない)
+            log_path: アラートを1行1件で追記するファイル (JSON Lines、省略時は保存しない)
+            min_horses: 最小の段階を超えた馬がこの頭数以上いるレースだけ通知する (RaceAlert と同じ 2頭)
+            predictions_path: save_predictions() の保存先。指定すると更新のたびに読み直す
+        """
+        self.bands = np.asarray(sorted(bands), dtype="float64")
+        self.safety_threshold = safety_threshold
+        self.sender = sender
+        self.log_path = log_path
+        self.min_horses = min_horses
+        self.predictions_path = predictions_path
+        self.races = {}   # race_id → 予測配列と通知済みの段階
+        self.stats = {"updates": 0, "alerts": 0}
+        self._loaded = {}            # race_id → 読み込んだ予測の updated_at
+        self._predictions_mtime = None
+
+    def set_predictions(self, race_id, numbers, probs, factors=None, names=None, race_name='', venue=''):
+        """
+        レースの予測を登録する (同じレースを再登録すると通知済みの段階はリセットされる)
+
+        Args:
+            race_id: レースID
+            numbers: 馬番の配列
+            probs: AI勝率 (0〜1) の配列
+            factors: 印補正などの倍率の配列 (省略時は 1.0)
+            names: 馬名の配列
+            race_name: レース名
+            venue: 開催場所
+        """
+        numbers = np.asarray(numbers, dtype="int64")
+        order = np.argsort(numbers, kind="stable")
+        probs = np.asarray(probs, dtype="float64")
+        factors = np.ones(len(numbers)) if factors is None else np.asarray(factors, dtype="float64")
+        names = np.asarray(names if names is not None else [''] * len(numbers), dtype=object)
+        self.races[str(race_id)] = {
+            'numbers': numbers[order],
+            'weight': np.where(probs >= self.safety_threshold, probs * factors, np.nan)[order],
+            'probs': probs[order],
+            'names': names[order],
+            'alerted': np.zeros(len(numbers), dtype="int64"),
+            'race_name': race_name,
+            'venue': venue,
+        }
+
+    def drop_race(self, race_id):
+        """レースの予測を破棄する (締切後など)"""
+        self.races.pop(str(race_id), None)
+
+    def load_predictions(self, path=None):
+        """
+        save_predictions() で保存された予測を登録する (前回から更新されたレースだけ登録し直す)
+
+        Args:
+            path: 保存先 (省略時は predictions_path、それもなければ PREDICTIONS_PATH)
+
+        Returns:
+            int: 登録したレース数
+        """
+        path = path or self.predictions_path or PREDICTIONS_PATH
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return 0
+        if mtime == self._predictions_mtime:
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Failed to load predictions: {e}")
+            return 0
+        self._predictions_mtime = mtime
+        count = 0
+        for race_id, p in saved.items():
+            if self._loaded.get(race_id) == p.get('updated_at'):
+                continue
+            factors = [np.nan if f is None else f for f in p['factors']] if p.get('factors') is not None else None
+            self.set_predictions(race_id, p['numbers'], p['probs'], factors=factors, names=p.get('names'),
+                                 race_name=p.get('race_name', ''), venue=p.get('venue', ''))
+            self._loaded[race_id] = p.get('updated_at')
+            count += 1
+        return count
+
+    def evaluate(self, race_id, numbers, odds):
+        """
+        1レース分のオッズから期待値を計算し、新しく段階を超えた馬がいればアラートにする
+
+        最小の段階を超えた馬が min_horses 頭未満のレースは通知しない。high_ev_horses はその時点で
+        段階を超えている全馬 (期待値の高い順、今回上がった馬は new=True、その頭数が new_count)
+
+        Args:
+            race_id: レースID
+            numbers: 馬番の配列
+            odds: 単勝オッズの配列 (取得できなかった馬は NaN / None)
+
+        Returns:
+            dict or None: format_alert_message() と同じ形式のアラート (通知しないときは None)
+        """
+        state = self.races.get(str(race_id))
+        if state is None or not len(state['numbers']):
+            return None
+        self.stats["updates"] += 1
+
+        # 届いたオッズを登録済みの馬番の並びに合わせる
+        numbers = np.asarray(numbers, dtype="int64")
+        odds = np.asarray(odds, dtype="float64")
+        pos = np.searchsorted(state['numbers'], numbers)
+        pos = np.minimum(pos, len(state['numbers']) - 1)
+        hit = state['numbers'][pos] == numbers
+        aligned = np.full(len(state['numbers']), np.nan)
+        aligned[pos[hit]] = odds[hit]
+        aligned[aligned <= 1.0] = np.nan
+
+        ev = state['weight'] * aligned - 1.0
+        band = np.searchsorted(self.bands, np.nan_to_num(ev, nan=-1.0), side='left')
+        high = band > 0
+        # レース単位の条件 (期待値の高い馬が min_horses 頭以上) を満たすまでは通知済みにしない
+        if high.sum() < self.min_horses:
+            return None
+        new = band > state['alerted']
+        if not new.any():
+            return None
+        state['alerted'] = np.maximum(state['alerted'], band)
+
+        idx = np.flatnonzero(high)
+        idx = idx[np.argsort(-ev[idx], kind="stable")]
+        horses = [{
+            'number': int(state['numbers'][i]),
+            'horse_name': state['names'][i],
+            'ai_prob': float(state['probs'][i]),
+            'odds': float(aligned[i]),
+            'ev': float(ev[i]),
+            'band': float(self.bands[band[i] - 1]),
+            'new': bool(new[i]),
+        } for i in idx]
+        self.stats["alerts"] += int(new.sum())
+        return {
+            'race_id': str(race_id),
+            'race_name': state['race_name'],
+            'venue': state['venue'],
+            'high_ev_count': len(horses),
+            'high_ev_horses': horses,
+            'new_count': int(new.sum()),
+            'timestamp': datetime.now().isoformat(),
+        }
+
+    def on_odds(self, race, horses):
+        """
+        オッズ更新の受け口 (OddsPoller.subscribe() に渡す)
+
+        Args:
+            race: スケジュールのエントリ (dict、"id" を持つ) またはレースID
+            horses: scrape_odds_for_race() の戻り値 ([{number, odds, ...}])
+
+        Returns:
+            dict or None: アラート
+        """
+        race_id = race.get('id') if isinstance(race, dict) else race
+        if self.predictions_path:
+            self.load_predictions()
+        if str(race_id) not in self.races or not horses:
+            return None
+        numbers, odds = [], []
+        for h in horses:
+            try:
+                numbers.append(int(h.get('number')))
+            except (TypeError, ValueError):
+                continue
+            try:
+                odds.append(float(h.get('odds')))
+            except (TypeError, ValueError):
+                odds.append(np.nan)
+        alert = self.evaluate(race_id, numbers, odds)
+        if alert is None:
+            return None
+        if isinstance(race, dict):
+            alert['race_name'] = alert['race_name'] or race.get('name', '')
+            alert['venue'] = alert['venue'] or race.get('venue', '')
+        if self.log_path:
+            append_alerts([alert], self.log_path)
+        if self.sender is not None:
+            self.sender.submit(alert)
+        return alert
+
+
+def append_alerts(alerts, filepath='alerts.jsonl'):
+    """
+    アラートをファイルに追記する (JSON Lines、既存の内容は読み直さない)
+
+    Args:
+        alerts: アラートのリスト
+        filepath: 保存先ファイルパス
+    """
+    try:
+        with open(filepath, 'a', encoding='utf-8') as f:
+            for alert in alerts:
+                f.write(json.dumps(alert, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"❌ Failed to save alerts: {e}")
+
+
+def save_predictions(race_id, numbers, probs, factors=None, names=None, race_name='', venue='', path=None):
+    """
+    レースの予測を保存する (アプリから呼ぶ。--poll-odds --alerts のポーラーが読み込んでアラートを出す)
+
+    Args:
+        race_id: レースID
+        numbers: 馬番の配列
+        probs: AI勝率 (0〜1) の配列
+        factors: 馬ごとの倍率 (印・信頼度などの補正。除外する馬は NaN)
+        names: 馬名の配列
+        race_name: レース名
+        venue: 開催場所
+        path: 保存先 (省略時は PREDICTIONS_PATH)
+    """
+    path = path or PREDICTIONS_PATH
+
+    def _floats(values):
+        return [None if v is None or not np.isfinite(v) else float(v) for v in np.asarray(values, dtype="float64")]
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+    saved[str(race_id)] = {
+        'numbers': [int(n) for n in numbers],
+        'probs': _floats(probs),
+        'factors': _floats(factors) if factors is not None else None,
+        'names': [str(n) for n in names] if names is not None else None,
+        'race_name': str(race_name or ''),
+        'venue': str(venue or ''),
+        'updated_at': time.time(),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(saved, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def engine_from_env(log_path='alerts.jsonl', predictions_path=None, **kwargs):
+    """
+    環境変数の通知先 (LINE_NOTIFY_TOKEN / SLACK_WEBHOOK_URL) で EVAlertEngine を作る
+
+    通知先がなければアラートはログにだけ書く。予測は predictions_path (省略時は PREDICTIONS_PATH) から読む。
+    """
+    notifiers = []
+    if os.environ.get("LINE_NOTIFY_TOKEN"):
+        notifiers.append(LineNotifier(os.environ["LINE_NOTIFY_TOKEN"]))
+    if os.environ.get("SLACK_WEBHOOK_URL"):
+        notifiers.append(SlackNotifier(os.environ["SLACK_WEBHOOK_URL"]))
+    sender = AsyncAlertSender(notifiers) if notifiers else None
+    engine = EVAlertEngine(sender=sender, log_path=log_path,
+                           predictions_path=predictions_path or PREDICTIONS_PATH, **kwargs)
+    engine.load_predictions()
+    return engine
+
+
+class Notifier:
+    """
+    通知先の基底クラス。send() は成功したら True を返す (False または例外で再試行される)
+    """
+
+    name = "notifier"
+
+    async def send(self, message):
+        raise NotImplementedError
+
+
+class LineNotifier(Notifier):
+    """LINE Notify (send_line_notify をスレッドで実行する)"""
+
+    name = "line"
+
+    def __init__(self, token):
+        self.token = token
+
+    async def send(self, message):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, send_line_notify, message, self.token)
+
+
+class SlackNotifier(Notifier):
+    """Slack Incoming Webhook (send_slack_notification をスレッドで実行する)"""
+
+    name = "slack"
+
+    def __init__(self, webhook_url):
+        self.webhook_url = webhook_url
+
+    async def send(self, message):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, send_slack_notification, message, self.webhook_url)
+
+
+class MemoryNotifier(Notifier):
+    """
+    送信せずにメッセージを保持する通知先 (テスト・動作確認用)
+
+    Args:
+        fail_times: 最初のこの回数だけ失敗する (再試行の確認用)
+    """
+
+    name = "memory"
+
+    def __init__(self, fail_times=0):
+        self.messages = []
+        self.attempts = 0
+        self.fail_times = fail_times
+
+    async def send(self, message):
+        self.attempts += 1
+        if self.attempts <= self.fail_times:
+            return False
+        self.messages.append(message)
+        return True
+
+
+class AsyncAlertSender:
+    """
+    アラートをまとめて非同期に通知する
+
+    submit() はキューに入れるだけで待たない。送信タスクは batch_window 秒の間に届いたアラート
+    (最大 batch_size 件) を1通のメッセージにまとめ、各通知先に並行に送る。失敗した通知先には
+    retry_delay × 2^n 秒待って max_retries 回まで再送する。
+
+        async with AsyncAlertSender([MemoryNotifier()]) as sender:
+            sender.submit(alert)
+    """
+
+    def __init__(self, notifiers, batch_size=10, batch_window=2.0, max_retries=3, retry_delay=1.0,
+                 formatter=None):
+        self.notifiers = list(notifiers)
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.formatter = formatter or RaceAlert().format_alert_message
+        self.stats = {"queued": 0, "batches": 0, "sent": 0, "retries": 0, "failed": 0}
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def submit(self, alert):
+        """アラートを送信キューに入れる (イベントループのスレッドから呼ぶ)"""
+        self._queue.put_nowait(alert)
+        self.stats["queued"] += 1
+
+    def start(self):
+        """送信タスクを開始する (実行中のイベントループ内で呼ぶ)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        """キューに残ったアラートを送ってから送信タスクを止める"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _deliver(self, notifier, message):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                if await notifier.send(message):
+                    self.stats["sent"] += 1
+                    return True
+            except Exception as e:
+                print(f"❌ {notifier.name} notification error: {e}")
+        self.stats["failed"] += 1
+        print(f"❌ {notifier.name} notification dropped after {self.max_retries} retries")
+        return False
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                message = self.formatter(batch)
+                await asyncio.gather(*(self._deliver(n, message) for n in self.notifiers))
+                self.stats["batches"] += 1
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
 if __name__ == "__main__":
     # Test
     alert_system = RaceAlert()